@@ -17,7 +17,9 @@ sys.path.insert(0, str(SKILL_DIR))
 from src.feishu_storage import FeishuStorage, FeishuClient
 from src.portfolio import PortfolioManager
 from src.price_fetcher import PriceFetcher
-from src.models import AssetType, AssetClass, Industry, Holding, NAVHistory
+from src.models import AssetType, AssetClass, Industry, Holding, NAVHistory, TransactionType
+from src.nav_timeline import NavTimeline
+from src.risk_tracker import RiskTracker
 from src.asset_utils import (
     validate_code as validate_asset_code,
     detect_asset_type,
@@ -200,6 +202,112 @@ class PortfolioSkill:
         except Exception as e:
             return {"success": False, "error": str(e), "message": f"记录失败: {e}"}
 
+    _TRADE_TYPES = {
+        'BUY': TransactionType.BUY, '买入': TransactionType.BUY,
+        'SELL': TransactionType.SELL, '卖出': TransactionType.SELL,
+    }
+
+    def import_trades(self, source, market: str = "平安证券",
+                      auto_cash: bool = False) -> Dict[str, Any]:
+        """
+        批量导入成交（券商对账单）
+
+        先逐行校验全部成交，任何一行有误都不写入；校验通过后一次防重查询，
+        交易、持仓和净现金变动均通过批量接口提交。不做逐笔价格校验和名称查询。
+
+        Args:
+            source: CSV 文件路径，或成交字典列表。字段：
+                    date (YYYY-MM-DD), type (BUY/SELL/买入/卖出), code, quantity, price,
+                    可选 name, fee, market, request_id, remark
+            market: 未指定 market 的买入成交使用的券商/平台，默认 "平安证券"
+            auto_cash: 是否按 CNY 成交净额调整现金，默认 False
+
+        Returns:
+            {"success": bool, "imported": int, "skipped": int, "net_cash": float, "message": str}
+        """
+        try:
+            if isinstance(source, (str, Path)):
+                import csv
+                with open(source, newline='', encoding='utf-8-sig') as f:
+                    rows = list(csv.DictReader(f))
+            else:
+                rows = list(source)
+
+            fills, errors = [], []
+            for i, row in enumerate(rows, 1):
+                try:
+                    fills.append(self._parse_fill(row, market))
+                except Exception as e:
+                    errors.append(f"第 {i} 行: {e}")
+
+            if errors:
+                return {
+                    "success": False,
+                    "error": "\n".join(errors),
+                    "errors": errors,
+                    "message": f"校验失败（{len(errors)} 行），未写入任何数据"
+                }
+
+            result = self.portfolio.import_trades(self.account, fills, auto_cash=auto_cash)
+            txs = result['transactions']
+            return {
+                "success": True,
+                "imported": len(txs),
+                "skipped": len(result['skipped']),
+                "net_cash": result['net_cash'],
+                "holdings": result['holdings'],
+                "transactions": [
+                    {"record_id": tx.record_id, "date": tx.tx_date.isoformat(), "type": tx.tx_type.value,
+                     "code": tx.asset_id, "quantity": fmt_qty(abs(tx.quantity)), "price": tx.price}
+                    for tx in txs
+                ],
+                "message": f"导入 {len(txs)} 笔成交，跳过重复 {len(result['skipped'])} 笔"
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e), "message": f"导入失败: {e}"}
+
+    def _parse_fill(self, row: Dict[str, Any], default_market: str) -> Dict[str, Any]:
+        """校验并解析一行成交（日期严格校验，不回退到今天）"""
+        tx_type = self._TRADE_TYPES.get(str(row.get('type') or '').strip().upper())
+        if tx_type is None:
+            raise ValueError(f"交易类型无效: {row.get('type')}")
+
+        date_value = row.get('date')
+        if isinstance(date_value, date):
+            tx_date = date_value
+        else:
+            tx_date = datetime.strptime(str(date_value or '').strip(), '%Y-%m-%d').date()
+
+        code = validate_asset_code(str(row.get('code') or ''))
+        asset_type, currency, asset_class = detect_asset_type(code)
+
+        quantity = float(row.get('quantity') or 0)
+        price = float(row.get('price') or 0)
+        fee = float(row.get('fee') or 0)
+        if quantity <= 0:
+            raise ValueError(f"数量必须大于 0: {row.get('quantity')}")
+        if price < 0 or fee < 0:
+            raise ValueError("价格和手续费不能为负")
+
+        row_market = (row.get('market') or '').strip()
+        return {
+            'tx_date': tx_date,
+            'tx_type': tx_type,
+            'asset_id': code,
+            'asset_name': (row.get('name') or '').strip() or None,
+            'asset_type': asset_type,
+            'currency': currency,
+            'asset_class': asset_class,
+            'industry': Industry.OTHER,
+            'quantity': quantity,
+            'price': price,
+            'fee': fee,
+            # 卖出未指定 market 时按已有持仓匹配（同 sell）
+            'market': row_market or (default_market if tx_type == TransactionType.BUY else None),
+            'request_id': (row.get('request_id') or '').strip() or None,
+            'remark': row.get('remark') or "",
+        }
+
     def deposit(self, amount: float, date_str: str = None,
                 remark: str = "入金", currency: str = "CNY") -> Dict[str, Any]:
         """记录入金"""
@@ -255,7 +363,9 @@ class PortfolioSkill:
     # ---------- 持仓查询 ----------
 
     def get_holdings(self, include_cash: bool = True, group_by_market: bool = False,
-                     include_price: bool = False, timeout: int = 10) -> Dict[str, Any]:
+                     include_price: bool = False, timeout: int = 10,
+                     stale_while_revalidate: bool = None,
+                     _holdings: list = None) -> Dict[str, Any]:
         """获取持仓列表
 
         Args:
@@ -263,9 +373,13 @@ class PortfolioSkill:
             group_by_market: 是否按券商分组
             include_price: 是否包含实时价格
             timeout: 价格获取超时时间（秒）
+            stale_while_revalidate: 过期不久的报价先行返回并后台刷新（None 时读取配置 price_swr.enabled）
+            _holdings: 已加载的持仓（内部复用，避免重复查询）
         """
+        if stale_while_revalidate is None:
+            stale_while_revalidate = config.is_price_swr_enabled()
         try:
-            holdings = self.storage.get_holdings(account=self.account)
+            holdings = _holdings if _holdings is not None else self.storage.get_holdings(account=self.account)
 
             # 只有需要价格时才获取
             prices = {}
@@ -286,7 +400,8 @@ class PortfolioSkill:
                             _fetch_result['prices'] = self.price_fetcher.fetch_batch(
                                 codes, name_map,
                                 use_concurrent=True,
-                                skip_us=False
+                                skip_us=False,
+                                stale_while_revalidate=stale_while_revalidate
                             )
                         except Exception as e:
                             _fetch_result['error'] = e
@@ -371,6 +486,10 @@ class PortfolioSkill:
                             "cny_price": cny_price,
                             "market_value": market_value,
                         })
+                        if price_data.get('stale'):
+                            # 过期报价先行返回，后台正在刷新
+                            item["price_stale"] = True
+                            item["price_age"] = price_data.get('age')
                     result_holdings.append(item)
 
             # 只有在包含价格时才计算权重和排序
@@ -595,30 +714,23 @@ class PortfolioSkill:
 
     def _calc_month_return(self, month: str, _navs: list = None) -> Dict:
         """计算月收益率（环比：较上月末的变化）"""
-        navs = _navs if _navs is not None else self.storage.get_nav_history(self.account, days=365)
-        month_navs = [n for n in navs if n.date.strftime('%Y-%m') == month]
-
-        if len(month_navs) < 1:
-            return {"success": False, "message": f"{month} 数据不足"}
+        timeline = NavTimeline.of(
+            _navs if _navs is not None else self.storage.get_nav_history(self.account, days=365))
+        year, mon = int(month[:4]), int(month[5:7])
 
         # 当月最后一天净值
-        end_nav = max(month_navs, key=lambda x: x.date)
+        end_nav = timeline.month_end(year, mon)
+        if end_nav is None:
+            return {"success": False, "message": f"{month} 数据不足"}
 
         # 获取上月最后一天净值（作为基准）
-        year, mon = int(month[:4]), int(month[5:7])
-        if mon == 1:
-            prev_month = f"{year-1}-12"
-        else:
-            prev_month = f"{year}-{mon-1:02d}"
-
-        prev_month_navs = [n for n in navs if n.date.strftime('%Y-%m') == prev_month]
-        if prev_month_navs:
+        start_nav = timeline.prev_month_end(year, mon)
+        if start_nav:
             # 上月有数据，使用上月最后一天作为基准
-            start_nav = max(prev_month_navs, key=lambda x: x.date)
             start_nav_label = "上月末"
         else:
             # 上月无数据，使用当月第一天作为基准（首次记录）
-            start_nav = min(month_navs, key=lambda x: x.date)
+            start_nav = timeline.month_start(year, mon)
             start_nav_label = "月初"
 
         ret = (end_nav.nav - start_nav.nav) / start_nav.nav * 100 if start_nav.nav > 0 else 0
@@ -636,26 +748,22 @@ class PortfolioSkill:
 
     def _calc_year_return(self, year: str, _navs: list = None) -> Dict:
         """计算年收益率（环比：较上年末的变化）"""
-        navs = _navs if _navs is not None else self.storage.get_nav_history(self.account, days=730)
-        year_navs = [n for n in navs if n.date.strftime('%Y') == year]
-
-        if len(year_navs) < 1:
-            return {"success": False, "message": f"{year} 数据不足"}
+        timeline = NavTimeline.of(
+            _navs if _navs is not None else self.storage.get_nav_history(self.account, days=730))
 
         # 当年最后一天净值
-        end_nav = max(year_navs, key=lambda x: x.date)
+        end_nav = timeline.year_end(int(year))
+        if end_nav is None:
+            return {"success": False, "message": f"{year} 数据不足"}
 
         # 获取上年最后一天净值（作为基准）
-        prev_year = str(int(year) - 1)
-        prev_year_navs = [n for n in navs if n.date.strftime('%Y') == prev_year]
-
-        if prev_year_navs:
+        start_nav = timeline.year_end(int(year) - 1)
+        if start_nav:
             # 上年有数据，使用上年最后一天作为基准
-            start_nav = max(prev_year_navs, key=lambda x: x.date)
             start_nav_label = "上年末"
         else:
             # 上年无数据，使用当年第一天作为基准（首次记录）
-            start_nav = min(year_navs, key=lambda x: x.date)
+            start_nav = timeline.year_start(int(year))
             start_nav_label = "年初"
 
         ret = (end_nav.nav - start_nav.nav) / start_nav.nav * 100 if start_nav.nav > 0 else 0
@@ -678,9 +786,9 @@ class PortfolioSkill:
 
         if _navs is not None:
             # 使用预获取的净值数据
-            base_candidates = [n for n in _navs if n.date <= BASE_DATE]
-            base_nav = max(base_candidates, key=lambda n: n.date) if base_candidates else None
-            latest = _navs[-1] if _navs else None
+            timeline = NavTimeline.of(_navs)
+            base_nav = timeline.as_of(BASE_DATE)
+            latest = timeline.latest
         else:
             base_nav = self.storage.get_nav_on_date(self.account, BASE_DATE)
             if not base_nav:
@@ -864,6 +972,7 @@ class PortfolioSkill:
                 "ytd_pnl": nav.get("ytd_pnl"),
                 "since_inception": returns.get("since_inception"),
                 "risk": {
+                    **(returns.get("risk_metrics") or {}),
                     "volatility": returns.get("historical_volatility"),
                     "max_drawdown": returns.get("max_drawdown"),
                 },
@@ -887,14 +996,15 @@ class PortfolioSkill:
             price_timeout: 价格获取超时时间（秒），默认30秒
         """
         try:
+            # 持仓与全部净值历史并行加载（两张表的请求同时进行）
+            holdings, all_navs = self.storage.load_holdings_and_navs(self.account)
+
             # 使用带超时保护的持仓查询（只获取一次）
-            holdings_data = self.get_holdings(include_price=True, timeout=price_timeout)
+            holdings_data = self.get_holdings(include_price=True, timeout=price_timeout,
+                                              _holdings=holdings)
             # 复用已获取的持仓数据，避免重复查询价格
             position_data = self.get_position(holdings_data=holdings_data)
 
-            # 一次性获取全部净值历史（1 次 API 调用）
-            all_navs = self.storage.get_nav_history(self.account, days=9999)
-
             # --- 合成实时虚拟净值 ---
             # 用实时持仓市值 + 最近一次记录的份额，推算当前净值
             # 确保即使今天未 record_nav()，收益统计也能正常计算
@@ -946,8 +1056,10 @@ class PortfolioSkill:
                 if latest.details:
                     nav_latest["details"] = latest.details
 
-            # 计算风险指标（复用 all_navs，不含虚拟净值）
-            hist_volatility, hist_max_dd = self._calc_risk_metrics(all_navs)
+            # 风险指标（复用 all_navs，不含虚拟净值）：本地增量状态只同步新增净值行
+            risk_metrics = RiskTracker.refresh(self.account, all_navs)
+            hist_volatility = risk_metrics["volatility"] or 0
+            hist_max_dd = risk_metrics["max_drawdown"] or 0
 
             # 获取资产分布（复用持仓数据）
             distribution_data = self.get_distribution(holdings_data=holdings_data)
@@ -957,9 +1069,11 @@ class PortfolioSkill:
             current_year = str(today.year)
             current_month = today.strftime('%Y-%m')
 
-            monthly_return = self._calc_month_return(current_month, _navs=working_navs)
-            yearly_return = self._calc_year_return(current_year, _navs=working_navs)
-            since_inception = self._calc_since_inception_return(_navs=working_navs)
+            # 三项收益共享同一条时间线（只排序一次）
+            timeline = NavTimeline(working_navs)
+            monthly_return = self._calc_month_return(current_month, _navs=timeline)
+            yearly_return = self._calc_year_return(current_year, _navs=timeline)
+            since_inception = self._calc_since_inception_return(_navs=timeline)
 
             # 获取 top10 持仓列表
             top_holdings_list = holdings_data.get("holdings", [])[:10]
@@ -979,7 +1093,10 @@ class PortfolioSkill:
                     "yearly": yearly_return,
                     "since_inception": since_inception,
                     "historical_volatility": hist_volatility,
-                    "max_drawdown": hist_max_dd
+                    "max_drawdown": hist_max_dd,
+                    "sharpe_ratio": risk_metrics["sharpe_ratio"],
+                    "sortino_ratio": risk_metrics["sortino_ratio"],
+                    "risk_metrics": risk_metrics
                 },
                 "top_holdings": top_holdings_list,
                 "distribution": distribution_result
@@ -994,9 +1111,16 @@ class PortfolioSkill:
             price_timeout: 价格获取超时时间（秒）
         """
         try:
-            valuation = self.portfolio.calculate_valuation(self.account)
+            # 持仓、净值、出入金三张表并行加载一次
+            data = self.storage.load_account_data(self.account)
+            valuation = self.portfolio.calculate_valuation(self.account, holdings=data['holdings'])
             today = date.today()
-            nav_record = self.portfolio.record_nav(self.account, valuation=valuation, nav_date=today)
+            nav_record = self.portfolio.record_nav(self.account, valuation=valuation, nav_date=today,
+                                                   all_navs=data['nav_history'],
+                                                   cash_flows=data['cash_flow'])
+            # 新净值追加到风险指标增量状态，报告直接读取
+            RiskTracker.refresh(self.account,
+                                [n for n in data['nav_history'] if n.date != today] + [nav_record])
             return {
                 "success": True,
                 "date": today.isoformat(),
@@ -1008,35 +1132,92 @@ class PortfolioSkill:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def _calc_risk_metrics(self, navs) -> tuple:
-        """计算风险指标：波动率和最大回撤"""
-        import statistics
+    def backfill_nav(self, start: str = None, end: str = None, dry_run: bool = False) -> Dict[str, Any]:
+        """按交易记录回放并补录缺失日期的净值（需开启本地时间序列 PORTFOLIO_TIMESERIES）
 
-        if len(navs) < 2:
-            return 0, 0
+        回放前自动从历史行情源导入区间内的日收盘价；缺收盘价的日期跳过，不写入。
+
+        Args:
+            start: 起始日期 YYYY-MM-DD（为空从第一笔交易/出入金开始）
+            end: 截止日期 YYYY-MM-DD（为空到昨天）
+            dry_run: 只计算不写入
+        """
+        try:
+            navs = self.portfolio.backfill_nav(
+                self.account,
+                start=date.fromisoformat(start) if start else None,
+                end=date.fromisoformat(end) if end else None,
+                dry_run=dry_run)
+            if navs and not dry_run:
+                # 补录的是历史中间的日期，风险指标增量状态全量重建
+                tracker = RiskTracker.load(self.account)
+                tracker.reset()
+                tracker.sync(self.storage.get_nav_history(self.account, days=9999))
+                tracker.save()
+            return {
+                "success": True,
+                "count": len(navs),
+                "dates": [n.date.isoformat() for n in navs],
+                "message": f"{'预览' if dry_run else '已补录'} {len(navs)} 天净值"
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
-        # 过滤无效 nav
-        valid_navs = [n for n in navs if n.nav and n.nav > 0]
-        if len(valid_navs) < 2:
-            return 0, 0
+    def reconcile_holdings(self, apply: bool = False, include_cash: bool = False) -> Dict[str, Any]:
+        """持仓对账：holdings 表与交易流水推导的持仓比较
 
-        returns = []
-        for i in range(1, len(valid_navs)):
-            r = (valid_navs[i].nav - valid_navs[i-1].nav) / valid_navs[i-1].nav
-            returns.append(r)
+        只有非现金持仓的数量差异视为不一致；现金类差异、成本差异仅列出供参考。
 
-        volatility = statistics.stdev(returns) * (252 ** 0.5) * 100 if len(returns) > 1 else 0
+        Args:
+            apply: 是否按交易流水修正 holdings 表（数量 + 平均成本）
+            include_cash: 是否同时修正现金/货币基金（add_cash/sub_cash 的调整会被覆盖）
+        """
+        try:
+            result = self.portfolio.reconcile_holdings(self.account, apply=apply, include_cash=include_cash)
+            diffs = result['diffs']
+            return {
+                "success": True,
+                "consistent": not diffs,
+                "diffs": diffs,
+                "cash_diffs": result['cash_diffs'],
+                "cost_diffs": result['cost_diffs'],
+                "missing_cost": result['missing_cost'],
+                "updated": result['updated'],
+                "created": result['created'],
+                "deleted": result['deleted'],
+                "message": "持仓数量与交易流水一致" if not diffs else
+                           f"{'已修正' if apply else '发现'} {len(diffs)} 项持仓数量差异"
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
-        max_dd = 0
-        peak = valid_navs[0].nav
-        for nav in valid_navs[1:]:
-            if nav.nav > peak:
-                peak = nav.nav
-            dd = (peak - nav.nav) / peak
-            if dd > max_dd:
-                max_dd = dd
+    def get_holdings_as_of(self, as_of: str) -> Dict[str, Any]:
+        """历史某日收盘后的持仓（由交易流水推导，不含价格）
 
-        return volatility, max_dd * 100
+        Args:
+            as_of: 日期 YYYY-MM-DD
+        """
+        try:
+            holdings = self.portfolio.holdings_as_of(self.account, date.fromisoformat(as_of))
+            return {
+                "success": True,
+                "as_of": as_of,
+                "count": len(holdings),
+                "holdings": [
+                    {
+                        "code": h.asset_id,
+                        "name": h.asset_name,
+                        "type": h.asset_type.value,
+                        "market": h.market,
+                        "quantity": h.quantity,
+                        "avg_cost": h.avg_cost,
+                        "currency": h.currency,
+                    }
+                    for h in holdings
+                ]
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
     # ---------- 价格查询 ----------
 
@@ -1150,6 +1331,10 @@ def sell(code: str, quantity: float, price: float, **kwargs) -> Dict:
     """卖出资产"""
     return _get_default_skill().sell(code, quantity, price, **kwargs)
 
+def import_trades(source, **kwargs) -> Dict:
+    """批量导入成交（CSV 路径或成交列表）"""
+    return _get_default_skill().import_trades(source, **kwargs)
+
 def deposit(amount: float, **kwargs) -> Dict:
     """入金"""
     return _get_default_skill().deposit(amount, **kwargs)
@@ -1210,12 +1395,36 @@ def record_nav(price_timeout: int = 30) -> Dict:
     """记录今日净值"""
     return _get_default_skill().record_nav(price_timeout=price_timeout)
 
+def backfill_nav(start: str = None, end: str = None, dry_run: bool = False) -> Dict:
+    """按交易记录补录缺失日期的净值"""
+    return _get_default_skill().backfill_nav(start=start, end=end, dry_run=dry_run)
+
+def reconcile_holdings(apply: bool = False, include_cash: bool = False) -> Dict:
+    """持仓与交易流水对账（apply=True 时修正持仓表）"""
+    return _get_default_skill().reconcile_holdings(apply=apply, include_cash=include_cash)
+
+def get_holdings_as_of(as_of: str) -> Dict:
+    """历史某日持仓"""
+    return _get_default_skill().get_holdings_as_of(as_of)
+
 # 价格
 def get_price(code: str) -> Dict:
     """查询价格"""
     return _get_default_skill().get_price(code)
 
 
+# 本地镜像
+def sync_mirror(table: str = None) -> Dict:
+    """与飞书全量对账本地 SQLite 镜像（需配置 local_mirror.enabled）"""
+    try:
+        synced = _get_default_skill().storage.sync_mirror(table)
+        if not synced:
+            return {"success": False, "error": "未启用本地镜像（local_mirror.enabled）"}
+        return {"success": True, "synced": synced}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
 # 数据清理
 def clean_data(table: str = None, account: str = None, dry_run: bool = True,
                code: str = None, date_before: str = None,
@@ -0,0 +1,67 @@
+"""
+出入金台账
+
+record_nav 需要当日、当月、各年度、累计和区间等多种口径的资金变动，
+逐个调用 storage.get_cash_flows 会重复下载整张 cash_flow 表。
+CashFlowLedger 由一次加载的出入金列表构建：
+1. 按日、月、年聚合人民币金额（dict，O(1) 查询）
+2. 按日期排序的前缀和，任意区间求和为两次二分查找 O(log n)
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from .models import CashFlow
+
+
+class CashFlowLedger:
+    """只读出入金台账（金额均为 cny_amount）"""
+
+    def __init__(self, cash_flows: List[CashFlow]):
+        self._by_day: Dict[date, float] = {}
+        self._by_month: Dict[Tuple[int, int], float] = {}
+        self._by_year: Dict[int, float] = {}
+
+        for cf in cash_flows:
+            if not cf.flow_date:
+                continue
+            amount = cf.cny_amount or 0
+            d = cf.flow_date
+            self._by_day[d] = self._by_day.get(d, 0.0) + amount
+            self._by_month[(d.year, d.month)] = self._by_month.get((d.year, d.month), 0.0) + amount
+            self._by_year[d.year] = self._by_year.get(d.year, 0.0) + amount
+
+        # 前缀和：_prefix[i] = 前 i 个日期的金额之和
+        self._dates: List[date] = sorted(self._by_day)
+        self._prefix: List[float] = [0.0]
+        for d in self._dates:
+            self._prefix.append(self._prefix[-1] + self._by_day[d])
+
+    @classmethod
+    def load(cls, storage, account: str) -> 'CashFlowLedger':
+        """从存储层一次加载账户全部出入金"""
+        return cls(storage.get_cash_flows(account))
+
+    def day(self, d: date) -> float:
+        """当日资金变动"""
+        return self._by_day.get(d, 0.0)
+
+    def month(self, year: int, month: int) -> float:
+        """当月资金变动"""
+        return self._by_month.get((year, month), 0.0)
+
+    def year(self, year: int) -> float:
+        """当年资金变动"""
+        return self._by_year.get(int(year), 0.0)
+
+    def between(self, start: Optional[date] = None, end: Optional[date] = None) -> float:
+        """区间 [start, end] 资金变动（端点为空表示不限）"""
+        lo = bisect_left(self._dates, start) if start else 0
+        hi = bisect_right(self._dates, end) if end else len(self._dates)
+        if hi <= lo:
+            return 0.0
+        return self._prefix[hi] - self._prefix[lo]
+
+    def total(self) -> float:
+        """累计资金变动"""
+        return self._prefix[-1]
@@ -5,8 +5,9 @@
 """
 import json
 import os
+import re
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
 # 项目根目录（config.json 所在目录）
 _PROJECT_ROOT = Path(__file__).parent.parent
@@ -64,7 +65,19 @@ def get(key: str, default=None):
         "feishu.tables.price_cache": "FEISHU_TABLE_PRICE_CACHE",
         "feishu.tables.nav_history": "FEISHU_TABLE_NAV_HISTORY",
         "feishu.tables.cash_flow": "FEISHU_TABLE_CASH_FLOW",
+        "feishu.qps": "FEISHU_QPS",
+        "feishu.burst": "FEISHU_BURST",
+        "feishu.async_io": "FEISHU_ASYNC_IO",
         "finnhub_api_key": "FINNHUB_API_KEY",
+        "local_mirror.enabled": "PORTFOLIO_LOCAL_MIRROR",
+        "local_mirror.max_staleness": "PORTFOLIO_MIRROR_MAX_STALENESS",
+        "local_mirror.modified_field": "PORTFOLIO_MIRROR_MODIFIED_FIELD",
+        "local_mirror.full_sync_interval": "PORTFOLIO_MIRROR_FULL_SYNC_INTERVAL",
+        "dedup_index.ttl": "PORTFOLIO_DEDUP_TTL",
+        "dedup_index.bloom": "PORTFOLIO_DEDUP_BLOOM",
+        "timeseries.enabled": "PORTFOLIO_TIMESERIES",
+        "price_swr.enabled": "PORTFOLIO_PRICE_SWR",
+        "price_fetcher.async_io": "PORTFOLIO_PRICE_ASYNC_IO",
     }
 
     # 1. 先查环境变量
@@ -105,6 +118,85 @@ def get_start_year() -> int:
     return int(val) if val is not None else 2024
 
 
+def get_feishu_qps() -> float:
+    """飞书 API 请求速率上限（每秒，飞书限制 20 QPS，默认留有余量）"""
+    val = get("feishu.qps")
+    return float(val) if val is not None else 16.0
+
+
+def get_feishu_burst() -> int:
+    """飞书 API 允许的突发请求数（令牌桶容量）"""
+    val = get("feishu.burst")
+    return int(val) if val is not None else 4
+
+
+def _as_bool(val) -> bool:
+    if isinstance(val, str):
+        return val.strip().lower() in ("1", "true", "yes", "on")
+    return bool(val)
+
+
+def is_feishu_async_enabled() -> bool:
+    """是否用异步客户端并发加载报告数据（需要 aiohttp，默认关闭）"""
+    return _as_bool(get("feishu.async_io", False))
+
+
+def is_local_mirror_enabled() -> bool:
+    """是否启用飞书表的本地 SQLite 镜像（默认关闭）"""
+    return _as_bool(get("local_mirror.enabled", False))
+
+
+def get_mirror_max_staleness() -> float:
+    """本地镜像最大陈旧时间（秒），超过后读取前先与飞书全量对账"""
+    val = get("local_mirror.max_staleness")
+    return float(val) if val is not None else 300.0
+
+
+def get_mirror_modified_field() -> Optional[str]:
+    """飞书表中「最后更新时间」字段名（配置后本地镜像走增量同步）"""
+    return get("local_mirror.modified_field")
+
+
+def get_mirror_full_sync_interval() -> float:
+    """本地镜像全量对账间隔（秒），增量同步无法感知远端删除，需定期全量对账"""
+    val = get("local_mirror.full_sync_interval")
+    return float(val) if val is not None else 86400.0
+
+
+def get_dedup_index_ttl() -> float:
+    """防重索引有效期（秒），超过后下次写入前重新加载；0 表示不使用索引"""
+    val = get("dedup_index.ttl")
+    return float(val) if val is not None else 300.0
+
+
+def is_dedup_bloom_enabled() -> bool:
+    """防重索引是否只保留 Bloom 过滤器（省内存，命中时再远程确认，默认关闭）"""
+    return _as_bool(get("dedup_index.bloom", False))
+
+
+def is_timeseries_enabled() -> bool:
+    """是否将日收盘价和净值追加到本地时间序列文件（需要 numpy，默认关闭）"""
+    return _as_bool(get("timeseries.enabled", False))
+
+
+def is_price_swr_enabled() -> bool:
+    """交互式持仓查询是否先返回过期报价、后台刷新（默认开启）"""
+    return _as_bool(get("price_swr.enabled", True))
+
+
+def get_price_max_staleness() -> Dict[str, int]:
+    """按市场覆盖过期报价的最长超期时间（秒），如 {"cn": 900}；未配置的市场用 MarketTimeUtil 默认值"""
+    val = get("price_swr.max_staleness")
+    if not isinstance(val, dict):
+        return {}
+    return {k: int(v) for k, v in val.items() if v not in (None, "")}
+
+
+def is_price_async_enabled() -> bool:
+    """批量获取价格是否走 asyncio 行情引擎（需要 aiohttp，默认关闭）"""
+    return _as_bool(get("price_fetcher.async_io", False))
+
+
 def get_project_root() -> Path:
     """获取项目根目录"""
     return _PROJECT_ROOT
@@ -115,3 +207,8 @@ def get_data_dir() -> Path:
     data_dir = _PROJECT_ROOT / ".data"
     data_dir.mkdir(parents=True, exist_ok=True)
     return data_dir
+
+
+def safe_filename(key: str) -> str:
+    """账户名/序列键转文件名（保留中文，替换路径分隔符等特殊字符）"""
+    return re.sub(r'[\\/:*?"<>|\s]', '_', key.strip())
@@ -0,0 +1,155 @@
+"""
+防重索引
+
+add_transaction / add_cash_flow 每次写入前都要按 request_id、dedup_key 各查一次飞书，
+每笔写入多两次网络往返。DedupIndex 按 (表, 账户) 一次加载全部防重键，之后在内存判断：
+1. 精确模式：保存 键 -> record_id，命中与未命中都是 O(1) 内存查找
+2. Bloom 模式：只保存位数组（大表省内存），未命中 O(1) 判定；可能命中时返回 UNKNOWN，
+   由调用方远程确认（本进程写入的键仍精确记录）
+3. 写入成功后立即登记新键；超过 ttl 视为陈旧，下次查询前重新加载（一次查询）
+4. 加载失败（表中无 dedup_key 字段、网络错误）时返回 UNKNOWN，调用方退回逐条远程查询
+"""
+import hashlib
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class BloomFilter:
+    """定长 Bloom 过滤器（双重哈希）"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class _IndexEntry:
+    """单个 (表, 账户) 的索引状态"""
+
+    __slots__ = ('keys', 'bloom', 'loaded_at', 'ok')
+
+    def __init__(self, loaded_at: float, ok: bool):
+        # 精确键："dedup_key:xxx" / "request_id:xxx" -> record_id
+        # （Bloom 模式下只保存本进程写入的键）
+        self.keys: Dict[str, str] = {}
+        self.bloom: Optional[BloomFilter] = None
+        self.loaded_at = loaded_at
+        self.ok = ok
+
+
+class DedupIndex:
+    """按账户的进程内防重索引（线程安全）"""
+
+    # check 的返回值：索引无法判定，调用方需远程查询
+    UNKNOWN = object()
+
+    # 各表参与防重的字段
+    TABLE_FIELDS = {
+        'transactions': ('dedup_key', 'request_id'),
+        'cash_flow': ('dedup_key',),
+    }
+
+    def __init__(self, loader: Callable[[str, str, Tuple[str, ...]], List[Dict]],
+                 ttl: float = 300.0, bloom: bool = False, error_rate: float = 0.01):
+        """
+        Args:
+            loader: 加载函数 (table, account, field_names) -> 飞书记录列表
+            ttl: 索引有效期（秒）
+            bloom: 是否使用 Bloom 模式
+            error_rate: Bloom 过滤器误判率
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.bloom = bloom
+        self.error_rate = error_rate
+        self._entries: Dict[Tuple[str, str], _IndexEntry] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: str, value: str) -> str:
+        return f"{kind}:{value}"
+
+    def _load(self, table: str, account: str) -> _IndexEntry:
+        fields = self.TABLE_FIELDS[table]
+        entry = _IndexEntry(time.monotonic(), ok=True)
+        try:
+            records = list(self.loader(table, account, fields))
+            if self.bloom:
+                entry.bloom = BloomFilter(max(1024, len(records) * 2), self.error_rate)
+            for record in records:
+                record_fields = record.get('fields', {})
+                for kind in fields:
+                    value = record_fields.get(kind)
+                    if not value:
+                        continue
+                    key = self._key(kind, str(value))
+                    if entry.bloom is not None:
+                        entry.bloom.add(key)
+                    else:
+                        entry.keys.setdefault(key, record['record_id'])
+        except Exception as e:
+            print(f"[警告] 加载防重索引失败({table}/{account})，退回逐条查询: {e}")
+            return _IndexEntry(time.monotonic(), ok=False)
+        return entry
+
+    def _get_entry(self, table: str, account: str) -> _IndexEntry:
+        """获取索引（不存在或超过 ttl 时重新加载），需在锁内调用"""
+        entry = self._entries.get((table, account))
+        if entry is None or time.monotonic() - entry.loaded_at >= self.ttl:
+            entry = self._load(table, account)
+            self._entries[(table, account)] = entry
+        return entry
+
+    def check(self, table: str, account: str, kind: str, value: str):
+        """判断防重键是否已存在
+
+        Returns:
+            record_id（已存在）/ None（确定不存在）/ DedupIndex.UNKNOWN（需远程确认）
+        """
+        if table not in self.TABLE_FIELDS or not value:
+            return self.UNKNOWN
+
+        key = self._key(kind, value)
+        with self._lock:
+            entry = self._get_entry(table, account)
+            if not entry.ok:
+                return self.UNKNOWN
+            if key in entry.keys:
+                return entry.keys[key]
+            if entry.bloom is not None and key in entry.bloom:
+                return self.UNKNOWN
+            return None
+
+    def add(self, table: str, account: str, record_id: str, **keys: Optional[str]):
+        """登记新写入记录的防重键（如 dedup_key=..., request_id=...）"""
+        with self._lock:
+            entry = self._entries.get((table, account))
+            if entry is None or not entry.ok:
+                return
+            for kind, value in keys.items():
+                if value:
+                    entry.keys[self._key(kind, value)] = record_id
+
+    def invalidate(self, table: Optional[str] = None, account: Optional[str] = None):
+        """使索引失效（删除记录后调用，避免已删除的键误判为重复）"""
+        with self._lock:
+            for table_key, account_key in list(self._entries):
+                if (table is None or table_key == table) and (account is None or account_key == account):
+                    del self._entries[(table_key, account_key)]
@@ -0,0 +1,342 @@
+"""
+飞书多维表异步 API 客户端
+
+基于 aiohttp，接口与 FeishuClient 一致（方法均为协程）：
+1. 连接池：单个 ClientSession 复用 TCP/TLS 连接，按 host 限制并发连接数
+2. 每次调用可传 deadline（秒），超时抛出 asyncio.TimeoutError 并取消在途请求
+3. 限流与同步客户端共享同一个进程级令牌桶（acquire_async 不阻塞事件循环）
+
+用法：
+    async with AsyncFeishuClient() as client:
+        holdings, navs = await asyncio.gather(
+            client.list_records('holdings', filter_str=...),
+            client.list_records('nav_history', filter_str=...),
+        )
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from .feishu_client import FeishuClient
+
+
+def _import_aiohttp():
+    """延迟导入 aiohttp（可选依赖）"""
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise ImportError("AsyncFeishuClient 需要 aiohttp，请执行 pip install aiohttp") from e
+    return aiohttp
+
+
+class AsyncFeishuClient(FeishuClient):
+    """飞书多维表异步客户端
+
+    复用 FeishuClient 的凭证、表配置、必填字段校验和令牌桶，仅替换网络 I/O。
+    """
+
+    def __init__(self, app_id: str = None, app_secret: str = None, user_token: str = None,
+                 max_connections: int = 10, default_deadline: Optional[float] = 30.0):
+        """
+        Args:
+            max_connections: 连接池大小（到飞书 host 的最大并发连接数）
+            default_deadline: 单次调用默认截止时间（秒），None 表示不限
+        """
+        super().__init__(app_id=app_id, app_secret=app_secret, user_token=user_token)
+        self.max_connections = max_connections
+        self.default_deadline = default_deadline
+        self._session = None
+        self._async_token_lock: Optional[asyncio.Lock] = None
+
+    # ========== 会话管理 ==========
+
+    async def _get_session(self):
+        """获取（或创建）aiohttp 会话；会话绑定到当前事件循环"""
+        if self._session is None or self._session.closed:
+            aiohttp = _import_aiohttp()
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             limit_per_host=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _with_deadline(self, coro, deadline: Optional[float]):
+        """为一次调用加截止时间（超时会取消其中所有在途请求）"""
+        deadline = self.default_deadline if deadline is None else deadline
+        if deadline is None or deadline <= 0:
+            return await coro
+        return await asyncio.wait_for(coro, timeout=deadline)
+
+    # ========== 认证与请求 ==========
+
+    async def _get_headers_async(self) -> Dict[str, str]:
+        if self.user_token:
+            token = self.user_token
+        else:
+            token = await self._get_tenant_token_async()
+        return {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        }
+
+    async def _get_tenant_token_async(self) -> str:
+        """获取 tenant access token（协程内加锁，并发请求只刷新一次）"""
+        import time
+
+        if self._async_token_lock is None:
+            self._async_token_lock = asyncio.Lock()
+
+        async with self._async_token_lock:
+            now = time.time()
+            if self._tenant_token and now < self._token_expire_time - 300:
+                return self._tenant_token
+
+            if not self.app_id or not self.app_secret:
+                raise ValueError("需要提供 app_id 和 app_secret，请在 config.json 或环境变量中配置")
+
+            session = await self._get_session()
+            url = f"{self.BASE_URL}/auth/v3/tenant_access_token/internal"
+            async with session.post(url, json={'app_id': self.app_id,
+                                               'app_secret': self.app_secret}) as response:
+                response.raise_for_status()
+                data = await response.json()
+
+            if data.get('code') != 0:
+                raise Exception(f"获取 token 失败: {data.get('msg')}")
+
+            self._tenant_token = data['tenant_access_token']
+            self._token_expire_time = now + data['expire']
+            return self._tenant_token
+
+    async def _request(self, method: str, endpoint: str, _retry_count: int = 0, **kwargs) -> Dict:
+        """发送请求（带限流和错误处理，语义同 FeishuClient._request）"""
+        await self._rate_limiter.acquire_async()
+
+        session = await self._get_session()
+        url = f"{self.BASE_URL}{endpoint}"
+        headers = await self._get_headers_async()
+
+        async with session.request(method, url, headers=headers, **kwargs) as response:
+            if response.status == 429:
+                self._rate_limiter.on_throttled()
+                if _retry_count >= 3:
+                    response.raise_for_status()
+                backoff = 1 * (2 ** _retry_count)
+                retry_after = self._retry_after(response)
+            else:
+                response.raise_for_status()
+                self._rate_limiter.on_success()
+                data = await response.json()
+
+        if response.status == 429:
+            await asyncio.sleep(max(retry_after, backoff))
+            return await self._request(method, endpoint, _retry_count=_retry_count + 1, **kwargs)
+
+        if data.get('code') != 0:
+            raise Exception(f"飞书 API 错误: {data.get('msg')} (code={data.get('code')})")
+
+        return data.get('data', {})
+
+    # ========== 读 ==========
+
+    async def list_records(self, table_name: str, filter_str: str = None,
+                           field_names: List[str] = None, page_size: int = 500,
+                           automatic_fields: bool = False, sort: List[str] = None,
+                           deadline: Optional[float] = None) -> List[Dict]:
+        """查询记录列表（参数同 FeishuClient.list_records，deadline 为整次分页查询的截止时间）"""
+        return await self._with_deadline(
+            self._list_records(table_name, filter_str, field_names, page_size,
+                               automatic_fields, sort),
+            deadline
+        )
+
+    async def _list_records(self, table_name, filter_str, field_names, page_size,
+                            automatic_fields, sort) -> List[Dict]:
+        app_token, table_id = self._get_table_config(table_name)
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records"
+
+        params = {'page_size': page_size}
+        if filter_str:
+            params['filter'] = filter_str
+        if field_names:
+            params['field_names'] = json.dumps(field_names)
+        if automatic_fields:
+            params['automatic_fields'] = 'true'
+        if sort:
+            params['sort'] = json.dumps(sort, ensure_ascii=False)
+
+        records = []
+        page_token = None
+        while True:
+            page_params = dict(params)
+            if page_token:
+                page_params['page_token'] = page_token
+            data = await self._request('GET', endpoint, params=page_params)
+            items = data.get('items', [])
+
+            for item in items:
+                record = {'record_id': item['record_id'], 'fields': item['fields']}
+                if automatic_fields:
+                    for key in ('created_time', 'last_modified_time'):
+                        if key in item:
+                            record[key] = item[key]
+                records.append(record)
+
+            page_token = data.get('page_token')
+            if not page_token or not items:
+                break
+
+        return records
+
+    async def list_records_many(self, queries: List[tuple], max_workers: int = 4,
+                                field_names: List[str] = None,
+                                deadline: Optional[float] = None) -> List[List[Dict]]:
+        """并发查询多张表/多个筛选条件（同一事件循环内，无线程开销）
+
+        Args:
+            queries: 同 FeishuClient.list_records_many
+            max_workers: 最大并发查询数
+            deadline: 整体截止时间（秒）
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def run(query):
+            names = query[2] if len(query) > 2 else field_names
+            async with semaphore:
+                return await self._list_records(query[0], query[1], names, 500, False, None)
+
+        return await self._with_deadline(asyncio.gather(*(run(q) for q in queries)), deadline)
+
+    async def list_records_modified_since(self, table_name: str, since_ms: int,
+                                          modified_field: str, page_size: int = 500) -> List[Dict]:
+        """增量查询（逻辑同 FeishuClient.list_records_modified_since）"""
+        app_token, table_id = self._get_table_config(table_name)
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records"
+        params = {'page_size': page_size,
+                  'sort': json.dumps([f"{modified_field} DESC"], ensure_ascii=False)}
+
+        records = []
+        while True:
+            data = await self._request('GET', endpoint, params=params)
+            items = data.get('items', [])
+            for item in items:
+                record = {'record_id': item['record_id'], 'fields': item['fields']}
+                modified = self.record_modified_ms(record, modified_field)
+                if modified is not None and modified < since_ms:
+                    return records
+                records.append(record)
+            page_token = data.get('page_token')
+            if not page_token or not items:
+                return records
+            params = dict(params, page_token=page_token)
+
+    async def get_record(self, table_name: str, record_id: str,
+                         deadline: Optional[float] = None) -> Optional[Dict]:
+        """获取单条记录"""
+        try:
+            app_token, table_id = self._get_table_config(table_name)
+        except ValueError:
+            return None
+
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
+        try:
+            data = await self._with_deadline(self._request('GET', endpoint), deadline)
+            return {'record_id': data['record_id'], 'fields': data['fields']}
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+
+    # ========== 写 ==========
+
+    async def create_record(self, table_name: str, fields: Dict[str, Any],
+                            deadline: Optional[float] = None) -> Dict:
+        """创建记录"""
+        app_token, table_id = self._get_table_config(table_name)
+
+        required = self.REQUIRED_FIELDS.get(table_name, [])
+        for field in required:
+            if field not in fields or fields[field] is None or fields[field] == '':
+                raise ValueError(f"表 {table_name} 缺少必填字段: {field}")
+
+        filtered_fields = {k: v for k, v in fields.items() if v is not None and v != ''}
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records"
+
+        data = await self._with_deadline(
+            self._request('POST', endpoint, json={'fields': filtered_fields}), deadline
+        )
+        return {'record_id': data['record']['record_id'], 'fields': data['record']['fields']}
+
+    async def update_record(self, table_name: str, record_id: str, fields: Dict[str, Any],
+                            deadline: Optional[float] = None) -> Dict:
+        """更新记录"""
+        app_token, table_id = self._get_table_config(table_name)
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
+
+        data = await self._with_deadline(
+            self._request('PUT', endpoint, json={'fields': fields}), deadline
+        )
+        return {'record_id': data['record']['record_id'], 'fields': data['record']['fields']}
+
+    async def delete_record(self, table_name: str, record_id: str,
+                            deadline: Optional[float] = None) -> bool:
+        """删除记录"""
+        try:
+            app_token, table_id = self._get_table_config(table_name)
+        except ValueError:
+            return False
+
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
+        try:
+            await self._with_deadline(self._request('DELETE', endpoint), deadline)
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return False
+
+    async def _batch(self, table_name: str, action: str, items: List,
+                     deadline: Optional[float]) -> List[Dict]:
+        """按 500 条分批调用 batch_* 接口（分批请求并发发出，共享令牌桶）"""
+        if not items:
+            return []
+
+        app_token, table_id = self._get_table_config(table_name)
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records/{action}"
+
+        batch_size = 500
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        responses = await self._with_deadline(
+            asyncio.gather(*(self._request('POST', endpoint, json={'records': b}) for b in batches)),
+            deadline
+        )
+        results = []
+        for data in responses:
+            results.extend(data.get('records', []))
+        return results
+
+    async def batch_create_records(self, table_name: str, records: List[Dict[str, Any]],
+                                   deadline: Optional[float] = None) -> List[Dict]:
+        """批量创建记录"""
+        return await self._batch(table_name, 'batch_create', records, deadline)
+
+    async def batch_update_records(self, table_name: str, records: List[Dict],
+                                   deadline: Optional[float] = None) -> List[Dict]:
+        """批量更新记录"""
+        return await self._batch(table_name, 'batch_update', records, deadline)
+
+    async def batch_delete_records(self, table_name: str, record_ids: List[str],
+                                   deadline: Optional[float] = None) -> int:
+        """批量删除记录，返回删除条数"""
+        return len(await self._batch(table_name, 'batch_delete', record_ids, deadline))
@@ -3,13 +3,16 @@
 支持读写 5 张核心表：holdings, transactions, price_cache, nav_history, cash_flow
 """
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import requests.adapters
 from typing import Dict, List, Optional, Any, Union
 from datetime import datetime
 
 from src import config
+from src.rate_limiter import get_bucket
 
 
 class FeishuClient:
@@ -30,13 +33,17 @@ class FeishuClient:
         self.app_secret = app_secret or config.get("feishu.app_secret")
         self.user_token = user_token or config.get("feishu.user_token")
 
-        # 应用级 token 缓存
+        # 应用级 token 缓存（预取/并行查询会从多个线程刷新，需加锁）
         self._tenant_token = None
         self._token_expire_time = 0
+        self._token_lock = threading.Lock()
 
-        # 限流保护：飞书 API 限制 20 QPS
-        self._last_request_time = 0
-        self._min_interval = 0.06  # 60ms = 约 16 QPS，留有余量
+        # 限流保护：飞书 API 限制 20 QPS，同一凭证的所有实例共享进程级令牌桶
+        self._rate_limiter = get_bucket(
+            f"feishu:{self.app_id or self.user_token or 'default'}",
+            rate=config.get_feishu_qps(),
+            burst=config.get_feishu_burst(),
+        )
 
         # 表配置映射（支持两种配置方式）
         # 方式1（统一base）：FEISHU_APP_TOKEN=bascnxxx + FEISHU_TABLE_HOLDINGS=tblxxx
@@ -89,7 +96,11 @@ class FeishuClient:
             }
 
     def _get_tenant_token(self) -> str:
-        """获取应用级 tenant access token（带缓存）"""
+        """获取应用级 tenant access token（带缓存，线程安全）"""
+        with self._token_lock:
+            return self._refresh_tenant_token()
+
+    def _refresh_tenant_token(self) -> str:
         now = time.time()
 
         if self._tenant_token and now < self._token_expire_time - 300:
@@ -114,12 +125,20 @@ class FeishuClient:
         return self._tenant_token
 
     def _rate_limit(self):
-        """限流控制"""
-        now = time.time()
-        elapsed = now - self._last_request_time
-        if elapsed < self._min_interval:
-            time.sleep(self._min_interval - elapsed)
-        self._last_request_time = time.time()
+        """限流控制（共享令牌桶，线程安全）"""
+        self._rate_limiter.acquire()
+
+    @staticmethod
+    def _retry_after(response) -> float:
+        """从 429 响应头读取建议等待秒数（没有则返回 0）"""
+        for header in ('Retry-After', 'x-ogw-ratelimit-reset'):
+            try:
+                value = float(response.headers.get(header))
+            except (TypeError, ValueError, AttributeError):
+                continue
+            if value > 0:
+                return min(value, 60.0)
+        return 0.0
 
     def _request(self, method: str, endpoint: str, _retry_count: int = 0, **kwargs) -> Dict:
         """发送请求（带限流和错误处理）"""
@@ -130,14 +149,17 @@ class FeishuClient:
 
         response = self.session.request(method, url, headers=headers, **kwargs)
 
-        # 处理限流错误（最多重试3次）
+        # 处理限流错误（最多重试3次）：令牌桶降速，并按服务端建议时间与指数退避中较长者等待
         if response.status_code == 429:
+            self._rate_limiter.on_throttled()
             if _retry_count >= 3:
                 response.raise_for_status()
-            time.sleep(1 * (2 ** _retry_count))  # 指数退避
+            backoff = 1 * (2 ** _retry_count)  # 指数退避，保证重试跨过限流窗口
+            time.sleep(max(self._retry_after(response), backoff))
             return self._request(method, endpoint, _retry_count=_retry_count + 1, **kwargs)
 
         response.raise_for_status()
+        self._rate_limiter.on_success()
         data = response.json()
 
         if data.get('code') != 0:
@@ -162,7 +184,8 @@ class FeishuClient:
         return app_token, table_id
 
     def list_records(self, table_name: str, filter_str: str = None,
-                     field_names: List[str] = None, page_size: int = 500) -> List[Dict]:
+                     field_names: List[str] = None, page_size: int = 500,
+                     automatic_fields: bool = False, sort: List[str] = None) -> List[Dict]:
         """
         查询记录列表
 
@@ -171,37 +194,151 @@ class FeishuClient:
             filter_str: 筛选条件（飞书 filter 语法）
             field_names: 指定返回的字段列表（减少数据传输）
             page_size: 每页数量
+            automatic_fields: 是否返回 created_time / last_modified_time 等系统字段
+            sort: 排序条件，如 ["修改时间 DESC"]
         """
-        app_token, table_id = self._get_table_config(table_name)
-
         records = []
-        page_token = None
+        for items in self._iter_record_pages(table_name, filter_str, field_names,
+                                             page_size, automatic_fields, sort):
+            records.extend(items)
+        return records
+
+    def _iter_record_pages(self, table_name: str, filter_str: str = None,
+                           field_names: List[str] = None, page_size: int = 500,
+                           automatic_fields: bool = False, sort: List[str] = None,
+                           prefetch: bool = True):
+        """逐页返回记录
+
+        prefetch=True 时流水线翻页：拿到本页 page_token 后立即在后台发出下一页请求，
+        调用方处理本页数据与下一页的网络往返重叠。调用方会提前终止时传 prefetch=False，
+        避免多拉一页。
+        """
+        app_token, table_id = self._get_table_config(table_name)
+        endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records"
 
-        while True:
-            endpoint = f"/bitable/v1/apps/{app_token}/tables/{table_id}/records"
-            params = {'page_size': page_size}
+        base_params = {'page_size': page_size}
+        if filter_str:
+            base_params['filter'] = filter_str
+        if field_names:
+            # 飞书API使用field_names参数指定返回字段
+            base_params['field_names'] = json.dumps(field_names)
+        if automatic_fields:
+            base_params['automatic_fields'] = 'true'
+        if sort:
+            base_params['sort'] = json.dumps(sort, ensure_ascii=False)
+
+        def fetch(page_token):
+            params = dict(base_params)
             if page_token:
                 params['page_token'] = page_token
-            if filter_str:
-                params['filter'] = filter_str
-            if field_names:
-                # 飞书API使用field_names参数指定返回字段
-                params['field_names'] = json.dumps(field_names)
-
-            data = self._request('GET', endpoint, params=params)
-            items = data.get('items', [])
-
-            for item in items:
-                record = {
-                    'record_id': item['record_id'],
-                    'fields': item['fields']
-                }
-                records.append(record)
+            return self._request('GET', endpoint, params=params)
 
-            page_token = data.get('page_token')
-            if not page_token or not items:
-                break
+        # 预取线程只在出现第二页时才创建，单页查询（最常见）没有额外开销
+        executor = None
+        pending = None
+        try:
+            data = fetch(None)
+            while True:
+                items = data.get('items', [])
+                page_token = data.get('page_token')
+                has_more = bool(page_token and items)
+                if has_more and prefetch:
+                    if executor is None:
+                        executor = ThreadPoolExecutor(max_workers=1)
+                    pending = executor.submit(fetch, page_token)
+
+                page = []
+                for item in items:
+                    record = {
+                        'record_id': item['record_id'],
+                        'fields': item['fields']
+                    }
+                    if automatic_fields:
+                        for key in ('created_time', 'last_modified_time'):
+                            if key in item:
+                                record[key] = item[key]
+                    page.append(record)
+                yield page
+
+                if not has_more:
+                    break
+                if pending is not None:
+                    data, pending = pending.result(), None
+                else:
+                    data = fetch(page_token)
+        finally:
+            if pending is not None:
+                pending.cancel()
+            if executor:
+                executor.shutdown(wait=False)
+
+    def list_records_many(self, queries: List[tuple], max_workers: int = 4,
+                          field_names: List[str] = None) -> List[List[Dict]]:
+        """
+        并行查询多张表/多个筛选条件
+
+        所有请求共享同一个令牌桶，总 QPS 不超过上限。
+
+        Args:
+            queries: [(table_name, filter_str), ...] 或 [(table_name, filter_str, field_names), ...]，
+                     filter_str 可为 None
+            max_workers: 最大并发数
+            field_names: 各查询默认返回字段（查询自带 field_names 时以查询为准）
 
+        Returns:
+            与 queries 顺序一致的记录列表
+        """
+        if not queries:
+            return []
+
+        def run(query):
+            table_name, filter_str = query[0], query[1]
+            names = query[2] if len(query) > 2 else field_names
+            return self.list_records(table_name, filter_str=filter_str, field_names=names)
+
+        if len(queries) == 1:
+            return [run(queries[0])]
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            return list(executor.map(run, queries))
+
+    @staticmethod
+    def record_modified_ms(record: Dict, modified_field: str) -> Optional[int]:
+        """读取记录「最后更新时间」字段的毫秒时间戳（非数字返回 None）"""
+        value = (record.get('fields') or {}).get(modified_field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        return int(value)
+
+    def list_records_modified_since(self, table_name: str, since_ms: int,
+                                    modified_field: str, page_size: int = 500) -> List[Dict]:
+        """
+        增量查询：只拉取 modified_field >= since_ms 的记录
+
+        按修改时间字段倒序分页，遇到早于水位线的记录即停止翻页，
+        拉取量只与变更条数有关，与表的历史总量无关。
+        排序与停止判断使用同一个字段，该字段须为「最后更新时间」类型（毫秒时间戳），
+        否则无法判断是否越过水位线，会一直翻到最后一页。
+
+        Args:
+            table_name: 表名
+            since_ms: 水位线（毫秒时间戳，含）
+            modified_field: 表中「最后更新时间」类型字段的名称（用于排序）
+            page_size: 每页数量
+        """
+        records = []
+        for items in self._iter_record_pages(table_name, page_size=page_size,
+                                             sort=[f"{modified_field} DESC"],
+                                             prefetch=False):
+            reached_watermark = False
+            for record in items:
+                modified = self.record_modified_ms(record, modified_field)
+                if modified is not None and modified < since_ms:
+                    reached_watermark = True
+                    break
+                records.append(record)
+            if reached_watermark:
+                break
         return records
 
     def get_record(self, table_name: str, record_id: str) -> Optional[Dict]:
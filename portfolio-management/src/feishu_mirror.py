@@ -0,0 +1,569 @@
+"""
+飞书多维表本地 SQLite 镜像
+
+将 holdings / transactions / cash_flow / nav_history / price_cache 五张表
+以 write-through 方式镜像到本地 SQLite：
+1. 读请求在本地完成（按索引查询，无网络往返）
+2. 写请求先写飞书，成功后同步写入本地
+3. 飞书是持久化同步目标，本地副本超过 max_staleness 秒未同步时自动对账：
+   - 配置了「最后更新时间」字段（local_mirror.modified_field）时按水位线增量拉取，
+     只下载上次同步后新增/修改的记录
+   - 未配置、无水位线或距上次全量超过 full_sync_interval 时全量拉取
+     （增量无法感知远端删除，定期全量对账兜底）
+
+MirroredFeishuClient 与 FeishuClient 接口一致，可直接注入 FeishuStorage。
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .feishu_client import FeishuClient
+from . import config
+
+# 默认镜像数据库路径
+MIRROR_DB_FILE = Path(__file__).parent.parent / '.data' / 'feishu_mirror.db'
+
+# 镜像的表
+MIRROR_TABLES = ['holdings', 'transactions', 'cash_flow', 'nav_history', 'price_cache']
+
+# 各表的日期字段（用于 (account, date) 索引）
+DATE_FIELDS = {
+    'transactions': 'tx_date',
+    'cash_flow': 'flow_date',
+    'nav_history': 'date',
+}
+
+# 建有独立索引列的字段
+INDEXED_FIELDS = ('account', 'asset_id', 'market')
+
+# 飞书 filter 单个条件: CurrentValue.[field] = "value"
+_CONDITION_PATTERN = re.compile(r'CurrentValue\.\[([^\]]+)\]\s*=\s*"((?:[^"\\]|\\.)*)"')
+_AND_PATTERN = re.compile(r'\s+AND\s+')
+
+
+def _parse_filter(filter_str: Optional[str]) -> List[Tuple[str, str]]:
+    """解析飞书 filter 字符串为 [(field, value), ...]
+
+    仅支持 FeishuStorage 使用的 `CurrentValue.[x] = "v"` 以 AND 连接的形式，
+    其他语法抛出 ValueError（调用方回退到远程查询）。
+    """
+    if not filter_str:
+        return []
+
+    conditions = []
+    pos = 0
+    text = filter_str.strip()
+    for match in _CONDITION_PATTERN.finditer(text):
+        # 条件之间只允许 AND 连接
+        gap = text[pos:match.start()]
+        if (conditions and not _AND_PATTERN.fullmatch(gap)) or (not conditions and gap.strip()):
+            raise ValueError(f"不支持的 filter 语法: {filter_str}")
+        value = re.sub(r'\\(.)', r'\1', match.group(2))
+        conditions.append((match.group(1), value))
+        pos = match.end()
+
+    if not conditions or text[pos:].strip():
+        raise ValueError(f"不支持的 filter 语法: {filter_str}")
+    return conditions
+
+
+def _date_to_ms(value: Any) -> Optional[int]:
+    """将飞书日期字段值统一转换为毫秒时间戳"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, date):
+        return int(datetime.combine(value, datetime.min.time()).timestamp() * 1000)
+    if isinstance(value, str):
+        try:
+            d = datetime.strptime(value[:10], '%Y-%m-%d')
+            return int(d.timestamp() * 1000)
+        except ValueError:
+            return None
+    return None
+
+
+def _text(value: Any) -> Optional[str]:
+    """索引列统一存为字符串（与飞书 filter 的文本比较语义一致）"""
+    if value is None:
+        return None
+    return str(value)
+
+
+class LocalMirror:
+    """飞书多维表的本地 SQLite 副本
+
+    每张表结构相同：record_id 主键 + 索引列 + 原始 fields JSON。
+    索引：
+    - (account, rec_date): 按账户和日期查询交易、出入金、净值
+    - (asset_id, account, market): 持仓业务主键
+    """
+
+    def __init__(self, db_file: Path = MIRROR_DB_FILE):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        if str(db_file) != ':memory:':
+            Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_file), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    def _init_schema(self):
+        """建表建索引"""
+        with self._lock, self._conn:
+            for table in MIRROR_TABLES:
+                self._conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS "{table}" (
+                        record_id TEXT PRIMARY KEY,
+                        account TEXT,
+                        asset_id TEXT,
+                        market TEXT,
+                        rec_date INTEGER,
+                        fields TEXT NOT NULL
+                    )
+                ''')
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table}_account_date" ON "{table}" (account, rec_date)'
+                )
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table}_asset" ON "{table}" (asset_id, account, market)'
+                )
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    table_name TEXT PRIMARY KEY,
+                    synced_at REAL
+                )
+            ''')
+            # 增量同步水位线：已同步记录的最大 last_modified_time + 上次全量时间
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_watermark (
+                    table_name TEXT PRIMARY KEY,
+                    modified_ms INTEGER,
+                    full_synced_at REAL
+                )
+            ''')
+
+    @staticmethod
+    def _check_table(table: str):
+        if table not in MIRROR_TABLES:
+            raise ValueError(f"未镜像的表: {table}")
+
+    @staticmethod
+    def _to_row(table: str, record: Dict) -> tuple:
+        """飞书记录 -> SQLite 行"""
+        fields = record.get('fields') or {}
+        date_field = DATE_FIELDS.get(table)
+        return (
+            record['record_id'],
+            _text(fields.get('account')),
+            _text(fields.get('asset_id')),
+            _text(fields.get('market')) or '',
+            _date_to_ms(fields.get(date_field)) if date_field else None,
+            json.dumps(fields, ensure_ascii=False),
+        )
+
+    def _upsert_unlocked(self, table: str, records: List[Dict]):
+        self._conn.executemany(
+            f'INSERT OR REPLACE INTO "{table}" '
+            f'(record_id, account, asset_id, market, rec_date, fields) VALUES (?, ?, ?, ?, ?, ?)',
+            [self._to_row(table, r) for r in records if r.get('record_id')]
+        )
+
+    def replace_table(self, table: str, records: List[Dict], modified_field: Optional[str] = None):
+        """全量替换某张表（全量同步/对账）
+
+        Args:
+            modified_field: 「最后更新时间」字段名，用于计算增量同步水位线
+        """
+        self._check_table(table)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(f'DELETE FROM "{table}"')
+            self._upsert_unlocked(table, records)
+            self._mark_synced_unlocked(table, now)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sync_watermark (table_name, modified_ms, full_synced_at) '
+                'VALUES (?, ?, ?)',
+                (table, self._max_modified(records, modified_field), now)
+            )
+
+    def merge_records(self, table: str, records: List[Dict], modified_field: Optional[str] = None):
+        """合并增量同步结果并推进水位线"""
+        self._check_table(table)
+        with self._lock, self._conn:
+            self._upsert_unlocked(table, records)
+            self._mark_synced_unlocked(table)
+            modified_ms = self._max_modified(records, modified_field)
+            if modified_ms is not None:
+                self._conn.execute(
+                    'UPDATE sync_watermark SET modified_ms = MAX(COALESCE(modified_ms, 0), ?) '
+                    'WHERE table_name = ?',
+                    (modified_ms, table)
+                )
+
+    @staticmethod
+    def _max_modified(records: List[Dict], modified_field: Optional[str] = None) -> Optional[int]:
+        """水位线：与增量查询的排序/停止判断使用同一个修改时间字段"""
+        if not modified_field:
+            return None
+        stamps = [FeishuClient.record_modified_ms(r, modified_field) for r in records]
+        stamps = [s for s in stamps if s is not None]
+        return max(stamps) if stamps else None
+
+    def upsert_records(self, table: str, records: List[Dict]):
+        """插入或覆盖记录"""
+        self._check_table(table)
+        if not records:
+            return
+        with self._lock, self._conn:
+            self._upsert_unlocked(table, records)
+
+    def delete_records(self, table: str, record_ids: List[str]):
+        """删除记录"""
+        self._check_table(table)
+        if not record_ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f'DELETE FROM "{table}" WHERE record_id = ?',
+                [(rid,) for rid in record_ids]
+            )
+
+    def get_record(self, table: str, record_id: str) -> Optional[Dict]:
+        """按 record_id 获取单条记录"""
+        self._check_table(table)
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT record_id, fields FROM "{table}" WHERE record_id = ?', (record_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {'record_id': row['record_id'], 'fields': json.loads(row['fields'])}
+
+    def query(self, table: str, conditions: List[Tuple[str, str]] = None,
+              field_names: List[str] = None,
+              date_from: Optional[date] = None, date_to: Optional[date] = None,
+              order_by_date: bool = False, latest_first: bool = False,
+              limit: Optional[int] = None) -> List[Dict]:
+        """按等值条件查询（索引列走 SQL，其余字段在内存中过滤）
+
+        Args:
+            table: 表名
+            conditions: [(field, value), ...]，均为等值比较
+            field_names: 只返回指定字段
+            date_from/date_to: 日期范围（闭区间，仅对有日期字段的表生效）
+            order_by_date: 按日期排序（走 (account, rec_date) 索引）
+            latest_first: 按日期倒序
+            limit: 最多返回条数
+        """
+        self._check_table(table)
+        conditions = conditions or []
+
+        where, params, residual = [], [], []
+        for field, value in conditions:
+            if field in INDEXED_FIELDS:
+                where.append(f'{field} = ?')
+                params.append(value)
+            else:
+                residual.append((field, value))
+        if date_from is not None:
+            where.append('rec_date >= ?')
+            params.append(_date_to_ms(date_from))
+        if date_to is not None:
+            # 飞书日期时间戳不一定落在零点，上界取次日零点（开区间）
+            where.append('rec_date < ?')
+            params.append(_date_to_ms(date_to + timedelta(days=1)))
+
+        sql = f'SELECT record_id, fields FROM "{table}"'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if order_by_date or latest_first:
+            direction = 'DESC' if latest_first else 'ASC'
+            sql += f' ORDER BY rec_date {direction}, rowid {direction}'
+        else:
+            sql += ' ORDER BY rowid'
+        if limit is not None and not residual:
+            # 有内存过滤条件时 LIMIT 需在过滤后生效
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        records = []
+        for row in rows:
+            fields = json.loads(row['fields'])
+            if any(_text(fields.get(f)) != v for f, v in residual):
+                continue
+            if field_names:
+                fields = {k: v for k, v in fields.items() if k in field_names}
+            records.append({'record_id': row['record_id'], 'fields': fields})
+            if limit is not None and len(records) >= limit:
+                break
+        return records
+
+    def _mark_synced_unlocked(self, table: str, synced_at: float = None):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO sync_state (table_name, synced_at) VALUES (?, ?)',
+            (table, synced_at if synced_at is not None else time.time())
+        )
+
+    def invalidate(self, table: str):
+        """标记本地副本失效（下次读取时强制全量对账）"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM sync_state WHERE table_name = ?', (table,))
+            self._conn.execute('DELETE FROM sync_watermark WHERE table_name = ?', (table,))
+
+    def get_watermark(self, table: str) -> Tuple[Optional[int], Optional[float]]:
+        """增量同步水位线
+
+        Returns:
+            (已同步的最大 last_modified_time 毫秒, 上次全量同步时间 Unix 秒)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT modified_ms, full_synced_at FROM sync_watermark WHERE table_name = ?', (table,)
+            ).fetchone()
+        if not row:
+            return None, None
+        return row['modified_ms'], row['full_synced_at']
+
+    def last_synced(self, table: str) -> Optional[float]:
+        """上次与飞书对账的时间（Unix 秒），从未同步返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT synced_at FROM sync_state WHERE table_name = ?', (table,)
+            ).fetchone()
+        return row['synced_at'] if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MirroredFeishuClient:
+    """带本地 SQLite 镜像的飞书客户端（接口与 FeishuClient 一致）
+
+    - 读：本地副本在 max_staleness 内直接本地查询，否则先与飞书对账（增量优先）
+    - 写：先写飞书（保证持久化），成功后写本地
+    - 不支持的 filter 语法回退到远程查询
+    """
+
+    def __init__(self, client: FeishuClient = None, mirror: LocalMirror = None,
+                 max_staleness: Optional[float] = None, modified_field: Optional[str] = None,
+                 full_sync_interval: Optional[float] = None):
+        """
+        Args:
+            client: 底层 FeishuClient，不传则自动创建
+            mirror: LocalMirror 实例，不传则使用默认路径
+            max_staleness: 本地副本最大陈旧时间（秒），默认读取配置
+            modified_field: 「最后更新时间」字段名，不配置则每次全量同步
+            full_sync_interval: 全量对账间隔（秒），默认读取配置
+        """
+        self.client = client or FeishuClient()
+        self.mirror = mirror or LocalMirror()
+        self.max_staleness = (
+            max_staleness if max_staleness is not None else config.get_mirror_max_staleness()
+        )
+        self.modified_field = modified_field or config.get_mirror_modified_field()
+        self.full_sync_interval = (
+            full_sync_interval if full_sync_interval is not None
+            else config.get_mirror_full_sync_interval()
+        )
+        # 同步与写入共用（可重入）
+        self._sync_lock = threading.RLock()
+
+    def __getattr__(self, name):
+        if name in ('client', 'mirror'):
+            raise AttributeError(name)
+        # 其余属性（table_configs、default_app_token 等）透传给底层客户端
+        return getattr(self.client, name)
+
+    # ========== 同步 ==========
+
+    def is_stale(self, table: str) -> bool:
+        """本地副本是否超过陈旧上限"""
+        synced_at = self.mirror.last_synced(table)
+        if synced_at is None:
+            return True
+        return time.time() - synced_at > self.max_staleness
+
+    def sync(self, table: str) -> int:
+        """从飞书全量拉取某张表并替换本地副本（对账）
+
+        Returns:
+            同步的记录数
+        """
+        with self._sync_lock:
+            records = self.client.list_records(table)
+            self.mirror.replace_table(table, records, self.modified_field)
+        return len(records)
+
+    def sync_delta(self, table: str) -> int:
+        """增量同步：只拉取水位线之后新增/修改的记录并合并到本地
+
+        未配置修改时间字段、尚无水位线或距上次全量超过 full_sync_interval 时
+        退化为全量同步。
+
+        Returns:
+            拉取的记录数
+        """
+        modified_ms, full_synced_at = self.mirror.get_watermark(table)
+        if (not self.modified_field or modified_ms is None or full_synced_at is None
+                or time.time() - full_synced_at > self.full_sync_interval):
+            return self.sync(table)
+
+        with self._sync_lock:
+            # 含等于水位线的记录：同一毫秒内的多次修改不会漏，重复合并是幂等的
+            records = self.client.list_records_modified_since(
+                table, modified_ms, self.modified_field
+            )
+            self.mirror.merge_records(table, records, self.modified_field)
+        return len(records)
+
+    def sync_all(self, tables: List[str] = None) -> Dict[str, int]:
+        """同步全部已配置的表
+
+        Returns:
+            {table: 记录数}，未配置的表跳过
+        """
+        results = {}
+        for table in tables or MIRROR_TABLES:
+            if table not in self.client.table_configs:
+                continue
+            results[table] = self.sync(table)
+        return results
+
+    def _ensure_fresh(self, table: str):
+        if self.is_stale(table):
+            self.sync_delta(table)
+
+    # ========== 读 ==========
+
+    def list_records(self, table_name: str, filter_str: str = None,
+                     field_names: List[str] = None, page_size: int = 500,
+                     automatic_fields: bool = False, sort: List[str] = None) -> List[Dict]:
+        """查询记录列表（本地镜像；需要系统字段或排序时回退远程）"""
+        try:
+            if table_name not in MIRROR_TABLES or automatic_fields or sort:
+                raise ValueError(f"本地镜像不支持该查询: {table_name}")
+            conditions = _parse_filter(filter_str)
+        except ValueError:
+            return self.client.list_records(table_name, filter_str=filter_str,
+                                            field_names=field_names, page_size=page_size,
+                                            automatic_fields=automatic_fields, sort=sort)
+
+        self._ensure_fresh(table_name)
+        return self.mirror.query(table_name, conditions, field_names=field_names)
+
+    def list_records_by_date(self, table_name: str, filter_str: str = None,
+                             date_from: Optional[date] = None, date_to: Optional[date] = None,
+                             latest_first: bool = False, limit: Optional[int] = None) -> List[Dict]:
+        """按 (account, 日期) 索引查询，结果按日期排序
+
+        Args:
+            table_name: 有日期字段的表（transactions / cash_flow / nav_history）
+            filter_str: 等值 filter（同 list_records）
+            date_from/date_to: 日期范围（闭区间）
+            latest_first: 是否按日期倒序
+            limit: 最多返回条数
+        """
+        self._ensure_fresh(table_name)
+        return self.mirror.query(table_name, _parse_filter(filter_str),
+                                 date_from=date_from, date_to=date_to,
+                                 order_by_date=True, latest_first=latest_first, limit=limit)
+
+    def list_records_modified_since(self, table_name: str, since_ms: int,
+                                    modified_field: str, page_size: int = 500) -> List[Dict]:
+        """增量查询直接走远程（用于对账本身）"""
+        return self.client.list_records_modified_since(table_name, since_ms, modified_field,
+                                                       page_size=page_size)
+
+    def list_records_many(self, queries: List[tuple], max_workers: int = 4,
+                          field_names: List[str] = None) -> List[List[Dict]]:
+        """批量查询（本地查询无网络往返，顺序执行即可）"""
+        return [self.list_records(q[0], filter_str=q[1],
+                                  field_names=q[2] if len(q) > 2 else field_names)
+                for q in queries]
+
+    def get_record(self, table_name: str, record_id: str) -> Optional[Dict]:
+        """获取单条记录（本地未命中时回退远程）"""
+        if table_name in MIRROR_TABLES:
+            self._ensure_fresh(table_name)
+            record = self.mirror.get_record(table_name, record_id)
+            if record:
+                return record
+        return self.client.get_record(table_name, record_id)
+
+    # ========== 写（write-through） ==========
+    # 写操作与全量同步持有同一把锁：否则同步拉取完成后、替换本地表之前落地的写入
+    # 会被 replace_table 清掉，而表仍被标记为新鲜，去重查询会漏掉新记录
+
+    def _merge_fields(self, table_name: str, record_id: str, fields: Dict) -> Dict:
+        """合并本地已有字段与更新后的字段（飞书更新接口可能只返回部分字段）"""
+        existing = self.mirror.get_record(table_name, record_id)
+        merged = dict(existing['fields']) if existing else {}
+        merged.update(fields or {})
+        return {'record_id': record_id, 'fields': merged}
+
+    def create_record(self, table_name: str, fields: Dict[str, Any]) -> Dict:
+        with self._sync_lock:
+            result = self.client.create_record(table_name, fields)
+            if table_name in MIRROR_TABLES:
+                self.mirror.upsert_records(table_name, [result])
+        return result
+
+    def update_record(self, table_name: str, record_id: str, fields: Dict[str, Any]) -> Dict:
+        with self._sync_lock:
+            result = self.client.update_record(table_name, record_id, fields)
+            if table_name in MIRROR_TABLES:
+                merged = self._merge_fields(table_name, record_id,
+                                            {**fields, **(result.get('fields') or {})})
+                self.mirror.upsert_records(table_name, [merged])
+        return result
+
+    def delete_record(self, table_name: str, record_id: str) -> bool:
+        with self._sync_lock:
+            ok = self.client.delete_record(table_name, record_id)
+            if ok and table_name in MIRROR_TABLES:
+                self.mirror.delete_records(table_name, [record_id])
+        return ok
+
+    def batch_create_records(self, table_name: str, records: List[Dict[str, Any]]) -> List[Dict]:
+        with self._sync_lock:
+            results = self.client.batch_create_records(table_name, records)
+            if table_name in MIRROR_TABLES:
+                self.mirror.upsert_records(table_name, results)
+        return results
+
+    def batch_update_records(self, table_name: str, records: List[Dict]) -> List[Dict]:
+        with self._sync_lock:
+            results = self.client.batch_update_records(table_name, records)
+            if table_name in MIRROR_TABLES:
+                returned = {r.get('record_id'): r.get('fields') or {} for r in results}
+                merged = [
+                    self._merge_fields(table_name, r['record_id'],
+                                       {**r.get('fields', {}), **returned.get(r['record_id'], {})})
+                    for r in records
+                ]
+                self.mirror.upsert_records(table_name, merged)
+        return results
+
+    def batch_delete_records(self, table_name: str, record_ids: List[str]) -> int:
+        with self._sync_lock:
+            deleted = self.client.batch_delete_records(table_name, record_ids)
+            if table_name in MIRROR_TABLES:
+                if deleted == len(record_ids):
+                    self.mirror.delete_records(table_name, record_ids)
+                elif deleted:
+                    # 部分删除成功，无法确定是哪些，下次读取时重新对账
+                    self.mirror.invalidate(table_name)
+        return deleted
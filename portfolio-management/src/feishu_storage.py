@@ -14,27 +14,54 @@ from .models import (
 )
 from .feishu_client import FeishuClient
 from .local_cache import LocalPriceCache
+from .feishu_mirror import MirroredFeishuClient
+from .holding_batch import HoldingBatch
+from .dedup_index import DedupIndex
+from . import config
 
 
 class FeishuStorage:
     """飞书多维表存储层 (带内存缓存优化)"""
 
-    def __init__(self, client: FeishuClient = None):
+    def __init__(self, client: FeishuClient = None, async_client=None):
         """
         初始化飞书存储层
 
         Args:
             client: FeishuClient 实例，如果不传则自动创建
+                    （配置 local_mirror.enabled 时自动包装本地 SQLite 镜像）
+            async_client: AsyncFeishuClient 实例（可选），用于报告数据的并发加载；
+                    不传且配置 feishu.async_io 时自动创建（启用本地镜像时不使用）
         """
-        self.client = client or FeishuClient()
+        if client is None:
+            client = FeishuClient()
+            if config.is_local_mirror_enabled():
+                client = MirroredFeishuClient(client)
+            elif async_client is None and config.is_feishu_async_enabled():
+                from .feishu_async import AsyncFeishuClient
+                async_client = AsyncFeishuClient()
+        self.client = client
+        self.async_client = async_client
 
         # 内存缓存：减少 API 调用次数
         # key: "asset_id:account:market" -> value: record_id
         self._holding_id_cache: Dict[str, str] = {}
 
-        # 本地文件价格缓存（替代飞书多维表）
+        # 本地 SQLite 价格缓存（替代飞书多维表）
         self._local_price_cache = LocalPriceCache()
 
+        # 防重索引：按账户一次加载 dedup_key/request_id，写入前内存判重
+        dedup_ttl = config.get_dedup_index_ttl()
+        self._dedup_index: Optional[DedupIndex] = DedupIndex(
+            self._load_dedup_records, ttl=dedup_ttl, bloom=config.is_dedup_bloom_enabled()
+        ) if dedup_ttl > 0 else None
+
+        # 本地时间序列（日收盘价、净值），供回填/归因/画图离线读取
+        self.timeseries = None
+        if config.is_timeseries_enabled():
+            from .timeseries_store import TimeSeriesStore
+            self.timeseries = TimeSeriesStore()
+
     def _get_holding_cache_key(self, asset_id: str, account: str, market: Optional[str]) -> str:
         """生成持仓缓存 key"""
         return f"{asset_id}:{account}:{market or ''}"
@@ -44,6 +71,23 @@ class FeishuStorage:
         cache_key = self._get_holding_cache_key(asset_id, account, market)
         self._holding_id_cache.pop(cache_key, None)
 
+    # ========== 本地镜像 ==========
+
+    def sync_mirror(self, table: str = None) -> Dict[str, int]:
+        """与飞书全量对账本地镜像
+
+        Args:
+            table: 指定表名，不传则同步全部表
+
+        Returns:
+            {table: 记录数}；未启用本地镜像时返回空字典
+        """
+        if not hasattr(self.client, 'sync_all'):
+            return {}
+        if table:
+            return {table: self.client.sync(table)}
+        return self.client.sync_all()
+
     # ========== 原始记录查询 ==========
 
     def list_raw_records(self, table: str, filter_str: str = None) -> List[Dict]:
@@ -342,7 +386,10 @@ class FeishuStorage:
 
         filter_str = ' AND '.join(conditions) if conditions else None
         records = self.client.list_records('holdings', filter_str=filter_str)
+        return self._records_to_holdings(records, include_empty)
 
+    def _records_to_holdings(self, records: List[Dict], include_empty: bool = False) -> List[Holding]:
+        """飞书持仓记录 -> Holding 列表（过滤空持仓并排序）"""
         holdings = []
         for record in records:
             fields = self._from_feishu_fields(record['fields'], 'holdings')
@@ -467,6 +514,18 @@ class FeishuStorage:
         }
         self.client.update_record('holdings', holding.record_id, update_fields)
 
+    def holding_batch(self, account: str, delete_zero: bool = False) -> HoldingBatch:
+        """创建持仓批量写入（Unit of Work）
+
+        批次内的 add/add_delta 只在内存累计，flush 时用一次 list_records 解析 record_id，
+        再通过 batch_update_records / batch_create_records 提交。
+
+        Args:
+            account: 账户
+            delete_zero: flush 时是否批量删除数量归零的持仓
+        """
+        return HoldingBatch(self, account, delete_zero=delete_zero)
+
     def delete_holding_if_zero(self, asset_id: str, account: str, market: Optional[str] = None):
         """如果持仓为0则删除"""
         holding = self.get_holding(asset_id, account, market)
@@ -483,10 +542,14 @@ class FeishuStorage:
 
     def delete_transaction_by_record_id(self, record_id: str) -> bool:
         """通过记录ID删除交易"""
+        if self._dedup_index is not None:
+            self._dedup_index.invalidate('transactions')
         return self.client.delete_record('transactions', record_id)
 
     def delete_cash_flow_by_record_id(self, record_id: str) -> bool:
         """通过记录ID删除出入金"""
+        if self._dedup_index is not None:
+            self._dedup_index.invalidate('cash_flow')
         return self.client.delete_record('cash_flow', record_id)
 
     def delete_nav_by_record_id(self, record_id: str) -> bool:
@@ -572,15 +635,15 @@ class FeishuStorage:
 
         # 1. request_id 幂等性检查
         if tx.request_id:
-            existing = self._find_by_request_id(tx.request_id)
+            existing = self._find_duplicate('transactions', tx.account, 'request_id', tx.request_id)
             if existing:
                 print(f"[幂等性保护] 发现重复请求(request_id={tx.request_id})，跳过创建")
-                tx.record_id = existing.record_id
+                tx.record_id = existing
                 return tx
 
         # 2. dedup_key 内容指纹检查
         if tx.dedup_key:
-            existing = self._find_by_dedup_key('transactions', tx.dedup_key)
+            existing = self._find_duplicate('transactions', tx.account, 'dedup_key', tx.dedup_key)
             if existing:
                 print(f"[防重保护] 发现相同内容交易(dedup_key={tx.dedup_key})，跳过创建")
                 tx.record_id = existing
@@ -603,8 +666,100 @@ class FeishuStorage:
                 raise
 
         tx.record_id = result['record_id']
+        self._remember_dedup('transactions', tx.account, tx.record_id,
+                             dedup_key=tx.dedup_key, request_id=tx.request_id)
         return tx
 
+    def add_transactions(self, txs: List[Transaction]) -> List[Transaction]:
+        """批量添加交易记录（batch_create_records，每 500 条一次请求）
+
+        不做逐条防重查询，调用方应先用 get_transaction_keys 一次性过滤重复。
+        """
+        if not txs:
+            return txs
+
+        records = []
+        for tx in txs:
+            if not tx.dedup_key:
+                tx.dedup_key = make_tx_dedup_key(tx)
+            fields = self._transaction_to_dict(tx)
+            records.append({'fields': self._to_feishu_fields(fields, 'transactions')})
+
+        try:
+            results = self.client.batch_create_records('transactions', records)
+        except Exception as e:
+            error_msg = str(e)
+            if 'field' in error_msg.lower() or '不存在' in error_msg:
+                # 移除可能不存在的可选字段后重试
+                for record in records:
+                    for optional_field in ('request_id', 'dedup_key'):
+                        record['fields'].pop(optional_field, None)
+                results = self.client.batch_create_records('transactions', records)
+            else:
+                raise
+
+        for tx, result in zip(txs, results):
+            tx.record_id = result.get('record_id')
+            if tx.record_id:
+                self._remember_dedup('transactions', tx.account, tx.record_id,
+                                     dedup_key=tx.dedup_key, request_id=tx.request_id)
+        return txs
+
+    def get_transaction_keys(self, account: str) -> Tuple[set, set]:
+        """一次查询账户全部交易的 dedup_key 和 request_id（批量导入防重用）
+
+        Returns:
+            (dedup_keys, request_ids)
+        """
+        filter_str = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
+        try:
+            records = self.client.list_records('transactions', filter_str=filter_str,
+                                               field_names=['dedup_key', 'request_id'])
+        except Exception as e:
+            # 表中没有 dedup_key/request_id 字段时 field_names 会报错，退回全字段查询
+            print(f"[警告] 按字段查询防重键失败，改为全字段查询: {e}")
+            records = self.client.list_records('transactions', filter_str=filter_str)
+
+        dedup_keys, request_ids = set(), set()
+        for record in records:
+            fields = record.get('fields', {})
+            if fields.get('dedup_key'):
+                dedup_keys.add(str(fields['dedup_key']))
+            if fields.get('request_id'):
+                request_ids.add(str(fields['request_id']))
+        return dedup_keys, request_ids
+
+    def _load_dedup_records(self, table: str, account: str, field_names) -> List[Dict]:
+        """加载账户全部防重键（DedupIndex 的加载函数，一次查询）"""
+        filter_str = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
+        return self.client.list_records(table, filter_str=filter_str, field_names=list(field_names))
+
+    def _find_duplicate(self, table: str, account: str, kind: str, value: str) -> Optional[str]:
+        """查找防重键对应的已有记录
+
+        优先查内存防重索引；索引无法判定（未加载成功、Bloom 可能命中）时退回远程查询。
+
+        Args:
+            kind: 'dedup_key' 或 'request_id'
+
+        Returns:
+            已有记录的 record_id，不存在返回 None
+        """
+        if self._dedup_index is not None:
+            found = self._dedup_index.check(table, account, kind, value)
+            if found is not DedupIndex.UNKNOWN:
+                return found
+
+        if kind == 'request_id':
+            existing = self._find_by_request_id(value)
+            return existing.record_id if existing else None
+        return self._find_by_dedup_key(table, value)
+
+    def _remember_dedup(self, table: str, account: str, record_id: str, **keys):
+        """写入成功后登记防重键"""
+        if self._dedup_index is not None and record_id:
+            self._dedup_index.add(table, account, record_id, **keys)
+
     def _find_by_request_id(self, request_id: str) -> Optional[Transaction]:
         """通过 request_id 查找交易记录（用于幂等性检查）"""
         if not request_id:
@@ -749,7 +904,7 @@ class FeishuStorage:
 
         # dedup_key 内容指纹检查
         if cf.dedup_key:
-            existing = self._find_by_dedup_key('cash_flow', cf.dedup_key)
+            existing = self._find_duplicate('cash_flow', cf.account, 'dedup_key', cf.dedup_key)
             if existing:
                 print(f"[防重保护] 发现相同内容出入金(dedup_key={cf.dedup_key})，跳过创建")
                 cf.record_id = existing
@@ -768,6 +923,7 @@ class FeishuStorage:
             else:
                 raise
         cf.record_id = result['record_id']
+        self._remember_dedup('cash_flow', cf.account, cf.record_id, dedup_key=cf.dedup_key)
         return cf
 
     def get_cash_flow(self, record_id: str) -> Optional[CashFlow]:
@@ -790,7 +946,11 @@ class FeishuStorage:
             conditions.append(f'CurrentValue.[account] = "{account}"')
         filter_str = ' AND '.join(conditions) if conditions else None
         records = self.client.list_records('cash_flow', filter_str=filter_str)
+        return self._records_to_cash_flows(records, start_date, end_date)
 
+    def _records_to_cash_flows(self, records: List[Dict], start_date: Optional[date] = None,
+                               end_date: Optional[date] = None) -> List[CashFlow]:
+        """飞书出入金记录 -> CashFlow 列表（按日期倒序）"""
         cash_flows = []
         for record in records:
             fields = self._from_feishu_fields(record['fields'], 'cash_flow')
@@ -906,77 +1066,175 @@ class FeishuStorage:
         except Exception as e:
             raise RuntimeError(f"保存净值记录失败({nav.account}/{nav.date}): {e}") from e
 
-    def get_nav_history(self, account: str, days: int = 365) -> List[NAVHistory]:
-        """获取净值历史"""
-        from datetime import timedelta
-        start_date = date.today() - timedelta(days=days)
+        if self.timeseries is not None:
+            try:
+                self.timeseries.append_navs(nav.account, [nav])
+            except (OSError, ValueError) as e:
+                print(f"[警告] 写入本地净值序列失败: {e}")
 
-        # 飞书日期字段不支持 >=/<= 比较操作符，只用 account 过滤，日期在客户端筛选
+    def save_navs(self, navs: List[NAVHistory]) -> List[NAVHistory]:
+        """批量新增净值记录（batch_create_records，每 500 条一次请求）
+
+        用于补录缺失日期，不做同日去重，调用方应只传入尚无记录的日期。
+        """
+        if not navs:
+            return navs
+        records = [{'fields': self._to_feishu_fields(self._nav_to_dict(nav), 'nav_history')} for nav in navs]
+        try:
+            results = self.client.batch_create_records('nav_history', records)
+        except Exception as e:
+            raise RuntimeError(f"批量保存净值记录失败({navs[0].account}): {e}") from e
+        for nav, result in zip(navs, results):
+            nav.record_id = result.get('record_id')
+
+        if self.timeseries is not None:
+            try:
+                for account in {nav.account for nav in navs}:
+                    self.timeseries.append_navs(account, [n for n in navs if n.account == account])
+            except (OSError, ValueError) as e:
+                print(f"[警告] 写入本地净值序列失败: {e}")
+        return navs
+
+    def _list_nav_records(self, account: str, date_from: Optional[date] = None,
+                          date_to: Optional[date] = None, latest_first: bool = False,
+                          limit: Optional[int] = None) -> List[NAVHistory]:
+        """按账户和日期范围查询净值记录（已按日期排序）
+
+        启用本地镜像时走 (account, date) 索引，只解码命中的行；
+        否则飞书日期字段不支持 >=/<= 比较操作符，只用 account 过滤，日期在客户端筛选。
+        """
         filter_str = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
-        records = self.client.list_records('nav_history', filter_str=filter_str)
+        if isinstance(self.client, MirroredFeishuClient):
+            records = self.client.list_records_by_date(
+                'nav_history', filter_str=filter_str, date_from=date_from, date_to=date_to,
+                latest_first=latest_first, limit=limit
+            )
+        else:
+            records = self.client.list_records('nav_history', filter_str=filter_str)
+        return self._records_to_navs(records, date_from, date_to, latest_first, limit)
 
+    def _records_to_navs(self, records: List[Dict], date_from: Optional[date] = None,
+                         date_to: Optional[date] = None, latest_first: bool = False,
+                         limit: Optional[int] = None) -> List[NAVHistory]:
+        """飞书净值记录 -> NAVHistory 列表（按日期范围过滤并排序）"""
         navs = []
         for record in records:
             fields = self._from_feishu_fields(record['fields'], 'nav_history')
             fields['record_id'] = record['record_id']
             nav = self._dict_to_nav(fields)
-            if nav.date and nav.date >= start_date:
-                navs.append(nav)
+            if not nav.date:
+                continue
+            if date_from and nav.date < date_from:
+                continue
+            if date_to and nav.date > date_to:
+                continue
+            navs.append(nav)
 
-        navs.sort(key=lambda n: n.date)
-        return navs
+        navs.sort(key=lambda n: n.date, reverse=latest_first)
+        return navs[:limit] if limit is not None else navs
 
-    def get_latest_nav(self, account: str) -> Optional[NAVHistory]:
-        """获取最新净值记录"""
-        filter_str = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
-        records = self.client.list_records('nav_history', filter_str=filter_str)
+    def load_holdings_and_navs(self, account: str, nav_days: int = 9999) -> Tuple[List[Holding], List[NAVHistory]]:
+        """并行加载持仓与净值历史（报告/记录净值时一次取齐，两张表的请求同时进行）
 
-        if not records:
-            return None
+        Returns:
+            (持仓列表, 按日期升序的净值历史)
+        """
+        data = self.load_account_data(account, ('holdings', 'nav_history'), nav_days)
+        return data['holdings'], data['nav_history']
 
-        # 按日期排序取最新
-        navs = []
-        for record in records:
-            fields = self._from_feishu_fields(record['fields'], 'nav_history')
-            fields['record_id'] = record['record_id']
-            navs.append(self._dict_to_nav(fields))
+    def load_account_data(self, account: str,
+                          tables: Tuple[str, ...] = ('holdings', 'nav_history', 'cash_flow'),
+                          nav_days: int = 9999) -> Dict[str, list]:
+        """并行加载账户的多张表（配置异步客户端时走事件循环，否则走线程池）
 
-        navs.sort(key=lambda n: n.date, reverse=True)
-        return navs[0] if navs else None
+        Returns:
+            {'holdings': [Holding], 'nav_history': [NAVHistory], 'cash_flow': [CashFlow]}
+        """
+        if self.async_client is not None and not self._in_event_loop():
+            return self._run_async(self.load_account_data_async(account, tables, nav_days))
 
-    def get_nav_on_date(self, account: str, nav_date: date) -> Optional[NAVHistory]:
-        """获取指定日期的净值记录"""
-        # 飞书日期字段不支持比较操作符，获取全部后客户端筛选
-        filter_str = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
-        records = self.client.list_records('nav_history', filter_str=filter_str)
+        account_filter = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
+        results = self.client.list_records_many([(table, account_filter) for table in tables])
+        decoders = self._account_data_decoders(nav_days)
+        return {table: decoders[table](records) for table, records in zip(tables, results)}
 
-        for record in records:
-            fields = self._from_feishu_fields(record['fields'], 'nav_history')
-            fields['record_id'] = record['record_id']
-            nav = self._dict_to_nav(fields)
-            if nav.date == nav_date:
-                return nav
+    def _account_data_decoders(self, nav_days: int) -> Dict[str, Any]:
+        """load_account_data 各表的记录解码函数"""
+        from datetime import timedelta
+        return {
+            'holdings': self._records_to_holdings,
+            'nav_history': lambda r: self._records_to_navs(
+                r, date_from=date.today() - timedelta(days=nav_days)),
+            'cash_flow': self._records_to_cash_flows,
+        }
 
-        return None
+    async def load_account_data_async(self, account: str,
+                                      tables: Tuple[str, ...] = ('holdings', 'nav_history', 'cash_flow'),
+                                      nav_days: int = 9999,
+                                      deadline: Optional[float] = None) -> Dict[str, list]:
+        """在同一事件循环内并发加载账户的多张表（无线程池开销）
 
-    def get_latest_nav_before(self, account: str, before_date: date) -> Optional[NAVHistory]:
-        """获取指定日期之前的最新净值记录"""
-        # 飞书日期字段不支持比较操作符，获取全部后客户端筛选
-        filter_str = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
-        records = self.client.list_records('nav_history', filter_str=filter_str)
+        Args:
+            tables: 要加载的表（holdings / nav_history / cash_flow）
+            nav_days: 净值历史天数
+            deadline: 整体截止时间（秒），超时取消全部在途请求
 
-        if not records:
-            return None
+        Returns:
+            {'holdings': [Holding], 'nav_history': [NAVHistory], 'cash_flow': [CashFlow]}
+        """
+        if self.async_client is None:
+            raise RuntimeError("未配置 AsyncFeishuClient")
 
-        navs = []
-        for record in records:
-            fields = self._from_feishu_fields(record['fields'], 'nav_history')
-            fields['record_id'] = record['record_id']
-            nav = self._dict_to_nav(fields)
-            if nav.date and nav.date < before_date:
-                navs.append(nav)
+        account_filter = f'CurrentValue.[account] = "{self._escape_filter_value(account)}"'
+        results = await self.async_client.list_records_many(
+            [(table, account_filter) for table in tables], deadline=deadline
+        )
+
+        decoders = self._account_data_decoders(nav_days)
+        return {table: decoders[table](records) for table, records in zip(tables, results)}
+
+    @staticmethod
+    def _in_event_loop() -> bool:
+        import asyncio
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def _run_async(self, coro):
+        """在新事件循环中运行协程，结束后关闭绑定该循环的连接池"""
+        import asyncio
 
-        navs.sort(key=lambda n: n.date, reverse=True)
+        async def runner():
+            try:
+                return await coro
+            finally:
+                await self.async_client.close()
+
+        return asyncio.run(runner())
+
+    def get_nav_history(self, account: str, days: int = 365) -> List[NAVHistory]:
+        """获取净值历史"""
+        from datetime import timedelta
+        start_date = date.today() - timedelta(days=days)
+        return self._list_nav_records(account, date_from=start_date)
+
+    def get_latest_nav(self, account: str) -> Optional[NAVHistory]:
+        """获取最新净值记录"""
+        navs = self._list_nav_records(account, latest_first=True, limit=1)
+        return navs[0] if navs else None
+
+    def get_nav_on_date(self, account: str, nav_date: date) -> Optional[NAVHistory]:
+        """获取指定日期的净值记录"""
+        navs = self._list_nav_records(account, date_from=nav_date, date_to=nav_date, limit=1)
+        return navs[0] if navs else None
+
+    def get_latest_nav_before(self, account: str, before_date: date) -> Optional[NAVHistory]:
+        """获取指定日期之前的最新净值记录"""
+        from datetime import timedelta
+        navs = self._list_nav_records(account, date_to=before_date - timedelta(days=1),
+                                      latest_first=True, limit=1)
         return navs[0] if navs else None
 
     def get_total_shares(self, account: str) -> float:
@@ -1058,6 +1316,35 @@ class FeishuStorage:
     def save_price(self, price: PriceCache):
         """保存价格缓存 - 使用本地文件（零 API 调用）"""
         self._local_price_cache.save(price)
+        self._append_price_history([price])
+
+    def get_prices(self, asset_ids: List[str], include_expired: bool = False) -> Dict[str, Dict]:
+        """批量获取缓存价格（一次查询，返回行字典，带 expired 标记）- 使用本地文件"""
+        return self._local_price_cache.get_many(asset_ids, include_expired=include_expired)
+
+    def save_prices(self, prices: List[PriceCache]):
+        """批量保存价格缓存（一个事务）- 使用本地文件"""
+        if not prices:
+            return
+        self._local_price_cache.save_many(prices)
+        self._append_price_history(prices)
+
+    def _append_price_history(self, prices: List[PriceCache]):
+        """收盘价追加到本地时间序列
+
+        按报价自身的交易日（close_date）落行：盘中报价、无法确定交易日的报价不写入，
+        周末/节假日取到的上一交易日报价落回上一交易日，基金净值落在净值日期。
+        """
+        if self.timeseries is None:
+            return
+        for price in prices:
+            if not price.price or price.close_date is None:
+                continue
+            try:
+                self.timeseries.append_prices(price.asset_id,
+                                              [(price.close_date, price.price, price.cny_price)])
+            except (OSError, ValueError) as e:
+                print(f"[警告] 写入本地价格序列失败: {e}")
 
     def get_all_prices(self) -> List[PriceCache]:
         """获取所有有效价格缓存 - 使用本地文件（零 API 调用）"""
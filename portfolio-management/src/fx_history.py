@@ -0,0 +1,196 @@
+"""
+汇率历史（本地时间序列）
+
+_fetch_exchange_rates 只保留一份当前汇率（内存 + rate_cache.json，24 小时有效），
+历史估值、补录的外币入金（CashFlow.exchange_rate）取不到过去某天的汇率。
+FxHistory 按 (货币对, 日期) 把日汇率存入本地 SQLite：
+
+    .data/fx_history.db   fx_rates(pair, date, rate, source)
+
+1. 写入：实时汇率每天记一条；backfill 从历史数据源批量导入（一个事务）
+2. 读取：按货币对加载为逐日数组（周末/节假日沿用前一个有效汇率），
+   as-of 查询是一次日期差下标访问，O(1)，不走网络
+3. 多进程：与 LocalPriceCache 相同，PRAGMA data_version 变化时重新加载
+"""
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FX_HISTORY_DB = Path(__file__).parent.parent / '.data' / 'fx_history.db'
+
+# 等待其他进程写事务的最长时间（毫秒）
+BUSY_TIMEOUT_MS = 5000
+# as-of 查询允许沿用的最长天数（覆盖长假；超过视为缺数据，需要回填）
+MAX_GAP_DAYS = 10
+
+
+def _to_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+class _PairIndex:
+    """单个货币对的逐日索引（按日历日前向填充）"""
+
+    __slots__ = ('start', 'rates', 'observed')
+
+    def __init__(self, rows: List[Tuple[date, float]]):
+        self.start = rows[0][0]
+        days = (rows[-1][0] - self.start).days + 1
+        self.rates: List[float] = [0.0] * days
+        # observed[i]：第 i 天沿用的实际记录在第几天（用于判断沿用天数）
+        self.observed: List[int] = [0] * days
+        for (d, rate), nxt in zip(rows, rows[1:] + [(None, None)]):
+            i = (d - self.start).days
+            end = (nxt[0] - self.start).days if nxt[0] else days
+            for j in range(i, end):
+                self.rates[j] = rate
+                self.observed[j] = i
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=len(self.rates) - 1)
+
+    def lookup(self, on: date, max_gap: int) -> Optional[float]:
+        i = (on - self.start).days
+        if i < 0:
+            return None
+        j = min(i, len(self.rates) - 1)
+        if i - self.observed[j] > max_gap:
+            return None
+        return self.rates[j]
+
+
+class FxHistory:
+    """本地日汇率时间序列（线程安全，数据库在首次使用时创建）"""
+
+    def __init__(self, db_file: Path = FX_HISTORY_DB):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._index: Dict[str, _PairIndex] = {}
+        self._data_version: Optional[int] = None
+
+    def _connect_unlocked(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if str(self.db_file) != ':memory:':
+                Path(self.db_file).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_file), check_same_thread=False,
+                                   timeout=BUSY_TIMEOUT_MS / 1000)
+            conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            if str(self.db_file) != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS fx_rates (
+                        pair TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        rate REAL NOT NULL,
+                        source TEXT,
+                        updated_at TEXT,
+                        PRIMARY KEY (pair, date)
+                    )
+                ''')
+            self._conn = conn
+        return self._conn
+
+    def _refresh_unlocked(self):
+        """其他连接（进程）提交过写事务时清空索引，按货币对重新加载"""
+        version = self._connect_unlocked().execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._index.clear()
+            self._data_version = version
+
+    def _pair_index_unlocked(self, pair: str) -> Optional[_PairIndex]:
+        if pair not in self._index:
+            rows = [(date.fromisoformat(d), rate) for d, rate in self._conn.execute(
+                'SELECT date, rate FROM fx_rates WHERE pair = ? ORDER BY date', (pair,))]
+            self._index[pair] = _PairIndex(rows) if rows else None
+        return self._index[pair]
+
+    def _exists(self) -> bool:
+        return self._conn is not None or str(self.db_file) == ':memory:' or Path(self.db_file).exists()
+
+    # ========== 写入 ==========
+
+    def put(self, pair: str, rows: Iterable[Tuple], source: str = '') -> int:
+        """写入日汇率（同一货币对同日覆盖）
+
+        Args:
+            pair: 货币对，如 'USDCNY'
+            rows: (日期, 汇率) 列表，日期可为 date 或 'YYYY-MM-DD'
+
+        Returns:
+            写入条数
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        values = [(pair, _to_date(d).isoformat(), float(rate), source, now)
+                  for d, rate in rows if rate]
+        if not values:
+            return 0
+        with self._lock:
+            conn = self._connect_unlocked()
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO fx_rates (pair, date, rate, source, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?)', values)
+            self._index.pop(pair, None)
+        return len(values)
+
+    # ========== 查询 ==========
+
+    def rate(self, pair: str, on, max_gap: int = MAX_GAP_DAYS) -> Optional[float]:
+        """as-of 查询：on 当天或之前最近一个交易日的汇率
+
+        Returns:
+            汇率；早于首条记录或沿用超过 max_gap 天时返回 None
+        """
+        if not self._exists():
+            return None
+        with self._lock:
+            self._refresh_unlocked()
+            index = self._pair_index_unlocked(pair)
+        return index.lookup(_to_date(on), max_gap) if index else None
+
+    def coverage(self, pair: str) -> Optional[Tuple[date, date]]:
+        """已有数据的日期范围 (首日, 末日)"""
+        if not self._exists():
+            return None
+        with self._lock:
+            self._refresh_unlocked()
+            index = self._pair_index_unlocked(pair)
+        return (index.start, index.end) if index else None
+
+    def series(self, pair: str, start=None, end=None) -> List[Tuple[date, float]]:
+        """实际记录（不含前向填充），按日期升序"""
+        if not self._exists():
+            return []
+        sql = 'SELECT date, rate FROM fx_rates WHERE pair = ?'
+        params = [pair]
+        if start:
+            sql += ' AND date >= ?'
+            params.append(_to_date(start).isoformat())
+        if end:
+            sql += ' AND date <= ?'
+            params.append(_to_date(end).isoformat())
+        with self._lock:
+            rows = self._connect_unlocked().execute(sql + ' ORDER BY date', params).fetchall()
+        return [(date.fromisoformat(d), rate) for d, rate in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._index.clear()
+            self._data_version = None
+
+
+# 进程内共享的汇率历史（所有 PriceFetcher 共用）
+fx_history = FxHistory()
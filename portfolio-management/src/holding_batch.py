@@ -0,0 +1,215 @@
+"""
+持仓批量写入（Unit of Work）
+
+逐笔 upsert_holding 每次都要先 list_records 查询当前数量，再 update/create 一次，
+导入一份几十笔成交的对账单就是上百次往返。HoldingBatch 先在内存中累计持仓变动：
+1. flush 时用一次 list_records 拉取账户全部持仓，解析每个变动对应的 record_id
+2. 已存在的持仓合并为一次 batch_update_records，新持仓合并为一次 batch_create_records
+3. 可选：数量归零的持仓合并为一次 batch_delete_records
+
+用法：
+    with storage.holding_batch('lx') as batch:
+        batch.add(Holding(asset_id='000001', ..., quantity=100))
+        batch.add_delta('CNY-CASH', -1000)
+    # 正常退出时自动 flush；块内抛异常则丢弃全部变动
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .models import Holding
+
+
+class HoldingBatch:
+    """单个账户的持仓变动收集器"""
+
+    def __init__(self, storage, account: str, delete_zero: bool = False):
+        """
+        Args:
+            storage: FeishuStorage 实例
+            account: 账户
+            delete_zero: flush 时是否删除数量归零的持仓（同 delete_holding_if_zero）
+        """
+        self.storage = storage
+        self.account = account
+        self.delete_zero = delete_zero
+
+        # (asset_id, market) -> 累计变动数量
+        self._deltas: Dict[Tuple[str, str], float] = {}
+        # (asset_id, market) -> 新建持仓时使用的模板（名称、类型、币种等）
+        self._templates: Dict[Tuple[str, str], Holding] = {}
+        # (asset_id, market) -> 要写入的平均成本价
+        self._avg_costs: Dict[Tuple[str, str], float] = {}
+        # 账户现有持仓（已解码字段 + record_id），按需加载一次
+        self._records: Optional[List[Dict]] = None
+
+    # ========== 收集 ==========
+
+    def add(self, holding: Holding):
+        """累加一笔持仓变动（语义同 upsert_holding：存在则数量累加，否则新建）"""
+        if holding.account != self.account:
+            raise ValueError(f"持仓账户 {holding.account} 与批次账户 {self.account} 不一致")
+        key = (holding.asset_id, holding.market or '')
+        self._deltas[key] = self._deltas.get(key, 0.0) + holding.quantity
+
+        template = self._templates.get(key)
+        if template is None or len(holding.asset_name or '') > len(template.asset_name or ''):
+            self._templates[key] = holding
+
+    def add_delta(self, asset_id: str, quantity_change: float, market: Optional[str] = None):
+        """累加数量变动（语义同 update_holding_quantity：持仓须已存在或已 add 过）"""
+        key = (asset_id, market or '')
+        self._deltas[key] = self._deltas.get(key, 0.0) + quantity_change
+
+    def set_avg_cost(self, asset_id: str, avg_cost: float, market: Optional[str] = None):
+        """flush 时写入平均成本价（持仓须已存在或已 add 过）"""
+        key = (asset_id, market or '')
+        self._deltas.setdefault(key, 0.0)
+        self._avg_costs[key] = avg_cost
+
+    def get_quantity(self, asset_id: str, market: Optional[str] = None) -> float:
+        """当前数量 + 批次内未提交的变动（首次调用时加载账户持仓）"""
+        key = (asset_id, market or '')
+        record = self._resolve(asset_id, market or '')
+        current = float(record['fields'].get('quantity') or 0) if record else 0.0
+        return current + self._deltas.get(key, 0.0)
+
+    def get_holding(self, asset_id: str, market: Optional[str] = None) -> Optional[Holding]:
+        """已存在的持仓（不含批次内变动），匹配规则同 storage.get_holding"""
+        record = self._resolve(asset_id, market or '')
+        if record is None:
+            return None
+        return self.storage._dict_to_holding({**record['fields'], 'record_id': record['record_id']})
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    # ========== 解析 ==========
+
+    def _load_records(self) -> List[Dict]:
+        if self._records is None:
+            filter_str = f'CurrentValue.[account] = "{self.storage._escape_filter_value(self.account)}"'
+            records = self.storage.client.list_records('holdings', filter_str=filter_str)
+            self._records = [
+                {'record_id': r['record_id'],
+                 'fields': self.storage._from_feishu_fields(r['fields'], 'holdings')}
+                for r in records
+            ]
+        return self._records
+
+    def _resolve(self, asset_id: str, market: str) -> Optional[Dict]:
+        """按 get_holding 的规则匹配现有记录
+
+        指定 market 时精确匹配；未指定时优先 market 为空的记录，其次第一条同代码记录。
+        """
+        candidates = [r for r in self._load_records()
+                      if r['fields'].get('asset_id') == asset_id]
+        if market:
+            for record in candidates:
+                if (record['fields'].get('market') or '') == market:
+                    return record
+            return None
+        for record in candidates:
+            if not record['fields'].get('market'):
+                return record
+        return candidates[0] if candidates else None
+
+    # ========== 提交 ==========
+
+    def flush(self) -> Dict[str, int]:
+        """提交全部变动
+
+        Returns:
+            {'updated': n, 'created': n, 'deleted': n}
+        """
+        if not self._deltas:
+            return {'updated': 0, 'created': 0, 'deleted': 0}
+
+        now = datetime.now()
+        now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+
+        updates = []
+        creates = []
+        create_keys = []
+        zero_keys = []
+
+        # 先校验后执行：任何一条无法解析都不发出写请求
+        for asset_id, market in self._deltas:
+            record = self._resolve(asset_id, market)
+            if record is None and (asset_id, market) not in self._templates:
+                raise ValueError(f"持仓不存在: {asset_id}@{self.account}")
+
+        for (asset_id, market), delta in self._deltas.items():
+            record = self._resolve(asset_id, market)
+            template = self._templates.get((asset_id, market))
+
+            if record is not None:
+                fields = record['fields']
+                new_quantity = float(fields.get('quantity') or 0) + delta
+                update_fields = {'quantity': new_quantity, 'updated_at': now_str}
+                if (asset_id, market) in self._avg_costs:
+                    update_fields['avg_cost'] = self._avg_costs[(asset_id, market)]
+
+                # 更新名称（如果新名称更完整）
+                old_name = fields.get('asset_name') or ''
+                if template and template.asset_name and len(template.asset_name) > len(old_name):
+                    update_fields['asset_name'] = template.asset_name
+                    print(f"[持仓名称更新] {old_name} -> {template.asset_name}")
+
+                updates.append({'record_id': record['record_id'], 'fields': update_fields})
+                self._cache_record_id(asset_id, market, record)
+                if self.delete_zero and new_quantity == 0:
+                    zero_keys.append((asset_id, market, record['record_id']))
+            elif self.delete_zero and delta == 0:
+                # 批次内买入又全部卖出：不创建空持仓
+                continue
+            else:
+                update = {'quantity': delta, 'created_at': now, 'updated_at': now}
+                if (asset_id, market) in self._avg_costs:
+                    update['avg_cost'] = self._avg_costs[(asset_id, market)]
+                holding = template.model_copy(update=update)
+                fields = self.storage._holding_to_dict(holding)
+                creates.append({'fields': self.storage._to_feishu_fields(fields, 'holdings')})
+                create_keys.append((asset_id, market))
+
+        client = self.storage.client
+        if updates:
+            client.batch_update_records('holdings', updates)
+        if creates:
+            results = client.batch_create_records('holdings', creates)
+            for (asset_id, market), result in zip(create_keys, results):
+                if result.get('record_id'):
+                    self.storage._holding_id_cache[
+                        self.storage._get_holding_cache_key(asset_id, self.account, market or None)
+                    ] = result['record_id']
+        deleted = 0
+        if zero_keys:
+            deleted = client.batch_delete_records('holdings', [rid for _, _, rid in zero_keys])
+            for asset_id, market, _ in zero_keys:
+                self.storage._invalidate_holding_cache(asset_id, self.account, market or None)
+
+        self._deltas.clear()
+        self._templates.clear()
+        self._avg_costs.clear()
+        self._records = None
+        return {'updated': len(updates), 'created': len(creates), 'deleted': deleted}
+
+    def _cache_record_id(self, asset_id: str, market: str, record: Dict):
+        cache_key = self.storage._get_holding_cache_key(asset_id, self.account, market or None)
+        self.storage._holding_id_cache[cache_key] = record['record_id']
+
+    def discard(self):
+        """丢弃未提交的变动"""
+        self._deltas.clear()
+        self._templates.clear()
+        self._avg_costs.clear()
+        self._records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
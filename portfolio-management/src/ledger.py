@@ -0,0 +1,483 @@
+"""
+持仓账本（由交易流水推导持仓）
+
+holdings 表由 buy/sell/deposit 逐笔累加维护，一旦某次写入失败（buy 中"持仓可以通过
+对账修复"的分支）或被手工改动，就和交易表对不上；查询过去某天的持仓也只能从头重放。
+PositionLedger 把交易表和出入金表视为唯一事实来源（事件流），一次顺序折叠得到
+每个 (资产代码, 券商) 的数量、成本与已实现盈亏：
+
+1. 事件：出入金 -> {币种}-CASH；买入/卖出 -> 对应持仓。按日期排序，同日出入金在前
+2. 现金：人民币买入先扣 CNY-CASH，不足部分扣 CNY-MMF，仍不足时 CNY-CASH 记为负数；
+   人民币卖出回款计入 CNY-CASH（与 buy/sell 默认的 auto_deduct_cash/auto_add_cash 一致，
+   关闭自动扣减录入的交易会与 holdings 表产生差异，由对账报告列出）
+3. 成本：移动加权平均，买入成本含手续费；卖出按平均成本结转，差额计入已实现盈亏
+4. 快照：每折叠 SNAPSHOT_INTERVAL 个事件（在日期边界）记录一次全部持仓，
+   持久化到 .data/ledger/<账户>.json。查询某日持仓时从该日之前最近的有效快照继续折叠，
+   不必从第一笔交易重放。快照记录其覆盖的事件数与事件指纹摘要，历史流水被补录或
+   修改导致摘要不符时该快照作废
+5. 物化：holdings 表是账本的物化视图。reconcile 列出数量不一致的持仓（成本差异、
+   现金/货币基金差异单独列出，仅供参考），materialize 用一次 HoldingBatch 写回
+   （数量归零的持仓删除；现金类默认不动，因为 add_cash/sub_cash 的手工调整不在流水中）
+"""
+import hashlib
+import json
+from bisect import bisect_right
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .asset_utils import detect_asset_type
+from .config import safe_filename
+from .models import AssetType, CashFlow, Holding, Transaction
+
+LEDGER_STATE_DIR = Path(__file__).parent.parent / '.data' / 'ledger'
+
+# 每折叠多少个事件记录一次快照
+SNAPSHOT_INTERVAL = 200
+# 最多保留的快照数（超出时丢弃最早的）
+MAX_SNAPSHOTS = 32
+# 数量/成本比较容差
+EPSILON = 1e-6
+
+PositionKey = Tuple[str, str]
+
+
+def _cash_asset_id(currency: str) -> str:
+    return f'{currency}-CASH'
+
+
+def _is_cash_like(asset_id: str) -> bool:
+    return asset_id.endswith('-CASH') or asset_id.endswith('-MMF')
+
+
+class Position:
+    """单个 (资产代码, 券商) 的持仓状态"""
+
+    __slots__ = ('asset_id', 'market', 'quantity', 'cost', 'realized_pnl',
+                 'currency', 'asset_name', 'asset_type')
+
+    def __init__(self, asset_id: str, market: str = '', quantity: float = 0.0, cost: float = 0.0,
+                 realized_pnl: float = 0.0, currency: str = 'CNY',
+                 asset_name: str = '', asset_type: Optional[str] = None):
+        self.asset_id = asset_id
+        self.market = market
+        self.quantity = quantity
+        # 持仓成本（原币种，含手续费）
+        self.cost = cost
+        self.realized_pnl = realized_pnl
+        self.currency = currency
+        self.asset_name = asset_name
+        self.asset_type = asset_type
+
+    @property
+    def key(self) -> PositionKey:
+        return (self.asset_id, self.market)
+
+    @property
+    def avg_cost(self) -> Optional[float]:
+        """平均成本价（现金/货币基金及空仓为 None）"""
+        if _is_cash_like(self.asset_id) or self.quantity <= EPSILON:
+            return None
+        return self.cost / self.quantity
+
+    def copy(self) -> 'Position':
+        return Position(self.asset_id, self.market, self.quantity, self.cost,
+                        self.realized_pnl, self.currency, self.asset_name, self.asset_type)
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Position':
+        return cls(**{slot: data[slot] for slot in cls.__slots__ if slot in data})
+
+    def to_holding(self, account: str) -> Holding:
+        detected_type, detected_currency, asset_class = detect_asset_type(self.asset_id)
+        asset_type = AssetType(self.asset_type) if self.asset_type else detected_type
+        avg_cost = self.avg_cost
+        return Holding(
+            asset_id=self.asset_id,
+            asset_name=self.asset_name or self.asset_id,
+            asset_type=asset_type,
+            account=account,
+            market=self.market,
+            quantity=round(self.quantity, 8),
+            avg_cost=round(avg_cost, 6) if avg_cost is not None else None,
+            currency=self.currency or detected_currency,
+            asset_class=asset_class,
+        )
+
+    def __repr__(self) -> str:
+        return f"Position({self.asset_id}@{self.market or '-'}, qty={self.quantity}, cost={self.cost})"
+
+
+class LedgerEvent:
+    """账本事件（一笔交易或一笔出入金）"""
+
+    __slots__ = ('date', 'kind', 'asset_id', 'market', 'quantity', 'price', 'fee',
+                 'currency', 'asset_name', 'asset_type', 'fingerprint')
+
+    # 同日排序：出入金在前（先入金再买入）
+    FLOW, TRADE = 0, 1
+
+    def __init__(self, date: date, kind: int, asset_id: str, market: str, quantity: float,
+                 price: float = 0.0, fee: float = 0.0, currency: str = 'CNY',
+                 asset_name: str = '', asset_type: Optional[str] = None):
+        self.date = date
+        self.kind = kind
+        self.asset_id = asset_id
+        self.market = market
+        self.quantity = quantity
+        self.price = price
+        self.fee = fee
+        self.currency = currency
+        self.asset_name = asset_name
+        self.asset_type = asset_type
+        # 内容指纹：任何影响折叠结果的字段变化都会改变快照摘要
+        self.fingerprint = (f"{date}|{kind}|{asset_id}|{market}|{quantity}|{price}|{fee}|{currency}"
+                            f"|{asset_name}|{asset_type}")
+
+    @classmethod
+    def from_transaction(cls, tx: Transaction) -> Optional['LedgerEvent']:
+        if not tx.tx_date or tx.tx_type.value not in ('BUY', 'SELL'):
+            return None
+        # 卖出记录的数量为负；兼容按正数记录的旧数据
+        quantity = -abs(tx.quantity) if tx.tx_type.value == 'SELL' else abs(tx.quantity)
+        return cls(tx.tx_date, cls.TRADE, tx.asset_id, tx.market or '', quantity,
+                   tx.price or 0.0, tx.fee or 0.0, tx.currency or 'CNY', tx.asset_name or '',
+                   tx.asset_type.value if tx.asset_type else None)
+
+    @classmethod
+    def from_cash_flow(cls, cf: CashFlow) -> Optional['LedgerEvent']:
+        if not cf.flow_date or not cf.amount:
+            return None
+        currency = cf.currency or 'CNY'
+        return cls(cf.flow_date, cls.FLOW, _cash_asset_id(currency), '', cf.amount,
+                   1.0, 0.0, currency, f'{currency}现金', AssetType.CASH.value)
+
+
+def apply_event(state: Dict[PositionKey, Position], event: LedgerEvent) -> List[Tuple[PositionKey, float]]:
+    """把一个事件折叠进持仓状态
+
+    Returns:
+        本事件引起的数量变动 [(持仓键, 变动)]
+    """
+    changes = []
+
+    def position(asset_id, market, currency, asset_name='', asset_type=None):
+        key = (asset_id, market)
+        pos = state.get(key)
+        if pos is None:
+            pos = state[key] = Position(asset_id, market, currency=currency,
+                                        asset_name=asset_name, asset_type=asset_type)
+        else:
+            if asset_name and len(asset_name) > len(pos.asset_name or ''):
+                pos.asset_name = asset_name
+            if asset_type and not pos.asset_type:
+                pos.asset_type = asset_type
+        return pos
+
+    def move_cash(asset_id, amount):
+        if asset_id.endswith('-CASH'):
+            pos = position(asset_id, '', 'CNY', 'CNY现金', AssetType.CASH.value)
+        else:
+            pos = position(asset_id, '', 'CNY')
+        pos.quantity += amount
+        pos.cost += amount
+        changes.append((pos.key, amount))
+
+    if event.kind == LedgerEvent.FLOW:
+        pos = position(event.asset_id, event.market, event.currency, event.asset_name, event.asset_type)
+        pos.quantity += event.quantity
+        pos.cost += event.quantity
+        changes.append((pos.key, event.quantity))
+        return changes
+
+    pos = position(event.asset_id, event.market, event.currency, event.asset_name, event.asset_type)
+    quantity = event.quantity
+    if quantity > 0:
+        pos.quantity += quantity
+        pos.cost += quantity * event.price + event.fee
+    elif quantity < 0:
+        sold = -quantity
+        avg = pos.cost / pos.quantity if pos.quantity > EPSILON else event.price
+        pos.realized_pnl += sold * event.price - event.fee - sold * avg
+        pos.quantity -= sold
+        pos.cost = pos.cost - sold * avg if pos.quantity > EPSILON else 0.0
+    changes.append((pos.key, quantity))
+
+    if event.currency == 'CNY' and not event.asset_id.endswith('-CASH'):
+        # 买入扣现金（含手续费），卖出回款（扣手续费）
+        amount = quantity * event.price + event.fee
+        if quantity > 0:
+            # 买入：先扣 CNY-CASH，不足部分扣 CNY-MMF（同 _deduct_cash）
+            remaining = amount
+            for asset_id in ('CNY-CASH', 'CNY-MMF'):
+                held = state.get((asset_id, ''))
+                available = held.quantity if held else 0.0
+                if remaining > 0 and available > 0:
+                    deduct = min(available, remaining)
+                    move_cash(asset_id, -deduct)
+                    remaining -= deduct
+            if remaining > EPSILON:
+                move_cash('CNY-CASH', -remaining)
+        elif quantity < 0:
+            move_cash('CNY-CASH', -amount)
+    return changes
+
+
+def _clean(state: Dict[PositionKey, Position]) -> Dict[PositionKey, Position]:
+    """去掉数量为 0 的持仓（保留副本，调用方可自由修改）"""
+    return {key: pos.copy() for key, pos in state.items() if abs(pos.quantity) > EPSILON}
+
+
+class PositionLedger:
+    """单账户持仓账本"""
+
+    def __init__(self, account: str, transactions: Iterable[Transaction] = (),
+                 cash_flows: Iterable[CashFlow] = (), state_file: Path = None,
+                 persist: bool = True):
+        """
+        Args:
+            account: 账户
+            transactions / cash_flows: 账户全部交易与出入金（顺序不限）
+            state_file: 快照文件，默认 .data/ledger/<账户>.json
+            persist: 是否读写快照文件（False 时只在内存中折叠）
+        """
+        self.account = account
+        self.state_file = state_file or LEDGER_STATE_DIR / f"{safe_filename(account)}.json"
+        self.persist = persist
+
+        events = [LedgerEvent.from_cash_flow(cf) for cf in cash_flows]
+        events += [LedgerEvent.from_transaction(tx) for tx in transactions]
+        # 同日出入金在前；其余按内容排序，使折叠结果与记录的读取顺序无关
+        self.events: List[LedgerEvent] = sorted(
+            (e for e in events if e is not None),
+            key=lambda e: (e.date, e.kind, e.fingerprint))
+        self._dates = [e.date for e in self.events]
+        self._digests: Dict[int, str] = {}
+
+        # 快照：[{'count': 事件数, 'date': 'YYYY-MM-DD', 'digest': ..., 'positions': [...]}]
+        self.snapshots: List[Dict] = []
+        self._dirty = False
+        if persist:
+            self._load_snapshots()
+
+    @classmethod
+    def load(cls, storage, account: str, state_file: Path = None) -> 'PositionLedger':
+        """从存储层读取账户的交易与出入金构建账本"""
+        return cls(account, storage.get_transactions(account), storage.get_cash_flows(account),
+                   state_file)
+
+    # ========== 快照 ==========
+
+    def _digest(self, count: int) -> str:
+        """前 count 个事件的指纹摘要"""
+        if count not in self._digests:
+            self._compute_digests([count])
+        return self._digests[count]
+
+    def _compute_digests(self, counts: Iterable[int]):
+        """一次顺序遍历计算多个前缀摘要"""
+        pending = sorted({n for n in counts if n not in self._digests and n <= len(self.events)})
+        if not pending:
+            return
+        h = hashlib.sha256()
+        done = 0
+        for n in pending:
+            for event in self.events[done:n]:
+                h.update(event.fingerprint.encode())
+                h.update(b'\n')
+            done = n
+            self._digests[n] = h.hexdigest()[:16]
+
+    def _load_snapshots(self):
+        if not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.snapshots = [s for s in data.get('snapshots', [])
+                              if {'count', 'date', 'digest', 'positions'} <= s.keys()]
+        except (json.JSONDecodeError, IOError, AttributeError) as e:
+            print(f"[警告] 持仓账本快照文件损坏，将从头折叠: {e}")
+            self.snapshots = []
+
+    def save(self):
+        """保存快照（无变化或不持久化时跳过）"""
+        if not self._dirty or not self.persist:
+            return
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_file.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'account': self.account, 'snapshots': self.snapshots}, f, ensure_ascii=False)
+            tmp.replace(self.state_file)
+            self._dirty = False
+        except IOError as e:
+            print(f"[警告] 保存持仓账本快照失败: {e}")
+
+    def _restore_point(self, count: int) -> Tuple[Dict[PositionKey, Position], int]:
+        """覆盖事件数不超过 count 的最近有效快照 -> (持仓状态, 已折叠事件数)"""
+        self._compute_digests(s['count'] for s in self.snapshots)
+        for snapshot in sorted(self.snapshots, key=lambda s: s['count'], reverse=True):
+            n = snapshot['count']
+            if n > count or n > len(self.events):
+                continue
+            if snapshot['digest'] != self._digest(n) or (n and self.events[n - 1].date.isoformat() != snapshot['date']):
+                continue
+            state = {}
+            for item in snapshot['positions']:
+                pos = Position.from_dict(item)
+                state[pos.key] = pos
+            return state, n
+        return {}, 0
+
+    def _take_snapshot(self, state: Dict[PositionKey, Position], count: int):
+        if any(s['count'] == count for s in self.snapshots):
+            return
+        # 丢弃与当前事件流不一致的旧快照
+        self._compute_digests([count] + [s['count'] for s in self.snapshots])
+        self.snapshots = [s for s in self.snapshots
+                          if s['count'] <= len(self.events) and s['digest'] == self._digest(s['count'])]
+        self.snapshots.append({
+            'count': count,
+            'date': self.events[count - 1].date.isoformat(),
+            'digest': self._digest(count),
+            'positions': [pos.to_dict() for pos in state.values() if abs(pos.quantity) > EPSILON or pos.realized_pnl],
+        })
+        self.snapshots.sort(key=lambda s: s['count'])
+        del self.snapshots[:-MAX_SNAPSHOTS]
+        self._dirty = True
+
+    # ========== 查询 ==========
+
+    def positions(self, as_of: Optional[date] = None) -> Dict[PositionKey, Position]:
+        """as_of 当天收盘后的持仓（为空时为全部事件之后），不含数量为 0 的持仓
+
+        从最近的有效快照继续折叠；沿途在日期边界每隔 SNAPSHOT_INTERVAL 个事件记录快照，
+        折叠到事件流末尾时也记录一次。有新快照时自动保存。
+        """
+        count = len(self.events) if as_of is None else bisect_right(self._dates, as_of)
+        state, start = self._restore_point(count)
+        last_snapshot = start
+        for i in range(start, count):
+            apply_event(state, self.events[i])
+            folded = i + 1
+            at_boundary = folded == len(self.events) or self.events[folded].date != self.events[i].date
+            if self.persist and at_boundary and (folded - last_snapshot >= SNAPSHOT_INTERVAL
+                                                 or folded == len(self.events)):
+                self._take_snapshot(state, folded)
+                last_snapshot = folded
+        self.save()
+        return _clean(state)
+
+    def quantities(self, as_of: Optional[date] = None) -> Dict[str, float]:
+        """as_of 当天收盘后各资产的数量 {资产代码: 数量}（不同券商合并）"""
+        result: Dict[str, float] = {}
+        for (asset_id, _), pos in self.positions(as_of).items():
+            result[asset_id] = result.get(asset_id, 0.0) + pos.quantity
+        return {k: round(v, 8) for k, v in result.items() if abs(v) > 1e-8}
+
+    def holdings(self, as_of: Optional[date] = None) -> List[Holding]:
+        """as_of 当天的持仓（Holding 列表，排序同 get_holdings）"""
+        holdings = [pos.to_holding(self.account) for pos in self.positions(as_of).values()]
+        holdings.sort(key=lambda h: (h.asset_type.value if h.asset_type else '', h.asset_id, h.market))
+        return holdings
+
+    def deltas(self) -> List[Tuple[date, str, float]]:
+        """逐事件的数量变动 (日期, 资产代码, 变动)，按事件顺序（用于净值回放）"""
+        state: Dict[PositionKey, Position] = {}
+        result = []
+        for event in self.events:
+            for (asset_id, _), delta in apply_event(state, event):
+                result.append((event.date, asset_id, delta))
+        return result
+
+    # ========== 对账与物化 ==========
+
+    def reconcile(self, holdings: List[Holding], include_cash: bool = False) -> Dict[str, List[Dict]]:
+        """账本与 holdings 表逐项比较
+
+        只有数量不一致才算持仓不一致（diffs）；其余差异仅供参考：
+        - 现金/货币基金：add_cash/sub_cash 等手工调整不在流水中，默认单独列出（cash_diffs）
+        - 成本：buy 写入路径不维护 avg_cost，表中为空的列为 missing_cost，
+          表中有值但与账本不同的列为 cost_diffs
+
+        Args:
+            holdings: holdings 表中该账户的持仓（应包含数量为 0 的记录）
+            include_cash: 现金/货币基金的数量差异是否计入 diffs
+
+        Returns:
+            {'diffs', 'cash_diffs', 'cost_diffs', 'missing_cost'}，每项为
+            [{'asset_id', 'market', 'ledger_quantity', 'table_quantity', 'ledger_avg_cost', 'table_avg_cost'}]
+        """
+        ledger = self.positions()
+        table = {}
+        for h in holdings:
+            key = (h.asset_id, h.market or '')
+            if key in table:
+                table[key] = table[key].model_copy(update={'quantity': table[key].quantity + h.quantity})
+            else:
+                table[key] = h
+
+        result = {'diffs': [], 'cash_diffs': [], 'cost_diffs': [], 'missing_cost': []}
+        for key in sorted(set(ledger) | set(table)):
+            pos, holding = ledger.get(key), table.get(key)
+            ledger_qty = round(pos.quantity, 8) if pos else 0.0
+            table_qty = holding.quantity if holding else 0.0
+            ledger_avg = pos.avg_cost if pos else None
+            table_avg = holding.avg_cost if holding else None
+            item = {
+                'asset_id': key[0],
+                'market': key[1],
+                'ledger_quantity': ledger_qty,
+                'table_quantity': table_qty,
+                'ledger_avg_cost': round(ledger_avg, 6) if ledger_avg is not None else None,
+                'table_avg_cost': table_avg,
+            }
+
+            if abs(ledger_qty - table_qty) > EPSILON:
+                result['cash_diffs' if _is_cash_like(key[0]) and not include_cash else 'diffs'].append(item)
+            if ledger_avg is None or holding is None:
+                continue
+            if table_avg is None:
+                result['missing_cost'].append(item)
+            elif abs(ledger_avg - table_avg) > EPSILON * max(1.0, abs(ledger_avg)):
+                result['cost_diffs'].append(item)
+        return result
+
+    def materialize(self, storage, dry_run: bool = False, include_cash: bool = False) -> Dict:
+        """把账本写回 holdings 表（一次 HoldingBatch，数量归零的持仓删除）
+
+        修正 diffs 中的数量，并为 cost_diffs/missing_cost 写入账本的平均成本。
+        现金/货币基金默认不写（见 reconcile），include_cash=True 时一并按账本修正。
+
+        Returns:
+            reconcile 的结果 + {'updated': n, 'created': n, 'deleted': n}
+        """
+        report = self.reconcile(storage.get_holdings(account=self.account, include_empty=True),
+                                include_cash=include_cash)
+        result = {**report, 'updated': 0, 'created': 0, 'deleted': 0}
+        quantity_fixes = {(d['asset_id'], d['market']): d['ledger_quantity'] - d['table_quantity']
+                          for d in report['diffs']}
+        cost_fixes = {(d['asset_id'], d['market']) for d in report['cost_diffs'] + report['missing_cost']}
+        if dry_run or not (quantity_fixes or cost_fixes):
+            return result
+
+        ledger = self.positions()
+        with storage.holding_batch(self.account, delete_zero=True) as batch:
+            for key in sorted(set(quantity_fixes) | cost_fixes):
+                delta = quantity_fixes.get(key, 0.0)
+                pos = ledger.get(key)
+                if pos is None:
+                    batch.add_delta(key[0], delta, key[1])
+                    continue
+                batch.add(pos.to_holding(self.account).model_copy(update={'quantity': delta}))
+                if pos.avg_cost is not None:
+                    batch.set_avg_cost(pos.asset_id, round(pos.avg_cost, 6), pos.market)
+            counts = batch.flush()
+        result.update(counts)
+        print(f"[持仓对账] {self.account} 已按账本修正 {len(quantity_fixes)} 项数量、{len(cost_fixes)} 项成本"
+              f"（更新 {counts['updated']}，新建 {counts['created']}，删除 {counts['deleted']}）")
+        return result
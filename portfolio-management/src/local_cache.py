@@ -1,178 +1,323 @@
 """
 本地价格缓存模块
 
-从 feishu_storage.py 提取。使用本地 JSON 文件存储价格缓存，
+从 feishu_storage.py 提取。使用本地 SQLite 存储价格缓存，
 替代飞书多维表存储，节省 API 配额。
+
+早期版本将整个缓存 dict 以 JSON 整文件重写（每保存一条价格重写一次）。
+现改为 SQLite（WAL 模式）：
+1. 每次保存只写入变化的一行（INSERT OR REPLACE）
+2. 事务保证原子性，多进程并发读写不会损坏文件
+3. 首次启动时自动迁移旧的 price_cache.json，迁移后重命名为 .json.migrated
+
+多进程共享（定时 record_nav 与交互式查询同时运行时共用一份热缓存）：
+1. 读：内存行缓存 + PRAGMA data_version 校验，其他进程提交后自动重新加载；
+   数据库开启 mmap I/O，重新加载时直接读映射页
+2. 写：busy_timeout 等待其他进程的写事务，而不是立即报 database is locked
+3. 迁移：在文件锁内进行，多个进程同时启动时只有一个导入旧 JSON
 """
 import json
+import sqlite3
 import threading
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
 
 from .models import AssetType, PriceCache
 
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl，迁移时不加文件锁
+    fcntl = None
+
 # 默认缓存文件路径
+PRICE_CACHE_DB = Path(__file__).parent.parent / '.data' / 'price_cache.db'
+# 旧版 JSON 缓存（仅用于迁移）
 PRICE_CACHE_FILE = Path(__file__).parent.parent / '.data' / 'price_cache.json'
 
+# 等待其他进程写事务的最长时间（毫秒）
+BUSY_TIMEOUT_MS = 5000
+# SQLite 内存映射 I/O 上限（字节）
+MMAP_SIZE = 64 * 1024 * 1024
+
+_COLUMNS = ('asset_id', 'asset_name', 'asset_type', 'price', 'currency', 'cny_price',
+            'change', 'change_pct', 'exchange_rate', 'data_source', 'expires_at', 'updated_at')
+
+
+def _now_str() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+@contextmanager
+def _file_lock(lock_file: Path):
+    """进程间互斥（fcntl 建议锁，不支持的平台退化为无锁）"""
+    if fcntl is None:
+        yield
+        return
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_file, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
 
 class LocalPriceCache:
-    """本地文件价格缓存（替代飞书多维表存储）
+    """本地 SQLite 价格缓存（替代飞书多维表存储）
 
     特性：
     1. 零 API 调用 - 本地文件读写
-    2. 低延迟 - 无需网络请求
-    3. 自动过期清理
-    4. 线程安全 - 使用锁保护并发访问
+    2. 低延迟 - 读取命中内存行缓存，仅一次 PRAGMA 校验
+    3. 增量写入 - 保存只写变化的一行
+    4. 自动过期清理
+    5. 线程安全 - 使用锁保护共享连接；进程间由 SQLite 事务保证一致，
+       其他进程写入的价格在下次读取时可见
     """
 
-    def __init__(self, cache_file: Path = PRICE_CACHE_FILE):
-        self.cache_file = cache_file
-        self._cache: Dict[str, Dict] = {}
+    def __init__(self, db_file: Path = PRICE_CACHE_DB, legacy_file: Optional[Path] = PRICE_CACHE_FILE):
+        self.db_file = db_file
+        self.legacy_file = legacy_file
         self._lock = threading.Lock()
-        self._load()
+        if str(db_file) != ':memory:':
+            Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_file), check_same_thread=False,
+                                     timeout=BUSY_TIMEOUT_MS / 1000)
+        self._conn.row_factory = sqlite3.Row
+        # 内存行缓存：{asset_id: 行字典}，_data_version 变化时重新加载
+        self._rows: Dict[str, Dict] = {}
+        self._data_version: Optional[int] = None
+        self._init_schema()
+        self._migrate_legacy()
+
+    def _init_schema(self):
+        """建表（WAL 模式：读写互不阻塞）"""
+        with self._lock:
+            self._conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            if str(self.db_file) != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute('PRAGMA synchronous=NORMAL')
+                self._conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+            with self._conn:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS price_cache (
+                        asset_id TEXT PRIMARY KEY,
+                        asset_name TEXT,
+                        asset_type TEXT,
+                        price REAL,
+                        currency TEXT,
+                        cny_price REAL,
+                        change REAL,
+                        change_pct REAL,
+                        exchange_rate REAL,
+                        data_source TEXT,
+                        expires_at TEXT,
+                        updated_at TEXT
+                    )
+                ''')
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_price_cache_expires ON price_cache (expires_at)'
+                )
 
-    def _load_unlocked(self):
-        """从文件加载缓存（无锁版本，需在锁内调用）"""
-        if self.cache_file.exists():
+    def _migrate_legacy(self):
+        """迁移旧版 JSON 缓存（只导入一次，完成后重命名原文件）"""
+        if not self.legacy_file or not Path(self.legacy_file).exists():
+            return
+        legacy = Path(self.legacy_file)
+        with _file_lock(legacy.with_suffix('.lock')):
+            # 拿到锁后再检查一次：其他进程可能已完成迁移
+            if not legacy.exists():
+                return
             try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self._cache = json.load(f)
+                with open(legacy, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
             except (json.JSONDecodeError, IOError):
-                self._cache = {}
-        else:
-            self._cache = {}
+                data = {}
 
-    def _load(self):
-        """从文件加载缓存 - 线程安全"""
-        with self._lock:
-            self._load_unlocked()
+            rows = [(entry.get('asset_id') or asset_id, *(entry.get(col) for col in _COLUMNS[1:]))
+                    for asset_id, entry in data.items() if isinstance(entry, dict)]
+            with self._lock, self._conn:
+                # 已存在的行保留（可能是其他进程迁移后写入的新价格）
+                self._conn.executemany(
+                    f'INSERT OR IGNORE INTO price_cache ({", ".join(_COLUMNS)}) '
+                    f'VALUES ({", ".join("?" * len(_COLUMNS))})', rows
+                )
+                self._data_version = None
+            try:
+                legacy.replace(Path(str(legacy) + '.migrated'))
+            except OSError as e:
+                print(f"[警告] 重命名旧价格缓存文件失败: {e}")
+        if rows:
+            print(f"[本地缓存] 已迁移 {len(rows)} 条价格缓存到 SQLite")
 
-    def _save_unlocked(self):
-        """保存缓存到文件（无锁版本，需在锁内调用）"""
-        try:
-            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self._cache, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            print(f"[警告] 保存本地价格缓存失败: {e}")
+    # ========== 内存行缓存 ==========
+
+    def _refresh_unlocked(self):
+        """其他连接（进程）提交过写事务时重新加载全部行（需在锁内调用）
+
+        PRAGMA data_version 只在其他连接提交后变化，本连接的写入直接同步到 _rows。
+        """
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return
+        self._rows = {row['asset_id']: dict(row)
+                      for row in self._conn.execute('SELECT * FROM price_cache')}
+        self._data_version = version
+
+    @staticmethod
+    def _row_to_price(row) -> PriceCache:
+        """SQLite 行 -> PriceCache"""
+        data = dict(row)
+        expires_at = data.get('expires_at') or ''
+        return PriceCache(
+            asset_id=data.get('asset_id', ''),
+            asset_name=data.get('asset_name'),
+            asset_type=AssetType(data.get('asset_type')) if data.get('asset_type') else AssetType.OTHER,
+            price=float(data.get('price') or 0),
+            currency=data.get('currency') or 'CNY',
+            cny_price=float(data.get('cny_price')) if data.get('cny_price') else None,
+            change=float(data.get('change')) if data.get('change') else None,
+            change_pct=float(data.get('change_pct')) if data.get('change_pct') else None,
+            exchange_rate=float(data.get('exchange_rate')) if data.get('exchange_rate') else None,
+            data_source=data.get('data_source'),
+            expires_at=expires_at if expires_at else None
+        )
 
     def get(self, asset_id: str) -> Optional[PriceCache]:
-        """获取价格缓存（检查有效期）- 线程安全"""
+        """获取价格缓存（检查有效期）- 线程安全
+
+        过期条目直接视为未命中，不在读路径上删除（由 clear_expired / get_all 统一清理）。
+        """
         with self._lock:
-            data = self._cache.get(asset_id)
-            if not data:
-                return None
-
-            # 检查过期时间
-            expires_at = data.get('expires_at', '')
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            if expires_at and expires_at < now:
-                self._delete_unlocked(asset_id)
-                return None
-
-            return PriceCache(
-                asset_id=data.get('asset_id', ''),
-                asset_name=data.get('asset_name'),
-                asset_type=AssetType(data.get('asset_type')) if data.get('asset_type') else AssetType.OTHER,
-                price=float(data.get('price', 0)),
-                currency=data.get('currency', 'CNY'),
-                cny_price=float(data.get('cny_price')) if data.get('cny_price') else None,
-                change=float(data.get('change')) if data.get('change') else None,
-                change_pct=float(data.get('change_pct')) if data.get('change_pct') else None,
-                exchange_rate=float(data.get('exchange_rate')) if data.get('exchange_rate') else None,
-                data_source=data.get('data_source'),
-                expires_at=expires_at if expires_at else None
-            )
+            self._refresh_unlocked()
+            row = self._rows.get(asset_id)
+        if not row:
+            return None
+        if row['expires_at'] and row['expires_at'] < _now_str():
+            return None
+        return self._row_to_price(row)
 
     def save(self, price: PriceCache):
-        """保存价格缓存 - 线程安全"""
+        """保存价格缓存 - 线程安全（只写这一行）"""
+        self.save_many([price])
+
+    @staticmethod
+    def _price_to_row(price: PriceCache, now: str) -> tuple:
+        """PriceCache -> SQLite 行"""
         expires_at_str = None
         if price.expires_at:
             if isinstance(price.expires_at, datetime):
                 expires_at_str = price.expires_at.strftime('%Y-%m-%d %H:%M:%S')
             else:
                 expires_at_str = price.expires_at
+        return (
+            price.asset_id,
+            price.asset_name,
+            price.asset_type.value if price.asset_type else None,
+            price.price,
+            price.currency,
+            price.cny_price,
+            price.change,
+            price.change_pct,
+            price.exchange_rate,
+            price.data_source,
+            expires_at_str,
+            now,
+        )
+
+    def save_many(self, prices: List[PriceCache]):
+        """批量保存价格缓存 - 线程安全（一次加锁、一个事务）"""
+        if not prices:
+            return
+        now = _now_str()
+        rows = [self._price_to_row(p, now) for p in prices]
+        try:
+            with self._lock:
+                # 先同步其他进程的写入，再叠加本次写入
+                self._refresh_unlocked()
+                with self._conn:
+                    self._conn.executemany(
+                        f'INSERT OR REPLACE INTO price_cache ({", ".join(_COLUMNS)}) '
+                        f'VALUES ({", ".join("?" * len(_COLUMNS))})', rows
+                    )
+                for row in rows:
+                    self._rows[row[0]] = dict(zip(_COLUMNS, row))
+        except sqlite3.Error as e:
+            print(f"[警告] 保存本地价格缓存失败: {e}")
+
+    def get_many(self, asset_ids: List[str], include_expired: bool = False) -> Dict[str, Dict]:
+        """批量获取价格缓存 - 线程安全（一次加锁，命中内存行缓存）
+
+        返回原始行字典（列名同表结构），不构建 PriceCache 模型，并附加 expired 标记。
 
+        Args:
+            asset_ids: 资产代码列表
+            include_expired: 是否返回已过期条目（用于获取失败时 fallback）
+
+        Returns:
+            {asset_id: 行字典}，未命中的代码不出现在结果中
+        """
+        if not asset_ids:
+            return {}
+        now = _now_str()
         with self._lock:
-            self._cache[price.asset_id] = {
-                'asset_id': price.asset_id,
-                'asset_name': price.asset_name,
-                'asset_type': price.asset_type.value if price.asset_type else None,
-                'price': price.price,
-                'currency': price.currency,
-                'cny_price': price.cny_price,
-                'change': price.change,
-                'change_pct': price.change_pct,
-                'exchange_rate': price.exchange_rate,
-                'data_source': price.data_source,
-                'expires_at': expires_at_str,
-                'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            self._save_unlocked()
-
-    def _delete_unlocked(self, asset_id: str):
-        """删除价格缓存（无锁版本，需在锁内调用）"""
-        if asset_id in self._cache:
-            del self._cache[asset_id]
-            self._save_unlocked()
+            self._refresh_unlocked()
+            rows = [self._rows[i] for i in dict.fromkeys(asset_ids) if i in self._rows]
+
+        result = {}
+        for row in rows:
+            data = dict(row)
+            data['expired'] = bool(data['expires_at']) and data['expires_at'] < now
+            if data['expired'] and not include_expired:
+                continue
+            result[data['asset_id']] = data
+        return result
 
     def delete(self, asset_id: str):
         """删除价格缓存 - 线程安全"""
         with self._lock:
-            self._delete_unlocked(asset_id)
+            self._refresh_unlocked()
+            with self._conn:
+                self._conn.execute('DELETE FROM price_cache WHERE asset_id = ?', (asset_id,))
+            self._rows.pop(asset_id, None)
+
+    def _purge_expired_unlocked(self, now: str) -> int:
+        """删除过期条目（需在锁内调用）"""
+        self._refresh_unlocked()
+        with self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM price_cache WHERE expires_at IS NOT NULL AND expires_at != '' "
+                "AND expires_at < ?", (now,)
+            )
+        if cursor.rowcount:
+            self._rows = {k: v for k, v in self._rows.items()
+                          if not (v['expires_at'] and v['expires_at'] < now)}
+        return cursor.rowcount
 
     def get_all(self) -> List[PriceCache]:
         """获取所有未过期的价格缓存 - 线程安全"""
         with self._lock:
-            results = []
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            expired_ids = []
-
-            cache_items = list(self._cache.items())
-
-            for asset_id, data in cache_items:
-                expires_at = data.get('expires_at', '')
-                if expires_at and expires_at < now:
-                    expired_ids.append(asset_id)
-                    continue
-
-                try:
-                    results.append(PriceCache(
-                        asset_id=data.get('asset_id', ''),
-                        asset_name=data.get('asset_name'),
-                        asset_type=AssetType(data.get('asset_type')) if data.get('asset_type') else AssetType.OTHER,
-                        price=float(data.get('price', 0)),
-                        currency=data.get('currency', 'CNY'),
-                        cny_price=float(data.get('cny_price')) if data.get('cny_price') else None,
-                        change=float(data.get('change')) if data.get('change') else None,
-                        change_pct=float(data.get('change_pct')) if data.get('change_pct') else None,
-                        exchange_rate=float(data.get('exchange_rate')) if data.get('exchange_rate') else None,
-                        data_source=data.get('data_source'),
-                        expires_at=expires_at if expires_at else None
-                    ))
-                except (ValueError, TypeError):
-                    continue
-
             # 清理过期数据
-            for asset_id in expired_ids:
-                self._cache.pop(asset_id, None)
-            if expired_ids:
-                self._save_unlocked()
+            self._purge_expired_unlocked(_now_str())
+            rows = list(self._rows.values())
 
-            return results
+        results = []
+        for row in rows:
+            try:
+                results.append(self._row_to_price(row))
+            except (ValueError, TypeError):
+                continue
+        return results
 
     def clear_expired(self):
         """清理所有过期缓存 - 线程安全"""
         with self._lock:
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            expired_ids = [
-                asset_id for asset_id, data in self._cache.items()
-                if data.get('expires_at') and data['expires_at'] < now
-            ]
-            for asset_id in expired_ids:
-                self._cache.pop(asset_id, None)
-            if expired_ids:
-                self._save_unlocked()
-                print(f"[本地缓存] 清理 {len(expired_ids)} 条过期价格缓存")
+            removed = self._purge_expired_unlocked(_now_str())
+        if removed:
+            print(f"[本地缓存] 清理 {removed} 条过期价格缓存")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
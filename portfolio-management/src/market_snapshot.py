@@ -0,0 +1,113 @@
+"""
+全市场快照缓存（AKShare 备用源）
+
+AKShare 的实时行情/基金排行接口一次下载整个市场（A股约 5000 行、场外基金上万行，
+耗时 20-30 秒），原先备用路径每个代码下载一次只取一行，5 个代码失败就是 5 次全量下载。
+MarketSnapshotCache 对每张全量表：
+1. TTL 内最多下载一次，按代码建立字典索引，之后的查询直接读内存
+2. 同一张表同一时刻只有一个线程在下载，并发回退的其他线程等待并复用结果
+3. 下载失败后 FAILURE_BACKOFF 秒内不再重试，直接视为未命中
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# 全量表：名称 -> (AKShare 函数名, 代码列)
+SNAPSHOT_TABLES = {
+    'cn_spot': ('stock_zh_a_spot_em', '代码'),
+    'hk_spot': ('stock_hk_spot_em', '代码'),
+    'fund_rank': ('fund_open_fund_rank_em', '基金代码'),
+}
+
+# 快照有效期（秒）：实时行情 5 分钟，基金净值每日更新一次
+SNAPSHOT_TTL = {
+    'cn_spot': 300,
+    'hk_spot': 300,
+    'fund_rank': 3600,
+}
+
+# 下载失败后的重试间隔（秒）
+FAILURE_BACKOFF = 60
+
+
+def _load_akshare_table(table: str):
+    """下载 AKShare 全量表（未安装 akshare 时抛出 ImportError）"""
+    import akshare as ak
+
+    func_name, _ = SNAPSHOT_TABLES[table]
+    print(f"[全量快照] 正在下载 {table}（可能需要20-30秒）...")
+    return getattr(ak, func_name)()
+
+
+class _Snapshot:
+    """单张全量表的索引与状态"""
+
+    def __init__(self):
+        self.rows: Optional[Dict[str, Dict]] = None
+        self.loaded_at = 0.0
+        self.failed_at = 0.0
+        self.lock = threading.Lock()
+
+
+class MarketSnapshotCache:
+    """按 TTL 缓存的全市场快照（线程安全，进程内共享）"""
+
+    def __init__(self, ttl: Dict[str, int] = None,
+                 loader: Callable[[str], object] = _load_akshare_table):
+        """
+        Args:
+            ttl: 各表有效期覆盖（秒）
+            loader: 下载函数 table -> DataFrame（测试时可替换）
+        """
+        self.ttl = {**SNAPSHOT_TTL, **(ttl or {})}
+        self.loader = loader
+        self._snapshots = {table: _Snapshot() for table in SNAPSHOT_TABLES}
+
+    def _fresh(self, snapshot: _Snapshot, table: str, now: float) -> bool:
+        return snapshot.rows is not None and now - snapshot.loaded_at < self.ttl[table]
+
+    def _index(self, table: str) -> Optional[Dict[str, Dict]]:
+        """返回有效期内的代码索引，过期时下载（同表只下载一次）"""
+        snapshot = self._snapshots[table]
+        if self._fresh(snapshot, table, time.time()):
+            return snapshot.rows
+
+        with snapshot.lock:
+            now = time.time()
+            # 拿到锁后再检查一次：等待期间其他线程可能已完成下载
+            if self._fresh(snapshot, table, now):
+                return snapshot.rows
+            if snapshot.failed_at and now - snapshot.failed_at < FAILURE_BACKOFF:
+                return None
+            try:
+                df = self.loader(table)
+            except ImportError:
+                raise
+            except Exception as e:
+                print(f"[全量快照] 下载 {table} 失败: {e}")
+                snapshot.failed_at = now
+                return None
+
+            _, key_column = SNAPSHOT_TABLES[table]
+            snapshot.rows = {str(row[key_column]): row for row in df.to_dict('records')}
+            snapshot.loaded_at = time.time()
+            snapshot.failed_at = 0.0
+            return snapshot.rows
+
+    def lookup(self, table: str, code: str) -> Optional[Dict]:
+        """按代码查询一行（列名同 AKShare 原表），未命中返回 None"""
+        rows = self._index(table)
+        return rows.get(code) if rows else None
+
+    def invalidate(self, table: str = None):
+        """清除快照（table 为空时清除全部）"""
+        for name in ([table] if table else list(self._snapshots)):
+            snapshot = self._snapshots[name]
+            with snapshot.lock:
+                snapshot.rows = None
+                snapshot.loaded_at = 0.0
+                snapshot.failed_at = 0.0
+
+
+# 进程内共享实例（所有 PriceFetcher 共用）
+market_snapshots = MarketSnapshotCache()
@@ -4,7 +4,7 @@
 从 price_fetcher.py 提取，零外部依赖（仅 pytz）。
 提供各市场开盘判断和智能缓存 TTL 计算。
 """
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import pytz
 
 
@@ -261,6 +261,63 @@ class MarketTimeUtil:
         next_update = next_update.replace(hour=19, minute=0, second=0, microsecond=0)
         return int((next_update - now).total_seconds())
 
+    # 过期报价仍可先行返回（stale-while-revalidate）的最长超期时间（秒）
+    # 交易时段价格变化快，只容忍较短超期；休市时报价不变，可长时间沿用
+    MAX_STALENESS_TRADING = 1800
+    MAX_STALENESS_CLOSED = 86400
+    MAX_STALENESS_FUND = 3 * 86400
+
+    @classmethod
+    def is_market_open(cls, market_type: str, dt: datetime = None) -> bool:
+        """按市场类型判断是否开盘（基金及未知类型视为休市）"""
+        if market_type == 'cn':
+            return cls.is_cn_market_open(dt)
+        if market_type == 'hk':
+            return cls.is_hk_market_open(dt)
+        if market_type == 'us':
+            return cls.is_us_market_open(dt)
+        return False
+
+    # 各市场收盘时刻（当地时区），港股含收市竞价
+    SESSION_CLOSE = {
+        'cn': ('TZ_SHANGHAI', 1500),
+        'hk': ('TZ_SHANGHAI', 1610),
+        'us': ('TZ_NEW_YORK', 1600),
+    }
+
+    @classmethod
+    def is_session_closed(cls, market_type: str, trade_date: date, now: datetime = None) -> bool:
+        """trade_date 这一交易日是否已收盘（收盘后报价才是当日收盘价）
+
+        基金净值按净值日期公布，公布即为终值；未知市场一律视为未收盘。
+        """
+        if market_type == 'fund':
+            return True
+        if market_type not in cls.SESSION_CLOSE:
+            return False
+        tz_name, close_time = cls.SESSION_CLOSE[market_type]
+        tz = getattr(cls, tz_name)
+        now = now.astimezone(tz) if now is not None else datetime.now(tz)
+        if trade_date != now.date():
+            return trade_date < now.date()
+        return now.hour * 100 + now.minute >= close_time
+
+    @classmethod
+    def get_max_staleness(cls, market_type: str, overrides: dict = None) -> int:
+        """过期报价可继续返回的最长超期时间（秒）
+
+        Args:
+            market_type: 'cn' / 'hk' / 'us' / 'fund'
+            overrides: 按市场覆盖的配置 {market_type: 秒}，交易与否不再区分
+        """
+        if overrides and overrides.get(market_type) is not None:
+            return int(overrides[market_type])
+        if market_type == 'fund':
+            return cls.MAX_STALENESS_FUND
+        if cls.is_market_open(market_type, datetime.now(cls.TZ_SHANGHAI)):
+            return cls.MAX_STALENESS_TRADING
+        return cls.MAX_STALENESS_CLOSED
+
     @classmethod
     def get_cache_ttl(cls, market_type: str) -> int:
         """根据市场类型和当前时间获取缓存有效期(秒)
@@ -196,6 +196,9 @@ class PriceCache(BaseModel):
     data_source: Optional[str] = None
     expires_at: Optional[datetime] = None
 
+    # 报价所属交易日已收盘时为该交易日（盘中报价为 None），只用于写入价格序列，不落缓存
+    close_date: Optional[date] = None
+
 
 class NAVHistory(BaseModel):
     """净值历史
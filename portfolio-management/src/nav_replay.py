@@ -0,0 +1,365 @@
+"""
+净值回放（按交易记录补录历史净值）
+
+record_nav 只能用实时价格记录当天净值。定时任务漏跑时，下一次记录用 gap_cash_flow
+把间隔期的出入金计入份额，但间隔期内每天的净值点永久缺失。NavReplay 从交易表和
+出入金表重建任意日期的持仓，用本地收盘价序列（TimeSeriesStore）和汇率历史（FxHistory）
+估值，一次向量化计算补齐缺失日期的净值序列：
+
+1. 持仓：由持仓账本（PositionLedger）按日期折叠交易与出入金得到；
+   人民币交易同时增减 CNY-CASH/CNY-MMF（与 buy/sell 默认的自动扣减/增加现金一致），外币交易不动现金
+2. 价格：当日或之前 MAX_CLOSE_GAP_DAYS 天内最近的收盘价（优先人民币收盘价，否则原币种 × 汇率），
+   现金/货币基金按 1 × 汇率。收盘价只来自本地时间序列：backfill 先通过
+   PriceFetcher.backfill_closes 从历史行情源导入区间内的真实日收盘价，不用成交价代替
+3. 净值：相邻两日 nav_t = nav_{t-1} × V_t / (V_{t-1} + 资金变动_t)，与 record_nav 的
+   份额口径（份额变动 = 资金变动 / 上一日净值）等价，整段序列为一次累乘；
+   已有净值记录的日期作为锚点（沿用记录的净值与份额），不覆盖
+4. 写入：只写缺失的日期，storage.save_navs 一次 batch_create_records
+
+日期网格为工作日（周一至周五），周末的交易与出入金计入下一个工作日。
+任一持仓当天无法估值（近期无收盘价或缺汇率）的日期跳过，不写入。
+本地时间序列未开启或回放区间内没有任何收盘价时直接报错，避免写入虚构的净值。
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .asset_utils import detect_asset_type
+from .ledger import PositionLedger
+from .models import AssetClass, AssetType, CashFlow, NAVHistory, Transaction
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，使用 NavReplay 时再报错
+    np = None
+
+
+# 收盘价最多沿用的日历天数（覆盖周末 + 单日假期；更长的停牌/长假当天跳过）
+MAX_CLOSE_GAP_DAYS = 4
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NavReplay 需要 numpy，请执行 pip install numpy")
+
+
+def _cash_asset_id(currency: str) -> str:
+    return f'{currency}-CASH'
+
+
+class NavReplay:
+    """从交易记录重建持仓并回放净值"""
+
+    def __init__(self, storage, timeseries=None, fx=None, price_fetcher=None):
+        """
+        Args:
+            storage: FeishuStorage（读取交易、出入金、净值，写入补录的净值）
+            timeseries: 收盘价序列（TimeSeriesStore），为空时使用 storage.timeseries
+            fx: 汇率历史（FxHistory），为空时使用进程内共享实例
+            price_fetcher: 用于 backfill 前导入历史收盘价（为空时只使用本地已有收盘价）
+
+        Raises:
+            RuntimeError: 本地时间序列未开启
+        """
+        _require_numpy()
+        self.storage = storage
+        if timeseries is None:
+            timeseries = getattr(storage, 'timeseries', None)
+        if timeseries is None:
+            raise RuntimeError("净值回放需要本地收盘价序列，请先开启 PORTFOLIO_TIMESERIES（timeseries.enabled）")
+        self.timeseries = timeseries
+        if fx is None:
+            from .fx_history import fx_history as fx
+        self.fx = fx
+        self.price_fetcher = price_fetcher
+
+    # ========== 持仓重建 ==========
+
+    @staticmethod
+    def _events(transactions: List[Transaction], cash_flows: List[CashFlow]) -> List[Tuple[date, str, float]]:
+        """交易与出入金 -> (日期, 资产代码, 数量变动)，由持仓账本折叠得到"""
+        return PositionLedger('', transactions, cash_flows, persist=False).deltas()
+
+    def holdings_as_of(self, account: str, as_of: date,
+                       transactions: List[Transaction] = None,
+                       cash_flows: List[CashFlow] = None) -> Dict[str, float]:
+        """as_of 当天收盘后的持仓数量 {资产代码: 数量}（不含数量为 0 的资产）"""
+        if transactions is None and cash_flows is None:
+            return PositionLedger.load(self.storage, account).quantities(as_of)
+        if transactions is None:
+            transactions = self.storage.get_transactions(account)
+        if cash_flows is None:
+            cash_flows = self.storage.get_cash_flows(account)
+        return PositionLedger(account, transactions, cash_flows, persist=False).quantities(as_of)
+
+    # ========== 估值 ==========
+
+    def _fx_rates(self, currency: str, dates) -> 'np.ndarray':
+        """各日期的 {currency}/CNY 汇率（缺失为 NaN）"""
+        if currency == 'CNY':
+            return np.ones(len(dates))
+        pair = f'{currency}CNY'
+        rates = [self.fx.rate(pair, d) for d in dates.astype(date)]
+        return np.array([r if r else np.nan for r in rates], dtype=float)
+
+    @staticmethod
+    def _as_of_index(series_dates, grid) -> 'np.ndarray':
+        """grid 中每个日期在 series_dates（升序）中当天或之前最近一条的下标，没有为 -1"""
+        return np.searchsorted(series_dates, grid, side='right') - 1
+
+    def _price_matrix(self, assets: List[str], currencies: Dict[str, str], grid) -> 'np.ndarray':
+        """[日期 × 资产] 人民币价格（向前填充至多 MAX_CLOSE_GAP_DAYS 天，无法估值为 NaN）
+
+        Raises:
+            RuntimeError: 有需要估值的资产，但区间内本地没有任何收盘价
+        """
+        prices = np.full((len(grid), len(assets)), np.nan)
+        fx_cache: Dict[str, np.ndarray] = {}
+
+        def fx(currency):
+            if currency not in fx_cache:
+                fx_cache[currency] = self._fx_rates(currency, grid)
+            return fx_cache[currency]
+
+        for j, asset_id in enumerate(assets):
+            currency = currencies[asset_id]
+            if asset_id.endswith('-CASH') or asset_id.endswith('-MMF'):
+                prices[:, j] = fx(currency)
+                continue
+
+            # 人民币收盘价缺失时按原币种收盘价 × 当日汇率
+            closes = self.timeseries.prices(asset_id)
+            if len(closes):
+                idx = self._as_of_index(closes['date'], grid)
+                safe = np.maximum(idx, 0)
+                fresh = (idx >= 0) & ((grid - closes['date'][safe]).astype(int) <= MAX_CLOSE_GAP_DAYS)
+                cny_close = np.asarray(closes['cny_close'], dtype=float)[safe]
+                close = np.asarray(closes['close'], dtype=float)[safe]
+                cny_close = np.where(np.isnan(cny_close), close * fx(currency), cny_close)
+                prices[:, j] = np.where(fresh, cny_close, np.nan)
+
+        priced = [a for a in assets if not (a.endswith('-CASH') or a.endswith('-MMF'))]
+        if priced and np.isnan(prices[:, [assets.index(a) for a in priced]]).all():
+            raise RuntimeError(f"本地时间序列在 {grid[0]} ~ {grid[-1]} 没有 {', '.join(priced)} 的收盘价，"
+                               f"请先导入历史收盘价（PriceFetcher.backfill_closes）")
+        return prices
+
+    # ========== 回放 ==========
+
+    @staticmethod
+    def _grid(start: date, end: date, extra_dates) -> 'np.ndarray':
+        """工作日网格 ∪ 额外日期（已有净值记录的日期）"""
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        days = days[np.is_busday(days)]
+        extra = np.array(sorted(extra_dates), dtype='datetime64[D]')
+        return np.union1d(days, extra)
+
+    def replay(self, account: str, start: Optional[date] = None, end: Optional[date] = None,
+               transactions: List[Transaction] = None, cash_flows: List[CashFlow] = None,
+               navs: List[NAVHistory] = None) -> List[NAVHistory]:
+        """计算 [start, end] 内缺失日期的净值记录（不写入）
+
+        Args:
+            start: 起始日期，为空时从第一笔交易/出入金开始
+            end: 截止日期，为空时到昨天（当天由 record_nav 用实时价格记录）
+            transactions / cash_flows / navs: 已加载的数据（可选，不传则从存储层查询）
+
+        Returns:
+            按日期升序的 NAVHistory（只含缺失且可估值的日期）
+        """
+        if transactions is None:
+            transactions = self.storage.get_transactions(account)
+        if cash_flows is None:
+            cash_flows = self.storage.get_cash_flows(account)
+        if navs is None:
+            navs = self.storage.get_nav_history(account, days=9999)
+
+        events = self._events(transactions, cash_flows)
+        if not events:
+            return []
+        start = start or events[0][0]
+        end = end or date.today() - timedelta(days=1)
+        if end < start:
+            return []
+
+        recorded = {n.date: n for n in navs if n.date and n.nav and n.nav > 0}
+        anchor = max((d for d in recorded if d < start), default=None)
+        grid_start = anchor or start
+        grid = self._grid(grid_start, end, [d for d in recorded if grid_start <= d <= end])
+        grid_dates = grid.astype(date)
+
+        # -- 持仓矩阵：事件落到当天或之后的第一个网格日期，按日期累加 --
+        assets = sorted({asset_id for _, asset_id, _ in events})
+        column = {asset_id: j for j, asset_id in enumerate(assets)}
+        deltas = np.zeros((len(grid), len(assets)))
+        event_dates = np.array([d for d, _, _ in events], dtype='datetime64[D]')
+        rows = np.searchsorted(grid, event_dates, side='left')
+        keep = rows < len(grid)
+        np.add.at(deltas, (rows[keep], [column[e[1]] for e, k in zip(events, keep) if k]),
+                  np.array([e[2] for e in events])[keep])
+        quantities = np.cumsum(deltas, axis=0)
+        quantities[np.abs(quantities) < 1e-8] = 0.0
+
+        # -- 价格矩阵与市值 --
+        meta = {}
+        for tx in transactions:
+            meta.setdefault(tx.asset_id, (tx.asset_type, tx.currency))
+        currencies, types, classes = {}, {}, {}
+        for asset_id in assets:
+            detected_type, detected_currency, asset_class = detect_asset_type(asset_id)
+            asset_type, currency = meta.get(asset_id, (None, None))
+            currencies[asset_id] = currency or detected_currency
+            types[asset_id] = asset_type or detected_type
+            classes[asset_id] = asset_class
+
+        prices = self._price_matrix(assets, currencies, grid)
+        held = quantities != 0
+        values = np.where(held, quantities * np.nan_to_num(prices), 0.0)
+        valued = ~np.any(held & np.isnan(prices), axis=1)
+        total = values.sum(axis=1)
+
+        # 已有记录的日期：重建估值失败时使用记录的总值
+        rec_nav = np.array([recorded[d].nav if d in recorded else np.nan for d in grid_dates])
+        rec_shares = np.array([recorded[d].shares or np.nan if d in recorded else np.nan for d in grid_dates])
+        is_recorded = ~np.isnan(rec_nav)
+        rec_total = np.array([recorded[d].total_value if d in recorded else np.nan for d in grid_dates])
+        total = np.where(is_recorded & ~valued, rec_total, total)
+        valid = valued | is_recorded
+
+        # 去掉无法估值的日期（其间的资金变动计入下一个有效日期）
+        grid, grid_dates = grid[valid], [d for d, v in zip(grid_dates, valid) if v]
+        values, total = values[valid], total[valid]
+        rec_nav, rec_shares, is_recorded = rec_nav[valid], rec_shares[valid], is_recorded[valid]
+        if not len(grid):
+            return []
+
+        # -- 资金变动：上一个网格日期之后到当天的出入金之和 --
+        flow_dates = np.array([cf.flow_date for cf in cash_flows if cf.flow_date], dtype='datetime64[D]')
+        flow_amounts = np.array([cf.cny_amount or 0.0 for cf in cash_flows if cf.flow_date], dtype=float)
+        order = np.argsort(flow_dates, kind='stable')
+        flow_dates = flow_dates[order]
+        prefix = np.concatenate([[0.0], np.cumsum(flow_amounts[order])])
+
+        def cumulative_flow(dates):
+            return prefix[np.searchsorted(flow_dates, dates, side='right')]
+
+        flows = np.diff(cumulative_flow(grid), prepend=cumulative_flow(grid[:1] - 1))
+
+        # -- 净值链：nav_t = nav_{t-1} × V_t / (V_{t-1} + 资金变动_t)，锚点处重新起算 --
+        prev_total = np.concatenate([[np.nan], total[:-1]])
+        base = prev_total + flows
+        growth = np.ones(len(grid))
+        chained = (base > 0) & (total > 0)
+        growth[chained] = total[chained] / base[chained]
+        # 锚点：已有记录的日期；或账户起始（前一日无资产）时净值从 1.0 起算
+        inception = ~chained & (total > 0) & ~is_recorded
+        is_anchor = is_recorded | inception
+        anchor_nav = np.where(is_recorded, rec_nav, 1.0)
+        growth[is_anchor] = 1.0
+        log_growth = np.cumsum(np.log(growth))
+        anchor_idx = np.maximum.accumulate(np.where(is_anchor, np.arange(len(grid)), -1))
+        has_anchor = anchor_idx >= 0
+        safe = np.maximum(anchor_idx, 0)
+        nav = np.where(has_anchor, anchor_nav[safe] * np.exp(log_growth - log_growth[safe]), np.nan)
+
+        shares = np.where(is_recorded & ~np.isnan(rec_shares), rec_shares, total / nav)
+        prev_shares = np.concatenate([[np.nan], shares[:-1]])
+        share_change = np.where(np.isnan(prev_shares), np.where(inception, shares, 0.0), shares - prev_shares)
+        pnl = np.where(np.isnan(prev_total), 0.0, total - prev_total - flows)
+
+        # -- 月初/年初至今：基准为上月末/上年末净值（已有记录与回放结果合并后查找）--
+        series = {d: (n.nav, n.total_value) for d, n in recorded.items()}
+        for d, v, t, n in zip(grid_dates, is_recorded, total, nav):
+            if not v and not np.isnan(n):
+                series[d] = (n, t)
+        series_dates = np.array(sorted(series), dtype='datetime64[D]')
+        series_nav = np.array([series[d][0] for d in series_dates.astype(date)])
+        series_total = np.array([series[d][1] for d in series_dates.astype(date)])
+
+        def period_change(period_start):
+            idx = np.searchsorted(series_dates, period_start, side='left') - 1
+            ok = idx >= 0
+            safe_idx = np.maximum(idx, 0)
+            base_nav, base_total = series_nav[safe_idx], series_total[safe_idx]
+            nav_change = np.where(ok & (base_nav > 0), nav / np.where(base_nav > 0, base_nav, 1.0) - 1, 0.0)
+            period_flow = cumulative_flow(grid) - cumulative_flow(series_dates[safe_idx])
+            period_pnl = np.where(ok, total - base_total - period_flow, 0.0)
+            return nav_change, period_pnl
+
+        months = grid.astype('datetime64[M]').astype('datetime64[D]')
+        years = grid.astype('datetime64[Y]').astype('datetime64[D]')
+        mtd_nav_change, mtd_pnl = period_change(months)
+        ytd_nav_change, ytd_pnl = period_change(years)
+
+        # -- 市值分类（与 calculate_valuation 一致）--
+        def column_sum(predicate):
+            mask = np.array([predicate(a) for a in assets], dtype=bool)
+            return values[:, mask].sum(axis=1) if mask.any() else np.zeros(len(grid))
+
+        cash_value = column_sum(lambda a: types[a] == AssetType.CASH)
+        fund_value = column_sum(lambda a: types[a] == AssetType.FUND)
+        cn_value = column_sum(lambda a: classes[a] == AssetClass.CN_ASSET)
+        us_value = column_sum(lambda a: classes[a] == AssetClass.US_ASSET)
+        hk_value = column_sum(lambda a: classes[a] == AssetClass.HK_ASSET)
+        # stock_value 口径同 record_nav：股票 + 基金
+        stock_value = total - cash_value
+
+        results = []
+        for i, d in enumerate(grid_dates):
+            if is_recorded[i] or d < start or np.isnan(nav[i]) or total[i] <= 0:
+                continue
+            results.append(NAVHistory(
+                date=d,
+                account=account,
+                total_value=round(float(total[i]), 2),
+                cash_value=round(float(cash_value[i]), 2),
+                stock_value=round(float(stock_value[i]), 2),
+                fund_value=round(float(fund_value[i]), 2),
+                cn_stock_value=round(float(cn_value[i]), 2),
+                us_stock_value=round(float(us_value[i]), 2),
+                hk_stock_value=round(float(hk_value[i]), 2),
+                stock_weight=round(float(stock_value[i] / total[i]), 6),
+                cash_weight=round(float(cash_value[i] / total[i]), 6),
+                shares=round(float(shares[i]), 2),
+                nav=round(float(nav[i]), 6),
+                cash_flow=round(float(flows[i]), 2),
+                share_change=round(float(share_change[i]), 2),
+                mtd_nav_change=round(float(mtd_nav_change[i]), 6),
+                ytd_nav_change=round(float(ytd_nav_change[i]), 6),
+                pnl=round(float(pnl[i]), 2),
+                mtd_pnl=round(float(mtd_pnl[i]), 2),
+                ytd_pnl=round(float(ytd_pnl[i]), 2),
+                details={'source': 'replay'},
+            ))
+        return results
+
+    def _backfill_closes(self, transactions: List[Transaction], cash_flows: List[CashFlow],
+                         start: Optional[date], end: Optional[date]):
+        """从历史行情源导入回放区间（含前 MAX_CLOSE_GAP_DAYS 天）内持有资产的日收盘价"""
+        events = self._events(transactions, cash_flows)
+        if not events:
+            return
+        start = start or events[0][0]
+        end = end or date.today() - timedelta(days=1)
+        names = {tx.asset_id: tx.asset_name for tx in transactions if tx.asset_name}
+        codes = sorted({asset_id for _, asset_id, _ in events
+                        if not (asset_id.endswith('-CASH') or asset_id.endswith('-MMF'))})
+        if codes:
+            self.price_fetcher.backfill_closes(codes, start - timedelta(days=MAX_CLOSE_GAP_DAYS), end,
+                                               timeseries=self.timeseries, name_map=names)
+
+    def backfill(self, account: str, start: Optional[date] = None, end: Optional[date] = None,
+                 dry_run: bool = False) -> List[NAVHistory]:
+        """导入区间内的历史收盘价，回放并批量写入缺失日期的净值记录
+
+        Returns:
+            补录的净值记录（dry_run 时只计算不写入）
+        """
+        transactions = self.storage.get_transactions(account)
+        cash_flows = self.storage.get_cash_flows(account)
+        if self.price_fetcher is not None:
+            self._backfill_closes(transactions, cash_flows, start, end)
+        navs = self.replay(account, start, end, transactions=transactions, cash_flows=cash_flows)
+        if navs and not dry_run:
+            self.storage.save_navs(navs)
+            print(f"[净值回放] {account} 已补录 {len(navs)} 天净值（{navs[0].date} ~ {navs[-1].date}）")
+        return navs
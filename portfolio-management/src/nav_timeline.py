@@ -0,0 +1,94 @@
+"""
+净值时间线
+
+记录净值和收益统计需要「某日之前最新」「月末」「年末」等多种查询，
+逐个在净值列表上过滤是 O(n)，按年循环调用后多年账户会退化为 O(n·年数)。
+NavTimeline 构建时按日期排序一次，并预计算每月、每年的首末位置：
+1. as_of / before：二分查找 O(log n)
+2. month_end / month_start / year_end / year_start：预计算边界，O(1)
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .models import NAVHistory
+
+
+class NavTimeline:
+    """按日期升序的只读净值序列"""
+
+    def __init__(self, navs: List[NAVHistory]):
+        self.navs: List[NAVHistory] = sorted((n for n in navs if n.date), key=lambda n: n.date)
+        self.dates: List[date] = [n.date for n in self.navs]
+
+        # 期间边界：(year, month) / year -> (首条下标, 末条下标)
+        self._months: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self._years: Dict[int, Tuple[int, int]] = {}
+        for i, d in enumerate(self.dates):
+            first, _ = self._months.get((d.year, d.month), (i, i))
+            self._months[(d.year, d.month)] = (first, i)
+            first, _ = self._years.get(d.year, (i, i))
+            self._years[d.year] = (first, i)
+
+    @classmethod
+    def of(cls, navs) -> 'NavTimeline':
+        """已是 NavTimeline 时直接返回，否则构建"""
+        return navs if isinstance(navs, cls) else cls(navs or [])
+
+    def __len__(self) -> int:
+        return len(self.navs)
+
+    def __iter__(self) -> Iterator[NAVHistory]:
+        return iter(self.navs)
+
+    @property
+    def latest(self) -> Optional[NAVHistory]:
+        return self.navs[-1] if self.navs else None
+
+    @property
+    def earliest(self) -> Optional[NAVHistory]:
+        return self.navs[0] if self.navs else None
+
+    # ========== 按日期 ==========
+
+    def as_of(self, d: date) -> Optional[NAVHistory]:
+        """指定日期当天或之前的最新净值"""
+        i = bisect_right(self.dates, d)
+        return self.navs[i - 1] if i else None
+
+    def before(self, d: date) -> Optional[NAVHistory]:
+        """指定日期之前（不含当天）的最新净值"""
+        i = bisect_left(self.dates, d)
+        return self.navs[i - 1] if i else None
+
+    def between(self, start: date, end: date) -> List[NAVHistory]:
+        """区间 [start, end] 内的净值"""
+        return self.navs[bisect_left(self.dates, start):bisect_right(self.dates, end)]
+
+    # ========== 按期间 ==========
+
+    def month_start(self, year: int, month: int) -> Optional[NAVHistory]:
+        """当月第一条净值"""
+        bounds = self._months.get((int(year), int(month)))
+        return self.navs[bounds[0]] if bounds else None
+
+    def month_end(self, year: int, month: int) -> Optional[NAVHistory]:
+        """当月最后一条净值"""
+        bounds = self._months.get((int(year), int(month)))
+        return self.navs[bounds[1]] if bounds else None
+
+    def prev_month_end(self, year: int, month: int) -> Optional[NAVHistory]:
+        """上月最后一条净值"""
+        if month == 1:
+            return self.month_end(year - 1, 12)
+        return self.month_end(year, month - 1)
+
+    def year_start(self, year: int) -> Optional[NAVHistory]:
+        """当年第一条净值"""
+        bounds = self._years.get(int(year))
+        return self.navs[bounds[0]] if bounds else None
+
+    def year_end(self, year: int) -> Optional[NAVHistory]:
+        """当年最后一条净值"""
+        bounds = self._years.get(int(year))
+        return self.navs[bounds[1]] if bounds else None
@@ -2,13 +2,17 @@
 组合计算逻辑
 """
 from datetime import date, datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from .models import (
     Holding, Transaction, CashFlow, NAVHistory,
-    PortfolioValuation, AssetType, TransactionType, AssetClass
+    PortfolioValuation, AssetType, TransactionType, AssetClass,
+    make_tx_dedup_key
 )
 from .price_fetcher import PriceFetcher
+from .cash_flow_ledger import CashFlowLedger
+from .ledger import PositionLedger
+from .nav_timeline import NavTimeline
 from . import config
 
 
@@ -126,7 +130,7 @@ class PortfolioManager:
             self.storage.upsert_holding(holding)
         except Exception as e:
             # 持仓更新失败，但交易已记录。打印警告但不回滚，
-            # 因为交易记录是核心，持仓可以通过对账修复
+            # 因为交易记录是核心，持仓可以通过对账修复（reconcile_holdings）
             print(f"[警告] 持仓更新失败，但交易已记录: {e}")
 
         # 4. 最后扣减现金（非核心，失败可补偿）
@@ -195,7 +199,12 @@ class PortfolioManager:
     def deposit(self, flow_date: date, account: str, amount: float, currency: str,
                 cny_amount: Optional[float] = None, exchange_rate: Optional[float] = None,
                 source: str = "", remark: str = "") -> CashFlow:
-        """入金 - 增加份额"""
+        """入金 - 增加份额
+
+        外币入金未提供 cny_amount / exchange_rate 时，按入金日汇率（汇率历史）折算。
+        """
+        cny_amount, exchange_rate = self._resolve_flow_rate(flow_date, amount, currency,
+                                                            cny_amount, exchange_rate)
         # 1. 记录出入金
         cf = CashFlow(
             flow_date=flow_date,
@@ -218,7 +227,9 @@ class PortfolioManager:
     def withdraw(self, flow_date: date, account: str, amount: float, currency: str,
                  cny_amount: Optional[float] = None, exchange_rate: Optional[float] = None,
                  remark: str = "") -> CashFlow:
-        """出金 - 减少份额"""
+        """出金 - 减少份额（外币汇率处理同 deposit）"""
+        cny_amount, exchange_rate = self._resolve_flow_rate(flow_date, amount, currency,
+                                                            cny_amount, exchange_rate)
         # 1. 记录出入金 (金额为负)
         cf = CashFlow(
             flow_date=flow_date,
@@ -237,6 +248,24 @@ class PortfolioManager:
 
         return cf
 
+    def _resolve_flow_rate(self, flow_date: date, amount: float, currency: str,
+                           cny_amount: Optional[float], exchange_rate: Optional[float]) -> tuple:
+        """外币出入金缺少汇率时查询 flow_date 当天汇率
+
+        Returns:
+            (cny_amount, exchange_rate)；查不到汇率时原样返回
+        """
+        if currency == 'CNY' or cny_amount is not None or exchange_rate is not None or not self.price_fetcher:
+            return cny_amount, exchange_rate
+        try:
+            rate = self.price_fetcher.get_exchange_rate(currency, flow_date)
+        except Exception as e:
+            print(f"[警告] 获取 {flow_date} {currency}/CNY 汇率失败: {e}")
+            rate = None
+        if not rate:
+            return cny_amount, exchange_rate
+        return round(amount * rate, 2), rate
+
     def _update_cash_holding(self, account: str, amount: float, currency: str, cny_amount: float):
         """更新现金持仓（旧版方法，保持兼容）"""
         # 根据币种确定资产ID
@@ -358,12 +387,206 @@ class PortfolioManager:
         print(f"  增加到 CNY-CASH: ¥{amount:,.2f}")
         return True
 
+    # ========== 批量导入 ==========
+
+    def import_trades(self, account: str, fills: List[Dict[str, Any]],
+                      auto_cash: bool = False) -> Dict[str, Any]:
+        """
+        批量导入成交（对账单导入）
+
+        与逐笔 buy/sell 相比：
+        1. 一次查询账户已有交易的 dedup_key/request_id 做防重（含批次内重复）
+        2. 先校验后执行：卖出数量、现金是否充足全部在内存中模拟，任何一笔不通过都不写入
+        3. 交易用 batch_create_records 写入，持仓变动和净现金变动通过 HoldingBatch 一次提交
+        4. 不逐笔查询资产名称，使用传入名称或已有持仓名称
+
+        Args:
+            account: 账户
+            fills: 成交列表，每项字段同 buy/sell 参数：
+                   tx_date, tx_type (TransactionType.BUY/SELL), asset_id, asset_name,
+                   asset_type, quantity (正数), price, currency, market, fee, remark,
+                   asset_class, industry, request_id
+            auto_cash: 是否按 CNY 成交净额调整现金（净流出先扣 CNY-CASH，不足扣 CNY-MMF）
+
+        Returns:
+            {'transactions': [...], 'skipped': [...], 'net_cash': float, 'holdings': {...}}
+
+        Raises:
+            ValueError: 卖出超过持仓、现金不足等校验失败（此时未写入任何数据）
+        """
+        dedup_keys, request_ids = self.storage.get_transaction_keys(account)
+        batch = self.storage.holding_batch(account, delete_zero=True)
+
+        txs: List[Transaction] = []
+        skipped: List[Transaction] = []
+        errors: List[str] = []
+        net_cash = 0.0
+        # asset_id -> 批次内买入使用的 market（卖出未指定 market 时匹配）
+        pending_markets: Dict[str, str] = {}
+        # (asset_id, market) -> (asset_name, asset_type)，卖出批次内新买入的资产时使用
+        pending_meta: Dict[tuple, tuple] = {}
+
+        # 按日期稳定排序，保证同一资产先买后卖的校验顺序
+        for fill in sorted(fills, key=lambda f: f['tx_date']):
+            asset_id = fill['asset_id']
+            quantity = float(fill['quantity'])
+            price = float(fill['price'])
+            fee = float(fill.get('fee') or 0)
+            is_buy = fill['tx_type'] == TransactionType.BUY
+            market = fill.get('market') or ''
+
+            if is_buy:
+                asset_name = fill.get('asset_name') or asset_id
+                asset_type = fill.get('asset_type')
+            else:
+                existing = batch.get_holding(asset_id, market or None)
+                if not market:
+                    market = existing.market if existing else pending_markets.get(asset_id, '')
+                if existing:
+                    asset_name, asset_type = existing.asset_name, existing.asset_type
+                else:
+                    asset_name, asset_type = pending_meta.get(
+                        (asset_id, market), (fill.get('asset_name') or asset_id, fill.get('asset_type')))
+
+            tx = Transaction(
+                tx_date=fill['tx_date'],
+                tx_type=TransactionType.BUY if is_buy else TransactionType.SELL,
+                asset_id=asset_id,
+                asset_name=asset_name,
+                asset_type=asset_type,
+                account=account,
+                market=market,
+                quantity=quantity if is_buy else -quantity,
+                price=price,
+                currency=fill['currency'],
+                fee=fee,
+                remark=fill.get('remark') or "",
+                request_id=fill.get('request_id'),
+            )
+            tx.dedup_key = make_tx_dedup_key(tx)
+
+            # 防重：已入库或批次内重复的成交跳过，不影响持仓和现金
+            if (tx.request_id and tx.request_id in request_ids) or tx.dedup_key in dedup_keys:
+                skipped.append(tx)
+                continue
+            dedup_keys.add(tx.dedup_key)
+            if tx.request_id:
+                request_ids.add(tx.request_id)
+
+            if is_buy:
+                batch.add(Holding(
+                    asset_id=asset_id,
+                    asset_name=asset_name,
+                    asset_type=asset_type,
+                    account=account,
+                    market=market,
+                    quantity=quantity,
+                    currency=fill['currency'],
+                    asset_class=fill.get('asset_class'),
+                    industry=fill.get('industry')
+                ))
+                pending_markets.setdefault(asset_id, market)
+                pending_meta.setdefault((asset_id, market), (asset_name, asset_type))
+            else:
+                available = batch.get_quantity(asset_id, market or None)
+                if quantity > available + 1e-9:
+                    errors.append(f"{tx.tx_date} 卖出 {asset_id} {quantity:,.2f} 超过持仓 {available:,.2f}")
+                    continue
+                batch.add_delta(asset_id, -quantity, market or None)
+
+            if fill['currency'] == 'CNY':
+                net_cash += -(quantity * price + fee) if is_buy else (quantity * price - fee)
+            txs.append(tx)
+
+        if auto_cash and net_cash:
+            errors.extend(self._apply_net_cash(batch, account, net_cash))
+
+        if errors:
+            batch.discard()
+            raise ValueError("批量导入校验失败:\n" + "\n".join(errors))
+
+        self.storage.add_transactions(txs)
+        holdings_result = batch.flush()
+
+        return {
+            'transactions': txs,
+            'skipped': skipped,
+            'net_cash': net_cash,
+            'holdings': holdings_result,
+        }
+
+    @staticmethod
+    def _apply_net_cash(batch, account: str, net_cash: float) -> List[str]:
+        """把批量成交的 CNY 净额记入持仓批次（逻辑同 _add_cash / _deduct_cash）
+
+        Returns:
+            校验错误列表（现金不足时非空）
+        """
+        if net_cash > 0:
+            if batch.get_holding('CNY-CASH'):
+                batch.add_delta('CNY-CASH', net_cash)
+            else:
+                batch.add(Holding(
+                    asset_id='CNY-CASH',
+                    asset_name='人民币现金',
+                    asset_type=AssetType.CASH,
+                    account=account,
+                    quantity=net_cash,
+                    currency='CNY',
+                    asset_class=AssetClass.CASH,
+                    industry="现金"
+                ))
+            return []
+
+        remaining = -net_cash
+        cash = max(batch.get_quantity('CNY-CASH'), 0.0)
+        mmf = max(batch.get_quantity('CNY-MMF'), 0.0)
+        if cash + mmf < remaining:
+            return [f"账户 {account} 现金不足，需要 ¥{remaining:,.2f}，可用 ¥{cash + mmf:,.2f}"]
+
+        deduct_from_cash = min(cash, remaining)
+        if deduct_from_cash > 0:
+            batch.add_delta('CNY-CASH', -deduct_from_cash)
+            remaining -= deduct_from_cash
+        if remaining > 0:
+            batch.add_delta('CNY-MMF', -remaining)
+        return []
+
+    # ========== 持仓账本 ==========
+
+    def holdings_as_of(self, account: str, as_of: Optional[date] = None) -> List[Holding]:
+        """由交易与出入金推导 as_of 当天收盘后的持仓（含平均成本，不读 holdings 表）
+
+        为空时为全部流水之后的持仓，即 holdings 表应有的内容。
+        """
+        return PositionLedger.load(self.storage, account).holdings(as_of)
+
+    def reconcile_holdings(self, account: str, apply: bool = False, include_cash: bool = False) -> Dict:
+        """持仓对账：holdings 表与交易流水推导的持仓逐项比较
+
+        Args:
+            apply: 是否按账本修正 holdings 表（一次批量写入）
+            include_cash: 是否同时修正现金/货币基金（其手工调整不在流水中，默认只列出）
+
+        Returns:
+            {'diffs', 'cash_diffs', 'cost_diffs', 'missing_cost', 'updated', 'created', 'deleted'}，
+            不修正时计数均为 0（见 PositionLedger.reconcile）
+        """
+        return PositionLedger.load(self.storage, account).materialize(
+            self.storage, dry_run=not apply, include_cash=include_cash)
+
     # ========== 估值计算 ==========
 
-    def calculate_valuation(self, account: str, fetch_prices: bool = True) -> PortfolioValuation:
-        """计算账户估值"""
+    def calculate_valuation(self, account: str, fetch_prices: bool = True,
+                            holdings: Optional[List[Holding]] = None) -> PortfolioValuation:
+        """计算账户估值
+
+        Args:
+            holdings: 已加载的持仓（可选，不传则从存储层查询）
+        """
         # 1. 获取持仓
-        holdings = self.storage.get_holdings(account=account)
+        if holdings is None:
+            holdings = self.storage.get_holdings(account=account)
 
         if not holdings:
             return PortfolioValuation(account=account, total_value_cny=0)
@@ -455,7 +678,9 @@ class PortfolioManager:
     # ========== 净值记录 ==========
 
     def record_nav(self, account: str, valuation: Optional[PortfolioValuation] = None,
-                   nav_date: Optional[date] = None) -> NAVHistory:
+                   nav_date: Optional[date] = None,
+                   all_navs: Optional[List[NAVHistory]] = None,
+                   cash_flows: Optional[List[CashFlow]] = None) -> NAVHistory:
         """
         记录每日净值（按Excel账户净值sheet逻辑）
         计算字段：股票市值、现金结余、账户净值、占比、份额变动、涨幅、资产升值
@@ -463,6 +688,10 @@ class PortfolioManager:
         按日计算：
         - 当日资金变动 = 当日出入金总和
         - 当日资产升值 = 今日账户净值 - 昨日账户净值 - 当日资金变动
+
+        Args:
+            all_navs: 已加载的全部净值历史（可选，不传则从存储层查询）
+            cash_flows: 已加载的全部出入金（可选，不传则从存储层查询一次）
         """
         if valuation is None:
             valuation = self.calculate_valuation(account)
@@ -481,13 +710,16 @@ class PortfolioManager:
         cash_ratio = cash_value / total_value if total_value > 0 else 0
 
         # ===== 3. 获取历史数据（单次 API 调用获取全部 NAV）=====
-        all_navs = self.storage.get_nav_history(account, days=9999)
+        if all_navs is None:
+            all_navs = self.storage.get_nav_history(account, days=9999)
 
         # 从全量数据中提取各细分查询结果，避免重复 API 调用
+        # 时间线排序一次，之后各期间查询为二分/预计算边界
+        all_navs = NavTimeline.of(all_navs)
         yesterday_nav = self._find_latest_nav_before(all_navs, today)
         prev_year_end_nav = self._find_year_end_nav(all_navs, str(today.year - 1))
         prev_month_end_nav = self._find_prev_month_end_nav(all_navs, today.year, today.month)
-        last_nav = self._find_latest_nav_before(all_navs, today)
+        last_nav = yesterday_nav
 
         # 各年份数据（动态：从 start_year 到当前年份）
         yearly_data = {}
@@ -498,19 +730,22 @@ class PortfolioManager:
                 'end': self._find_year_end_nav(all_navs, yr_str),
             }
 
-        # ===== 4. 资金变动计算 =====
-        daily_cash_flow = self._get_daily_cash_flow(account, today)
-        monthly_cash_flow = self._get_monthly_cash_flow(account, today.year, today.month)
-        yearly_cash_flow = self._get_yearly_cash_flow(account, current_year)
+        # ===== 4. 资金变动计算（出入金只加载一次，各口径从台账查询）=====
+        if cash_flows is None:
+            cash_flows = self.storage.get_cash_flows(account)
+        ledger = CashFlowLedger(cash_flows)
+        daily_cash_flow = ledger.day(today)
+        monthly_cash_flow = ledger.month(today.year, today.month)
+        yearly_cash_flow = ledger.year(today.year)
         for yr_str, yd in yearly_data.items():
-            yd['cash_flow'] = self._get_yearly_cash_flow(account, yr_str)
-        cumulative_cash_flow = self._get_cumulative_cash_flow_from_year(account, str(start_year), today)
+            yd['cash_flow'] = ledger.year(int(yr_str))
+        cumulative_cash_flow = ledger.between(date(start_year, 1, 1), today)
 
         # 计算上次记录净值后到今天的全部出入金（解决非每日记录时中间入金丢失问题）
         if last_nav:
             from datetime import timedelta
             gap_start = last_nav.date + timedelta(days=1)
-            gap_cash_flow = self._get_period_cash_flow(account, gap_start, today)
+            gap_cash_flow = ledger.between(gap_start, today)
         else:
             gap_cash_flow = daily_cash_flow
 
@@ -554,6 +789,21 @@ class PortfolioManager:
 
         return nav_record
 
+    def backfill_nav(self, account: str, start: Optional[date] = None, end: Optional[date] = None,
+                     dry_run: bool = False) -> List[NAVHistory]:
+        """按交易记录回放并补录缺失日期的净值（见 NavReplay）
+
+        回放前先从历史行情源导入区间内的日收盘价；本地时间序列未开启时报错。
+
+        Args:
+            start: 起始日期（为空从第一笔交易/出入金开始）
+            end: 截止日期（为空到昨天）
+            dry_run: 只计算不写入
+        """
+        from .nav_replay import NavReplay
+        return NavReplay(self.storage, price_fetcher=self.price_fetcher).backfill(
+            account, start, end, dry_run=dry_run)
+
     def _calc_nav_metrics(
         self, *, account, today, total_value, yesterday_nav, prev_year_end_nav,
         prev_month_end_nav, last_nav, yearly_data, daily_cash_flow,
@@ -775,37 +1025,6 @@ class PortfolioManager:
 
         return None
 
-    def _get_daily_cash_flow(self, account: str, flow_date: date) -> float:
-        """获取当日资金变动（从cash_flow表）"""
-        # 使用通用的 get_cash_flows 方法
-        flows = self.storage.get_cash_flows(account, flow_date, flow_date)
-        return sum(f.cny_amount or 0 for f in flows)
-
-    def _get_yearly_cash_flow(self, account: str, year: str) -> float:
-        """获取当年累计资金变动"""
-        year_start = date(int(year), 1, 1)
-        year_end = date(int(year), 12, 31)
-
-        flows = self.storage.get_cash_flows(account, year_start, year_end)
-        return sum(f.cny_amount or 0 for f in flows)
-
-    def _get_monthly_cash_flow(self, account: str, year: int, month: int) -> float:
-        """获取当月累计资金变动"""
-        month_start = date(year, month, 1)
-        if month == 12:
-            month_end = date(year, 12, 31)
-        else:
-            month_end = date(year, month + 1, 1)
-            from datetime import timedelta
-            month_end = month_end - timedelta(days=1)
-        flows = self.storage.get_cash_flows(account, month_start, month_end)
-        return sum(f.cny_amount or 0 for f in flows)
-
-    def _get_period_cash_flow(self, account: str, start_date: date, end_date: date) -> float:
-        """获取指定期间的累计资金变动"""
-        flows = self.storage.get_cash_flows(account, start_date, end_date)
-        return sum(f.cny_amount or 0 for f in flows)
-
     def _get_prev_month_end_nav(self, account: str, year: int, month: int) -> Optional[NAVHistory]:
         """获取上月末净值记录"""
         if month == 1:
@@ -827,7 +1046,7 @@ class PortfolioManager:
             return config.get_initial_value() or None
 
         # 按日期排序，取最早的
-        earliest_nav = min(navs, key=lambda x: x.date)
+        earliest_nav = NavTimeline.of(navs).earliest
 
         # 如果最早记录的净值接近1，使用其total_value
         if earliest_nav and earliest_nav.nav and abs(earliest_nav.nav - 1.0) < 0.01:
@@ -839,40 +1058,21 @@ class PortfolioManager:
     # ========== 内存查询辅助（避免重复 API 调用）==========
 
     @staticmethod
-    def _find_latest_nav_before(navs: list, before_date: date):
-        """从内存 NAV 列表中找指定日期之前的最新记录"""
-        candidates = [n for n in navs if n.date < before_date]
-        return max(candidates, key=lambda n: n.date) if candidates else None
+    def _find_latest_nav_before(navs, before_date: date):
+        """指定日期之前的最新记录（navs 为 NavTimeline 或列表）"""
+        return NavTimeline.of(navs).before(before_date)
 
     @staticmethod
-    def _find_year_end_nav(navs: list, year: str):
-        """从内存 NAV 列表中找指定年份的年末记录"""
+    def _find_year_end_nav(navs, year: str):
+        """指定年份的年末记录；没有当年记录时取次年第一条"""
+        timeline = NavTimeline.of(navs)
         yr = int(year)
-        year_navs = [n for n in navs if n.date.year == yr]
-        if year_navs:
-            return max(year_navs, key=lambda n: n.date)
-        # 没有当年记录，找次年第一条
-        next_year_navs = [n for n in navs if n.date.year == yr + 1]
-        if next_year_navs:
-            return min(next_year_navs, key=lambda n: n.date)
-        return None
+        return timeline.year_end(yr) or timeline.year_start(yr + 1)
 
     @staticmethod
-    def _find_prev_month_end_nav(navs: list, year: int, month: int):
-        """从内存 NAV 列表中找上月末记录"""
-        if month == 1:
-            prev_year, prev_month = year - 1, 12
-        else:
-            prev_year, prev_month = year, month - 1
-        prev_month_navs = [n for n in navs if n.date.year == prev_year and n.date.month == prev_month]
-        return max(prev_month_navs, key=lambda n: n.date) if prev_month_navs else None
-
-    def _get_cumulative_cash_flow_from_year(self, account: str, from_year: str, to_date: date) -> float:
-        """获取从某年开始到指定日期的累计资金变动"""
-        year_start = date(int(from_year), 1, 1)
-
-        flows = self.storage.get_cash_flows(account, year_start, to_date)
-        return sum(f.cny_amount or 0 for f in flows)
+    def _find_prev_month_end_nav(navs, year: int, month: int):
+        """上月末记录"""
+        return NavTimeline.of(navs).prev_month_end(year, month)
 
     # ========== 份额管理 ==========
 
@@ -9,26 +9,52 @@
 3. 非交易时间延长缓存，交易时间缩短缓存
 4. 美股多数据源备选，防止限流
 """
+import asyncio
+import atexit
 import requests
 import re
 import os
 import time
 import random
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from typing import Dict, Optional, List
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 import threading
+import weakref
 from pathlib import Path
 
 from .market_time import MarketTimeUtil
-from .asset_utils import detect_market_type as _detect_market_type_func
+from .market_snapshot import market_snapshots
+from .fx_history import fx_history
+from .quote_providers import ProviderRegistry, QuoteProvider
+from .single_flight import SingleFlight
+from .asset_utils import detect_asset_type, detect_market_type as _detect_market_type_func
 from . import config as _config
 
 
 # 汇率缓存文件路径（使用项目相对路径）
 RATE_CACHE_FILE = Path(__file__).parent.parent / '.data' / 'rate_cache.json'
 
+# 进程内在途请求合并：key 为资产代码 / 货币对（如 USDCNY）
+_quote_flight = SingleFlight()
+_fx_flight = SingleFlight()
+
+# 进程退出前等待后台刷新（过期报价先行返回）完成的最长时间（秒）
+REFRESH_EXIT_TIMEOUT = 10.0
+# 有后台刷新在进行的 PriceFetcher（退出时逐个等待）
+_refreshing_fetchers: 'weakref.WeakSet' = weakref.WeakSet()
+
+
+@atexit.register
+def _wait_for_pending_refreshes():
+    """skill_api 多为短进程：退出前等待后台刷新写入缓存，否则刷新随进程被杀掉、过期报价一直不更新"""
+    deadline = time.monotonic() + REFRESH_EXIT_TIMEOUT
+    for fetcher in list(_refreshing_fetchers):
+        if not fetcher.wait_for_refresh(max(0.0, deadline - time.monotonic())):
+            print("[警告] 后台价格刷新未在退出前完成，下次查询将重新刷新")
+            return
+
 class PriceFetcher:
     """统一价格获取器 (带缓存优化，支持飞书多维表)"""
 
@@ -63,6 +89,53 @@ class PriceFetcher:
         self.use_cache = use_cache and storage is not None
         self._rate_cache = {}  # 汇率缓存
         self._rate_cache_time = None
+        # 后台刷新（stale-while-revalidate）：进行中的代码集合，避免重复刷新
+        self._refresh_lock = threading.Lock()
+        self._refreshing: set = set()
+        self._refresh_threads: List[threading.Thread] = []
+        # AKShare 全量表快照（进程内共享，TTL 内每张表只下载一次）
+        self.snapshots = market_snapshots
+        # 行情源注册表（健康统计与熔断状态进程内共享）
+        self.providers = self._build_providers()
+        # 请求合并（进程内共享）：同一代码/货币对的并发查询只请求一次上游
+        self.quote_flight = _quote_flight
+        self.fx_flight = _fx_flight
+        # 日汇率历史（进程内共享，历史汇率查询不走网络）
+        self.fx_history = fx_history
+
+    def _build_providers(self) -> ProviderRegistry:
+        """注册各市场的行情源（注册顺序即无健康样本时的同分优先级）"""
+        registry = ProviderRegistry()
+        registry.register(QuoteProvider(
+            'tencent',
+            {'cn': self._fetch_a_stock_from_tencent, 'hk': self._fetch_hk_stock_from_tencent,
+             'etf': self._fetch_etf_from_tencent},
+            fetch_batch=self._fetch_tencent_batch, rate=10, burst=5, expected_latency=0.3,
+        ))
+        registry.register(QuoteProvider(
+            'akshare',
+            {'cn': self._fetch_a_stock_from_akshare, 'hk': self._fetch_hk_stock_from_akshare},
+            rate=2, burst=5, expected_latency=20.0,
+        ))
+        finnhub_key = _config.get('finnhub_api_key')
+        if finnhub_key:
+            # 免费额度 60 次/分钟
+            registry.register(QuoteProvider(
+                'finnhub', {'us': lambda code: self._fetch_us_stock_finnhub(code, finnhub_key)},
+                rate=1, burst=10, expected_latency=0.5,
+            ))
+        registry.register(QuoteProvider(
+            'yahoo_api', {'us': self._fetch_us_stock_yahoo_api},
+            rate=2, burst=5, expected_latency=1.0,
+        ))
+        registry.register(QuoteProvider(
+            'yfinance', {'us': self._fetch_us_stock_yfinance}, expected_latency=3.0,
+        ))
+        return registry
+
+    def provider_health(self) -> Dict[str, Dict]:
+        """各行情源健康状态（滚动耗时、错误率、熔断状态）"""
+        return self.providers.health()
 
     def fetch(self, code: str, asset_name: str = None, force_refresh: bool = False) -> Optional[Dict]:
         """获取资产价格 (带缓存)
@@ -100,52 +173,98 @@ class PriceFetcher:
                     'expires_at': cached.expires_at
                 }
 
-        # 获取实时价格
-        result = self._fetch_realtime(code, asset_name)
+        # 获取实时价格（同一代码的并发查询共享一次请求）
+        result, shared = self.quote_flight.do(code, self._fetch_realtime, code, asset_name)
 
-        # 写入缓存
-        if result and self.use_cache:
-            from .models import PriceCache, AssetType
-            from datetime import datetime, timedelta
-
-            market_type = _detect_market_type_func(code)
-            ttl = MarketTimeUtil.get_cache_ttl(market_type)
-
-            # 计算过期时间
-            expires_at = datetime.now() + timedelta(seconds=ttl)
-
-            # 检测资产类型
-            asset_type = AssetType.OTHER
-            if market_type == 'cn':
-                asset_type = AssetType.A_STOCK
-            elif market_type == 'hk':
-                asset_type = AssetType.HK_STOCK
-            elif market_type == 'us':
-                asset_type = AssetType.US_STOCK
-            elif market_type == 'fund':
-                asset_type = AssetType.FUND
-
-            price_cache = PriceCache(
-                asset_id=code,
-                asset_name=result.get('name'),
-                asset_type=asset_type,
-                price=result.get('price', 0),
-                currency=result.get('currency', 'CNY'),
-                cny_price=result.get('cny_price', result.get('price', 0)),
-                change=result.get('change'),
-                change_pct=result.get('change_pct'),
-                exchange_rate=result.get('exchange_rate'),
-                data_source=result.get('source'),
-                expires_at=expires_at
-            )
-            self.storage.save_price(price_cache)
-            result['market_type'] = market_type
+        # 写入缓存（共享结果由发起请求的调用方写入）
+        if result and self.use_cache and not shared:
+            self.storage.save_price(self._build_price_cache(code, result))
 
         return result
 
+    @staticmethod
+    def _is_cacheable(code: str) -> bool:
+        """现金和货币基金不走价格缓存"""
+        return not (code == 'CASH' or code.endswith('-CASH') or code.endswith('-MMF'))
+
+    def _fetch_fresh(self, code: str, asset_name: str = None) -> Optional[Dict]:
+        """获取价格（不读写缓存，供批量查询使用）"""
+        code = code.upper().strip()
+        if code == 'CASH' or code.endswith('-CASH'):
+            return self._get_cash_price(code)
+        if code.endswith('-MMF'):
+            return self._get_mmf_price(code)
+        return self.quote_flight.do(code, self._fetch_realtime, code, (asset_name or '').strip())[0]
+
+    def _build_price_cache(self, code: str, result: Dict):
+        """实时价格 -> PriceCache（按市场计算过期时间，并在 result 中标注 market_type）"""
+        from .models import PriceCache, AssetType
+        from datetime import datetime, timedelta
+
+        market_type = _detect_market_type_func(code)
+        ttl = MarketTimeUtil.get_cache_ttl(market_type)
+
+        # 计算过期时间
+        expires_at = datetime.now() + timedelta(seconds=ttl)
+
+        # 检测资产类型
+        asset_type = AssetType.OTHER
+        if market_type == 'cn':
+            asset_type = AssetType.A_STOCK
+        elif market_type == 'hk':
+            asset_type = AssetType.HK_STOCK
+        elif market_type == 'us':
+            asset_type = AssetType.US_STOCK
+        elif market_type == 'fund':
+            asset_type = AssetType.FUND
+
+        result['market_type'] = market_type
+        trade_date = self._quote_trade_date(result)
+        closed = (trade_date is not None and trade_date.weekday() < 5
+                  and MarketTimeUtil.is_session_closed(market_type, trade_date))
+        return PriceCache(
+            asset_id=code,
+            asset_name=result.get('name'),
+            asset_type=asset_type,
+            price=result.get('price', 0),
+            currency=result.get('currency', 'CNY'),
+            cny_price=result.get('cny_price', result.get('price', 0)),
+            change=result.get('change'),
+            change_pct=result.get('change_pct'),
+            exchange_rate=result.get('exchange_rate'),
+            data_source=result.get('source'),
+            expires_at=expires_at,
+            close_date=trade_date if closed else None
+        )
+
+    @staticmethod
+    def _quote_trade_date(result: Dict) -> Optional[date]:
+        """报价所属交易日：trade_date（美股）> nav_date（基金）> time 中的 YYYYMMDD（腾讯行情）
+
+        只有时分秒的 time（akshare 港股）无法判断交易日，返回 None。
+        """
+        value = result.get('trade_date') or result.get('nav_date')
+        if value is not None:
+            if isinstance(value, datetime):
+                return value.date()
+            if isinstance(value, date):
+                return value
+            try:
+                return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+            except ValueError:
+                return None
+        digits = re.sub(r'\D', '', str(result.get('time') or ''))
+        if len(digits) < 8:
+            return None
+        try:
+            return datetime.strptime(digits[:8], '%Y%m%d').date()
+        except ValueError:
+            return None
+
     def fetch_batch(self, codes: List[str], name_map: Dict[str, str] = None,
                     force_refresh: bool = False, use_concurrent: bool = True,
-                    skip_us: bool = False, use_cache_only: bool = False) -> Dict[str, Dict]:
+                    skip_us: bool = False, use_cache_only: bool = False,
+                    stale_while_revalidate: bool = False, async_io: bool = None) -> Dict[str, Dict]:
         """批量获取价格 (智能缓存 + 并发查询)
 
         Args:
@@ -155,74 +274,44 @@ class PriceFetcher:
             use_concurrent: 是否使用并发查询
             skip_us: 是否跳过美股查询（用于快速获取）
             use_cache_only: 仅使用缓存，不请求实时价格（超时时使用）
+            stale_while_revalidate: 过期不久的缓存直接返回（标记 stale 和 age 秒数），
+                后台线程刷新；超期超过 MarketTimeUtil.get_max_staleness 的仍同步获取。
+                适合交互式查询，记录净值等需要最新价格的场景不要开启
+            async_io: 并发查询改走 asyncio 行情引擎（fetch_batch_async 的同步包装，
+                需要 aiohttp）；为空时读取配置 price_fetcher.async_io。已在事件循环中时忽略
 
         Returns:
             代码到价格数据的映射
         """
         name_map = name_map or {}
-        results = {}
+        if async_io is None:
+            async_io = _config.is_price_async_enabled()
+        if async_io and use_concurrent and not self._in_event_loop():
+            return asyncio.run(self.fetch_batch_async(
+                codes, name_map, force_refresh=force_refresh, skip_us=skip_us,
+                use_cache_only=use_cache_only, stale_while_revalidate=stale_while_revalidate))
 
         # 第一步：智能检查缓存，分离需要查询和已有缓存的
-        to_fetch = []
-        expired_cache = {}  # 记录过期缓存，用于 fallback
-
-        for code in codes:
-            if self.use_cache:
-                from .models import PriceCache
-                cached = self.storage.get_price(code)
-                if cached:
-                    cached_dict = self._price_cache_to_dict(cached)
-                    # 检查是否过期
-                    is_expired = True
-                    if cached.expires_at:
-                        try:
-                            expire_dt = datetime.fromisoformat(cached.expires_at.replace('Z', '+00:00')) if isinstance(cached.expires_at, str) else cached.expires_at
-                            is_expired = expire_dt <= datetime.now()
-                        except:
-                            pass
-
-                    if not is_expired:
-                        # 缓存有效，直接使用
-                        results[code] = cached_dict
-                        continue
-                    else:
-                        # 缓存过期但保留，用于失败时 fallback
-                        expired_cache[code] = cached_dict
-
-            # 需要获取新价格
-            if not use_cache_only:
-                to_fetch.append(code)
-            elif code in expired_cache:
-                # 仅使用缓存模式：即使过期也使用
-                results[code] = expired_cache[code]
-
+        results, to_fetch, expired_cache = self._split_cached(
+            codes, name_map, use_cache_only, stale_while_revalidate)
         if not to_fetch:
             return results
 
         # 第二步：区分美股和非美股
-        us_codes = []
-        other_codes = []
-        for code in to_fetch:
-            market_type = _detect_market_type_func(code)
-            if market_type == 'us' and not skip_us:
-                us_codes.append(code)
-            elif market_type != 'us':
-                other_codes.append(code)
-            elif skip_us and code in expired_cache:
-                # 跳过美股但保留过期缓存
-                results[code] = expired_cache[code]
+        us_codes, other_codes = self._split_us(to_fetch, skip_us, expired_cache, results)
 
         # 第三步：美股和非美股并行查询
         # 使用 ThreadPoolExecutor 同时启动两组查询，减少总等待时间
+        fresh = {}  # 本次实时获取成功的非美股价格，最后一次性写入缓存
         if use_concurrent and (other_codes or us_codes):
             with ThreadPoolExecutor(max_workers=2) as executor:
                 futures = []
+                other_future = None
 
                 # 提交非美股查询
                 if other_codes:
-                    futures.append(
-                        executor.submit(self._fetch_concurrent, other_codes, name_map)
-                    )
+                    other_future = executor.submit(self._fetch_concurrent, other_codes, name_map)
+                    futures.append(other_future)
 
                 # 提交美股查询（并行执行）
                 if us_codes:
@@ -235,6 +324,8 @@ class PriceFetcher:
                     try:
                         batch_results = future.result()
                         results.update(batch_results)
+                        if future is other_future:
+                            fresh.update(batch_results)
                     except Exception as e:
                         print(f"[警告] 批量查询失败: {e}")
 
@@ -243,12 +334,14 @@ class PriceFetcher:
                 if code not in results and code in expired_cache:
                     results[code] = expired_cache[code]
         else:
-            # 非并发模式：串行处理
+            # 非并发模式：批量行情源请求后，剩余代码串行处理
+            batch_results = self._fetch_many_shared(other_codes, name_map)
             for code in other_codes:
                 asset_name = name_map.get(code)
-                result = self.fetch(code, asset_name, force_refresh)
+                result = batch_results.get(code) or self._fetch_fresh(code, asset_name)
                 if result and 'error' not in result:
                     results[code] = result
+                    fresh[code] = result
                 elif code in expired_cache:
                     results[code] = expired_cache[code]
 
@@ -256,8 +349,146 @@ class PriceFetcher:
                 us_results = self._fetch_us_batch(us_codes, name_map, expired_cache)
                 results.update(us_results)
 
+        # 第四步：新价格一次性写入缓存（一个事务）
+        self._persist_fresh(fresh)
+
+        return results
+
+    async def fetch_batch_async(self, codes: List[str], name_map: Dict[str, str] = None,
+                                force_refresh: bool = False, skip_us: bool = False,
+                                use_cache_only: bool = False, stale_while_revalidate: bool = False,
+                                deadline: Optional[float] = None) -> Dict[str, Dict]:
+        """批量获取价格（asyncio 行情引擎，单事件循环内并发，不嵌套线程池）
+
+        缓存读取、过期报价先行返回、新价格写入缓存与 fetch_batch 相同；实时查询由
+        AsyncQuoteEngine 完成（按 host 限制连接数、每个请求有超时），超过 deadline
+        时取消在途请求，未获取到的代码使用过期缓存。
+
+        Args:
+            deadline: 实时查询整体截止时间（秒），为空使用引擎默认值
+            其余参数同 fetch_batch
+        """
+        from .quote_engine import AsyncQuoteEngine
+
+        name_map = name_map or {}
+        results, to_fetch, expired_cache = self._split_cached(
+            codes, name_map, use_cache_only, stale_while_revalidate)
+        if not to_fetch:
+            return results
+
+        us_codes, other_codes = self._split_us(to_fetch, skip_us, expired_cache, results)
+        async with AsyncQuoteEngine(self) as engine:
+            fetched = await engine.fetch_many(other_codes + us_codes, name_map, deadline=deadline)
+
+        fresh = {}
+        for code in other_codes + us_codes:
+            result = fetched.get(code)
+            if result:
+                results[code] = result
+                if code in other_codes:
+                    fresh[code] = result
+            elif code in expired_cache:
+                results[code] = expired_cache[code]
+
+        self._persist_fresh(fresh)
         return results
 
+    def _split_cached(self, codes: List[str], name_map: Dict[str, str], use_cache_only: bool,
+                      stale_while_revalidate: bool) -> tuple:
+        """第一步：智能检查缓存，分离需要查询和已有缓存的
+
+        一次批量查询（含过期条目），不逐个构建 PriceCache 模型。
+
+        Returns:
+            (已有结果, 需要实时获取的代码, 过期缓存)
+        """
+        results = {}
+        to_fetch = []
+        expired_cache = {}  # 记录过期缓存，用于 fallback
+        to_revalidate = []  # 已先行返回过期报价、需后台刷新的代码
+        cached_rows = self.storage.get_prices(codes, include_expired=True) if self.use_cache else {}
+        now = datetime.now()
+        staleness_overrides = _config.get_price_max_staleness() if stale_while_revalidate else None
+
+        for code in codes:
+            if self.use_cache:
+                row = cached_rows.get(code)
+                if row:
+                    cached_dict = self._cache_row_to_dict(row)
+                    # 无过期时间的条目视为过期
+                    is_expired = row['expired'] or not row['expires_at']
+
+                    if not is_expired:
+                        # 缓存有效，直接使用
+                        results[code] = cached_dict
+                        continue
+                    else:
+                        # 缓存过期但保留，用于失败时 fallback
+                        expired_cache[code] = cached_dict
+
+                        if stale_while_revalidate and not use_cache_only and \
+                                self._within_staleness(row, now, staleness_overrides):
+                            results[code] = self._mark_stale(cached_dict, row, now)
+                            to_revalidate.append(code)
+                            continue
+
+            # 需要获取新价格
+            if not use_cache_only:
+                to_fetch.append(code)
+            elif code in expired_cache:
+                # 仅使用缓存模式：即使过期也使用
+                results[code] = expired_cache[code]
+
+        if to_revalidate:
+            self._revalidate_async(to_revalidate, name_map)
+
+        return results, to_fetch, expired_cache
+
+    @staticmethod
+    def _split_us(to_fetch: List[str], skip_us: bool, expired_cache: Dict[str, Dict],
+                  results: Dict[str, Dict]) -> tuple:
+        """第二步：区分美股和非美股（跳过美股时直接使用过期缓存）
+
+        Returns:
+            (美股代码, 非美股代码)
+        """
+        us_codes = []
+        other_codes = []
+        for code in to_fetch:
+            market_type = _detect_market_type_func(code)
+            if market_type == 'us' and not skip_us:
+                us_codes.append(code)
+            elif market_type != 'us':
+                other_codes.append(code)
+            elif skip_us and code in expired_cache:
+                # 跳过美股但保留过期缓存
+                results[code] = expired_cache[code]
+        return us_codes, other_codes
+
+    def _persist_fresh(self, fresh: Dict[str, Dict]):
+        """新价格一次性写入缓存（一个事务）"""
+        if self.use_cache and fresh:
+            self.storage.save_prices([
+                self._build_price_cache(code.upper().strip(), result)
+                for code, result in fresh.items() if self._is_cacheable(code.upper().strip())
+            ])
+
+    @staticmethod
+    def _in_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    # 支持批量请求的市场
+    BATCH_MARKETS = ['cn', 'hk', 'etf']
+
+    def _fetch_many_shared(self, codes: List[str], name_map: Dict[str, str]) -> Dict[str, Dict]:
+        """批量行情源查询，已有其他调用方在查询的代码等待其结果"""
+        return self.quote_flight.do_many(
+            codes, lambda pending: self.providers.fetch_many(self.BATCH_MARKETS, pending, name_map))
+
     def _fetch_concurrent(self, codes: List[str], name_map: Dict[str, str],
                           max_workers: int = 5) -> Dict[str, Dict]:
         """并发批量查询（用于非美股资产）
@@ -273,10 +504,14 @@ class PriceFetcher:
         results = {}
         errors = []
 
+        # 批量行情源（腾讯多代码请求）覆盖 A股/港股/ETF，剩余代码（场外基金、美股、批量未返回的）逐个获取
+        results.update(self._fetch_many_shared(codes, name_map))
+        codes = [c for c in codes if c not in results]
+
         def fetch_single(code):
             try:
                 asset_name = name_map.get(code)
-                return code, self.fetch(code, asset_name, force_refresh=False)
+                return code, self._fetch_fresh(code, asset_name)
             except Exception as e:
                 return code, {'error': str(e)}
 
@@ -307,9 +542,8 @@ class PriceFetcher:
 
         策略：
         1. 使用并发但限制并发数
-        2. 缩短超时时间（5秒 vs 15秒）
-        3. 不重试，失败后立即使用缓存
-        4. 跟踪失败率，如果过高则跳过剩余
+        2. 数据源按健康度路由，被限流/连续失败的数据源熔断，熔断状态跨调用保留
+        3. 所有数据源熔断时立即返回，失败的代码使用过期缓存
 
         Args:
             codes: 美股代码列表
@@ -324,157 +558,112 @@ class PriceFetcher:
         if not codes:
             return results
 
-        failure_lock = threading.Lock()
-        consecutive_failures = [0]  # 使用列表以便在闭包中修改
-        max_consecutive_failures = 3  # 连续失败3次则认为接口不可用
-
-        # 检查是否有 Finnhub API key
-        finnhub_key = _config.get('finnhub_api_key')
-
-        def fetch_single_us(code):
-            """获取单个美股价格（快速模式）"""
-            try:
-                # 使用缩短的超时和不重试
-                yf_code = code.replace('.', '-')
-
-                # 尝试1: Finnhub API（如果配置了 API key，3秒超时）
-                if finnhub_key:
-                    try:
-                        result = self._fetch_us_stock_finnhub(yf_code, finnhub_key)
-                        if result:
-                            result['code'] = code  # 确保使用原始代码
-                            return code, result
-                    except Exception:
-                        pass
-
-                # 尝试2: Yahoo API（5秒超时，不重试）
-                try:
-                    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{yf_code}?interval=1d&range=2d"
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                        'Accept': 'application/json',
-                    }
-                    response = self.session.get(url, headers=headers, timeout=5)
-
-                    if response.status_code == 200:
-                        data = response.json()
-                        chart = data.get('chart', {})
-                        if not chart.get('error'):
-                            result = chart.get('result', [{}])[0]
-                            meta = result.get('meta', {})
-                            quotes = result.get('indicators', {}).get('quote', [{}])[0]
-                            closes = [c for c in quotes.get('close', []) if c is not None]
-
-                            if closes:
-                                current = closes[-1]
-                                prev_close = meta.get('previousClose') or meta.get('chartPreviousClose') or current
-                                change = current - prev_close
-                                change_pct = (change / prev_close * 100) if prev_close else 0
-
-                                rates = self._fetch_exchange_rates()
-                                usd_cny = rates['USDCNY']
-
-                                return code, {
-                                    'code': code,
-                                    'name': meta.get('shortName') or meta.get('longName') or code,
-                                    'price': round(current, 2),
-                                    'prev_close': round(prev_close, 2),
-                                    'change': round(change, 2),
-                                    'change_pct': round(change_pct, 2),
-                                    'currency': meta.get('currency', 'USD'),
-                                    'cny_price': round(current * usd_cny, 2),
-                                    'exchange_rate': usd_cny,
-                                    'market_type': 'us',
-                                    'source': 'yahoo_api'
-                                }
-                except Exception:
-                    pass
-
-                # 如果 Yahoo API 失败，尝试 yfinance（3秒超时）
-                try:
-                    import yfinance as yf
-                    ticker = yf.Ticker(yf_code)
-                    info = ticker.info
-                    hist = ticker.history(period="1d", timeout=3)
-
-                    if not hist.empty:
-                        latest = hist.iloc[-1]
-                        prev_close = info.get('previousClose', latest['Open'])
-                        current = latest['Close']
-                        change = current - prev_close
-                        change_pct = (change / prev_close * 100) if prev_close else 0
-
-                        rates = self._fetch_exchange_rates()
-                        usd_cny = rates['USDCNY']
-
-                        return code, {
-                            'code': code,
-                            'name': info.get('shortName', yf_code),
-                            'price': round(current, 2),
-                            'prev_close': round(prev_close, 2),
-                            'change': round(change, 2),
-                            'change_pct': round(change_pct, 2),
-                            'currency': info.get('currency', 'USD'),
-                            'cny_price': round(current * usd_cny, 2),
-                            'exchange_rate': usd_cny,
-                            'market_type': 'us',
-                            'source': 'yfinance'
-                        }
-                except Exception:
-                    pass
-
-                # 所有数据源失败
-                return code, None
-
-            except Exception:
-                return code, None
-
-        # 使用 ThreadPoolExecutor 并发查询，但限制并发数
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
             future_to_code = {
-                executor.submit(fetch_single_us, code): code for code in codes
+                executor.submit(self.quote_flight.do, code, self._fetch_us_stock, code): code
+                for code in codes
             }
 
-            # 收集结果
             for future in as_completed(future_to_code):
                 code = future_to_code[future]
                 try:
-                    _, result = future.result(timeout=10)  # 整体等待10秒
-                    if result:
-                        results[code] = result
-                        with failure_lock:
-                            consecutive_failures[0] = 0  # 重置失败计数
-                    else:
-                        with failure_lock:
-                            consecutive_failures[0] += 1
-                        # 使用过期缓存作为 fallback
-                        if code in expired_cache:
-                            results[code] = expired_cache[code]
-                            results[code]['source'] = 'cache_fallback'
+                    result, _ = future.result(timeout=10)
                 except Exception:
-                    with failure_lock:
-                        consecutive_failures[0] += 1
-                    if code in expired_cache:
-                        results[code] = expired_cache[code]
-                        results[code]['source'] = 'cache_fallback'
-
-                # 如果连续失败过多，取消剩余任务
-                with failure_lock:
-                    should_break = consecutive_failures[0] >= max_consecutive_failures
-                if should_break:
-                    print(f"[美股价格] 连续 {consecutive_failures[0]} 次获取失败，跳过剩余美股查询")
-                    # 剩余未完成的都使用缓存
-                    for f, c in future_to_code.items():
-                        if c not in results and c in expired_cache:
-                            results[c] = expired_cache[c]
-                            results[c]['source'] = 'cache_fallback'
-                    break
+                    result = None
+                if result:
+                    results[code] = result
+                elif code in expired_cache:
+                    # 使用过期缓存作为 fallback
+                    results[code] = expired_cache[code]
+                    results[code]['source'] = 'cache_fallback'
 
         return results
 
+    @staticmethod
+    def _within_staleness(row: Dict, now: datetime, overrides: Dict[str, int] = None) -> bool:
+        """过期缓存的超期时间是否在所属市场允许范围内"""
+        if not row.get('expires_at'):
+            return False
+        try:
+            expires_at = datetime.strptime(row['expires_at'][:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return False
+        market_type = _detect_market_type_func(row['asset_id'])
+        overdue = (now - expires_at).total_seconds()
+        return overdue <= MarketTimeUtil.get_max_staleness(market_type, overrides)
+
+    @staticmethod
+    def _mark_stale(cached_dict: Dict, row: Dict, now: datetime) -> Dict:
+        """标记过期报价及其年龄（距上次写入缓存的秒数）"""
+        age = None
+        if row.get('updated_at'):
+            try:
+                age = int((now - datetime.strptime(row['updated_at'], '%Y-%m-%d %H:%M:%S')).total_seconds())
+            except ValueError:
+                pass
+        return {**cached_dict, 'stale': True, 'age': age}
+
+    def _revalidate_async(self, codes: List[str], name_map: Dict[str, str]):
+        """后台刷新过期报价（守护线程，进程退出前最多等待 REFRESH_EXIT_TIMEOUT 秒；同一代码进行中时不重复提交）"""
+        with self._refresh_lock:
+            codes = [c for c in codes if c not in self._refreshing]
+            self._refreshing.update(codes)
+            self._refresh_threads = [t for t in self._refresh_threads if t.is_alive()]
+        if not codes:
+            return
+
+        def _run():
+            try:
+                fresh = self._fetch_concurrent(codes, name_map)
+                to_save = [self._build_price_cache(code.upper().strip(), result)
+                           for code, result in fresh.items()
+                           if self._is_cacheable(code.upper().strip())]
+                if to_save:
+                    self.storage.save_prices(to_save)
+            except Exception as e:
+                print(f"[警告] 后台刷新价格失败: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.difference_update(codes)
+
+        thread = threading.Thread(target=_run, daemon=True, name='price-revalidate')
+        with self._refresh_lock:
+            self._refresh_threads.append(thread)
+        _refreshing_fetchers.add(self)
+        thread.start()
+
+    def wait_for_refresh(self, timeout: float = None) -> bool:
+        """等待后台刷新完成（进程退出时由 atexit 调用，测试中也可直接使用）
+
+        Args:
+            timeout: 总等待时间（秒），为空时一直等待
+
+        Returns:
+            是否全部完成
+        """
+        with self._refresh_lock:
+            threads = list(self._refresh_threads)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(t.is_alive() for t in threads)
+
+    @staticmethod
+    def _cache_row_to_dict(row: Dict) -> Dict:
+        """将价格缓存行字典（LocalPriceCache.get_many）转为价格字典"""
+        return {
+            'code': row['asset_id'],
+            'name': row.get('asset_name'),
+            'price': row.get('price') or 0,
+            'currency': row.get('currency') or 'CNY',
+            'cny_price': row.get('cny_price'),
+            'change': row.get('change'),
+            'change_pct': row.get('change_pct'),
+            'exchange_rate': row.get('exchange_rate'),
+            'source': row.get('data_source') or 'cache',
+            'expires_at': row.get('expires_at')
+        }
+
     def _price_cache_to_dict(self, cached) -> Dict:
         """将PriceCache对象转为字典"""
         return {
@@ -816,9 +1005,11 @@ class PriceFetcher:
 
         try:
             with ThreadPoolExecutor(max_workers=2) as executor:
-                futures = {executor.submit(fetch_single_rate_with_fallback, c): c for c in currencies}
+                # 同一货币对的并发查询共享一次请求
+                futures = {executor.submit(self.fx_flight.do, f'{c}CNY', fetch_single_rate_with_fallback, c): c
+                           for c in currencies}
                 for future in as_completed(futures):
-                    currency, rate, error = future.result()
+                    (currency, rate, error), _ = future.result()
                     if error:
                         errors.append(f"{currency}: {error}")
                     else:
@@ -835,8 +1026,9 @@ class PriceFetcher:
             }
             self._rate_cache_time = now
 
-            # 保存到文件
+            # 保存到文件，并记入当日汇率历史
             self._save_rate_cache_to_file(self._rate_cache)
+            self._record_fx_history(self._rate_cache, now.date())
             print(f"[汇率] 已更新缓存: USD/CNY={self._rate_cache['USDCNY']}, HKD/CNY={self._rate_cache['HKDCNY']}")
 
             return self._rate_cache
@@ -869,31 +1061,404 @@ class PriceFetcher:
             # 完全没有缓存，抛出异常
             raise RuntimeError(f"获取汇率失败且没有可用缓存: {e}")
 
-    # ========== 具体数据源获取方法 ==========
+    # ========== 汇率历史 ==========
 
-    def _fetch_a_stock(self, code: str) -> Optional[Dict]:
-        """获取A股价格 (腾讯主源 + AKShare备用)"""
-        # 1. 先尝试腾讯API
-        try:
-            result = self._fetch_a_stock_from_tencent(code)
-            if result:
-                return result
-        except requests.Timeout:
-            print(f"[超时] 腾讯API获取A股价格 {code}")
-        except Exception as e:
-            print(f"[腾讯API失败] 获取A股价格 {code}: {e}")
+    # 需要记录历史的货币（与 _fetch_exchange_rates 一致）
+    FX_CURRENCIES = ('USD', 'HKD')
+    # exchangerate.host timeseries 单次请求的最大天数
+    FX_TIMESERIES_MAX_DAYS = 365
 
-        # 2. 腾讯失败，尝试AKShare
-        print(f"[备用源] 尝试AKShare获取A股 {code}...")
+    def _record_fx_history(self, rates: Dict[str, float], on: date):
+        """实时汇率记入汇率历史（失败只打印警告）"""
         try:
-            result = self._fetch_a_stock_from_akshare(code)
-            if result:
-                return result
+            for pair, rate in rates.items():
+                self.fx_history.put(pair, [(on, rate)], source='live')
         except Exception as e:
-            print(f"[AKShare失败] 获取A股价格 {code}: {e}")
+            print(f"[警告] 记录汇率历史失败: {e}")
+
+    def get_exchange_rate(self, currency: str, on: date = None) -> Optional[float]:
+        """某一天的 {currency}/CNY 汇率
+
+        Args:
+            currency: 币种（CNY 返回 1.0）
+            on: 日期；为空或不早于今天时取实时汇率，过去的日期只查本地汇率历史（不走网络）
+
+        Returns:
+            汇率；历史中没有该日期（需先 backfill_exchange_rates）时返回 None
+        """
+        currency = currency.upper()
+        if currency == 'CNY':
+            return 1.0
+        pair = f'{currency}CNY'
+        if on is None or on >= date.today():
+            return self._fetch_exchange_rates().get(pair)
+        return self.fx_history.rate(pair, on)
+
+    def backfill_exchange_rates(self, start: date, end: date = None, currencies: List[str] = None,
+                                force: bool = False) -> Dict[str, int]:
+        """从历史数据源批量导入日汇率
+
+        依次尝试新浪外汇日K线（一次返回全部历史）、exchangerate.host timeseries（按年分段）。
+        已覆盖 [start, end] 的货币对跳过（force=True 时重新导入）。
 
+        Returns:
+            {货币对: 写入条数}
+        """
+        end = end or date.today()
+        written = {}
+        for currency in currencies or self.FX_CURRENCIES:
+            currency = currency.upper()
+            pair = f'{currency}CNY'
+            coverage = self.fx_history.coverage(pair)
+            if not force and coverage and coverage[0] <= start and coverage[1] >= end:
+                written[pair] = 0
+                continue
+
+            rows, source = [], None
+            for source, func in (('sina', self._fetch_fx_history_sina),
+                                 ('exchangerate_host', self._fetch_fx_history_exchangerate_host)):
+                try:
+                    rows = [(d, rate) for d, rate in func(currency, start, end) if start <= d <= end]
+                except Exception as e:
+                    print(f"[汇率历史] {source} 获取 {pair} 失败: {e}")
+                    continue
+                if rows:
+                    break
+            written[pair] = self.fx_history.put(pair, rows, source=source) if rows else 0
+            if rows:
+                print(f"[汇率历史] {pair} 已导入 {written[pair]} 条（{source}，{rows[0][0]} ~ {rows[-1][0]}）")
+            else:
+                print(f"[警告] {pair} 历史汇率获取失败")
+        return written
+
+    def _fetch_fx_history_sina(self, currency: str, start: date, end: date) -> List[tuple]:
+        """新浪外汇日K线（与实时汇率同源，一次返回全部历史）"""
+        symbol = f'fx_s{currency.lower()}cny'
+        url = (f'https://vip.stock.finance.sina.com.cn/forex/api/jsonp.php/var%20_{symbol}=/'
+               f'NewForexService.getDayKLine?symbol={symbol}')
+        response = self.session.get(url, timeout=15, headers={'Referer': 'https://finance.sina.com.cn'})
+        response.raise_for_status()
+        return self._parse_sina_fx_kline(response.text)
+
+    @staticmethod
+    def _parse_sina_fx_kline(text: str) -> List[tuple]:
+        """解析 var _fx_susdcny=("日期,开盘,最低,最高,收盘,|...") ，返回 [(日期, 收盘价)]"""
+        match = re.search(r'"([^"]*)"', text)
+        if not match:
+            return []
+        rows = []
+        for item in match.group(1).split('|'):
+            parts = item.split(',')
+            if len(parts) < 5:
+                continue
+            try:
+                rows.append((date.fromisoformat(parts[0]), float(parts[4])))
+            except ValueError:
+                continue
+        return sorted(rows)
+
+    def _fetch_fx_history_exchangerate_host(self, currency: str, start: date, end: date) -> List[tuple]:
+        """exchangerate.host timeseries（按 FX_TIMESERIES_MAX_DAYS 分段请求）"""
+        rows = []
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + timedelta(days=self.FX_TIMESERIES_MAX_DAYS - 1))
+            response = self.session.get('https://api.exchangerate.host/timeseries', timeout=15, params={
+                'start_date': chunk_start.isoformat(), 'end_date': chunk_end.isoformat(),
+                'base': currency, 'symbols': 'CNY',
+            })
+            response.raise_for_status()
+            rows.extend(self._parse_exchangerate_host_timeseries(response.json()))
+            chunk_start = chunk_end + timedelta(days=1)
+        return rows
+
+    @staticmethod
+    def _parse_exchangerate_host_timeseries(data: Dict) -> List[tuple]:
+        """解析 {'rates': {'2025-01-02': {'CNY': 7.3}}}，返回 [(日期, 汇率)]"""
+        rows = []
+        for day, rates in (data.get('rates') or {}).items():
+            rate = (rates or {}).get('CNY')
+            if rate:
+                rows.append((date.fromisoformat(day), float(rate)))
+        return sorted(rows)
+
+    # ========== 历史收盘价（净值回放使用） ==========
+
+    TENCENT_KLINE_URL = 'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get'
+    # 腾讯日K线单次最多返回 640 条，按约 600 个交易日的日历区间分段请求
+    TENCENT_KLINE_LIMIT = 640
+    TENCENT_KLINE_CHUNK_DAYS = 870
+
+    def backfill_closes(self, codes: List[str], start: date, end: date = None,
+                        timeseries=None, name_map: Dict[str, str] = None) -> Dict[str, int]:
+        """从历史数据源导入 [start, end] 的日收盘价到本地时间序列（同日覆盖）
+
+        A股/ETF/港股：腾讯日K线（不复权）；美股：Yahoo chart；场外基金：akshare 历史净值。
+        人民币计价的资产同时写入人民币收盘价，外币资产只写原币种收盘价（估值时按当日汇率折算）。
+
+        Args:
+            timeseries: 目标 TimeSeriesStore，为空时使用 storage.timeseries
+
+        Returns:
+            {资产代码: 写入条数}（获取失败为 0）
+        """
+        if timeseries is None:
+            timeseries = getattr(self.storage, 'timeseries', None)
+        if timeseries is None:
+            raise RuntimeError("本地时间序列未开启（PORTFOLIO_TIMESERIES），无法导入历史收盘价")
+        end = end or date.today()
+        name_map = name_map or {}
+        written = {}
+        for code in codes:
+            try:
+                rows = [(d, close) for d, close in self._fetch_close_history(code, name_map.get(code), start, end)
+                        if start <= d <= end and close]
+            except Exception as e:
+                print(f"[收盘价历史] 获取 {code} 失败: {e}")
+                rows = []
+            if not rows:
+                print(f"[警告] {code} 历史收盘价获取失败（{start} ~ {end}）")
+                written[code] = 0
+                continue
+            cny = detect_asset_type(code)[1] == 'CNY'
+            written[code] = timeseries.append_prices(code, [(d, close, close if cny else None) for d, close in rows])
+            print(f"[收盘价历史] {code} 已导入 {written[code]} 条（{rows[0][0]} ~ {rows[-1][0]}）")
+        return written
+
+    def _fetch_close_history(self, code: str, asset_name: Optional[str], start: date, end: date) -> List[tuple]:
+        """按 _fetch_realtime 的路由规则选择历史数据源，返回 [(日期, 原币种收盘价)]"""
+        target = self._tencent_query_code(code, asset_name)
+        if target is not None:
+            return self._fetch_tencent_kline(target[0], start, end)
+        normalized = self._normalize_code_with_name(code.upper().strip(), asset_name)
+        if normalized.isdigit() and len(normalized) == 6:
+            return self._fetch_fund_nav_history(normalized)
+        return self._fetch_yahoo_history(code.upper().strip(), start, end)
+
+    def _fetch_tencent_kline(self, query_code: str, start: date, end: date) -> List[tuple]:
+        """腾讯日K线（不复权，按 TENCENT_KLINE_CHUNK_DAYS 分段请求）"""
+        rows = []
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + timedelta(days=self.TENCENT_KLINE_CHUNK_DAYS - 1))
+            response = self.session.get(self.TENCENT_KLINE_URL, timeout=15, params={
+                'param': f'{query_code},day,{chunk_start.isoformat()},{chunk_end.isoformat()},'
+                         f'{self.TENCENT_KLINE_LIMIT},',
+            })
+            response.raise_for_status()
+            rows.extend(self._parse_tencent_kline(response.json(), query_code))
+            chunk_start = chunk_end + timedelta(days=1)
+        return sorted(set(rows))
+
+    @staticmethod
+    def _parse_tencent_kline(data: Dict, query_code: str) -> List[tuple]:
+        """解析 {'data': {'sh600519': {'day': [['2025-01-02', 开, 收, 高, 低, 量], ...]}}}"""
+        series = ((data.get('data') or {}).get(query_code) or {})
+        klines = series.get('day') or series.get('qfqday') or []
+        rows = []
+        for item in klines:
+            try:
+                rows.append((date.fromisoformat(item[0]), float(item[2])))
+            except (ValueError, TypeError, IndexError):
+                continue
+        return rows
+
+    def _fetch_yahoo_history(self, code: str, start: date, end: date) -> List[tuple]:
+        """Yahoo chart 日线（period1/period2 为 UTC 时间戳）"""
+        period1 = int(datetime(start.year, start.month, start.day).timestamp())
+        period2 = int((datetime(end.year, end.month, end.day) + timedelta(days=1)).timestamp())
+        response = self.session.get(
+            f'https://query1.finance.yahoo.com/v8/finance/chart/{code}', timeout=15,
+            params={'interval': '1d', 'period1': period1, 'period2': period2},
+            headers={'User-Agent': 'Mozilla/5.0', 'Accept': 'application/json'})
+        response.raise_for_status()
+        return self._parse_yahoo_history(response.json())
+
+    @staticmethod
+    def _parse_yahoo_history(data: Dict) -> List[tuple]:
+        """Yahoo chart 响应 -> [(交易所当地日期, 收盘价)]"""
+        result = ((data.get('chart') or {}).get('result') or [{}])[0]
+        offset = (result.get('meta') or {}).get('gmtoffset', 0)
+        closes = ((result.get('indicators') or {}).get('quote') or [{}])[0].get('close') or []
+        rows = {}
+        for ts, close in zip(result.get('timestamp') or [], closes):
+            if close is not None:
+                rows[datetime.fromtimestamp(ts + offset, tz=timezone.utc).date()] = float(close)
+        return sorted(rows.items())
+
+    def _fetch_fund_nav_history(self, code: str) -> List[tuple]:
+        """akshare 场外基金历史单位净值（一次返回全部历史）"""
+        import akshare as ak
+
+        df = ak.fund_open_fund_info_em(symbol=code)
+        rows = []
+        for nav_date, nav in zip(df['净值日期'], df['单位净值']):
+            try:
+                rows.append((date.fromisoformat(str(nav_date)[:10]), float(nav)))
+            except (ValueError, TypeError):
+                continue
+        return sorted(rows)
+
+    # ========== 具体数据源获取方法 ==========
+
+    # ========== 腾讯行情（qt.gtimg.cn，支持逗号分隔多代码） ==========
+
+    # 单次请求的代码数（控制 URL 长度）
+    TENCENT_BATCH_SIZE = 60
+    TENCENT_URL = 'http://qt.gtimg.cn/q='
+    _TENCENT_LINE = re.compile(r'v_([A-Za-z0-9_]+)="([^"]*)"')
+
+    def _query_tencent(self, query_codes: List[str], timeout: int = 5) -> Dict[str, List[str]]:
+        """请求腾讯行情并一次解析全部 v_xxx="..." 行
+
+        Returns:
+            {query_code: 按 ~ 拆分的字段列表}，字段不足的行不返回
+        """
+        url = f"{self.TENCENT_URL}{','.join(query_codes)}"
+        response = self.session.get(url, timeout=timeout)
+        response.encoding = 'gb2312'
+        return self._parse_tencent_text(response.text)
+
+    @classmethod
+    def _parse_tencent_text(cls, text: str) -> Dict[str, List[str]]:
+        """解析腾讯行情响应中的全部 v_xxx="..." 行（字段不足的行忽略）"""
+        result = {}
+        for query_code, body in cls._TENCENT_LINE.findall(text):
+            data = body.split('~')
+            if len(data) > 45:
+                result[query_code] = data
+        return result
+
+    @staticmethod
+    def _parse_tencent_fields(code: str, data: List[str], kind: str, hkd_cny: float = None) -> Dict:
+        """腾讯行情字段 -> 价格字典
+
+        Args:
+            kind: 'cn'（A股）/ 'etf'（场内基金）/ 'hk'（港股，需传 hkd_cny）
+        """
+        price = float(data[3])
+        result = {
+            'code': code,
+            'name': data[1],
+            'price': price,
+            'prev_close': float(data[4]),
+            'open': float(data[5]),
+            'high': float(data[33]),
+            'low': float(data[34]),
+            'change': float(data[31]),
+            'change_pct': float(data[32]),
+            'volume': float(data[36]) * 100 if data[36] else 0,
+            'time': data[30],
+        }
+        if kind == 'hk':
+            result.update({
+                'currency': 'HKD',
+                'cny_price': round(price * hkd_cny, 2),
+                'exchange_rate': hkd_cny,
+                'market_type': 'hk',
+                'source': 'tencent',
+            })
+        else:
+            result.update({
+                'currency': 'CNY',
+                'cny_price': price,
+                'market_type': 'cn',
+                'source': 'tencent_etf' if kind == 'etf' else 'tencent',
+            })
+        return result
+
+    def _tencent_query_code(self, code: str, asset_name: str = None) -> Optional[tuple]:
+        """按 _fetch_realtime 的路由规则计算腾讯行情代码
+
+        Returns:
+            (query_code, kind)；场外基金、美股、现金等不走腾讯的返回 None
+        """
+        code = code.upper().strip()
+        if not self._is_cacheable(code):
+            return None
+        name_hints = self._get_type_hints_from_name(asset_name)
+        code = self._normalize_code_with_name(code, asset_name)
+
+        if self._is_etf(code):
+            return f'{self._get_exchange_prefix(code)}{code}', 'etf'
+        if code.startswith(('SH', 'SZ')) or (code.isdigit() and len(code) == 6 and
+                                            code.startswith(('6', '0', '3', '1', '2'))):
+            is_likely_fund = name_hints.get('is_fund', False) or self._is_otc_fund(code)
+            if is_likely_fund and not name_hints.get('is_stock', False):
+                return None
+            if code.startswith(('SH', 'SZ')):
+                return code.lower(), 'cn'
+            return (f'sh{code}' if code.startswith('6') else f'sz{code}'), 'cn'
+        if code.startswith('HK') or (code.isdigit() and 4 <= len(code) <= 5):
+            numeric_part = code[2:] if code.startswith('HK') else code
+            return f'hk{numeric_part.zfill(5)}', 'hk'
         return None
 
+    def _fetch_tencent_batch(self, codes: List[str], name_map: Dict[str, str] = None,
+                             max_workers: int = 5) -> Dict[str, Dict]:
+        """A股/港股/ETF 合并为少量多代码请求（每批 TENCENT_BATCH_SIZE 个）
+
+        Returns:
+            成功获取的 {原始代码: 价格字典}；不适用或未返回的代码不在结果中，由调用方逐个回退
+        """
+        targets = self._tencent_targets(codes, name_map)
+        if not targets:
+            return {}
+
+        chunks = self._tencent_chunks(targets)
+        quotes = {}
+        if len(chunks) == 1:
+            quotes.update(self._query_tencent(chunks[0]))
+        else:
+            errors = []
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+                for future in as_completed([executor.submit(self._query_tencent, c) for c in chunks]):
+                    try:
+                        quotes.update(future.result())
+                    except Exception as e:
+                        print(f"[腾讯批量行情失败] {e}")
+                        errors.append(e)
+            if len(errors) == len(chunks):
+                raise errors[0]
+
+        hkd_cny = self._fetch_exchange_rates()['HKDCNY'] if self._tencent_needs_hkd(targets, quotes) else None
+        return self._tencent_results(targets, quotes, hkd_cny)
+
+    def _tencent_targets(self, codes: List[str], name_map: Dict[str, str] = None) -> Dict[str, List[tuple]]:
+        """腾讯行情代码 -> [(原始代码, kind)]（不走腾讯的代码不在结果中）"""
+        name_map = name_map or {}
+        targets = {}
+        for code in codes:
+            routed = self._tencent_query_code(code, name_map.get(code))
+            if routed:
+                targets.setdefault(routed[0], []).append((code, routed[1]))
+        return targets
+
+    def _tencent_chunks(self, targets: Dict[str, List[tuple]]) -> List[List[str]]:
+        query_codes = list(targets)
+        return [query_codes[i:i + self.TENCENT_BATCH_SIZE]
+                for i in range(0, len(query_codes), self.TENCENT_BATCH_SIZE)]
+
+    @staticmethod
+    def _tencent_needs_hkd(targets: Dict[str, List[tuple]], quotes: Dict[str, List[str]]) -> bool:
+        return any(kind == 'hk' for query_code in quotes for _, kind in targets.get(query_code, []))
+
+    def _tencent_results(self, targets: Dict[str, List[tuple]], quotes: Dict[str, List[str]],
+                         hkd_cny: Optional[float]) -> Dict[str, Dict]:
+        """腾讯行情字段 -> {原始代码: 价格字典}"""
+        results = {}
+        for query_code, data in quotes.items():
+            for code, kind in targets.get(query_code, []):
+                try:
+                    results[code] = self._parse_tencent_fields(code, data, kind, hkd_cny=hkd_cny)
+                except (ValueError, IndexError, TypeError):
+                    continue
+        return results
+
+    def _fetch_a_stock(self, code: str) -> Optional[Dict]:
+        """获取A股价格（按健康度路由：腾讯 / AKShare）"""
+        return self.providers.fetch('cn', code)
+
     def _fetch_a_stock_from_tencent(self, code: str) -> Optional[Dict]:
         """从腾讯获取A股价格"""
         if code.startswith('SH'):
@@ -905,40 +1470,12 @@ class PriceFetcher:
         else:
             query_code = code
 
-        url = f"http://qt.gtimg.cn/q={query_code}"
-        response = self.session.get(url, timeout=5)
-        response.encoding = 'gb2312'
-        text = response.text
-
-        pattern = rf'v_{query_code}="([^"]+)"'
-        match = re.search(pattern, text)
-
-        if match:
-            data = match.group(1).split('~')
-            if len(data) > 45:
-                return {
-                    'code': code,
-                    'name': data[1],
-                    'price': float(data[3]),
-                    'prev_close': float(data[4]),
-                    'open': float(data[5]),
-                    'high': float(data[33]),
-                    'low': float(data[34]),
-                    'change': float(data[31]),
-                    'change_pct': float(data[32]),
-                    'volume': float(data[36]) * 100 if data[36] else 0,
-                    'time': data[30],
-                    'currency': 'CNY',
-                    'cny_price': float(data[3]),
-                    'market_type': 'cn',
-                    'source': 'tencent'
-                }
-        return None
+        data = self._query_tencent([query_code], timeout=5).get(query_code)
+        return self._parse_tencent_fields(code, data, 'cn') if data else None
 
     def _fetch_a_stock_from_akshare(self, code: str) -> Optional[Dict]:
         """从AKShare获取A股价格 (备用源)"""
         try:
-            import akshare as ak
             import pandas as pd
 
             # 标准化代码
@@ -947,16 +1484,11 @@ class PriceFetcher:
             else:
                 pure_code = code
 
-            # 使用akshare获取实时行情
-            df = ak.stock_zh_a_spot_em()
-
-            # 查找对应代码
-            row = df[df['代码'] == pure_code]
-            if row.empty:
+            # 全市场实时行情快照（TTL 内复用，不再每个代码下载一次）
+            data = self.snapshots.lookup('cn_spot', pure_code)
+            if data is None:
                 return None
 
-            data = row.iloc[0]
-
             return {
                 'code': code,
                 'name': data['名称'],
@@ -982,27 +1514,8 @@ class PriceFetcher:
             return None
 
     def _fetch_hk_stock(self, code: str) -> Optional[Dict]:
-        """获取港股价格 (腾讯主源 + AKShare备用)"""
-        # 1. 先尝试腾讯API
-        try:
-            result = self._fetch_hk_stock_from_tencent(code)
-            if result:
-                return result
-        except requests.Timeout:
-            print(f"[超时] 腾讯API获取港股价格 {code}")
-        except Exception as e:
-            print(f"[腾讯API失败] 获取港股价格 {code}: {e}")
-
-        # 2. 腾讯失败，尝试AKShare
-        print(f"[备用源] 尝试AKShare获取港股 {code}...")
-        try:
-            result = self._fetch_hk_stock_from_akshare(code)
-            if result:
-                return result
-        except Exception as e:
-            print(f"[AKShare失败] 获取港股价格 {code}: {e}")
-
-        return None
+        """获取港股价格（按健康度路由：腾讯 / AKShare）"""
+        return self.providers.fetch('hk', code)
 
     def _fetch_hk_stock_from_tencent(self, code: str) -> Optional[Dict]:
         """从腾讯获取港股价格"""
@@ -1013,45 +1526,14 @@ class PriceFetcher:
 
         query_code = f'hk{numeric_part}'
 
-        url = f"http://qt.gtimg.cn/q={query_code}"
-        response = self.session.get(url, timeout=5)
-        response.encoding = 'gb2312'
-        text = response.text
-
-        pattern = rf'v_{query_code}="([^"]+)"'
-        match = re.search(pattern, text)
-
-        if match:
-            data = match.group(1).split('~')
-            if len(data) > 45:
-                price = float(data[3])
-                rates = self._fetch_exchange_rates()
-                hkd_cny = rates['HKDCNY']
-
-                return {
-                    'code': code,
-                    'name': data[1],
-                    'price': price,
-                    'prev_close': float(data[4]),
-                    'open': float(data[5]),
-                    'high': float(data[33]),
-                    'low': float(data[34]),
-                    'change': float(data[31]),
-                    'change_pct': float(data[32]),
-                    'volume': float(data[36]) * 100 if data[36] else 0,
-                    'time': data[30],
-                    'currency': 'HKD',
-                    'cny_price': round(price * hkd_cny, 2),
-                    'exchange_rate': hkd_cny,
-                    'market_type': 'hk',
-                    'source': 'tencent'
-                }
-        return None
+        data = self._query_tencent([query_code], timeout=5).get(query_code)
+        if not data:
+            return None
+        return self._parse_tencent_fields(code, data, 'hk', hkd_cny=self._fetch_exchange_rates()['HKDCNY'])
 
     def _fetch_hk_stock_from_akshare(self, code: str) -> Optional[Dict]:
         """从AKShare获取港股价格 (备用源)"""
         try:
-            import akshare as ak
             import pandas as pd
 
             # 标准化代码
@@ -1060,15 +1542,10 @@ class PriceFetcher:
             else:
                 pure_code = code.zfill(5)
 
-            # 使用akshare获取港股实时行情
-            df = ak.stock_hk_spot_em()
-
-            # 查找对应代码
-            row = df[df['代码'] == pure_code]
-            if row.empty:
+            # 港股全市场实时行情快照（TTL 内复用）
+            data = self.snapshots.lookup('hk_spot', pure_code)
+            if data is None:
                 return None
-
-            data = row.iloc[0]
             price = float(data['最新价']) if pd.notna(data['最新价']) else 0.0
 
             # 获取汇率
@@ -1101,80 +1578,54 @@ class PriceFetcher:
             return None
 
     def _fetch_us_stock(self, code: str) -> Optional[Dict]:
-        """获取美股价格 (带多数据源备选和重试机制)
+        """获取美股价格（按健康度路由：Finnhub / Yahoo API / yfinance）
 
-        数据源优先级:
-        1. Finnhub API (如果配置了 API key) - 首选，稳定快速
-        2. Yahoo Finance API - 免费备选
-        3. yfinance 库 - 最后备选
+        Finnhub 需配置 API key；被限流或连续失败的数据源熔断后跳过，不再逐个重试。
         """
-        yf_code = code.replace('.', '-')
-        errors = []
-
-        # 尝试1: Finnhub API (如果配置了 API key)
-        finnhub_key = _config.get('finnhub_api_key')
-        if finnhub_key:
-            try:
-                result = self._fetch_us_stock_finnhub(yf_code, finnhub_key)
-                if result:
-                    return result
-            except Exception as e:
-                errors.append(f"Finnhub: {e}")
-
-        # 尝试2: Yahoo Finance 直接API (带重试)
-        try:
-            result = self._retry_with_backoff(
-                lambda: self._fetch_us_stock_yahoo_api(yf_code),
-                max_retries=2,
-                base_delay=1.0
-            )
-            if result:
-                return result
-        except Exception as e:
-            errors.append(f"Yahoo API: {e}")
+        result = self.providers.fetch('us', code.replace('.', '-'))
+        if not result:
+            print(f"获取美股价格失败 {code}: 所有数据源均无结果或已熔断")
+            return None
+        return {**result, 'code': code}
 
-        # 尝试3: yfinance库
-        try:
-            import yfinance as yf
-            ticker = yf.Ticker(yf_code)
-            info = ticker.info
-            hist = ticker.history(period="1d")
+    def _fetch_us_stock_yfinance(self, code: str) -> Optional[Dict]:
+        """通过 yfinance 库获取美股价格"""
+        import yfinance as yf
 
-            if not hist.empty:
-                latest = hist.iloc[-1]
-                prev_close = info.get('previousClose', latest['Open'])
-                current = latest['Close']
-                change = current - prev_close
-                change_pct = (change / prev_close * 100) if prev_close else 0
+        ticker = yf.Ticker(code)
+        info = ticker.info
+        hist = ticker.history(period="1d", timeout=5)
+        if hist.empty:
+            return None
 
-                rates = self._fetch_exchange_rates()
-                usd_cny = rates['USDCNY']
+        latest = hist.iloc[-1]
+        trade_date = hist.index[-1].date()
+        prev_close = info.get('previousClose', latest['Open'])
+        current = latest['Close']
+        change = current - prev_close
+        change_pct = (change / prev_close * 100) if prev_close else 0
 
-                return {
-                    'code': code,
-                    'name': info.get('shortName', yf_code),
-                    'price': round(current, 2),
-                    'prev_close': round(prev_close, 2),
-                    'open': round(latest['Open'], 2),
-                    'high': round(latest['High'], 2),
-                    'low': round(latest['Low'], 2),
-                    'change': round(change, 2),
-                    'change_pct': round(change_pct, 2),
-                    'volume': int(latest['Volume']),
-                    'currency': info.get('currency', 'USD'),
-                    'cny_price': round(current * usd_cny, 2),
-                    'exchange_rate': usd_cny,
-                    'market_type': 'us',
-                    'source': 'yfinance'
-                }
-        except ImportError:
-            errors.append("yfinance未安装")
-        except Exception as e:
-            errors.append(f"yfinance: {e}")
+        rates = self._fetch_exchange_rates()
+        usd_cny = rates['USDCNY']
 
-        # 所有数据源都失败
-        print(f"获取美股价格失败 {code}: {'; '.join(errors)}")
-        return None
+        return {
+            'code': code,
+            'name': info.get('shortName', code),
+            'price': round(current, 2),
+            'prev_close': round(prev_close, 2),
+            'open': round(latest['Open'], 2),
+            'high': round(latest['High'], 2),
+            'low': round(latest['Low'], 2),
+            'change': round(change, 2),
+            'change_pct': round(change_pct, 2),
+            'volume': int(latest['Volume']),
+            'currency': info.get('currency', 'USD'),
+            'cny_price': round(current * usd_cny, 2),
+            'exchange_rate': usd_cny,
+            'market_type': 'us',
+            'trade_date': trade_date,
+            'source': 'yfinance'
+        }
 
     def _fetch_us_stock_finnhub(self, code: str, api_key: str) -> Optional[Dict]:
         """通过 Finnhub API 获取美股价格
@@ -1194,8 +1645,11 @@ class PriceFetcher:
 
         response = self.session.get(url, params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
+        return self._parse_finnhub_quote(code, response.json(), self._fetch_exchange_rates()['USDCNY'])
 
+    @staticmethod
+    def _parse_finnhub_quote(code: str, data: Dict, usd_cny: float) -> Optional[Dict]:
+        """Finnhub quote 响应 -> 价格字典（同步与异步引擎共用）"""
         # Finnhub 返回字段：c(当前价), d(涨跌额), dp(涨跌幅%), h(最高), l(最低), o(开盘), pc(昨收)
         current = data.get('c')
         prev_close = data.get('pc')
@@ -1206,9 +1660,6 @@ class PriceFetcher:
         change = data.get('d', current - prev_close if prev_close else 0)
         change_pct = data.get('dp', (change / prev_close * 100) if prev_close else 0)
 
-        rates = self._fetch_exchange_rates()
-        usd_cny = rates['USDCNY']
-
         return {
             'code': code,
             'name': code,  # Finnhub quote 接口不返回名称，需要单独调用
@@ -1223,6 +1674,8 @@ class PriceFetcher:
             'cny_price': round(current * usd_cny, 2),
             'exchange_rate': usd_cny,
             'market_type': 'us',
+            'trade_date': (datetime.fromtimestamp(data['t'], tz=timezone.utc)
+                           .astimezone(MarketTimeUtil.TZ_NEW_YORK).date() if data.get('t') else None),
             'source': 'finnhub'
         }
 
@@ -1242,8 +1695,11 @@ class PriceFetcher:
             raise Exception("Rate limited")
 
         response.raise_for_status()
-        data = response.json()
+        return self._parse_yahoo_chart(code, response.json(), self._fetch_exchange_rates()['USDCNY'])
 
+    @staticmethod
+    def _parse_yahoo_chart(code: str, data: Dict, usd_cny: float) -> Optional[Dict]:
+        """Yahoo chart 响应 -> 价格字典（同步与异步引擎共用）"""
         chart = data.get('chart', {})
         if chart.get('error'):
             raise Exception(chart['error'].get('description', 'Unknown error'))
@@ -1287,9 +1743,6 @@ class PriceFetcher:
         valid_lows = [l for l in lows if l is not None]
         valid_volumes = [v for v in volumes if v is not None]
 
-        rates = self._fetch_exchange_rates()
-        usd_cny = rates['USDCNY']
-
         return {
             'code': code,
             'name': meta.get('shortName') or meta.get('longName') or meta.get('symbol'),
@@ -1305,55 +1758,30 @@ class PriceFetcher:
             'cny_price': round(current * usd_cny, 2),
             'exchange_rate': usd_cny,
             'market_type': 'us',
+            'trade_date': datetime.fromtimestamp(
+                (meta.get('regularMarketTime') or timestamps[-1]) + (meta.get('gmtoffset') or 0),
+                tz=timezone.utc).date(),
             'source': 'yahoo_api'
         }
 
     def _fetch_etf(self, code: str) -> Optional[Dict]:
         """获取ETF价格"""
-        try:
-            prefix = self._get_exchange_prefix(code)
-            query_code = f'{prefix}{code}'
-
-            url = f"http://qt.gtimg.cn/q={query_code}"
-            response = self.session.get(url, timeout=10)
-            response.encoding = 'gb2312'
-            text = response.text
+        return self.providers.fetch('etf', code)
 
-            pattern = rf'v_{query_code}="([^"]+)"'
-            match = re.search(pattern, text)
+    def _fetch_etf_from_tencent(self, code: str) -> Optional[Dict]:
+        """从腾讯获取ETF价格"""
+        prefix = self._get_exchange_prefix(code)
+        query_code = f'{prefix}{code}'
 
-            if match:
-                data = match.group(1).split('~')
-                if len(data) > 45:
-                    return {
-                        'code': code,
-                        'name': data[1],
-                        'price': float(data[3]),
-                        'prev_close': float(data[4]),
-                        'open': float(data[5]),
-                        'high': float(data[33]),
-                        'low': float(data[34]),
-                        'change': float(data[31]),
-                        'change_pct': float(data[32]),
-                        'volume': float(data[36]) * 100 if data[36] else 0,
-                        'time': data[30],
-                        'currency': 'CNY',
-                        'cny_price': float(data[3]),
-                        'market_type': 'cn',
-                        'source': 'tencent_etf'
-                    }
-            return None
-
-        except Exception as e:
-            print(f"获取ETF价格失败 {code}: {e}")
-            return None
+        data = self._query_tencent([query_code], timeout=10).get(query_code)
+        return self._parse_tencent_fields(code, data, 'etf') if data else None
 
     def _fetch_fund(self, code: str) -> Optional[Dict]:
         """获取场外基金净值（优化版）
 
         优化策略：
         1. 优先使用单个基金查询接口（<1秒）
-        2. 单个查询失败时，再使用全量排行接口（20-30秒）作为备用
+        2. 单个查询失败时，再使用全量排行快照作为备用（首次下载20-30秒，TTL 内复用）
         """
         import akshare as ak
 
@@ -1397,14 +1825,10 @@ class PriceFetcher:
             except Exception as e:
                 print(f"[基金] 单个查询失败 {code}: {e}，尝试备用方案...")
 
-            # 尝试2: 全量排行查询（慢，20-30秒）- 备用方案
+            # 尝试2: 全量排行快照（首次下载慢，TTL 内复用）- 备用方案
             try:
-                print(f"[基金] 正在从全量排行获取 {code}（可能需要20-30秒）...")
-                df = ak.fund_open_fund_rank_em()
-                fund_data = df[df['基金代码'] == code]
-
-                if not fund_data.empty:
-                    row = fund_data.iloc[0]
+                row = self.snapshots.lookup('fund_rank', code)
+                if row is not None:
                     try:
                         change_pct = float(row['日增长率'])
                     except (ValueError, TypeError):
@@ -0,0 +1,239 @@
+"""
+asyncio 行情引擎
+
+PriceFetcher.fetch_batch 的并发查询是嵌套线程池：外层 2 个线程分别跑
+_fetch_concurrent（5 线程）和 _fetch_us_batch（3 线程），每个线程阻塞在 requests 上。
+AsyncQuoteEngine 在一个事件循环内完成全部实时查询：
+1. 连接池：单个 aiohttp ClientSession，总连接数与每个 host 的连接数分别限制
+2. 每个请求有超时（request_timeout），整批有截止时间（deadline），超时取消全部在途请求，
+   已获取的结果照常返回
+3. 腾讯多代码请求、Finnhub、Yahoo API 为原生协程；AKShare、yfinance 等没有异步接口的
+   数据源在一个小线程池（blocking_workers）中执行，线程数不随代码数增长
+4. 数据源路由、健康统计、熔断与限速与同步路径共用 PriceFetcher.providers
+
+用法：
+    async with AsyncQuoteEngine(fetcher) as engine:
+        quotes = await engine.fetch_many(codes, name_map, deadline=20)
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from . import config as _config
+from .asset_utils import detect_market_type
+
+FINNHUB_URL = 'https://finnhub.io/api/v1/quote'
+YAHOO_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{code}?interval=1d&range=2d'
+YAHOO_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/json',
+}
+
+
+def _import_aiohttp():
+    """延迟导入 aiohttp（可选依赖）"""
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise ImportError("AsyncQuoteEngine 需要 aiohttp，请执行 pip install aiohttp") from e
+    return aiohttp
+
+
+class AsyncQuoteEngine:
+    """单事件循环的批量行情查询"""
+
+    def __init__(self, fetcher, max_connections: int = 100, limit_per_host: int = 10,
+                 request_timeout: float = 8.0, default_deadline: Optional[float] = 25.0,
+                 blocking_workers: int = 4):
+        """
+        Args:
+            fetcher: PriceFetcher 实例（复用代码路由、解析函数、汇率缓存和行情源注册表）
+            max_connections: 连接池总连接数
+            limit_per_host: 每个 host 的最大并发连接数
+            request_timeout: 单个 HTTP 请求超时（秒）
+            default_deadline: 整批查询默认截止时间（秒），None 表示不限
+            blocking_workers: 同步数据源（AKShare、yfinance、基金）的线程池大小
+        """
+        self.fetcher = fetcher
+        self.max_connections = max_connections
+        self.limit_per_host = limit_per_host
+        self.request_timeout = request_timeout
+        self.default_deadline = default_deadline
+        self.blocking_workers = blocking_workers
+        self._session = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._rates_task: Optional[asyncio.Future] = None
+
+    # ========== 会话管理 ==========
+
+    async def _get_session(self):
+        """获取（或创建）aiohttp 会话；会话绑定到当前事件循环"""
+        if self._session is None or self._session.closed:
+            aiohttp = _import_aiohttp()
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=dict(self.fetcher.session.headers),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+        return self._session
+
+    async def close(self):
+        """关闭连接池和线程池（不等待仍在执行的同步查询）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # ========== 基础 I/O ==========
+
+    async def _get(self, url: str, params: Dict = None, headers: Dict = None,
+                   encoding: str = 'utf-8') -> tuple:
+        """GET 请求（单请求超时）
+
+        Returns:
+            (状态码, 响应文本)
+        """
+        async def request():
+            session = await self._get_session()
+            async with session.get(url, params=params, headers=headers) as response:
+                body = await response.read()
+                return response.status, body.decode(encoding, errors='replace')
+
+        return await asyncio.wait_for(request(), timeout=self.request_timeout)
+
+    async def _run_blocking(self, func, *args):
+        """在有界线程池中执行同步函数"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.blocking_workers,
+                                                thread_name_prefix='quote-blocking')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _rates(self) -> Dict[str, float]:
+        """汇率（整批只取一次，走 PriceFetcher 的内存/文件缓存）"""
+        if self._rates_task is None:
+            self._rates_task = asyncio.ensure_future(
+                self._run_blocking(self.fetcher._fetch_exchange_rates))
+        # shield：单个等待方被取消时不取消共享的汇率查询
+        return await asyncio.shield(self._rates_task)
+
+    # ========== 数据源（原生协程） ==========
+
+    async def _tencent_batch(self, codes: List[str], name_map: Dict[str, str] = None) -> Dict[str, Dict]:
+        """腾讯多代码请求，各批并发发出（语义同 PriceFetcher._fetch_tencent_batch）"""
+        fetcher = self.fetcher
+        targets = fetcher._tencent_targets(codes, name_map)
+        if not targets:
+            return {}
+
+        chunks = fetcher._tencent_chunks(targets)
+        responses = await asyncio.gather(
+            *(self._get(fetcher.TENCENT_URL + ','.join(chunk), encoding='gb2312') for chunk in chunks),
+            return_exceptions=True)
+
+        quotes = {}
+        errors = []
+        for response in responses:
+            if isinstance(response, BaseException):
+                if isinstance(response, asyncio.CancelledError):
+                    raise response
+                print(f"[腾讯批量行情失败] {response}")
+                errors.append(response)
+                continue
+            status, text = response
+            if status >= 400:
+                errors.append(Exception(f"HTTP {status}"))
+                continue
+            quotes.update(fetcher._parse_tencent_text(text))
+        if errors and len(errors) == len(chunks):
+            raise errors[0]
+
+        hkd_cny = (await self._rates())['HKDCNY'] if fetcher._tencent_needs_hkd(targets, quotes) else None
+        return fetcher._tencent_results(targets, quotes, hkd_cny)
+
+    async def _finnhub(self, code: str) -> Optional[Dict]:
+        status, text = await self._get(FINNHUB_URL, params={
+            'symbol': code, 'token': _config.get('finnhub_api_key')})
+        if status >= 400:
+            raise Exception(f"HTTP {status}")
+        return self.fetcher._parse_finnhub_quote(code, json.loads(text), (await self._rates())['USDCNY'])
+
+    async def _yahoo(self, code: str) -> Optional[Dict]:
+        status, text = await self._get(YAHOO_URL.format(code=code), headers=YAHOO_HEADERS)
+        if status == 429:
+            raise Exception("Rate limited")
+        if status >= 400:
+            raise Exception(f"HTTP {status}")
+        return self.fetcher._parse_yahoo_chart(code, json.loads(text), (await self._rates())['USDCNY'])
+
+    # ========== 批量查询 ==========
+
+    async def _fetch_others(self, codes: List[str], name_map: Dict[str, str], results: Dict[str, Dict]):
+        """非美股：批量行情源一次取回，其余代码（场外基金、批量未返回的）走同步路径"""
+        providers = self.fetcher.providers
+        results.update(await providers.fetch_many_async(
+            self.fetcher.BATCH_MARKETS, codes, name_map,
+            overrides={'tencent': self._tencent_batch}, run_blocking=self._run_blocking))
+
+        async def fetch_one(code):
+            try:
+                result = await self._run_blocking(self.fetcher._fetch_fresh, code, name_map.get(code))
+            except Exception as e:
+                print(f"[行情引擎] 获取 {code} 失败: {e}")
+                return
+            if result and 'error' not in result:
+                results[code] = result
+
+        await asyncio.gather(*(fetch_one(code) for code in codes if code not in results))
+
+    async def _fetch_us(self, code: str, results: Dict[str, Dict]):
+        """美股：按健康度路由，Finnhub / Yahoo API 走原生协程，yfinance 走线程池"""
+        result = await self.fetcher.providers.fetch_async(
+            'us', code.replace('.', '-'),
+            overrides={'finnhub': self._finnhub, 'yahoo_api': self._yahoo},
+            run_blocking=self._run_blocking)
+        if result:
+            results[code] = {**result, 'code': code}
+
+    async def fetch_many(self, codes: List[str], name_map: Dict[str, str] = None,
+                         deadline: Optional[float] = None) -> Dict[str, Dict]:
+        """并发获取一组代码的实时价格
+
+        Args:
+            deadline: 截止时间（秒），超时取消在途请求；为空使用 default_deadline，<=0 不限
+
+        Returns:
+            成功获取的 {代码: 价格字典}（超时或失败的代码不在结果中）
+        """
+        name_map = name_map or {}
+        deadline = self.default_deadline if deadline is None else deadline
+        results: Dict[str, Dict] = {}
+
+        us_codes = [c for c in codes if detect_market_type(c) == 'us']
+        us_set = set(us_codes)
+        other_codes = [c for c in codes if c not in us_set]
+        tasks = [asyncio.ensure_future(self._fetch_us(code, results)) for code in us_codes]
+        if other_codes:
+            tasks.append(asyncio.ensure_future(self._fetch_others(other_codes, name_map, results)))
+        if not tasks:
+            return results
+
+        done, pending = await asyncio.wait(tasks, timeout=deadline if deadline and deadline > 0 else None)
+        if pending:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            print(f"[行情引擎] 超过截止时间 {deadline} 秒，已取消 {len(pending)} 组在途查询")
+        for task in done:
+            if not task.cancelled() and task.exception():
+                print(f"[行情引擎] 查询失败: {task.exception()}")
+        return dict(results)
@@ -0,0 +1,350 @@
+"""
+行情源注册表（健康评分 + 熔断）
+
+原先各市场的数据源回退顺序写死在各个方法里（A股：腾讯 → AKShare；美股：Finnhub →
+Yahoo API → yfinance），美股批量查询的连续失败计数每次调用都重新开始，前一次调用中
+已被限流的数据源下一次仍然首先尝试。
+
+QuoteProvider 声明数据源覆盖的市场、是否支持批量、限速；ProviderRegistry 负责路由：
+1. 健康统计（进程内共享，跨调用保留）：最近 HEALTH_WINDOW 次调用的耗时与错误率
+2. 熔断：连续失败 FAILURE_THRESHOLD 次，或样本充足且错误率超过 ERROR_RATE_THRESHOLD 时
+   打开，冷却期内直接跳过；冷却结束后半开放行一次试探，成功则关闭，失败则冷却时间翻倍
+3. 路由：按预期耗时（平均耗时 / 成功率）从小到大尝试健康的数据源，无样本时使用声明的预期耗时
+4. 限速：每个数据源一个进程内共享的令牌桶（rate_limiter.get_bucket）
+
+约定：数据源抛出异常记为失败；返回 None 表示该代码无数据（如代码不存在），不计入错误率。
+异步路由（fetch_async / fetch_many_async）与同步共用健康统计、熔断与令牌桶，调用被取消时不计入统计。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from .rate_limiter import get_bucket
+
+HEALTH_WINDOW = 50
+FAILURE_THRESHOLD = 3
+ERROR_RATE_THRESHOLD = 0.5
+MIN_SAMPLES = 10
+COOLDOWN = 60.0
+MAX_COOLDOWN = 600.0
+
+
+class ProviderHealth:
+    """单个数据源的滚动健康统计与熔断状态（线程安全）"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.samples: deque = deque(maxlen=HEALTH_WINDOW)  # (是否成功, 耗时秒)
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self.opened_at = 0.0
+            self.cooldown = COOLDOWN
+            self._probing = False
+
+    # ========== 统计 ==========
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._error_rate_unlocked()
+
+    def _error_rate_unlocked(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for ok, _ in self.samples if not ok) / len(self.samples)
+
+    def latency(self) -> Optional[float]:
+        """最近成功调用的平均耗时（秒），无样本时返回 None"""
+        with self._lock:
+            return self._latency_unlocked()
+
+    def _latency_unlocked(self) -> Optional[float]:
+        latencies = [t for ok, t in self.samples if ok]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def score(self, expected_latency: float) -> float:
+        """预期耗时（平均耗时 / 成功率），越小越优先"""
+        with self._lock:
+            latency = self._latency_unlocked()
+            success = 1.0 - self._error_rate_unlocked()
+        if latency is None:
+            latency = expected_latency
+        return latency / max(success, 0.05)
+
+    # ========== 熔断 ==========
+
+    def allow(self) -> bool:
+        """是否允许调用（打开状态冷却结束后转为半开，只放行一次试探）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def available(self) -> bool:
+        """是否可参与路由（不占用半开试探名额）"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return not (self.state == self.HALF_OPEN and self._probing)
+
+    def release(self):
+        """调用被取消：归还半开试探名额（不计入统计）"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            self.samples.append((ok, latency))
+            if ok:
+                self.consecutive_failures = 0
+                if self.state != self.CLOSED:
+                    print(f"[行情源] {self.name} 已恢复")
+                self.state = self.CLOSED
+                self.cooldown = COOLDOWN
+                self._probing = False
+                return
+
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN:
+                # 试探失败：冷却时间翻倍
+                self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+                self._open_unlocked()
+            elif self.state == self.CLOSED and (
+                    self.consecutive_failures >= FAILURE_THRESHOLD or
+                    (len(self.samples) >= MIN_SAMPLES and
+                     self._error_rate_unlocked() >= ERROR_RATE_THRESHOLD)):
+                self._open_unlocked()
+
+    def _open_unlocked(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._probing = False
+        print(f"[行情源] {self.name} 熔断 {int(self.cooldown)} 秒"
+              f"（连续失败 {self.consecutive_failures} 次）")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latency = self._latency_unlocked()
+            return {
+                'state': self.state,
+                'calls': len(self.samples),
+                'error_rate': round(self._error_rate_unlocked(), 4),
+                'latency_ms': round(latency * 1000, 1) if latency is not None else None,
+                'consecutive_failures': self.consecutive_failures,
+            }
+
+
+# 进程级健康统计：数据源名称 -> ProviderHealth（所有 PriceFetcher 共享）
+_health: Dict[str, ProviderHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_health(name: str) -> ProviderHealth:
+    """获取（或创建）进程内共享的数据源健康统计"""
+    with _health_lock:
+        health = _health.get(name)
+        if health is None:
+            health = ProviderHealth(name)
+            _health[name] = health
+        return health
+
+
+def reset_health():
+    """清空健康统计（测试用）"""
+    with _health_lock:
+        _health.clear()
+
+
+class QuoteProvider:
+    """行情数据源声明"""
+
+    def __init__(self, name: str, fetchers: Dict[str, Callable[[str], Optional[Dict]]],
+                 fetch_batch: Callable[..., Dict[str, Dict]] = None,
+                 rate: float = None, burst: int = 1, expected_latency: float = 1.0):
+        """
+        Args:
+            name: 数据源名称（健康统计与令牌桶按名称共享）
+            fetchers: 市场 -> 单代码查询函数（'cn' / 'hk' / 'etf' / 'us' / 'fund'）
+            fetch_batch: 批量查询函数（可选），返回 {代码: 价格字典}，只包含成功的代码
+            rate: 每秒请求数上限（为空不限速）
+            burst: 令牌桶容量
+            expected_latency: 无样本时的预期耗时（秒），用于初始排序
+        """
+        self.name = name
+        self.fetchers = fetchers
+        self.fetch_batch = fetch_batch
+        self.expected_latency = expected_latency
+        self.bucket = get_bucket(f'quote:{name}', rate, burst) if rate else None
+        self.health = get_health(name)
+
+    @property
+    def markets(self) -> List[str]:
+        return list(self.fetchers)
+
+    @property
+    def supports_batch(self) -> bool:
+        return self.fetch_batch is not None
+
+    def call(self, func: Callable, *args):
+        """限速后调用，记录耗时与成败"""
+        if self.bucket:
+            self.bucket.acquire()
+        start = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception:
+            self.health.record(False, time.monotonic() - start)
+            raise
+        self.health.record(True, time.monotonic() - start)
+        return result
+
+    async def call_async(self, func: Callable, *args):
+        """协程版 call：func 为协程函数，限速等待不阻塞事件循环"""
+        if self.bucket:
+            await self.bucket.acquire_async()
+        start = time.monotonic()
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            self.health.release()
+            raise
+        except Exception:
+            self.health.record(False, time.monotonic() - start)
+            raise
+        self.health.record(True, time.monotonic() - start)
+        return result
+
+
+class ProviderRegistry:
+    """按市场路由到最快的健康数据源"""
+
+    def __init__(self):
+        self._providers: List[QuoteProvider] = []
+
+    def register(self, provider: QuoteProvider) -> QuoteProvider:
+        self._providers.append(provider)
+        return provider
+
+    def route(self, market: str, batch: bool = False) -> List[QuoteProvider]:
+        """覆盖该市场的可用数据源，按预期耗时升序（同分时保持注册顺序）"""
+        candidates = [p for p in self._providers
+                      if market in p.fetchers and (p.supports_batch or not batch)
+                      and p.health.available()]
+        return sorted(candidates, key=lambda p: p.health.score(p.expected_latency))
+
+    def fetch(self, market: str, code: str) -> Optional[Dict]:
+        """依次尝试该市场的数据源，返回第一个有效结果；全部失败或熔断时返回 None"""
+        for provider in self.route(market):
+            if not provider.health.allow():
+                continue
+            try:
+                result = provider.call(provider.fetchers[market], code)
+            except Exception as e:
+                print(f"[行情源] {provider.name} 获取 {code} 失败: {e}")
+                continue
+            if result and 'error' not in result:
+                return result
+        return None
+
+    def fetch_many(self, markets: List[str], codes: List[str], *args) -> Dict[str, Dict]:
+        """用支持批量的数据源获取一组代码，前一个数据源未返回的代码交给下一个
+
+        Args:
+            markets: 这组代码涉及的市场，覆盖其中任一市场的批量数据源都会参与
+            args: 透传给批量函数的额外参数（如名称映射）
+        """
+        results: Dict[str, Dict] = {}
+        tried = set()
+        for market in markets:
+            for provider in self.route(market, batch=True):
+                remaining = [c for c in codes if c not in results]
+                if not remaining:
+                    return results
+                if provider.name in tried or not provider.health.allow():
+                    continue
+                tried.add(provider.name)
+                try:
+                    results.update(provider.call(provider.fetch_batch, remaining, *args))
+                except Exception as e:
+                    print(f"[行情源] {provider.name} 批量获取失败: {e}")
+        return results
+
+    # ========== 异步路由 ==========
+
+    @staticmethod
+    def _async_impl(provider: QuoteProvider, func: Callable, overrides: Optional[Dict[str, Callable]],
+                    run_blocking: Optional[Callable]) -> Optional[Callable]:
+        """数据源的协程实现：优先使用 overrides 中的原生协程，否则把同步函数交给 run_blocking"""
+        impl = (overrides or {}).get(provider.name)
+        if impl is not None:
+            return impl
+        if run_blocking is None:
+            return None
+
+        async def blocking(*args):
+            return await run_blocking(func, *args)
+        return blocking
+
+    async def fetch_async(self, market: str, code: str, overrides: Dict[str, Callable] = None,
+                          run_blocking: Callable = None) -> Optional[Dict]:
+        """fetch 的协程版
+
+        Args:
+            overrides: 数据源名称 -> 单代码查询协程函数（原生异步实现）
+            run_blocking: 没有原生异步实现的数据源，同步函数通过它在线程池中执行
+        """
+        for provider in self.route(market):
+            impl = self._async_impl(provider, provider.fetchers[market], overrides, run_blocking)
+            if impl is None or not provider.health.allow():
+                continue
+            try:
+                result = await provider.call_async(impl, code)
+            except Exception as e:
+                print(f"[行情源] {provider.name} 获取 {code} 失败: {e}")
+                continue
+            if result and 'error' not in result:
+                return result
+        return None
+
+    async def fetch_many_async(self, markets: List[str], codes: List[str], *args,
+                               overrides: Dict[str, Callable] = None,
+                               run_blocking: Callable = None) -> Dict[str, Dict]:
+        """fetch_many 的协程版（overrides 为数据源名称 -> 批量查询协程函数）"""
+        results: Dict[str, Dict] = {}
+        tried = set()
+        for market in markets:
+            for provider in self.route(market, batch=True):
+                remaining = [c for c in codes if c not in results]
+                if not remaining:
+                    return results
+                impl = self._async_impl(provider, provider.fetch_batch, overrides, run_blocking)
+                if impl is None or provider.name in tried or not provider.health.allow():
+                    continue
+                tried.add(provider.name)
+                try:
+                    results.update(await provider.call_async(impl, remaining, *args))
+                except Exception as e:
+                    print(f"[行情源] {provider.name} 批量获取失败: {e}")
+        return results
+
+    def health(self) -> Dict[str, Dict]:
+        """各数据源健康状态（按注册顺序）"""
+        return {p.name: p.health.snapshot() for p in self._providers}
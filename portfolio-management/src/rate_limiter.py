@@ -0,0 +1,107 @@
+"""
+令牌桶限流器
+
+飞书开放平台按应用限制 QPS（多维表约 20 QPS）。同一进程内所有使用相同凭证的
+FeishuClient 共享一个令牌桶：
+1. 线程安全：令牌在锁内预约，等待在锁外进行，并发线程不会同时放行
+2. 支持 asyncio：acquire_async 用 asyncio.sleep 等待，不阻塞事件循环
+3. 允许突发：桶容量 burst 个令牌，空闲后可立即连发
+4. 自适应（AIMD）：收到 429 时速率减半，之后每次成功请求线性回升到配置上限
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """线程安全、支持 asyncio 的自适应令牌桶"""
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: Optional[float] = None,
+                 increase_step: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒令牌数（速率上限）
+            burst: 桶容量（允许的突发请求数）
+            min_rate: 429 降速的下限，默认 rate 的 1/8
+            increase_step: 每次成功后速率回升步长，默认 rate 的 5%
+        """
+        if rate <= 0:
+            raise ValueError("rate 必须大于 0")
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.min_rate = min_rate if min_rate is not None else self.max_rate / 8
+        self.increase_step = increase_step if increase_step is not None else self.max_rate * 0.05
+
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_unlocked(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """预约一个令牌
+
+        Returns:
+            需要等待的秒数（令牌不足时为负余额对应的补充时间）
+        """
+        with self._lock:
+            self._refill_unlocked(time.monotonic())
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """获取一个令牌（阻塞等待）"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """获取一个令牌（协程等待）"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_throttled(self):
+        """收到 429：速率减半并清空突发额度"""
+        with self._lock:
+            self._refill_unlocked(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+
+    def on_success(self):
+        """请求成功：速率线性回升到上限"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+
+# 进程级令牌桶注册表：key -> TokenBucket
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key: str, rate: float, burst: int = 1) -> TokenBucket:
+    """获取（或创建）进程内共享的令牌桶
+
+    相同 key（同一应用凭证）的所有调用方共享额度；首次创建时的 rate/burst 生效。
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            _buckets[key] = bucket
+        return bucket
+
+
+def reset_buckets():
+    """清空注册表（测试用）"""
+    with _buckets_lock:
+        _buckets.clear()
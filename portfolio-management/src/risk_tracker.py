@@ -0,0 +1,326 @@
+"""
+增量风险指标
+
+full_report 每次都从头遍历全部净值历史计算波动率和最大回撤。RiskTracker 保存
+滚动状态，每追加一条净值只做 O(1)（VaR/CVaR 为 O(窗口)）的更新：
+1. 20/60/252 日滚动波动率：各窗口维护收益率的和与平方和
+2. 全历史波动率、夏普、索提诺：Welford 累积均值/方差 + 下行平方和
+3. 回撤：当前回撤、最大回撤、回撤持续天数（水下天数）及最长持续天数
+4. VaR/CVaR：最近 252 个日收益率的历史模拟法（默认 95% 置信度）
+
+状态持久化到 .data/risk/<账户>.json，下次只需同步新增的净值行。
+状态记录已同步净值行数和链式前缀摘要（同 PositionLedger 快照），
+最后同步日之前任意一行被改写、补录或删除都会导致摘要不符，自动全量重建。
+"""
+import hashlib
+import json
+import math
+from bisect import bisect_right
+from collections import deque
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import safe_filename
+
+RISK_STATE_DIR = Path(__file__).parent.parent / '.data' / 'risk'
+
+TRADING_DAYS = 252
+WINDOWS = (20, 60, 252)
+VAR_WINDOW = 252
+VAR_CONFIDENCE = 0.95
+
+
+class RollingWindow:
+    """定长收益率窗口，维护和与平方和以 O(1) 求样本标准差"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values: deque = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def push(self, value: float):
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) >= self.size
+
+    def std(self) -> Optional[float]:
+        """样本标准差（ddof=1），数据不足两个时返回 None"""
+        n = len(self.values)
+        if n < 2:
+            return None
+        var = (self.total_sq - self.total * self.total / n) / (n - 1)
+        return math.sqrt(max(var, 0.0))
+
+
+class RiskTracker:
+    """单账户增量风险指标"""
+
+    def __init__(self, account: str, state_file: Path = None):
+        self.account = account
+        self.state_file = state_file or RISK_STATE_DIR / f"{safe_filename(account)}.json"
+        self.reset()
+
+    def reset(self):
+        """清空状态"""
+        self.last_date: Optional[date] = None
+        self.last_nav: Optional[float] = None
+        # 已同步净值行数及其链式前缀摘要
+        self.synced = 0
+        self.digest = ''
+        # 全历史收益率统计（Welford）
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
+        # 回撤
+        self.peak_nav: Optional[float] = None
+        self.peak_date: Optional[date] = None
+        self.max_drawdown = 0.0
+        self.max_drawdown_days = 0
+        # 滚动窗口（VaR 窗口与最长滚动窗口共用收益率序列）
+        self.windows: Dict[int, RollingWindow] = {w: RollingWindow(w) for w in WINDOWS}
+        self.recent: deque = deque(maxlen=VAR_WINDOW)
+        self._dirty = False
+
+    # ========== 更新 ==========
+
+    def update(self, nav_date: date, nav: float) -> bool:
+        """追加一条净值，日期不晚于最后同步日或净值无效时忽略
+
+        Returns:
+            是否更新了状态
+        """
+        if not nav or nav <= 0:
+            return False
+        if self.last_date and nav_date <= self.last_date:
+            return False
+
+        if self.last_nav:
+            r = nav / self.last_nav - 1
+            self.count += 1
+            delta = r - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (r - self.mean)
+            self.downside_sq += min(r, 0.0) ** 2
+            for window in self.windows.values():
+                window.push(r)
+            self.recent.append(r)
+
+        if self.peak_nav is None or nav >= self.peak_nav:
+            if self.last_nav and self.last_nav < self.peak_nav:
+                # 收复前高：水下期间为峰值日至收复日
+                self.max_drawdown_days = max(self.max_drawdown_days, (nav_date - self.peak_date).days)
+            self.peak_nav = nav
+            self.peak_date = nav_date
+        else:
+            self.max_drawdown = max(self.max_drawdown, (self.peak_nav - nav) / self.peak_nav)
+            self.max_drawdown_days = max(self.max_drawdown_days, (nav_date - self.peak_date).days)
+
+        self.last_date = nav_date
+        self.last_nav = nav
+        self.synced += 1
+        self.digest = self._chain(self.digest, nav_date, nav)
+        self._dirty = True
+        return True
+
+    @staticmethod
+    def _chain(digest: str, nav_date: date, nav: float) -> str:
+        """前缀摘要追加一行净值"""
+        row = f"{digest}|{nav_date.isoformat()}|{nav:.10g}"
+        return hashlib.sha256(row.encode()).hexdigest()[:16]
+
+    @classmethod
+    def _prefix(cls, navs: List) -> tuple:
+        """按 update 的取舍规则（日期严格递增）计算净值前缀的行数与摘要"""
+        count, digest, last = 0, '', None
+        for n in navs:
+            if last and n.date <= last:
+                continue
+            count += 1
+            digest = cls._chain(digest, n.date, n.nav)
+            last = n.date
+        return count, digest
+
+    def sync(self, navs: List) -> int:
+        """同步按日期升序的净值列表，只处理最后同步日之后的新行
+
+        最后同步日及之前的净值行数或前缀摘要与状态不一致（历史被改写、补录或删除）时全量重建。
+
+        Returns:
+            新处理的净值条数
+        """
+        valid = [n for n in navs if n.date and n.nav and n.nav > 0]
+        if self.last_date:
+            dates = [n.date for n in valid]
+            i = bisect_right(dates, self.last_date)
+            if (self.synced, self.digest) != self._prefix(valid[:i]):
+                self.reset()
+                i = 0
+            valid = valid[i:]
+        return sum(self.update(n.date, n.nav) for n in valid)
+
+    # ========== 指标 ==========
+
+    def volatility(self, window: int = None) -> Optional[float]:
+        """年化波动率（比例）；window 为空表示全历史，窗口未填满时返回 None"""
+        if window is None:
+            if self.count < 2:
+                return None
+            std = math.sqrt(self.m2 / (self.count - 1))
+        else:
+            rolling = self.windows[window]
+            if not rolling.full:
+                return None
+            std = rolling.std()
+        return std * math.sqrt(TRADING_DAYS)
+
+    def drawdown(self) -> float:
+        """当前回撤（比例）"""
+        if not self.peak_nav or not self.last_nav:
+            return 0.0
+        return (self.peak_nav - self.last_nav) / self.peak_nav
+
+    def drawdown_days(self) -> int:
+        """当前回撤持续天数（自峰值日起的自然日，处于新高时为 0）"""
+        if not self.peak_date or not self.last_date:
+            return 0
+        return (self.last_date - self.peak_date).days
+
+    def var(self, confidence: float = VAR_CONFIDENCE) -> Optional[float]:
+        """历史模拟法 VaR（单日损失比例，正数）"""
+        tail = self._tail(confidence)
+        return -tail[-1] if tail else None
+
+    def cvar(self, confidence: float = VAR_CONFIDENCE) -> Optional[float]:
+        """历史模拟法 CVaR（超过 VaR 的平均单日损失比例，正数）"""
+        tail = self._tail(confidence)
+        return -sum(tail) / len(tail) if tail else None
+
+    def _tail(self, confidence: float) -> List[float]:
+        """最差的 (1 - confidence) 部分收益率（升序）"""
+        if len(self.recent) < 2:
+            return []
+        ordered = sorted(self.recent)
+        k = max(1, int(math.ceil(len(ordered) * (1 - confidence))))
+        return ordered[:k]
+
+    def sharpe(self) -> Optional[float]:
+        """全历史年化夏普比率（无风险利率为 0）"""
+        if self.count < 2 or self.m2 <= 0:
+            return None
+        return self.mean / math.sqrt(self.m2 / (self.count - 1)) * math.sqrt(TRADING_DAYS)
+
+    def sortino(self) -> Optional[float]:
+        """全历史年化索提诺比率（下行目标为 0）"""
+        if self.count < 2 or self.downside_sq <= 0:
+            return None
+        return self.mean / math.sqrt(self.downside_sq / self.count) * math.sqrt(TRADING_DAYS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前指标（百分比，保留 4 位小数）"""
+        def pct(value):
+            return round(value * 100, 4) if value is not None else None
+
+        result = {
+            "as_of": self.last_date.isoformat() if self.last_date else None,
+            "volatility": pct(self.volatility()),
+        }
+        for w in WINDOWS:
+            result[f"volatility_{w}d"] = pct(self.volatility(w))
+        result.update({
+            "drawdown": pct(self.drawdown()),
+            "drawdown_days": self.drawdown_days(),
+            "max_drawdown": pct(self.max_drawdown),
+            "max_drawdown_days": max(self.max_drawdown_days, self.drawdown_days()),
+            "var_95": pct(self.var()),
+            "cvar_95": pct(self.cvar()),
+            "sharpe_ratio": round(self.sharpe(), 4) if self.sharpe() is not None else None,
+            "sortino_ratio": round(self.sortino(), 4) if self.sortino() is not None else None,
+        })
+        return result
+
+    # ========== 持久化 ==========
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "account": self.account,
+            "last_date": self.last_date.isoformat() if self.last_date else None,
+            "last_nav": self.last_nav,
+            "synced": self.synced,
+            "digest": self.digest,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "downside_sq": self.downside_sq,
+            "peak_nav": self.peak_nav,
+            "peak_date": self.peak_date.isoformat() if self.peak_date else None,
+            "max_drawdown": self.max_drawdown,
+            "max_drawdown_days": self.max_drawdown_days,
+            "recent": list(self.recent),
+        }
+
+    def _restore(self, data: Dict[str, Any]):
+        self.reset()
+        self.last_date = date.fromisoformat(data['last_date']) if data.get('last_date') else None
+        self.last_nav = data.get('last_nav')
+        # 旧状态文件无摘要，下次同步时全量重建
+        self.synced = data.get('synced', 0)
+        self.digest = data.get('digest', '')
+        self.count = data.get('count', 0)
+        self.mean = data.get('mean', 0.0)
+        self.m2 = data.get('m2', 0.0)
+        self.downside_sq = data.get('downside_sq', 0.0)
+        self.peak_nav = data.get('peak_nav')
+        self.peak_date = date.fromisoformat(data['peak_date']) if data.get('peak_date') else None
+        self.max_drawdown = data.get('max_drawdown', 0.0)
+        self.max_drawdown_days = data.get('max_drawdown_days', 0)
+        # 滚动窗口均为最近收益率序列的尾部，由 recent 重放得到
+        for r in data.get('recent', []):
+            self.recent.append(r)
+            for window in self.windows.values():
+                window.push(r)
+
+    @classmethod
+    def load(cls, account: str, state_file: Path = None) -> 'RiskTracker':
+        """从本地文件加载状态，文件不存在或损坏时返回空状态"""
+        tracker = cls(account, state_file)
+        if tracker.state_file.exists():
+            try:
+                with open(tracker.state_file, 'r', encoding='utf-8') as f:
+                    tracker._restore(json.load(f))
+            except (json.JSONDecodeError, IOError, KeyError, ValueError) as e:
+                print(f"[警告] 风险指标状态文件损坏，将全量重建: {e}")
+                tracker.reset()
+        return tracker
+
+    def save(self):
+        """保存状态（无变化时跳过）"""
+        if not self._dirty:
+            return
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_file.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False)
+            tmp.replace(self.state_file)
+            self._dirty = False
+        except IOError as e:
+            print(f"[警告] 保存风险指标状态失败: {e}")
+
+    @classmethod
+    def refresh(cls, account: str, navs: Iterable, state_file: Path = None) -> Dict[str, Any]:
+        """加载状态、同步新增净值、保存并返回指标快照"""
+        tracker = cls.load(account, state_file)
+        tracker.sync(list(navs))
+        tracker.save()
+        return tracker.snapshot()
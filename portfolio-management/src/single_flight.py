@@ -0,0 +1,126 @@
+"""
+请求合并（single-flight）
+
+get_holdings、calculate_valuation、get_industry_distribution 并行执行，或多个线程在缓存
+过期后同时查询同一代码时，每个调用方都会各自请求上游。SingleFlight 按 key 合并在途请求：
+1. 同一 key 同一时刻只有一个调用方（leader）真正执行，其余调用方等待并共享结果/异常
+2. 请求结束即从在途表移除，不做结果缓存（缓存仍由 LocalPriceCache 负责）
+3. do_many：批量请求中已在途的 key 等待共享结果，其余 key 合并为一次批量调用；
+   批量调用可能只返回部分 key，单个等待方拿到空结果时会自行重新发起
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+
+class _Call:
+    """一次在途请求"""
+
+    __slots__ = ('done', 'value', 'error', 'dups', 'partial')
+
+    def __init__(self, partial: bool = False):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.dups = 0
+        # 批量调用中的 key：结果为空不代表该 key 查询失败
+        self.partial = partial
+
+
+class SingleFlight:
+    """按 key 合并并发请求（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.shared = 0  # 累计共享结果的调用次数（监控用）
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """执行 func(*args, **kwargs)，同一 key 的并发调用只执行一次
+
+        Returns:
+            (结果, 是否共享了其他调用方的结果)；leader 抛出的异常会同样抛给等待方
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    break
+                call.dups += 1
+
+            call.done.wait()
+            if call.partial and call.error is None and call.value is None:
+                # 批量调用没有返回该 key，由当前调用方重新发起
+                continue
+            with self._lock:
+                self.shared += 1
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = func(*args, **kwargs)
+            return call.value, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def do_many(self, keys: Iterable[Hashable],
+                func: Callable[[list], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """批量版 do
+
+        Args:
+            keys: 要查询的 key
+            func: 批量函数，参数为未在途的 key 列表，返回 {key: 结果}（可只含部分 key）
+
+        Returns:
+            {key: 结果}，只包含结果非空的 key；等待的请求失败时该 key 视为缺失
+        """
+        own: Dict[Hashable, _Call] = {}
+        waiting: Dict[Hashable, _Call] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call(partial=True)
+                    self._calls[key] = call
+                    own[key] = call
+                else:
+                    call.dups += 1
+                    waiting[key] = call
+
+        values: Dict[Hashable, Any] = {}
+        try:
+            if own:
+                values = func(list(own)) or {}
+        except BaseException as e:
+            for call in own.values():
+                call.error = e
+            raise
+        finally:
+            for key, call in own.items():
+                call.value = values.get(key)
+                self._finish(key, call)
+
+        results = {key: value for key, value in values.items() if key in own and value is not None}
+        for key, call in waiting.items():
+            call.done.wait()
+            if call.error is None and call.value is not None:
+                results[key] = call.value
+                with self._lock:
+                    self.shared += 1
+        return results
+
+    def _finish(self, key: Hashable, call: _Call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def in_flight(self) -> int:
+        """当前在途的 key 数"""
+        with self._lock:
+            return len(self._calls)
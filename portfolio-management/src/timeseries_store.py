@@ -0,0 +1,193 @@
+"""
+本地时间序列存储（内存映射、只追加）
+
+LocalPriceCache 只保留每个资产的最新报价，净值历史只在飞书。回填、归因、画图需要
+多年的日频数据时，每次都要解析 JSON 或走网络。TimeSeriesStore 为每个序列维护一个
+定长二进制文件：
+
+    .data/timeseries/price/<资产代码>.bin   日收盘价（原币种 + 人民币）
+    .data/timeseries/nav/<账户>.bin         账户净值
+
+文件 = 16 字节文件头 + 按日期严格递增的定长记录（NumPy 结构化 dtype）。
+1. 追加：新日期直接写到文件尾；与最后一条同日则原地覆盖（盘中价格更新）
+2. 回填更早日期：合并后写临时文件再原子替换（少见路径）
+3. 读取：np.memmap 映射整个文件，日期列即索引（searchsorted 二分），
+   按日期切片返回的是映射视图，不复制、不解析
+"""
+import struct
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from .config import safe_filename
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，使用 TimeSeriesStore 时再报错
+    np = None
+
+TIMESERIES_DIR = Path(__file__).parent.parent / '.data' / 'timeseries'
+
+_MAGIC = b'PMTS'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHH8x')  # magic, version, record_size, 保留
+HEADER_SIZE = _HEADER.size
+
+# 记录格式（date 为 datetime64[D]，切片后可直接参与日期运算）
+PRICE_FIELDS = [('date', '<M8[D]'), ('close', '<f8'), ('cny_close', '<f8')]
+NAV_FIELDS = [('date', '<M8[D]'), ('nav', '<f8'), ('total_value', '<f8'),
+              ('shares', '<f8'), ('cash_flow', '<f8')]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("TimeSeriesStore 需要 numpy，请执行 pip install numpy")
+
+
+class _Series:
+    """单个序列文件"""
+
+    def __init__(self, path: Path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self._map = None
+        self._map_size = -1
+
+    def _check_header(self, f):
+        header = f.read(HEADER_SIZE)
+        magic, version, record_size = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION or record_size != self.dtype.itemsize:
+            raise ValueError(f"时间序列文件格式不匹配: {self.path}")
+
+    def read(self):
+        """映射整个文件，返回结构化数组视图（文件不存在时为空数组）"""
+        if not self.path.exists():
+            return np.empty(0, dtype=self.dtype)
+        size = self.path.stat().st_size
+        if self._map is None or size != self._map_size:
+            count = (size - HEADER_SIZE) // self.dtype.itemsize
+            if count <= 0:
+                return np.empty(0, dtype=self.dtype)
+            with open(self.path, 'rb') as f:
+                self._check_header(f)
+            self._map = np.memmap(self.path, dtype=self.dtype, mode='r',
+                                  offset=HEADER_SIZE, shape=(count,))
+            self._map_size = size
+        return self._map
+
+    def write(self, records):
+        """追加记录（records 已按日期升序、日期唯一）
+
+        Returns:
+            新增或覆盖的记录条数
+        """
+        if len(records) == 0:
+            return 0
+        existing = self.read()
+        last = existing['date'][-1] if len(existing) else None
+
+        if last is None or records['date'][0] >= last:
+            # 常规路径：只追加（首条与最后一条同日时原地覆盖）
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            mode = 'r+b' if self.path.exists() else 'wb'
+            with open(self.path, mode) as f:
+                if mode == 'wb':
+                    f.write(_HEADER.pack(_MAGIC, _VERSION, self.dtype.itemsize))
+                else:
+                    self._check_header(f)
+                if last is not None and records['date'][0] == last:
+                    f.seek(HEADER_SIZE + (len(existing) - 1) * self.dtype.itemsize)
+                else:
+                    f.seek(0, 2)
+                f.write(records.tobytes())
+        else:
+            # 回填更早日期：合并（新数据覆盖同日旧数据）后原子替换
+            merged = np.concatenate([existing, records])
+            _, idx = np.unique(merged['date'][::-1], return_index=True)
+            merged = merged[::-1][idx]
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, self.dtype.itemsize))
+                f.write(merged.tobytes())
+            self._map = None
+            tmp.replace(self.path)
+        self._map_size = -1
+        return len(records)
+
+
+class TimeSeriesStore:
+    """本地日频价格/净值时间序列"""
+
+    def __init__(self, root: Path = TIMESERIES_DIR):
+        _require_numpy()
+        self.root = Path(root)
+        self.price_dtype = np.dtype(PRICE_FIELDS)
+        self.nav_dtype = np.dtype(NAV_FIELDS)
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, kind: str, key: str) -> _Series:
+        series = self._series.get((kind, key))
+        if series is None:
+            dtype = self.price_dtype if kind == 'price' else self.nav_dtype
+            series = _Series(self.root / kind / f"{safe_filename(key)}.bin", dtype)
+            self._series[(kind, key)] = series
+        return series
+
+    @staticmethod
+    def _to_records(rows, dtype):
+        """行列表转结构化数组：按日期排序，同日保留最后一条"""
+        records = np.array(rows, dtype=dtype)
+        if len(records) == 0:
+            return records
+        _, idx = np.unique(records['date'][::-1], return_index=True)
+        return records[::-1][idx]
+
+    @staticmethod
+    def _slice(records, start: Optional[date], end: Optional[date]):
+        """按日期区间 [start, end] 切片（二分查找，返回视图）"""
+        dates = records['date']
+        lo = int(np.searchsorted(dates, np.datetime64(start, 'D'), side='left')) if start else 0
+        hi = int(np.searchsorted(dates, np.datetime64(end, 'D'), side='right')) if end else len(dates)
+        return records[lo:hi]
+
+    # ========== 价格 ==========
+
+    def append_prices(self, asset_id: str, rows: Iterable[Tuple[date, float, Optional[float]]]) -> int:
+        """写入日收盘价
+
+        Args:
+            rows: (日期, 原币种收盘价, 人民币收盘价) 列表，人民币价为空时记为 NaN
+        """
+        rows = [(d, close, cny if cny is not None else np.nan) for d, close, cny in rows]
+        with self._lock:
+            return self._get_series('price', asset_id).write(self._to_records(rows, self.price_dtype))
+
+    def prices(self, asset_id: str, start: date = None, end: date = None):
+        """读取日收盘价（结构化数组视图：date / close / cny_close）"""
+        with self._lock:
+            return self._slice(self._get_series('price', asset_id).read(), start, end)
+
+    # ========== 净值 ==========
+
+    def append_navs(self, account: str, navs: Iterable) -> int:
+        """写入账户净值（NAVHistory 列表）"""
+        def _f(value):
+            return float(value) if value is not None else np.nan
+
+        rows = [(n.date, _f(n.nav), _f(n.total_value), _f(n.shares), n.cash_flow or 0.0)
+                for n in navs if n.date]
+        with self._lock:
+            return self._get_series('nav', account).write(self._to_records(rows, self.nav_dtype))
+
+    def navs(self, account: str, start: date = None, end: date = None):
+        """读取账户净值（结构化数组视图：date / nav / total_value / shares / cash_flow）"""
+        with self._lock:
+            return self._slice(self._get_series('nav', account).read(), start, end)
+
+    def last_date(self, kind: str, key: str) -> Optional[date]:
+        """序列最后一条记录的日期"""
+        with self._lock:
+            records = self._get_series(kind, key).read()
+        return records['date'][-1].astype(date) if len(records) else None
@@ -3,6 +3,43 @@ import pytest
 from datetime import date, datetime
 from unittest.mock import Mock
 
+from src import ledger as _ledger
+from src import price_fetcher as _price_fetcher
+from src.fx_history import FxHistory
+from src.quote_providers import reset_health
+from src.rate_limiter import reset_buckets
+
+
+@pytest.fixture(autouse=True)
+def _reset_rate_limiters():
+    """每个测试使用独立的进程级令牌桶"""
+    reset_buckets()
+    yield
+    reset_buckets()
+
+
+@pytest.fixture(autouse=True)
+def _reset_provider_health():
+    """每个测试使用独立的行情源健康统计（熔断状态不跨测试泄漏）"""
+    reset_health()
+    yield
+    reset_health()
+
+
+@pytest.fixture(autouse=True)
+def _isolate_fx_history(tmp_path, monkeypatch):
+    """汇率历史写入临时目录（不污染 .data/fx_history.db）"""
+    history = FxHistory(tmp_path / 'fx_history.db')
+    monkeypatch.setattr(_price_fetcher, 'fx_history', history)
+    yield history
+    history.close()
+
+
+@pytest.fixture(autouse=True)
+def _isolate_ledger_snapshots(tmp_path, monkeypatch):
+    """持仓账本快照写入临时目录（不污染 .data/ledger）"""
+    monkeypatch.setattr(_ledger, 'LEDGER_STATE_DIR', tmp_path / 'ledger')
+
 
 @pytest.fixture
 def mock_storage():
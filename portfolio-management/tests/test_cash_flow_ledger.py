@@ -0,0 +1,46 @@
+"""测试出入金台账"""
+from datetime import date
+from unittest.mock import Mock
+
+from src.cash_flow_ledger import CashFlowLedger
+from src.models import CashFlow
+
+
+def _cf(d, amount):
+    return CashFlow(flow_date=d, account='lx', amount=amount, currency='CNY',
+                    cny_amount=amount, flow_type='DEPOSIT' if amount > 0 else 'WITHDRAW')
+
+
+class TestCashFlowLedger:
+    """测试台账各口径汇总"""
+
+    def setup_method(self):
+        self.ledger = CashFlowLedger([
+            _cf(date(2024, 12, 31), 100000),
+            _cf(date(2025, 1, 15), 50000),
+            _cf(date(2025, 1, 15), -10000),
+            _cf(date(2025, 3, 1), 20000),
+            _cf(date(2025, 3, 14), 5000),
+        ])
+
+    def test_day_month_year(self):
+        assert self.ledger.day(date(2025, 1, 15)) == 40000
+        assert self.ledger.day(date(2025, 1, 16)) == 0
+        assert self.ledger.month(2025, 3) == 25000
+        assert self.ledger.year(2025) == 65000
+        assert self.ledger.year('2024') == 100000
+
+    def test_between(self):
+        assert self.ledger.between(date(2025, 1, 1), date(2025, 3, 14)) == 65000
+        assert self.ledger.between(date(2025, 1, 16), date(2025, 3, 13)) == 20000
+        assert self.ledger.between(date(2025, 3, 15), date(2025, 12, 31)) == 0
+        assert self.ledger.between(end=date(2024, 12, 31)) == 100000
+        assert self.ledger.between(date(2025, 3, 14), date(2025, 3, 1)) == 0
+        assert self.ledger.total() == 165000
+
+    def test_load_fetches_once(self):
+        storage = Mock()
+        storage.get_cash_flows.return_value = [_cf(date(2025, 1, 1), 1000)]
+        ledger = CashFlowLedger.load(storage, 'lx')
+        storage.get_cash_flows.assert_called_once_with('lx')
+        assert ledger.total() == 1000
@@ -0,0 +1,125 @@
+"""测试防重索引"""
+from datetime import date
+from unittest.mock import Mock, patch
+
+from src.dedup_index import BloomFilter, DedupIndex
+from src.feishu_storage import FeishuStorage
+from src.models import CashFlow, Transaction, TransactionType
+
+
+def _records():
+    return [
+        {'record_id': 'tx1', 'fields': {'dedup_key': 'k1', 'request_id': 'r1'}},
+        {'record_id': 'tx2', 'fields': {'dedup_key': 'k2'}},
+    ]
+
+
+class TestBloomFilter:
+    """测试 Bloom 过滤器"""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = [f"key-{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"key-{i}")
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+
+class TestDedupIndex:
+    """测试防重索引"""
+
+    def test_loads_once_and_answers_from_memory(self):
+        """测试只加载一次，命中/未命中均在内存判断"""
+        loader = Mock(return_value=_records())
+        index = DedupIndex(loader, ttl=300)
+
+        assert index.check('transactions', 'lx', 'dedup_key', 'k1') == 'tx1'
+        assert index.check('transactions', 'lx', 'request_id', 'r1') == 'tx1'
+        assert index.check('transactions', 'lx', 'dedup_key', 'new') is None
+        loader.assert_called_once_with('transactions', 'lx', ('dedup_key', 'request_id'))
+
+    def test_add_registers_new_keys(self):
+        """测试写入后登记的键立即可见"""
+        index = DedupIndex(Mock(return_value=[]), ttl=300)
+        assert index.check('cash_flow', 'lx', 'dedup_key', 'c1') is None
+        index.add('cash_flow', 'lx', 'cf1', dedup_key='c1')
+        assert index.check('cash_flow', 'lx', 'dedup_key', 'c1') == 'cf1'
+
+    def test_reload_after_ttl(self):
+        """测试超过 ttl 后重新加载"""
+        loader = Mock(return_value=_records())
+        index = DedupIndex(loader, ttl=10)
+        with patch('src.dedup_index.time.monotonic', return_value=100.0):
+            index.check('transactions', 'lx', 'dedup_key', 'k1')
+        with patch('src.dedup_index.time.monotonic', return_value=105.0):
+            index.check('transactions', 'lx', 'dedup_key', 'k1')
+        assert loader.call_count == 1
+        with patch('src.dedup_index.time.monotonic', return_value=111.0):
+            index.check('transactions', 'lx', 'dedup_key', 'k1')
+        assert loader.call_count == 2
+
+    def test_load_failure_returns_unknown(self):
+        """测试加载失败时返回 UNKNOWN"""
+        index = DedupIndex(Mock(side_effect=Exception('field not found')), ttl=300)
+        assert index.check('transactions', 'lx', 'dedup_key', 'k1') is DedupIndex.UNKNOWN
+
+    def test_bloom_mode(self):
+        """测试 Bloom 模式：未命中确定，可能命中返回 UNKNOWN"""
+        index = DedupIndex(Mock(return_value=_records()), ttl=300, bloom=True)
+        assert index.check('transactions', 'lx', 'dedup_key', 'k1') is DedupIndex.UNKNOWN
+        assert index.check('transactions', 'lx', 'dedup_key', 'missing') is None
+        index.add('transactions', 'lx', 'tx3', dedup_key='k3')
+        assert index.check('transactions', 'lx', 'dedup_key', 'k3') == 'tx3'
+
+    def test_invalidate(self):
+        """测试删除记录后索引失效"""
+        loader = Mock(return_value=_records())
+        index = DedupIndex(loader, ttl=300)
+        index.check('transactions', 'lx', 'dedup_key', 'k1')
+        index.invalidate('transactions')
+        index.check('transactions', 'lx', 'dedup_key', 'k1')
+        assert loader.call_count == 2
+
+
+class TestFeishuStorageDedupIndex:
+    """测试存储层使用防重索引"""
+
+    def test_writes_share_one_index_query(self):
+        """测试连续写入只做一次防重查询"""
+        client = Mock()
+        client.list_records.return_value = []
+        client.create_record.side_effect = [{'record_id': 'tx_a'}, {'record_id': 'tx_b'}]
+        storage = FeishuStorage(client=client)
+
+        for price in (10.0, 11.0):
+            storage.add_transaction(Transaction(
+                tx_date=date(2025, 3, 14), tx_type=TransactionType.BUY, asset_id='000001',
+                account='lx', quantity=100, price=price, currency='CNY'))
+
+        client.list_records.assert_called_once()
+        assert client.create_record.call_count == 2
+
+    def test_duplicate_of_own_write_skipped(self):
+        """测试本进程刚写入的出入金再次提交时被识别为重复"""
+        client = Mock()
+        client.list_records.return_value = []
+        client.create_record.return_value = {'record_id': 'cf_a'}
+        storage = FeishuStorage(client=client)
+
+        def make_cf():
+            return CashFlow(flow_date=date(2025, 3, 14), account='lx', amount=1000,
+                            currency='CNY', cny_amount=1000, flow_type='DEPOSIT')
+
+        storage.add_cash_flow(make_cf())
+        result = storage.add_cash_flow(make_cf())
+
+        assert result.record_id == 'cf_a'
+        client.create_record.assert_called_once()
+        client.list_records.assert_called_once()
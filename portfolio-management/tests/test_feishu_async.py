@@ -0,0 +1,154 @@
+"""测试飞书异步客户端"""
+import asyncio
+import pytest
+from datetime import date
+from unittest.mock import AsyncMock, Mock, patch
+
+from src.feishu_async import AsyncFeishuClient
+from src.feishu_storage import FeishuStorage
+
+
+class _FakeResponse:
+    def __init__(self, payload, status=200, headers=None, delay=0):
+        self.payload = payload
+        self.status = status
+        self.headers = headers or {}
+        self.delay = delay
+
+    async def __aenter__(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise Exception(f"HTTP {self.status}")
+
+    async def json(self):
+        return self.payload
+
+
+class _FakeSession:
+    """按顺序返回预设响应，记录请求参数"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.closed = False
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.responses.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+def _client(responses):
+    client = AsyncFeishuClient(user_token='u-test')
+    client.table_configs = {'holdings': {'app_token': 'app', 'table_id': 'tbl'},
+                            'nav_history': {'app_token': 'app', 'table_id': 'tbl2'}}
+    session = _FakeSession(responses)
+    client._get_session = AsyncMock(return_value=session)
+    return client, session
+
+
+class TestAsyncFeishuClient:
+    """测试异步客户端"""
+
+    def test_list_records_pagination(self):
+        """测试分页拉取全部记录"""
+        client, session = _client([
+            _FakeResponse({'code': 0, 'data': {'items': [{'record_id': 'r1', 'fields': {}}],
+                                               'page_token': 'p2'}}),
+            _FakeResponse({'code': 0, 'data': {'items': [{'record_id': 'r2', 'fields': {}}],
+                                               'page_token': None}}),
+        ])
+        records = asyncio.run(client.list_records('holdings', filter_str='x'))
+
+        assert [r['record_id'] for r in records] == ['r1', 'r2']
+        assert session.calls[1][2]['params']['page_token'] == 'p2'
+        assert session.calls[0][2]['params']['filter'] == 'x'
+
+    def test_list_records_many_concurrent(self):
+        """测试多表查询并发执行，结果顺序与请求一致"""
+        client, session = _client([
+            _FakeResponse({'code': 0, 'data': {'items': [{'record_id': 'h1', 'fields': {}}]}}, delay=0.05),
+            _FakeResponse({'code': 0, 'data': {'items': [{'record_id': 'n1', 'fields': {}}]}}, delay=0.05),
+        ])
+        results = asyncio.run(client.list_records_many([('holdings', None), ('nav_history', None)]))
+        assert [[r['record_id'] for r in rs] for rs in results] == [['h1'], ['n1']]
+
+    def test_deadline_cancels_request(self):
+        """测试超过截止时间抛出超时并取消在途请求"""
+        client, _ = _client([_FakeResponse({'code': 0, 'data': {}}, delay=1)])
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(client.list_records('holdings', deadline=0.05))
+
+    @patch('src.feishu_async.asyncio.sleep', new_callable=AsyncMock)
+    def test_throttled_retry(self, mock_sleep):
+        """测试 429 降速后按退避重试"""
+        client, session = _client([
+            _FakeResponse({}, status=429),
+            _FakeResponse({'code': 0, 'data': {'record_id': 'r1', 'fields': {'a': 1}}}),
+        ])
+        client._rate_limiter = Mock(acquire_async=AsyncMock())
+
+        record = asyncio.run(client.get_record('holdings', 'r1'))
+
+        assert record == {'record_id': 'r1', 'fields': {'a': 1}}
+        client._rate_limiter.on_throttled.assert_called_once()
+        mock_sleep.assert_awaited_once_with(1)
+
+    def test_create_record_validates_required(self):
+        """测试创建记录校验必填字段"""
+        client, _ = _client([])
+        with pytest.raises(ValueError):
+            asyncio.run(client.create_record('holdings', {'asset_id': 'X'}))
+
+    def test_batch_delete_counts(self):
+        """测试批量删除返回条数"""
+        client, session = _client([
+            _FakeResponse({'code': 0, 'data': {'records': [{'record_id': 'a'}, {'record_id': 'b'}]}}),
+        ])
+        assert asyncio.run(client.batch_delete_records('holdings', ['a', 'b'])) == 2
+        assert session.calls[0][1].endswith('/records/batch_delete')
+
+
+class TestFeishuStorageAsyncLoad:
+    """测试存储层异步并发加载"""
+
+    def test_load_account_data_async(self):
+        """测试三张表并发加载并解码"""
+        async_client = Mock()
+        async_client.list_records_many = AsyncMock(return_value=[
+            [{'record_id': 'h1', 'fields': {'asset_id': '000001', 'account': 'lx',
+                                            'asset_type': 'a_stock', 'quantity': 100}}],
+            [{'record_id': 'n1', 'fields': {'account': 'lx', 'date': date.today().isoformat(), 'nav': 1.0}}],
+            [{'record_id': 'c1', 'fields': {'account': 'lx', 'flow_date': date.today().isoformat(),
+                                            'amount': 100, 'currency': 'CNY', 'cny_amount': 100,
+                                            'flow_type': 'DEPOSIT'}}],
+        ])
+        async_client.close = AsyncMock()
+        storage = FeishuStorage(client=Mock(), async_client=async_client)
+
+        data = asyncio.run(storage.load_account_data_async('lx'))
+
+        assert [h.record_id for h in data['holdings']] == ['h1']
+        assert [n.record_id for n in data['nav_history']] == ['n1']
+        assert [c.record_id for c in data['cash_flow']] == ['c1']
+
+    def test_load_holdings_and_navs_uses_async_client(self):
+        """测试配置异步客户端时同步入口走事件循环并关闭连接池"""
+        async_client = Mock()
+        async_client.list_records_many = AsyncMock(return_value=[[], []])
+        async_client.close = AsyncMock()
+        client = Mock()
+        storage = FeishuStorage(client=client, async_client=async_client)
+
+        assert storage.load_holdings_and_navs('lx') == ([], [])
+        client.list_records_many.assert_not_called()
+        async_client.close.assert_awaited_once()
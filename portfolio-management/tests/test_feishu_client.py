@@ -127,6 +127,27 @@ class TestFeishuClientToken:
         # 只调用了一次API
         assert mock_post.call_count == 1
 
+    @patch('src.feishu_client.requests.post')
+    def test_get_tenant_token_concurrent_refresh(self, mock_post):
+        """测试多线程同时刷新 token 只请求一次"""
+        import threading
+        import time as _time
+
+        def slow_post(*args, **kwargs):
+            _time.sleep(0.05)
+            response = Mock()
+            response.json.return_value = {'code': 0, 'tenant_access_token': 't', 'expire': 7200}
+            return response
+
+        mock_post.side_effect = slow_post
+        client = FeishuClient(app_id='test_id', app_secret='test_secret')
+        threads = [threading.Thread(target=client._get_tenant_token) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert mock_post.call_count == 1
+
     def test_get_headers_with_user_token(self):
         """测试使用个人访问令牌的请求头"""
         client = FeishuClient(user_token='user_token_123')
@@ -297,6 +318,83 @@ class TestFeishuClientRecords:
         assert records[0]['record_id'] == 'rec1'
         assert records[0]['fields']['asset_id'] == '000001'
 
+    @patch('src.feishu_client.FeishuClient._request')
+    @patch('src.feishu_client.FeishuClient._get_table_config')
+    def test_list_records_multi_page(self, mock_config, mock_request):
+        """测试流水线翻页：按 page_token 顺序拉取全部分页"""
+        mock_config.return_value = ('app_token', 'table_id')
+        pages = {
+            None: {'items': [{'record_id': 'rec1', 'fields': {}}], 'page_token': 'p2'},
+            'p2': {'items': [{'record_id': 'rec2', 'fields': {}}], 'page_token': 'p3'},
+            'p3': {'items': [{'record_id': 'rec3', 'fields': {}}], 'page_token': None},
+        }
+        mock_request.side_effect = lambda method, endpoint, params: pages[params.get('page_token')]
+
+        client = FeishuClient(app_id='test', app_secret='test')
+        records = client.list_records('transactions', filter_str='x')
+
+        assert [r['record_id'] for r in records] == ['rec1', 'rec2', 'rec3']
+        assert mock_request.call_count == 3
+        assert all(c.kwargs['params']['filter'] == 'x' for c in mock_request.call_args_list)
+
+    @patch('src.feishu_client.ThreadPoolExecutor')
+    @patch('src.feishu_client.FeishuClient._request')
+    @patch('src.feishu_client.FeishuClient._get_table_config')
+    def test_single_page_no_prefetch_thread(self, mock_config, mock_request, mock_executor):
+        """测试单页查询不创建预取线程"""
+        mock_config.return_value = ('app_token', 'table_id')
+        mock_request.return_value = {'items': [{'record_id': 'rec1', 'fields': {}}], 'page_token': None}
+
+        client = FeishuClient(app_id='test', app_secret='test')
+        assert len(client.list_records('holdings')) == 1
+        mock_executor.assert_not_called()
+
+    @patch('src.feishu_client.FeishuClient.list_records')
+    def test_list_records_many(self, mock_list):
+        """测试并行查询多张表，结果顺序与请求一致"""
+        mock_list.side_effect = lambda table, filter_str=None, field_names=None: [{'record_id': f'{table}:{filter_str}'}]
+
+        client = FeishuClient(app_id='test', app_secret='test')
+        results = client.list_records_many([
+            ('holdings', 'a'), ('nav_history', None), ('cash_flow', 'b')
+        ])
+
+        assert results == [
+            [{'record_id': 'holdings:a'}],
+            [{'record_id': 'nav_history:None'}],
+            [{'record_id': 'cash_flow:b'}],
+        ]
+
+    @patch('src.feishu_client.FeishuClient._request')
+    @patch('src.feishu_client.FeishuClient._get_table_config')
+    def test_list_records_modified_since(self, mock_config, mock_request):
+        """测试增量查询遇到水位线即停止翻页"""
+        mock_config.return_value = ('app_token', 'table_id')
+        mock_request.side_effect = [
+            {
+                'items': [
+                    {'record_id': 'rec3', 'fields': {'修改时间': 3000}},
+                    {'record_id': 'rec2', 'fields': {'修改时间': 2000}},
+                ],
+                'page_token': 'p2'
+            },
+            {
+                'items': [
+                    {'record_id': 'rec1', 'fields': {'修改时间': 1000}},
+                    {'record_id': 'rec0', 'fields': {'修改时间': 500}},
+                ],
+                'page_token': 'p3'
+            },
+        ]
+
+        client = FeishuClient(app_id='test', app_secret='test')
+        records = client.list_records_modified_since('nav_history', 2000, '修改时间')
+
+        assert [r['record_id'] for r in records] == ['rec3', 'rec2']
+        assert mock_request.call_count == 2
+        params = mock_request.call_args_list[0].kwargs['params']
+        assert json.loads(params['sort']) == ['修改时间 DESC']
+
     @patch('src.feishu_client.FeishuClient._request')
     @patch('src.feishu_client.FeishuClient._get_table_config')
     def test_list_records_with_filter(self, mock_config, mock_request):
@@ -508,26 +606,70 @@ class TestFeishuClientBatchOperations:
 class TestFeishuClientRateLimit:
     """测试飞书客户端限流"""
 
-    @patch('src.feishu_client.time.time')
+    def test_rate_limit(self):
+        """测试限流委托给令牌桶"""
+        client = FeishuClient(app_id='test', app_secret='test')
+        client._rate_limiter = Mock()
+        client._rate_limit()
+        client._rate_limiter.acquire.assert_called_once()
+
+    def test_bucket_shared_by_credentials(self):
+        """测试相同凭证的实例共享令牌桶，不同凭证互不影响"""
+        a = FeishuClient(app_id='app_a', app_secret='s1')
+        b = FeishuClient(app_id='app_a', app_secret='s2')
+        c = FeishuClient(app_id='app_c', app_secret='s3')
+        assert a._rate_limiter is b._rate_limiter
+        assert a._rate_limiter is not c._rate_limiter
+
     @patch('src.feishu_client.time.sleep')
-    def test_rate_limit(self, mock_sleep, mock_time):
-        """测试限流控制"""
+    @patch('src.feishu_client.requests.Session.request')
+    @patch('src.feishu_client.FeishuClient._get_headers')
+    def test_throttled_feedback(self, mock_headers, mock_request, mock_sleep):
+        """测试 429 反馈给令牌桶降速，并按 Retry-After 与指数退避中较长者等待"""
+        mock_headers.return_value = {}
+        error_response = Mock(status_code=429, headers={'Retry-After': '2'})
+        success_response = Mock(status_code=200)
+        success_response.json.return_value = {'code': 0, 'data': {}}
+        mock_request.side_effect = [error_response, success_response]
+
         client = FeishuClient(app_id='test', app_secret='test')
+        client._rate_limiter = Mock()
+        client._request('GET', '/test')
 
-        # 第一次调用：足够间隔，不需要sleep
-        mock_time.side_effect = [
-            1000.1,   # now in _rate_limit
-            1000.1,   # update _last_request_time
-        ]
-        client._last_request_time = 1000.0  # 上次请求在0.1秒前
-        client._rate_limit()
-        assert mock_sleep.call_count == 0  # 间隔>=0.06，不需要sleep
+        client._rate_limiter.on_throttled.assert_called_once()
+        client._rate_limiter.on_success.assert_called_once()
+        mock_sleep.assert_called_once_with(2.0)
 
-        # 第二次调用：间隔不足，需要sleep
-        mock_time.side_effect = [
-            1000.12,  # now in _rate_limit (距上次0.02秒)
-            1000.16,  # update _last_request_time
-        ]
-        client._last_request_time = 1000.1  # 上次请求在0.02秒前
-        client._rate_limit()
-        mock_sleep.assert_called_once()  # 间隔<0.06，需要sleep
+    @patch('src.feishu_client.time.sleep')
+    @patch('src.feishu_client.requests.Session.request')
+    @patch('src.feishu_client.FeishuClient._get_headers')
+    def test_throttled_without_header_keeps_backoff(self, mock_headers, mock_request, mock_sleep):
+        """测试无等待头时仍按指数退避，重试跨过限流窗口"""
+        mock_headers.return_value = {}
+        error_response = Mock(status_code=429, headers={})
+        error_response.raise_for_status.side_effect = Exception("429")
+        mock_request.return_value = error_response
+
+        client = FeishuClient(app_id='test', app_secret='test')
+        client._rate_limiter = Mock()
+        with pytest.raises(Exception):
+            client._request('GET', '/test')
+
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [1, 2, 4]
+        assert client._rate_limiter.on_throttled.call_count == 4
+        client._rate_limiter.on_success.assert_not_called()
+
+    @patch('src.feishu_client.requests.Session.request')
+    @patch('src.feishu_client.FeishuClient._get_headers')
+    def test_server_error_does_not_raise_rate(self, mock_headers, mock_request):
+        """测试 5xx 响应不会提升令牌桶速率"""
+        mock_headers.return_value = {}
+        error_response = Mock(status_code=500)
+        error_response.raise_for_status.side_effect = Exception("500")
+        mock_request.return_value = error_response
+
+        client = FeishuClient(app_id='test', app_secret='test')
+        client._rate_limiter = Mock()
+        with pytest.raises(Exception):
+            client._request('GET', '/test')
+        client._rate_limiter.on_success.assert_not_called()
@@ -0,0 +1,300 @@
+"""测试飞书表本地 SQLite 镜像"""
+import pytest
+from datetime import date
+from unittest.mock import Mock, patch
+
+from src.feishu_mirror import LocalMirror, MirroredFeishuClient, _parse_filter
+from src.feishu_storage import FeishuStorage
+
+
+def _holding(record_id, asset_id, account='lx', market='', quantity=100):
+    return {
+        'record_id': record_id,
+        'fields': {'asset_id': asset_id, 'account': account, 'market': market,
+                   'quantity': quantity, 'asset_type': 'a_stock'}
+    }
+
+
+def _modified(record, modified_ms):
+    record['fields']['修改时间'] = modified_ms
+    return record
+
+
+class TestParseFilter:
+    """测试 filter 解析"""
+
+    def test_single_condition(self):
+        """测试单个条件"""
+        assert _parse_filter('CurrentValue.[account] = "lx"') == [('account', 'lx')]
+
+    def test_and_conditions_with_escape(self):
+        """测试 AND 连接与转义"""
+        result = _parse_filter('CurrentValue.[asset_id] = "A\\"B" AND CurrentValue.[account] = "lx"')
+        assert result == [('asset_id', 'A"B'), ('account', 'lx')]
+
+    def test_empty(self):
+        """测试空 filter"""
+        assert _parse_filter(None) == []
+
+    def test_unsupported_syntax(self):
+        """测试不支持的语法"""
+        with pytest.raises(ValueError):
+            _parse_filter('CurrentValue.[quantity] > 0')
+        with pytest.raises(ValueError):
+            _parse_filter('CurrentValue.[a] = "1" OR CurrentValue.[b] = "2"')
+
+
+class TestLocalMirror:
+    """测试本地镜像存储"""
+
+    def setup_method(self):
+        self.mirror = LocalMirror(':memory:')
+
+    def teardown_method(self):
+        self.mirror.close()
+
+    def test_replace_and_query(self):
+        """测试全量替换与等值查询"""
+        self.mirror.replace_table('holdings', [
+            _holding('rec1', '000001'),
+            _holding('rec2', 'AAPL', account='other'),
+        ])
+        records = self.mirror.query('holdings', [('account', 'lx')])
+        assert [r['record_id'] for r in records] == ['rec1']
+        assert self.mirror.last_synced('holdings') is not None
+
+    def test_query_residual_field(self):
+        """测试非索引字段在内存中过滤"""
+        self.mirror.replace_table('holdings', [
+            _holding('rec1', '000001'),
+            {'record_id': 'rec2', 'fields': {'asset_id': '000002', 'account': 'lx', 'asset_type': 'cash'}},
+        ])
+        records = self.mirror.query('holdings', [('asset_type', 'cash')])
+        assert [r['record_id'] for r in records] == ['rec2']
+
+    def test_query_date_range(self):
+        """测试按日期范围查询"""
+        self.mirror.upsert_records('cash_flow', [
+            {'record_id': 'cf1', 'fields': {'account': 'lx', 'flow_date': '2025-01-10'}},
+            {'record_id': 'cf2', 'fields': {'account': 'lx', 'flow_date': '2025-03-10'}},
+        ])
+        records = self.mirror.query('cash_flow', [('account', 'lx')],
+                                    date_from=date(2025, 2, 1), date_to=date(2025, 12, 31))
+        assert [r['record_id'] for r in records] == ['cf2']
+
+    def test_query_latest_first_with_limit(self):
+        """测试按日期倒序取最新记录"""
+        self.mirror.upsert_records('nav_history', [
+            {'record_id': 'n1', 'fields': {'account': 'lx', 'date': '2025-01-02'}},
+            {'record_id': 'n3', 'fields': {'account': 'lx', 'date': '2025-01-06'}},
+            {'record_id': 'n2', 'fields': {'account': 'lx', 'date': '2025-01-03'}},
+        ])
+        latest = self.mirror.query('nav_history', [('account', 'lx')], latest_first=True, limit=1)
+        assert [r['record_id'] for r in latest] == ['n3']
+        before = self.mirror.query('nav_history', [('account', 'lx')],
+                                   date_to=date(2025, 1, 5), latest_first=True, limit=1)
+        assert [r['record_id'] for r in before] == ['n2']
+
+    def test_invalidate(self):
+        """测试标记失效"""
+        self.mirror.replace_table('holdings', [])
+        self.mirror.invalidate('holdings')
+        assert self.mirror.last_synced('holdings') is None
+
+    def test_unknown_table(self):
+        """测试未镜像的表"""
+        with pytest.raises(ValueError):
+            self.mirror.query('unknown')
+
+
+class TestMirroredFeishuClient:
+    """测试带镜像的飞书客户端"""
+
+    def setup_method(self):
+        self.remote = Mock()
+        self.remote.list_records.return_value = [_holding('rec1', '000001')]
+        self.mirror = LocalMirror(':memory:')
+        self.client = MirroredFeishuClient(self.remote, self.mirror, max_staleness=300)
+
+    def teardown_method(self):
+        self.mirror.close()
+
+    def test_reads_are_local_after_sync(self):
+        """测试同步后读请求不再访问飞书"""
+        filter_str = 'CurrentValue.[asset_id] = "000001" AND CurrentValue.[account] = "lx"'
+        assert len(self.client.list_records('holdings', filter_str=filter_str)) == 1
+        assert len(self.client.list_records('holdings', filter_str=filter_str)) == 1
+        self.remote.list_records.assert_called_once_with('holdings')
+
+    def test_stale_mirror_resyncs(self):
+        """测试超过陈旧上限时重新对账"""
+        self.client.max_staleness = 0
+        with patch('src.feishu_mirror.time.time', side_effect=[1000.0, 2000.0, 3000.0, 4000.0]):
+            self.client.list_records('holdings')
+            self.client.list_records('holdings')
+        assert self.remote.list_records.call_count == 2
+
+    def test_unsupported_filter_falls_back_to_remote(self):
+        """测试不支持的 filter 回退远程"""
+        self.client.list_records('holdings', filter_str='CurrentValue.[quantity] > 0')
+        self.remote.list_records.assert_called_once()
+        assert self.mirror.last_synced('holdings') is None
+
+    def test_write_through_create_and_update(self):
+        """测试写入先飞书后本地"""
+        self.client.sync('holdings')
+        self.remote.create_record.return_value = _holding('rec2', 'AAPL', market='美股')
+        self.client.create_record('holdings', {'asset_id': 'AAPL'})
+        self.remote.update_record.return_value = {'record_id': 'rec1', 'fields': {'quantity': 200}}
+        self.client.update_record('holdings', 'rec1', {'quantity': 200})
+
+        assert self.mirror.get_record('holdings', 'rec2')['fields']['asset_id'] == 'AAPL'
+        updated = self.mirror.get_record('holdings', 'rec1')['fields']
+        assert updated['quantity'] == 200
+        assert updated['asset_id'] == '000001'
+
+    def test_failed_remote_write_not_mirrored(self):
+        """测试飞书写入失败时本地不变"""
+        self.client.sync('holdings')
+        self.remote.delete_record.side_effect = Exception("API error")
+        with pytest.raises(Exception):
+            self.client.delete_record('holdings', 'rec1')
+        assert self.mirror.get_record('holdings', 'rec1') is not None
+
+    def test_partial_batch_delete_invalidates(self):
+        """测试批量删除部分成功时标记失效"""
+        self.client.sync('holdings')
+        self.remote.batch_delete_records.return_value = 1
+        self.client.batch_delete_records('holdings', ['rec1', 'rec9'])
+        assert self.mirror.last_synced('holdings') is None
+
+    def test_write_during_sync_survives_replace(self):
+        """测试同步拉取期间完成的写入不会被全量替换清掉"""
+        import threading
+        fetched = threading.Event()
+        release = threading.Event()
+
+        def slow_list(*args, **kwargs):
+            fetched.set()
+            release.wait(2)
+            return [_holding('rec1', '000001')]
+
+        self.remote.list_records.side_effect = slow_list
+        self.remote.create_record.return_value = _holding('rec2', 'AAPL')
+
+        syncer = threading.Thread(target=self.client.sync, args=('holdings',))
+        syncer.start()
+        fetched.wait(2)
+        writer = threading.Thread(target=self.client.create_record, args=('holdings', {}))
+        writer.start()
+        release.set()
+        syncer.join()
+        writer.join()
+
+        assert self.mirror.get_record('holdings', 'rec2') is not None
+
+    def test_remote_only_kwargs_forwarded(self):
+        """测试系统字段/排序查询回退远程，接口与 FeishuClient 一致"""
+        self.client.list_records('holdings', automatic_fields=True, sort=['x DESC'])
+        self.remote.list_records.assert_called_once_with(
+            'holdings', filter_str=None, field_names=None, page_size=500,
+            automatic_fields=True, sort=['x DESC'])
+        self.client.list_records_modified_since('holdings', 1000, '修改时间')
+        self.remote.list_records_modified_since.assert_called_once_with(
+            'holdings', 1000, '修改时间', page_size=500)
+
+    def test_attribute_passthrough(self):
+        """测试其他属性透传给底层客户端"""
+        self.remote.table_configs = {'holdings': {}}
+        assert self.client.table_configs == {'holdings': {}}
+        assert self.client.sync_all() == {'holdings': 1}
+
+
+class TestMirrorDeltaSync:
+    """测试增量同步"""
+
+    def setup_method(self):
+        self.remote = Mock()
+        self.remote.list_records.return_value = [
+            _modified(_holding('rec1', '000001'), 1000),
+            _modified(_holding('rec2', '000002'), 2000),
+        ]
+        self.mirror = LocalMirror(':memory:')
+        self.client = MirroredFeishuClient(self.remote, self.mirror, max_staleness=300,
+                                           modified_field='修改时间', full_sync_interval=86400)
+
+    def teardown_method(self):
+        self.mirror.close()
+
+    def test_first_sync_is_full(self):
+        """测试无水位线时全量同步并记录水位线"""
+        assert self.client.sync_delta('holdings') == 2
+        self.remote.list_records_modified_since.assert_not_called()
+        assert self.mirror.get_watermark('holdings')[0] == 2000
+
+    def test_delta_merges_changes(self):
+        """测试增量同步只拉取水位线之后的记录并合并"""
+        self.client.sync('holdings')
+        self.remote.list_records_modified_since.return_value = [
+            _modified(_holding('rec2', '000002', quantity=300), 3000),
+            _modified(_holding('rec3', '000003'), 2500),
+        ]
+        assert self.client.sync_delta('holdings') == 2
+
+        self.remote.list_records_modified_since.assert_called_once_with('holdings', 2000, '修改时间')
+        assert self.remote.list_records.call_count == 1
+        assert self.mirror.get_record('holdings', 'rec2')['fields']['quantity'] == 300
+        assert len(self.mirror.query('holdings')) == 3
+        assert self.mirror.get_watermark('holdings')[0] == 3000
+
+    def test_periodic_full_reconcile(self):
+        """测试超过全量间隔时重新全量对账"""
+        self.client.sync('holdings')
+        self.client.full_sync_interval = 0
+        with patch('src.feishu_mirror.time.time', return_value=9999999999.0):
+            self.client.sync_delta('holdings')
+        assert self.remote.list_records.call_count == 2
+        self.remote.list_records_modified_since.assert_not_called()
+
+    def test_without_modified_field_falls_back_to_full(self):
+        """测试未配置修改时间字段时全量同步"""
+        self.client.modified_field = None
+        self.client.sync('holdings')
+        self.client.sync_delta('holdings')
+        assert self.remote.list_records.call_count == 2
+
+
+class TestFeishuStorageMirror:
+    """测试存储层接入镜像"""
+
+    @patch('src.feishu_storage.config.is_local_mirror_enabled', return_value=True)
+    @patch('src.feishu_mirror.LocalMirror')
+    @patch('src.feishu_storage.FeishuClient')
+    def test_auto_wrap_when_enabled(self, mock_client_class, mock_mirror_class, _):
+        """测试启用镜像时自动包装客户端"""
+        storage = FeishuStorage()
+        assert isinstance(storage.client, MirroredFeishuClient)
+        assert storage.client.client == mock_client_class.return_value
+
+    def test_nav_reads_use_date_index(self):
+        """测试净值查询走镜像日期索引"""
+        remote = Mock()
+        remote.list_records.return_value = [
+            {'record_id': 'n1', 'fields': {'account': 'lx', 'date': '2025-01-02', 'nav': 1.0}},
+            {'record_id': 'n2', 'fields': {'account': 'lx', 'date': '2025-01-03', 'nav': 1.1}},
+            {'record_id': 'n3', 'fields': {'account': 'lx', 'date': '2025-01-06', 'nav': 1.2}},
+        ]
+        mirror = LocalMirror(':memory:')
+        storage = FeishuStorage(client=MirroredFeishuClient(remote, mirror, max_staleness=300))
+
+        assert storage.get_latest_nav('lx').record_id == 'n3'
+        assert storage.get_latest_nav_before('lx', date(2025, 1, 6)).record_id == 'n2'
+        assert storage.get_nav_on_date('lx', date(2025, 1, 3)).record_id == 'n2'
+        assert storage.get_nav_on_date('lx', date(2025, 1, 4)) is None
+        remote.list_records.assert_called_once()
+        mirror.close()
+
+    def test_sync_mirror_disabled(self):
+        """测试未启用镜像时 sync_mirror 为空操作"""
+        storage = FeishuStorage(client=Mock(spec=['list_records']))
+        assert storage.sync_mirror() == {}
@@ -414,6 +414,99 @@ class TestFeishuStorageHoldingOperations:
         self.mock_client.delete_record.assert_called_once_with('holdings', 'rec_123')
 
 
+class TestFeishuStorageHoldingBatch:
+    """测试持仓批量写入"""
+
+    def setup_method(self):
+        self.mock_client = Mock()
+        self.mock_client.list_records.return_value = [
+            {'record_id': 'rec_cash', 'fields': {'asset_id': 'CNY-CASH', 'asset_name': '人民币现金',
+                                                 'account': 'lx', 'quantity': 10000, 'currency': 'CNY'}},
+            {'record_id': 'rec_stock', 'fields': {'asset_id': '000001', 'asset_name': '平安',
+                                                  'account': 'lx', 'market': '', 'quantity': 100,
+                                                  'currency': 'CNY'}},
+        ]
+        self.mock_client.batch_create_records.return_value = [{'record_id': 'rec_new'}]
+        self.storage = FeishuStorage(client=self.mock_client)
+
+    def _holding(self, asset_id, quantity, name=None):
+        return Holding(asset_id=asset_id, asset_name=name or asset_id, asset_type=AssetType.A_STOCK,
+                       account='lx', quantity=quantity, currency='CNY')
+
+    def test_flush_resolves_with_one_list_call(self):
+        """测试多笔变动只查询一次，并合并为批量更新/创建"""
+        with self.storage.holding_batch('lx') as batch:
+            batch.add(self._holding('000001', 100, '平安银行'))
+            batch.add(self._holding('600000', 200))
+            batch.add(self._holding('000001', 50, '平安'))
+            batch.add_delta('CNY-CASH', -3000)
+            batch.add_delta('CNY-CASH', -500)
+
+        self.mock_client.list_records.assert_called_once()
+        self.mock_client.update_record.assert_not_called()
+        self.mock_client.create_record.assert_not_called()
+
+        updates = self.mock_client.batch_update_records.call_args[0][1]
+        by_id = {u['record_id']: u['fields'] for u in updates}
+        assert by_id['rec_stock']['quantity'] == 250
+        assert by_id['rec_stock']['asset_name'] == '平安银行'
+        assert by_id['rec_cash']['quantity'] == 6500
+
+        creates = self.mock_client.batch_create_records.call_args[0][1]
+        assert len(creates) == 1
+        assert creates[0]['fields']['asset_id'] == '600000'
+        assert creates[0]['fields']['quantity'] == 200
+        assert self.storage._holding_id_cache['600000:lx:'] == 'rec_new'
+
+    def test_get_quantity_includes_pending(self):
+        """测试批次内数量包含未提交的变动"""
+        batch = self.storage.holding_batch('lx')
+        batch.add_delta('CNY-CASH', -2000)
+        assert batch.get_quantity('CNY-CASH') == 8000
+        assert batch.get_quantity('MISSING') == 0
+
+    def test_missing_holding_delta_raises_before_write(self):
+        """测试变动指向不存在的持仓时不发出任何写请求"""
+        batch = self.storage.holding_batch('lx')
+        batch.add(self._holding('600000', 200))
+        batch.add_delta('MISSING', 10)
+
+        with pytest.raises(ValueError):
+            batch.flush()
+        self.mock_client.batch_update_records.assert_not_called()
+        self.mock_client.batch_create_records.assert_not_called()
+
+    def test_exception_discards_batch(self):
+        """测试块内异常时丢弃变动"""
+        with pytest.raises(RuntimeError):
+            with self.storage.holding_batch('lx') as batch:
+                batch.add_delta('CNY-CASH', -100)
+                raise RuntimeError('boom')
+
+        self.mock_client.batch_update_records.assert_not_called()
+
+    def test_delete_zero(self):
+        """测试归零持仓批量删除"""
+        self.mock_client.batch_delete_records.return_value = 1
+        with self.storage.holding_batch('lx', delete_zero=True) as batch:
+            batch.add_delta('000001', -100)
+
+        self.mock_client.batch_delete_records.assert_called_once_with('holdings', ['rec_stock'])
+
+    def test_set_avg_cost(self):
+        """测试平均成本随批量更新/创建写入"""
+        with self.storage.holding_batch('lx') as batch:
+            batch.set_avg_cost('000001', 12.5)
+            batch.add(self._holding('600000', 200))
+            batch.set_avg_cost('600000', 8.0)
+
+        updates = self.mock_client.batch_update_records.call_args[0][1]
+        assert updates == [{'record_id': 'rec_stock', 'fields': {
+            'quantity': 100, 'updated_at': updates[0]['fields']['updated_at'], 'avg_cost': 12.5}}]
+        creates = self.mock_client.batch_create_records.call_args[0][1]
+        assert creates[0]['fields']['avg_cost'] == 8.0
+
+
 class TestFeishuStorageTransactionOperations:
     """测试飞书存储层交易操作"""
 
@@ -704,6 +797,20 @@ class TestFeishuStorageNAVOperations:
         assert nav.record_id == 'existing_nav'
         self.mock_client.update_record.assert_called_once()
 
+    def test_save_navs_batch_create(self):
+        """测试批量补录净值（一次 batch_create_records）"""
+        self.mock_client.batch_create_records.return_value = [{'record_id': 'nav_1'}, {'record_id': 'nav_2'}]
+        navs = [NAVHistory(date=date(2025, 3, d), account='测试账户', total_value=1000.0, nav=1.0, shares=1000.0)
+                for d in (12, 13)]
+
+        self.storage.save_navs(navs)
+
+        table, records = self.mock_client.batch_create_records.call_args[0]
+        assert table == 'nav_history'
+        assert len(records) == 2 and 'fields' in records[0]
+        assert [n.record_id for n in navs] == ['nav_1', 'nav_2']
+        self.mock_client.list_records.assert_not_called()
+
     def test_get_nav_history(self):
         """测试获取净值历史"""
         from datetime import timedelta
@@ -903,3 +1010,45 @@ class TestFeishuStoragePriceOperations:
 
         assert len(prices) == 1
         assert prices[0].asset_id == '000001'
+
+    def test_save_prices_appends_closes_by_trade_date(self):
+        """价格序列按报价自身交易日落行，盘中报价不写入"""
+        self.storage.timeseries = Mock()
+        self.storage.save_prices([
+            PriceCache(asset_id='AAPL', price=243.85, currency='USD', cny_price=1770.0,
+                       close_date=date(2025, 1, 2)),
+            PriceCache(asset_id='600519', price=1488.0, currency='CNY', cny_price=1488.0),
+        ])
+
+        self.storage.timeseries.append_prices.assert_called_once_with(
+            'AAPL', [(date(2025, 1, 2), 243.85, 1770.0)])
+
+
+class TestFeishuStorageParallelLoad:
+    """测试持仓与净值并行加载"""
+
+    def test_load_holdings_and_navs(self):
+        """测试一次并行查询两张表并解码"""
+        mock_client = Mock()
+        today = date.today()
+        mock_client.list_records_many.return_value = [
+            [
+                {'record_id': 'h1', 'fields': {'asset_id': '000001', 'account': 'lx',
+                                               'asset_type': 'a_stock', 'quantity': 100}},
+                {'record_id': 'h2', 'fields': {'asset_id': '000002', 'account': 'lx',
+                                               'asset_type': 'a_stock', 'quantity': 0}},
+            ],
+            [
+                {'record_id': 'n2', 'fields': {'account': 'lx', 'date': today.isoformat(), 'nav': 1.1}},
+                {'record_id': 'n1', 'fields': {'account': 'lx',
+                                               'date': (today - timedelta(days=1)).isoformat(), 'nav': 1.0}},
+            ],
+        ]
+        storage = FeishuStorage(client=mock_client)
+
+        holdings, navs = storage.load_holdings_and_navs('lx')
+
+        queries = mock_client.list_records_many.call_args.args[0]
+        assert [q[0] for q in queries] == ['holdings', 'nav_history']
+        assert [h.record_id for h in holdings] == ['h1']
+        assert [n.record_id for n in navs] == ['n1', 'n2']
@@ -0,0 +1,118 @@
+"""测试汇率历史"""
+from datetime import date, timedelta
+from unittest.mock import Mock
+
+from src.fx_history import MAX_GAP_DAYS, FxHistory
+from src.portfolio import PortfolioManager
+from src.price_fetcher import PriceFetcher
+
+
+def _sina_kline(rows):
+    body = '|'.join(f'{d},{r},{r},{r},{r},' for d, r in rows)
+    return f'var _fx_susdcny=("{body}");'
+
+
+def _response(text=None, json_data=None):
+    response = Mock()
+    response.text = text
+    response.json.return_value = json_data
+    return response
+
+
+class TestFxHistory:
+    """测试存储与 as-of 查询"""
+
+    def test_as_of_lookup_fills_weekends(self, tmp_path):
+        history = FxHistory(tmp_path / 'fx.db')
+        # 2025-01-03 周五，2025-01-06 周一
+        assert history.put('USDCNY', [(date(2025, 1, 3), 7.30), ('2025-01-06', 7.32)], source='test') == 2
+
+        assert history.rate('USDCNY', date(2025, 1, 3)) == 7.30
+        assert history.rate('USDCNY', date(2025, 1, 5)) == 7.30
+        assert history.rate('USDCNY', '2025-01-06') == 7.32
+        assert history.rate('USDCNY', date(2025, 1, 2)) is None
+        assert history.rate('HKDCNY', date(2025, 1, 3)) is None
+        # 末条之后沿用，超过 MAX_GAP_DAYS 视为缺数据
+        assert history.rate('USDCNY', date(2025, 1, 6) + timedelta(days=MAX_GAP_DAYS)) == 7.32
+        assert history.rate('USDCNY', date(2025, 1, 7) + timedelta(days=MAX_GAP_DAYS)) is None
+        assert history.coverage('USDCNY') == (date(2025, 1, 3), date(2025, 1, 6))
+
+    def test_same_day_overwrites(self, tmp_path):
+        history = FxHistory(tmp_path / 'fx.db')
+        history.put('HKDCNY', [(date(2025, 1, 3), 0.93)])
+        history.put('HKDCNY', [(date(2025, 1, 3), 0.94), (date(2025, 1, 2), 0.92)])
+        assert history.series('HKDCNY') == [(date(2025, 1, 2), 0.92), (date(2025, 1, 3), 0.94)]
+        assert history.series('HKDCNY', start=date(2025, 1, 3)) == [(date(2025, 1, 3), 0.94)]
+
+    def test_other_connection_writes_visible(self, tmp_path):
+        reader = FxHistory(tmp_path / 'fx.db')
+        writer = FxHistory(tmp_path / 'fx.db')
+        writer.put('USDCNY', [(date(2025, 1, 3), 7.30)])
+        assert reader.rate('USDCNY', date(2025, 1, 3)) == 7.30
+        writer.put('USDCNY', [(date(2025, 1, 3), 7.31)])
+        assert reader.rate('USDCNY', date(2025, 1, 3)) == 7.31
+
+    def test_missing_db_not_created_on_read(self, tmp_path):
+        history = FxHistory(tmp_path / 'fx.db')
+        assert history.rate('USDCNY', date(2025, 1, 3)) is None
+        assert not (tmp_path / 'fx.db').exists()
+
+
+class TestPriceFetcherFxHistory:
+    """测试回填与历史汇率查询"""
+
+    def test_backfill_then_lookup_without_network(self):
+        fetcher = PriceFetcher()
+        fetcher.session.get = Mock(return_value=_response(_sina_kline(
+            [('2024-12-31', 7.29), ('2025-01-02', 7.30), ('2025-01-03', 7.31)])))
+
+        written = fetcher.backfill_exchange_rates(date(2025, 1, 1), date(2025, 1, 3), currencies=['USD'])
+
+        assert written == {'USDCNY': 2}
+        fetcher.session.get.reset_mock()
+        assert fetcher.get_exchange_rate('USD', date(2025, 1, 1)) is None
+        assert fetcher.get_exchange_rate('USD', date(2025, 1, 2)) == 7.30
+        assert fetcher.get_exchange_rate('CNY', date(2025, 1, 2)) == 1.0
+        fetcher.session.get.assert_not_called()
+
+        # 已覆盖的区间不再请求
+        assert fetcher.backfill_exchange_rates(date(2025, 1, 2), date(2025, 1, 3), currencies=['USD']) == {'USDCNY': 0}
+        fetcher.session.get.assert_not_called()
+
+    def test_backfill_falls_back_to_timeseries(self):
+        fetcher = PriceFetcher()
+
+        def get(url, **kwargs):
+            if 'sina' in url:
+                raise ConnectionError('blocked')
+            return _response(json_data={'rates': {'2025-01-02': {'CNY': 0.94}, '2025-01-03': {'CNY': 0.95}}})
+
+        fetcher.session.get = Mock(side_effect=get)
+        written = fetcher.backfill_exchange_rates(date(2025, 1, 2), date(2025, 1, 3), currencies=['HKD'])
+
+        assert written == {'HKDCNY': 2}
+        assert fetcher.fx_history.series('HKDCNY')[-1] == (date(2025, 1, 3), 0.95)
+
+    def test_live_rates_recorded(self):
+        fetcher = PriceFetcher()
+        fetcher._load_rate_cache_from_file = Mock(return_value=None)
+        fetcher._save_rate_cache_to_file = Mock()
+        fetcher.session.get = Mock(return_value=_response(json_data={'rates': {'CNY': 7.2}}))
+
+        fetcher._fetch_exchange_rates()
+
+        assert fetcher.fx_history.rate('USDCNY', date.today()) == 7.2
+        assert fetcher.fx_history.rate('HKDCNY', date.today()) == 7.2
+
+    def test_backdated_deposit_uses_history(self):
+        storage = Mock()
+        storage.add_cash_flow.side_effect = lambda cf: cf
+        storage.get_holding.return_value = None
+        fetcher = PriceFetcher()
+        fetcher.fx_history.put('USDCNY', [(date(2024, 6, 28), 7.27)])
+        manager = PortfolioManager(storage=storage, price_fetcher=fetcher)
+
+        cf = manager.deposit(flow_date=date(2024, 6, 30), account='测试账户', amount=1000, currency='USD')
+
+        assert cf.exchange_rate == 7.27
+        assert cf.cny_amount == 7270.0
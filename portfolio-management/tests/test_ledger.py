@@ -0,0 +1,148 @@
+"""测试持仓账本"""
+import json
+from datetime import date
+from unittest.mock import Mock
+
+import pytest
+
+from src import ledger as ledger_module
+from src.feishu_storage import FeishuStorage
+from src.ledger import PositionLedger
+from src.models import AssetType, CashFlow, Transaction, TransactionType
+
+ACCOUNT = '测试账户'
+
+
+def _deposit(d, amount, currency='CNY'):
+    return CashFlow(flow_date=d, account=ACCOUNT, amount=amount, currency=currency,
+                    cny_amount=amount, flow_type='DEPOSIT')
+
+
+def _trade(d, asset_id, quantity, price, currency='CNY', fee=0.0, market='',
+           asset_type=AssetType.A_STOCK):
+    tx_type = TransactionType.SELL if quantity < 0 else TransactionType.BUY
+    return Transaction(tx_date=d, tx_type=tx_type, asset_id=asset_id, asset_name=asset_id,
+                       asset_type=asset_type, account=ACCOUNT, market=market, quantity=quantity,
+                       price=price, currency=currency, fee=fee)
+
+
+class TestPositionLedger:
+    """测试持仓折叠、快照与对账"""
+
+    def test_fold_quantity_cost_and_cash(self, tmp_path):
+        ledger = PositionLedger(ACCOUNT, [
+            _trade(date(2025, 1, 6), '600519', 100, 1000.0, fee=10),
+            _trade(date(2025, 1, 7), '600519', 100, 1200.0),
+            _trade(date(2025, 1, 8), '600519', -50, 1300.0, fee=5),
+            _trade(date(2025, 1, 8), 'AAPL', 10, 200.0, currency='USD', asset_type=AssetType.US_STOCK),
+        ], [
+            # 同日入金先于买入折叠
+            _deposit(date(2025, 1, 6), 300000),
+            _deposit(date(2025, 1, 6), 1000, currency='USD'),
+        ], state_file=tmp_path / 'ledger.json')
+
+        positions = ledger.positions()
+        stock = positions[('600519', '')]
+        assert stock.quantity == 150
+        # 移动加权平均：(100×1000 + 10 + 100×1200) / 200 = 1100.05
+        assert stock.avg_cost == pytest.approx(1100.05)
+        assert stock.realized_pnl == pytest.approx(50 * 1300 - 5 - 50 * 1100.05)
+        assert positions[('CNY-CASH', '')].quantity == pytest.approx(300000 - 100010 - 120000 + 64995)
+        # 外币交易不动现金
+        assert positions[('USD-CASH', '')].quantity == 1000
+        assert positions[('AAPL', '')].avg_cost == 200.0
+
+        assert ledger.quantities(date(2025, 1, 6)) == {'600519': 100, 'CNY-CASH': 199990, 'USD-CASH': 1000}
+
+    def test_buy_deducts_mmf_when_cash_short(self, tmp_path):
+        ledger = PositionLedger(ACCOUNT, [
+            _trade(date(2025, 1, 6), 'CNY-MMF', 5000, 1.0, asset_type=AssetType.MMF),
+            _trade(date(2025, 1, 7), '600000', 1000, 8.0),
+        ], [_deposit(date(2025, 1, 6), 10000)], state_file=tmp_path / 'ledger.json')
+
+        quantities = ledger.quantities()
+        # 5000 现金不足 8000：先扣现金 5000，余下 3000 扣货币基金
+        assert quantities == {'CNY-MMF': 2000, '600000': 1000}
+
+    def test_snapshots_skip_replay_and_invalidate_on_history_change(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ledger_module, 'SNAPSHOT_INTERVAL', 3)
+        state_file = tmp_path / 'ledger.json'
+        transactions = [_trade(date(2025, 1, d), '600000', 100, 10.0) for d in range(6, 11)]
+        cash_flows = [_deposit(date(2025, 1, 6), 100000)]
+
+        PositionLedger(ACCOUNT, transactions, cash_flows, state_file=state_file).positions()
+        snapshots = json.loads(state_file.read_text(encoding='utf-8'))['snapshots']
+        assert [s['count'] for s in snapshots] == [3, 6]
+
+        # 从快照继续折叠：快照之前的事件不再重放
+        ledger = PositionLedger(ACCOUNT, transactions, cash_flows, state_file=state_file)
+        applied = []
+        real_apply = ledger_module.apply_event
+        monkeypatch.setattr(ledger_module, 'apply_event',
+                            lambda state, event: applied.append(event) or real_apply(state, event))
+        # 快照 count=3 覆盖到 1 月 7 日，只需再折叠 8、9 日两笔
+        assert ledger.quantities(date(2025, 1, 9))['600000'] == 400
+        assert len(applied) == 2
+        applied.clear()
+        assert ledger.quantities()['600000'] == 500
+        assert applied == []
+
+        # 补录一笔更早的交易：快照摘要不符，从头折叠
+        backdated = [_trade(date(2025, 1, 3), '600000', 100, 10.0)] + transactions
+        ledger = PositionLedger(ACCOUNT, backdated, cash_flows, state_file=state_file)
+        assert ledger.quantities()['600000'] == 600
+        assert len(applied) == 7
+
+    @staticmethod
+    def _storage(records):
+        client = Mock()
+        client.list_records.return_value = records
+        client.batch_create_records.return_value = [{'record_id': 'rec_new'}]
+        client.batch_delete_records.return_value = 1
+        return client, FeishuStorage(client=client)
+
+    def test_healthy_table_has_no_diffs(self, tmp_path):
+        """buy 写入路径不维护 avg_cost：成本为空只列为 missing_cost，不算不一致"""
+        _, storage = self._storage([
+            {'record_id': 'rec_cash', 'fields': {'asset_id': 'CNY-CASH', 'asset_name': '人民币现金',
+                                                 'account': ACCOUNT, 'quantity': 90000, 'currency': 'CNY'}},
+            {'record_id': 'rec_stock', 'fields': {'asset_id': '600519', 'asset_name': '贵州茅台',
+                                                  'account': ACCOUNT, 'quantity': 10, 'currency': 'CNY'}},
+        ])
+        ledger = PositionLedger(ACCOUNT, [_trade(date(2025, 1, 6), '600519', 10, 1000.0)],
+                                [_deposit(date(2025, 1, 6), 100000)], state_file=tmp_path / 'ledger.json')
+
+        report = ledger.reconcile(storage.get_holdings(account=ACCOUNT, include_empty=True))
+
+        assert report['diffs'] == [] and report['cash_diffs'] == [] and report['cost_diffs'] == []
+        assert [(d['asset_id'], d['ledger_avg_cost']) for d in report['missing_cost']] == [('600519', 1000.0)]
+
+    def test_reconcile_and_materialize(self, tmp_path):
+        client, storage = self._storage([
+            # 手工 add_cash 过的现金：与流水不符，但默认不修正
+            {'record_id': 'rec_cash', 'fields': {'asset_id': 'CNY-CASH', 'asset_name': '人民币现金',
+                                                 'account': ACCOUNT, 'quantity': 95000, 'currency': 'CNY'}},
+            {'record_id': 'rec_old', 'fields': {'asset_id': '000001', 'asset_name': '平安银行',
+                                                'account': ACCOUNT, 'quantity': 300, 'currency': 'CNY'}},
+        ])
+        ledger = PositionLedger(ACCOUNT, [_trade(date(2025, 1, 6), '600519', 10, 1000.0, market='平安证券')],
+                                [_deposit(date(2025, 1, 6), 100000)], state_file=tmp_path / 'ledger.json')
+
+        result = ledger.materialize(storage, dry_run=True)
+        assert {(d['asset_id'], d['market']) for d in result['diffs']} == {('000001', ''), ('600519', '平安证券')}
+        assert [(d['asset_id'], d['ledger_quantity']) for d in result['cash_diffs']] == [('CNY-CASH', 90000)]
+        client.batch_update_records.assert_not_called()
+
+        result = ledger.materialize(storage)
+        # 000001 先归零再删除；现金未被写入
+        assert (result['updated'], result['created'], result['deleted']) == (1, 1, 1)
+        assert [u['record_id'] for u in client.batch_update_records.call_args[0][1]] == ['rec_old']
+        created = client.batch_create_records.call_args[0][1][0]['fields']
+        assert (created['asset_id'], created['quantity'], created['avg_cost']) == ('600519', 10, 1000.0)
+        assert created['market'] == '平安证券'
+        client.batch_delete_records.assert_called_once_with('holdings', ['rec_old'])
+
+        # 显式要求时现金也按流水修正
+        ledger.materialize(storage, include_cash=True)
+        updates = client.batch_update_records.call_args[0][1]
+        assert ('rec_cash', 90000) in [(u['record_id'], u['fields']['quantity']) for u in updates]
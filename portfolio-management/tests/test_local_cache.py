@@ -0,0 +1,107 @@
+"""测试本地价格缓存"""
+import json
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.local_cache import LocalPriceCache
+from src.models import AssetType, PriceCache
+
+
+def _price(asset_id, price=10.0, expires_in=3600):
+    return PriceCache(asset_id=asset_id, asset_name=f"名称{asset_id}", asset_type=AssetType.A_STOCK,
+                      price=price, currency='CNY', cny_price=price, data_source='tencent',
+                      expires_at=datetime.now() + timedelta(seconds=expires_in))
+
+
+class TestLocalPriceCache:
+    """测试 SQLite 价格缓存"""
+
+    def test_save_and_get(self, tmp_path):
+        cache = LocalPriceCache(tmp_path / 'cache.db', legacy_file=None)
+        cache.save(_price('600519', 1500.0))
+        cache.save(_price('600519', 1510.0))
+
+        result = cache.get('600519')
+        assert result.price == 1510.0
+        assert result.asset_type == AssetType.A_STOCK
+        assert cache.get('000001') is None
+
+    def test_expired_entries(self, tmp_path):
+        cache = LocalPriceCache(tmp_path / 'cache.db', legacy_file=None)
+        cache.save(_price('600519'))
+        cache.save(_price('000001', expires_in=-60))
+
+        assert cache.get('000001') is None
+        assert [p.asset_id for p in cache.get_all()] == ['600519']
+        cache.delete('600519')
+        assert cache.get_all() == []
+
+    def test_shared_between_instances(self, tmp_path):
+        """测试两个实例（模拟两个进程）共享同一数据库"""
+        db = tmp_path / 'cache.db'
+        writer = LocalPriceCache(db, legacy_file=None)
+        reader = LocalPriceCache(db, legacy_file=None)
+        writer.save(_price('AAPL', 190.0))
+        assert reader.get('AAPL').price == 190.0
+        assert sqlite3.connect(str(db)).execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    def test_migrates_legacy_json(self, tmp_path):
+        legacy = tmp_path / 'price_cache.json'
+        expires = (datetime.now() + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+        legacy.write_text(json.dumps({
+            '600519': {'asset_id': '600519', 'asset_name': '贵州茅台', 'asset_type': 'a_stock',
+                       'price': 1500.0, 'currency': 'CNY', 'cny_price': 1500.0,
+                       'expires_at': expires},
+        }), encoding='utf-8')
+
+        cache = LocalPriceCache(tmp_path / 'cache.db', legacy_file=legacy)
+        assert cache.get('600519').asset_name == '贵州茅台'
+        assert not legacy.exists()
+        assert (tmp_path / 'price_cache.json.migrated').exists()
+
+    def test_get_many_and_save_many(self, tmp_path):
+        """测试批量读写：一次查询返回行字典，带过期标记"""
+        cache = LocalPriceCache(tmp_path / 'cache.db', legacy_file=None)
+        cache.save_many([_price('600519', 1500.0), _price('000001', 10.0, expires_in=-60)])
+
+        fresh = cache.get_many(['600519', '000001', 'AAPL'])
+        assert list(fresh) == ['600519']
+        assert fresh['600519']['price'] == 1500.0
+        assert fresh['600519']['expired'] is False
+
+        rows = cache.get_many(['600519', '000001'], include_expired=True)
+        assert rows['000001']['expired'] is True
+        assert cache.get_many([]) == {}
+
+    def test_reader_sees_sibling_updates(self, tmp_path):
+        """测试已加载内存行缓存的实例能看到其他连接的后续写入"""
+        db = tmp_path / 'cache.db'
+        reader = LocalPriceCache(db, legacy_file=None)
+        writer = LocalPriceCache(db, legacy_file=None)
+        writer.save(_price('600519', 1500.0))
+        assert reader.get('600519').price == 1500.0
+
+        writer.save(_price('600519', 1520.0))
+        writer.delete('000001')
+        assert reader.get_many(['600519'])['600519']['price'] == 1520.0
+
+    def test_cross_process_write(self, tmp_path):
+        """测试另一个进程写入的价格对本进程可见"""
+        db = tmp_path / 'cache.db'
+        cache = LocalPriceCache(db, legacy_file=None)
+        assert cache.get('AAPL') is None
+
+        script = (
+            "from datetime import datetime, timedelta\n"
+            "from src.local_cache import LocalPriceCache\n"
+            "from src.models import AssetType, PriceCache\n"
+            f"cache = LocalPriceCache({str(db)!r}, legacy_file=None)\n"
+            "cache.save(PriceCache(asset_id='AAPL', asset_type=AssetType.US_STOCK, price=190.0,\n"
+            "    currency='USD', cny_price=1380.0, expires_at=datetime.now() + timedelta(hours=1)))\n"
+        )
+        subprocess.run([sys.executable, '-c', script], check=True,
+                       cwd=Path(__file__).resolve().parent.parent)
+        assert cache.get('AAPL').price == 190.0
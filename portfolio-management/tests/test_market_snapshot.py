@@ -0,0 +1,106 @@
+"""测试全市场快照缓存"""
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src import market_snapshot
+from src.market_snapshot import MarketSnapshotCache
+
+
+class _FakeFrame:
+    """模拟 AKShare 返回的 DataFrame（只需 to_dict('records')）"""
+
+    def __init__(self, records):
+        self.records = records
+
+    def to_dict(self, orient):
+        assert orient == 'records'
+        return list(self.records)
+
+
+def _spot_frame():
+    return _FakeFrame([
+        {'代码': '600519', '名称': '贵州茅台', '最新价': 1500.0},
+        {'代码': '000001', '名称': '平安银行', '最新价': 10.5},
+    ])
+
+
+class TestMarketSnapshotCache:
+    """测试 TTL 内只下载一次"""
+
+    def test_lookup_downloads_once_per_ttl(self):
+        calls = []
+
+        def loader(table):
+            calls.append(table)
+            return _spot_frame()
+
+        cache = MarketSnapshotCache(loader=loader)
+        assert cache.lookup('cn_spot', '600519')['名称'] == '贵州茅台'
+        assert cache.lookup('cn_spot', '000001')['最新价'] == 10.5
+        assert cache.lookup('cn_spot', '999999') is None
+        assert calls == ['cn_spot']
+
+    def test_expired_snapshot_reloads(self):
+        calls = []
+
+        def loader(table):
+            calls.append(table)
+            return _spot_frame()
+
+        cache = MarketSnapshotCache(ttl={'cn_spot': 0}, loader=loader)
+        cache.lookup('cn_spot', '600519')
+        cache.lookup('cn_spot', '600519')
+        assert len(calls) == 2
+
+        cache.invalidate()
+        cache.ttl['cn_spot'] = 300
+        cache.lookup('cn_spot', '600519')
+        cache.lookup('cn_spot', '000001')
+        assert len(calls) == 3
+
+    def test_concurrent_lookups_share_download(self):
+        calls = []
+
+        def loader(table):
+            calls.append(table)
+            time.sleep(0.1)
+            return _spot_frame()
+
+        cache = MarketSnapshotCache(loader=loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.lookup('cn_spot', '600519')))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert calls == ['cn_spot']
+        assert all(r['名称'] == '贵州茅台' for r in results)
+
+    def test_failure_backoff(self):
+        calls = []
+
+        def loader(table):
+            calls.append(table)
+            raise ConnectionError('timeout')
+
+        cache = MarketSnapshotCache(loader=loader)
+        assert cache.lookup('fund_rank', '000001') is None
+        assert cache.lookup('fund_rank', '000002') is None
+        assert calls == ['fund_rank']
+
+        with patch.object(market_snapshot, 'FAILURE_BACKOFF', 0):
+            cache.lookup('fund_rank', '000001')
+        assert len(calls) == 2
+
+    def test_import_error_propagates(self):
+        def loader(table):
+            raise ImportError('akshare')
+
+        cache = MarketSnapshotCache(loader=loader)
+        with pytest.raises(ImportError):
+            cache.lookup('hk_spot', '00700')
@@ -0,0 +1,162 @@
+"""测试净值回放"""
+from datetime import date
+from unittest.mock import Mock
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.fx_history import FxHistory
+from src.models import AssetType, CashFlow, NAVHistory, Transaction, TransactionType
+from src.nav_replay import NavReplay
+from src.timeseries_store import TimeSeriesStore
+
+ACCOUNT = '测试账户'
+
+
+def _deposit(d, amount, currency='CNY', cny_amount=None):
+    return CashFlow(flow_date=d, account=ACCOUNT, amount=amount, currency=currency,
+                    cny_amount=cny_amount if cny_amount is not None else amount, flow_type='DEPOSIT')
+
+
+def _buy(d, asset_id, quantity, price, currency='CNY', asset_type=AssetType.A_STOCK):
+    return Transaction(tx_date=d, tx_type=TransactionType.BUY, asset_id=asset_id, asset_type=asset_type,
+                       account=ACCOUNT, quantity=quantity, price=price, currency=currency)
+
+
+def _storage(transactions, cash_flows, navs=()):
+    storage = Mock()
+    storage.get_transactions.return_value = list(transactions)
+    storage.get_cash_flows.return_value = list(cash_flows)
+    storage.get_nav_history.return_value = list(navs)
+    return storage
+
+
+@pytest.fixture
+def closes(tmp_path):
+    store = TimeSeriesStore(tmp_path / 'ts')
+    # 2025-01-06 周一
+    store.append_prices('600519', [(date(2025, 1, 6), 1000.0, 1000.0), (date(2025, 1, 7), 1100.0, 1100.0),
+                                   (date(2025, 1, 8), 1050.0, 1050.0)])
+    return store
+
+
+class TestNavReplay:
+    """测试持仓重建与净值链"""
+
+    def test_replay_matches_record_nav_share_logic(self, closes, tmp_path):
+        storage = _storage(
+            [_buy(date(2025, 1, 6), '600519', 100, 1000.0)],
+            [_deposit(date(2025, 1, 6), 100000), _deposit(date(2025, 1, 8), 50000)])
+        replay = NavReplay(storage, timeseries=closes, fx=FxHistory(tmp_path / 'fx.db'))
+
+        navs = replay.replay(ACCOUNT, end=date(2025, 1, 9))
+
+        assert [n.date for n in navs] == [date(2025, 1, d) for d in (6, 7, 8, 9)]
+        assert navs[0].nav == 1.0 and navs[0].shares == 100000
+        assert navs[1].nav == pytest.approx(1.1)
+        # 入金按上一日净值折算份额：100000 + 50000 / 1.1
+        assert navs[2].shares == pytest.approx(100000 + 50000 / 1.1, abs=0.01)
+        assert navs[2].nav == pytest.approx(155000 / (100000 + 50000 / 1.1), abs=1e-6)
+        assert navs[2].cash_flow == 50000 and navs[2].pnl == -5000
+        assert navs[2].cash_value == 50000 and navs[2].stock_value == 105000
+        # 无新收盘价的日期沿用最近收盘价
+        assert navs[3].total_value == 155000 and navs[3].pnl == 0
+        # 没有上月末净值时涨幅为 0（同 record_nav）
+        assert navs[3].mtd_nav_change == 0.0
+
+    def test_recorded_days_are_anchors(self, closes, tmp_path):
+        recorded = [
+            NAVHistory(date=date(2024, 12, 31), account=ACCOUNT, total_value=0.01, nav=1.0, shares=0.01),
+            NAVHistory(date=date(2025, 1, 7), account=ACCOUNT, total_value=110000, nav=1.2, shares=91666.67),
+        ]
+        storage = _storage(
+            [_buy(date(2025, 1, 6), '600519', 100, 1000.0)],
+            [_deposit(date(2025, 1, 6), 100000)], navs=recorded)
+        replay = NavReplay(storage, timeseries=closes, fx=FxHistory(tmp_path / 'fx.db'))
+
+        navs = replay.replay(ACCOUNT, start=date(2025, 1, 7), end=date(2025, 1, 8))
+
+        assert [n.date for n in navs] == [date(2025, 1, 8)]
+        assert navs[0].nav == pytest.approx(1.2 * 105000 / 110000, abs=1e-6)
+        # 月初/年初至今以上年末记录为基准
+        assert navs[0].mtd_nav_change == pytest.approx(navs[0].nav - 1.0, abs=1e-6)
+        assert navs[0].ytd_pnl == pytest.approx(105000 - 0.01 - 100000, abs=0.01)
+
+    def test_unpriced_days_skipped(self, tmp_path):
+        """外币资产缺汇率的日期跳过"""
+        fx = FxHistory(tmp_path / 'fx.db')
+        fx.put('USDCNY', [(date(2025, 1, 8), 7.3)])
+        store = TimeSeriesStore(tmp_path / 'ts')
+        store.append_prices('AAPL', [(date(2025, 1, d), 200.0, None) for d in (6, 7, 8)])
+        storage = _storage(
+            [_buy(date(2025, 1, 6), 'AAPL', 10, 200.0, currency='USD', asset_type=AssetType.US_STOCK)],
+            [_deposit(date(2025, 1, 6), 20000)])
+        replay = NavReplay(storage, timeseries=store, fx=fx)
+
+        navs = replay.replay(ACCOUNT, end=date(2025, 1, 8))
+
+        assert [n.date for n in navs] == [date(2025, 1, 8)]
+        assert navs[0].us_stock_value == 14600.0
+        assert navs[0].total_value == 34600.0
+
+    def test_stale_close_not_reused(self, tmp_path):
+        """收盘价超过 MAX_CLOSE_GAP_DAYS 的日期跳过，不用成交价或旧收盘价代替"""
+        store = TimeSeriesStore(tmp_path / 'ts')
+        store.append_prices('600519', [(date(2025, 1, 6), 1000.0, 1000.0), (date(2025, 1, 20), 1200.0, 1200.0)])
+        storage = _storage([_buy(date(2025, 1, 6), '600519', 100, 1000.0)], [_deposit(date(2025, 1, 6), 100000)])
+        replay = NavReplay(storage, timeseries=store, fx=FxHistory(tmp_path / 'fx.db'))
+
+        navs = replay.replay(ACCOUNT, end=date(2025, 1, 20))
+
+        assert [n.date for n in navs] == [date(2025, 1, d) for d in (6, 7, 8, 9, 10, 20)]
+        assert navs[-1].nav == pytest.approx(1.2)
+
+    def test_missing_closes_fail_loudly(self, tmp_path):
+        storage = _storage([_buy(date(2025, 1, 6), '600519', 100, 1000.0)], [_deposit(date(2025, 1, 6), 100000)])
+        replay = NavReplay(storage, timeseries=TimeSeriesStore(tmp_path / 'ts'), fx=FxHistory(tmp_path / 'fx.db'))
+        with pytest.raises(RuntimeError, match='收盘价'):
+            replay.replay(ACCOUNT, end=date(2025, 1, 8))
+
+        storage.timeseries = None
+        with pytest.raises(RuntimeError, match='PORTFOLIO_TIMESERIES'):
+            NavReplay(storage)
+
+    def test_holdings_as_of(self, tmp_path):
+        sell = Transaction(tx_date=date(2025, 1, 8), tx_type=TransactionType.SELL, asset_id='600519',
+                           account=ACCOUNT, quantity=-40, price=1050.0, currency='CNY', fee=5)
+        storage = _storage([_buy(date(2025, 1, 6), '600519', 100, 1000.0), sell],
+                           [_deposit(date(2025, 1, 6), 100000)])
+        replay = NavReplay(storage, timeseries=TimeSeriesStore(tmp_path / 'ts'), fx=FxHistory(tmp_path / 'fx.db'))
+
+        assert replay.holdings_as_of(ACCOUNT, date(2025, 1, 7)) == {'600519': 100}
+        assert replay.holdings_as_of(ACCOUNT, date(2025, 1, 8)) == {'600519': 60, 'CNY-CASH': 41995}
+
+    def test_backfill_writes_missing_days_once(self, closes, tmp_path):
+        recorded = NAVHistory(date=date(2025, 1, 6), account=ACCOUNT, total_value=100000, nav=1.0, shares=100000)
+        storage = _storage(
+            [_buy(date(2025, 1, 6), '600519', 100, 1000.0)],
+            [_deposit(date(2025, 1, 6), 100000)], navs=[recorded])
+        replay = NavReplay(storage, timeseries=closes, fx=FxHistory(tmp_path / 'fx.db'))
+
+        navs = replay.backfill(ACCOUNT, end=date(2025, 1, 8))
+
+        storage.save_navs.assert_called_once_with(navs)
+        assert [n.date for n in navs] == [date(2025, 1, 7), date(2025, 1, 8)]
+        assert replay.backfill(ACCOUNT, end=date(2025, 1, 8), dry_run=True) == navs
+        storage.save_navs.assert_called_once()
+
+    def test_backfill_imports_closes_first(self, tmp_path):
+        store = TimeSeriesStore(tmp_path / 'ts')
+        fetcher = Mock()
+        fetcher.backfill_closes.side_effect = lambda codes, start, end, timeseries, name_map: {
+            code: timeseries.append_prices(code, [(date(2025, 1, 6), 1000.0, 1000.0), (date(2025, 1, 7), 1100.0, 1100.0)])
+            for code in codes}
+        storage = _storage([_buy(date(2025, 1, 6), '600519', 100, 1000.0)], [_deposit(date(2025, 1, 6), 100000)])
+        replay = NavReplay(storage, timeseries=store, fx=FxHistory(tmp_path / 'fx.db'), price_fetcher=fetcher)
+
+        navs = replay.backfill(ACCOUNT, end=date(2025, 1, 7), dry_run=True)
+
+        args = fetcher.backfill_closes.call_args
+        assert args[0][0] == ['600519'] and args[0][2] == date(2025, 1, 7)
+        assert [n.nav for n in navs] == [1.0, pytest.approx(1.1)]
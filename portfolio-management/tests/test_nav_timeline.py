@@ -0,0 +1,55 @@
+"""测试净值时间线"""
+from datetime import date
+
+from src.models import NAVHistory
+from src.nav_timeline import NavTimeline
+
+
+def _nav(d, nav=1.0):
+    return NAVHistory(date=d, account='lx', total_value=100000 * nav, nav=nav)
+
+
+class TestNavTimeline:
+    """测试二分查询与期间边界"""
+
+    def setup_method(self):
+        # 故意乱序传入，验证构建时排序
+        self.timeline = NavTimeline([
+            _nav(date(2025, 1, 15), 1.02),
+            _nav(date(2024, 12, 31), 1.00),
+            _nav(date(2025, 3, 14), 1.05),
+            _nav(date(2025, 1, 31), 1.03),
+            _nav(date(2025, 3, 1), 1.04),
+        ])
+
+    def test_sorted(self):
+        assert [n.date for n in self.timeline] == sorted(n.date for n in self.timeline)
+        assert self.timeline.earliest.date == date(2024, 12, 31)
+        assert self.timeline.latest.date == date(2025, 3, 14)
+        assert len(self.timeline) == 5
+
+    def test_as_of_and_before(self):
+        assert self.timeline.as_of(date(2025, 1, 31)).date == date(2025, 1, 31)
+        assert self.timeline.before(date(2025, 1, 31)).date == date(2025, 1, 15)
+        assert self.timeline.as_of(date(2025, 2, 20)).date == date(2025, 1, 31)
+        assert self.timeline.as_of(date(2024, 12, 30)) is None
+        assert self.timeline.before(date(2024, 12, 31)) is None
+
+    def test_between(self):
+        navs = self.timeline.between(date(2025, 1, 1), date(2025, 3, 1))
+        assert [n.date for n in navs] == [date(2025, 1, 15), date(2025, 1, 31), date(2025, 3, 1)]
+
+    def test_period_boundaries(self):
+        assert self.timeline.month_start(2025, 1).date == date(2025, 1, 15)
+        assert self.timeline.month_end(2025, 1).date == date(2025, 1, 31)
+        assert self.timeline.month_end(2025, 2) is None
+        assert self.timeline.prev_month_end(2025, 1).date == date(2024, 12, 31)
+        assert self.timeline.prev_month_end(2025, 3) is None
+        assert self.timeline.year_start(2025).date == date(2025, 1, 15)
+        assert self.timeline.year_end('2024').date == date(2024, 12, 31)
+        assert self.timeline.year_end(2023) is None
+
+    def test_of_reuses_instance(self):
+        assert NavTimeline.of(self.timeline) is self.timeline
+        assert len(NavTimeline.of(None)) == 0
+        assert NavTimeline.of([]).latest is None
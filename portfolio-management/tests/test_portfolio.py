@@ -3,6 +3,7 @@ import pytest
 from datetime import date, datetime, timedelta
 from unittest.mock import Mock, patch, MagicMock
 
+from src.cash_flow_ledger import CashFlowLedger
 from src.portfolio import PortfolioManager
 from src.models import (
     Holding, Transaction, CashFlow, NAVHistory, PortfolioValuation,
@@ -413,6 +414,100 @@ class TestPortfolioManagerDepositWithdraw:
         assert call_args[0][0].currency == 'USD'
 
 
+class TestPortfolioManagerImportTrades:
+    """测试批量导入成交"""
+
+    def setup_method(self):
+        from src.feishu_storage import FeishuStorage
+        self.mock_client = Mock()
+        holdings = [
+            {'record_id': 'rec_cash', 'fields': {'asset_id': 'CNY-CASH', 'asset_name': '人民币现金',
+                                                 'account': 'lx', 'quantity': 10000, 'currency': 'CNY'}},
+            {'record_id': 'rec_pa', 'fields': {'asset_id': '000001', 'asset_name': '平安银行',
+                                               'account': 'lx', 'market': '平安证券',
+                                               'quantity': 300, 'currency': 'CNY'}},
+        ]
+        existing_tx = [{'record_id': 'tx_old', 'fields': {'request_id': 'dup-1'}}]
+        self.mock_client.list_records.side_effect = \
+            lambda table, **kwargs: existing_tx if table == 'transactions' else holdings
+        self.mock_client.batch_create_records.side_effect = \
+            lambda table, records: [{'record_id': f'{table}_{i}'} for i in range(len(records))]
+        self.storage = FeishuStorage(client=self.mock_client)
+        self.manager = PortfolioManager(storage=self.storage, price_fetcher=Mock())
+
+    def _fill(self, tx_type, asset_id, quantity, price, **kwargs):
+        fill = {'tx_date': date(2025, 3, 3), 'tx_type': tx_type, 'asset_id': asset_id,
+                'asset_type': AssetType.A_STOCK, 'quantity': quantity, 'price': price,
+                'currency': 'CNY', 'market': '平安证券'}
+        fill.update(kwargs)
+        return fill
+
+    def test_import_batches_writes_and_nets_cash(self):
+        """测试批量导入：一次防重查询，交易/持仓/现金全部走批量接口"""
+        fills = [
+            self._fill(TransactionType.BUY, '600000', 200, 10, asset_name='浦发银行', fee=5),
+            self._fill(TransactionType.SELL, '000001', 100, 12, market=None),
+            self._fill(TransactionType.BUY, '600000', 100, 10, request_id='dup-1'),
+        ]
+
+        result = self.manager.import_trades('lx', fills, auto_cash=True)
+
+        assert len(result['transactions']) == 2
+        assert len(result['skipped']) == 1
+        assert result['net_cash'] == pytest.approx(-2005 + 1200)
+
+        # 2 次查询：交易防重键 + 账户持仓
+        assert self.mock_client.list_records.call_count == 2
+        self.mock_client.create_record.assert_not_called()
+        self.mock_client.update_record.assert_not_called()
+
+        tx_records = self.mock_client.batch_create_records.call_args_list[0][0][1]
+        assert len(tx_records) == 2
+        assert tx_records[1]['fields']['market'] == '平安证券'
+
+        updates = {u['record_id']: u['fields']['quantity']
+                   for u in self.mock_client.batch_update_records.call_args[0][1]}
+        assert updates == {'rec_pa': 200, 'rec_cash': pytest.approx(10000 - 805)}
+
+        created = self.mock_client.batch_create_records.call_args_list[1][0][1]
+        assert created[0]['fields']['asset_id'] == '600000'
+        assert created[0]['fields']['quantity'] == 200
+
+    def test_oversell_rejects_whole_batch(self):
+        """测试卖出超过持仓时整批不写入"""
+        fills = [
+            self._fill(TransactionType.BUY, '600000', 200, 10),
+            self._fill(TransactionType.SELL, '000001', 500, 12),
+        ]
+
+        with pytest.raises(ValueError, match='超过持仓'):
+            self.manager.import_trades('lx', fills)
+        self.mock_client.batch_create_records.assert_not_called()
+        self.mock_client.batch_update_records.assert_not_called()
+
+    def test_insufficient_cash_rejects_whole_batch(self):
+        """测试现金不足时整批不写入"""
+        fills = [self._fill(TransactionType.BUY, '600000', 2000, 10)]
+
+        with pytest.raises(ValueError, match='现金不足'):
+            self.manager.import_trades('lx', fills, auto_cash=True)
+        self.mock_client.batch_create_records.assert_not_called()
+
+    def test_buy_then_sell_in_same_batch(self):
+        """测试批次内先买后卖同一新资产"""
+        fills = [
+            self._fill(TransactionType.BUY, '600000', 200, 10),
+            self._fill(TransactionType.SELL, '600000', 200, 11, market=None, tx_date=date(2025, 3, 4)),
+        ]
+
+        result = self.manager.import_trades('lx', fills)
+
+        assert len(result['transactions']) == 2
+        assert result['transactions'][1].market == '平安证券'
+        # 净持仓为 0，不创建新持仓
+        assert result['holdings']['created'] == 0
+
+
 class TestPortfolioManagerCashOperations:
     """测试现金操作"""
 
@@ -563,11 +658,14 @@ class TestPortfolioManagerValuation:
                 currency='CNY'
             )
         ]
-        self.mock_storage.get_price.return_value = Mock(
-            cny_price=10.5,
-            price=10.5,
-            currency='CNY'
-        )
+        # fetch_batch 通过 get_prices 一次批量读取缓存
+        self.mock_storage.get_prices.return_value = {
+            '000001': {
+                'asset_id': '000001', 'asset_name': '平安银行', 'price': 10.5,
+                'cny_price': 10.5, 'currency': 'CNY', 'data_source': 'tencent',
+                'expires_at': '2099-01-01 00:00:00', 'expired': False,
+            }
+        }
         self.mock_storage.get_total_shares.return_value = 1000.0
 
         manager = PortfolioManager(storage=self.mock_storage, price_fetcher=None)
@@ -784,23 +882,15 @@ class TestPortfolioManagerNAVRecord:
             shares=1000000.0
         )
         self.mock_storage.get_latest_nav_before.return_value = existing_nav
-        # 模拟当日入金5万 (side_effect 按调用顺序返回)
-        # 调用顺序: daily, yearly(2025), yearly(2024), yearly(2025), cumulative(2024), yearly(2024), yearly(2025)
+        # 模拟当日入金5万（出入金只加载一次，各口径从台账汇总）
         deposit = CashFlow(flow_date=date(2025, 3, 14), account='测试账户', amount=50000, currency='CNY', cny_amount=50000, flow_type='DEPOSIT')
-        self.mock_storage.get_cash_flows.side_effect = [
-            [deposit],   # daily
-            [deposit],   # yearly 2025
-            [],          # yearly 2024
-            [deposit],   # yearly 2025 again
-            [deposit],   # cumulative from 2024
-            [],          # yearly 2024 (again for appreciation calc)
-            [deposit]    # yearly 2025 (again for appreciation calc)
-        ]
+        self.mock_storage.get_cash_flows.return_value = [deposit]
         self.mock_storage.save_nav.return_value = None
         self.mock_storage.get_nav_history.return_value = [existing_nav]
 
         result = self.manager.record_nav('测试账户', valuation, nav_date=date(2025, 3, 14))
 
+        self.mock_storage.get_cash_flows.assert_called_once_with('测试账户')
         # 份额变动 = 50000 / 1.0 = 50000
         assert result.shares == 1050000.0
         # 净值 = 1050000 / 1050000 = 1.0
@@ -828,7 +918,7 @@ class TestPortfolioManagerNAVRecord:
             CashFlow(flow_date=date(2025, 3, 14), account='测试账户', amount=-10000, currency='CNY', cny_amount=-10000, flow_type='WITHDRAW')
         ]
 
-        result = self.manager._get_daily_cash_flow('测试账户', date(2025, 3, 14))
+        result = CashFlowLedger.load(self.mock_storage, '测试账户').day(date(2025, 3, 14))
 
         assert result == 40000.0  # 50000 - 10000
 
@@ -839,7 +929,7 @@ class TestPortfolioManagerNAVRecord:
             CashFlow(flow_date=date(2025, 2, 15), account='测试账户', amount=50000, currency='CNY', cny_amount=50000, flow_type='DEPOSIT')
         ]
 
-        result = self.manager._get_yearly_cash_flow('测试账户', '2025')
+        result = CashFlowLedger.load(self.mock_storage, '测试账户').year('2025')
 
         assert result == 150000.0
 
@@ -1,6 +1,7 @@
 """测试价格获取模块"""
 import pytest
-from datetime import datetime, timedelta
+import math
+from datetime import date, datetime, timedelta
 from unittest.mock import Mock, patch, MagicMock
 import pytz
 
@@ -302,3 +303,190 @@ class TestPriceFetcher:
         assert result is not None
         assert result["price"] == 10.5
         assert result["code"] == "000001"
+
+    def test_fetch_batch_reads_and_persists_once(self):
+        """测试批量获取：缓存一次批量读取，新价格一次批量写入"""
+        mock_storage = Mock()
+        mock_storage.get_prices.return_value = {
+            '000001': {'asset_id': '000001', 'asset_name': '平安银行', 'price': 10.5,
+                       'cny_price': 10.5, 'currency': 'CNY', 'data_source': 'tencent',
+                       'expires_at': '2099-01-01 00:00:00', 'expired': False},
+        }
+        fetcher = PriceFetcher(storage=mock_storage)
+
+        def fake_realtime(code, name):
+            return {'code': code, 'name': code, 'price': 20.0, 'cny_price': 20.0,
+                    'currency': 'CNY', 'source': 'tencent'}
+
+        with patch.object(fetcher.providers, 'fetch_many', return_value={}), \
+                patch.object(fetcher, '_fetch_realtime', side_effect=fake_realtime) as realtime:
+            results = fetcher.fetch_batch(['000001', '600519', '600036', 'CASH'])
+
+        mock_storage.get_prices.assert_called_once_with(['000001', '600519', '600036', 'CASH'],
+                                                        include_expired=True)
+        assert results['000001']['price'] == 10.5
+        assert results['600519']['price'] == 20.0
+        assert realtime.call_count == 2
+        mock_storage.get_price.assert_not_called()
+        mock_storage.save_price.assert_not_called()
+        mock_storage.save_prices.assert_called_once()
+        saved = mock_storage.save_prices.call_args[0][0]
+        assert sorted(p.asset_id for p in saved) == ['600036', '600519']
+
+    def test_fetch_batch_stale_while_revalidate(self):
+        """测试过期不久的报价先行返回并后台刷新，超期过久的同步获取"""
+        now = datetime.now()
+
+        def row(code, expired_minutes):
+            return {'asset_id': code, 'asset_name': code, 'price': 10.0, 'cny_price': 10.0,
+                    'currency': 'CNY', 'data_source': 'tencent',
+                    'expires_at': (now - timedelta(minutes=expired_minutes)).strftime('%Y-%m-%d %H:%M:%S'),
+                    'updated_at': (now - timedelta(minutes=expired_minutes + 30)).strftime('%Y-%m-%d %H:%M:%S'),
+                    'expired': True}
+
+        mock_storage = Mock()
+        mock_storage.get_prices.return_value = {'600519': row('600519', 5), '000001': row('000001', 20)}
+        fetcher = PriceFetcher(storage=mock_storage)
+
+        def fake_realtime(code, name):
+            return {'code': code, 'name': code, 'price': 20.0, 'cny_price': 20.0,
+                    'currency': 'CNY', 'source': 'tencent'}
+
+        with patch('src.price_fetcher._config.get_price_max_staleness', return_value={'cn': 600}), \
+                patch.object(fetcher.providers, 'fetch_many', return_value={}), \
+                patch.object(fetcher, '_fetch_realtime', side_effect=fake_realtime) as realtime:
+            results = fetcher.fetch_batch(['600519', '000001'], stale_while_revalidate=True)
+            assert fetcher.wait_for_refresh(timeout=5)
+
+        assert results['600519']['price'] == 10.0
+        assert results['600519']['stale'] is True
+        assert 2090 <= results['600519']['age'] <= 2110
+        assert results['000001']['price'] == 20.0
+        assert 'stale' not in results['000001']
+        assert realtime.call_count == 2
+        saved = [p.asset_id for call in mock_storage.save_prices.call_args_list for p in call[0][0]]
+        assert sorted(saved) == ['000001', '600519']
+
+    def test_pending_refresh_joined_at_exit(self):
+        """进程退出钩子等待后台刷新写入缓存（受 REFRESH_EXIT_TIMEOUT 限制）"""
+        import time as _time
+        from src import price_fetcher as pf
+
+        mock_storage = Mock()
+        fetcher = PriceFetcher(storage=mock_storage)
+
+        def slow(codes, name_map):
+            _time.sleep(0.2)
+            return {'600519': {'code': '600519', 'price': 20.0, 'cny_price': 20.0,
+                               'currency': 'CNY', 'source': 'tencent'}}
+
+        with patch.object(fetcher, '_fetch_concurrent', side_effect=slow):
+            fetcher._revalidate_async(['600519'], {})
+            assert fetcher in pf._refreshing_fetchers
+            pf._wait_for_pending_refreshes()
+
+        mock_storage.save_prices.assert_called_once()
+
+    def test_fetch_tencent_batch_single_request(self):
+        """测试 A股/港股/ETF 合并为一次腾讯请求，场外基金和美股不参与"""
+        def line(query_code, name, price):
+            fields = [''] * 50
+            fields[1], fields[3], fields[4], fields[5] = name, str(price), str(price - 1), str(price)
+            fields[30], fields[31], fields[32] = '20250314150000', '1.0', '1.0'
+            fields[33], fields[34], fields[36] = str(price), str(price), '100'
+            return f'v_{query_code}="{"~".join(fields)}";'
+
+        response = Mock()
+        response.text = '\n'.join([
+            line('sh600519', '贵州茅台', 1500.0),
+            line('hk00700', '腾讯控股', 400.0),
+            line('sh510300', '沪深300ETF', 4.0),
+            'v_pv_none_match="1";',
+        ])
+        fetcher = PriceFetcher()
+        fetcher.session = Mock()
+        fetcher.session.get.return_value = response
+
+        with patch.object(fetcher, '_fetch_exchange_rates', return_value={'HKDCNY': 0.9}):
+            results = fetcher._fetch_tencent_batch(['600519', '00700', '510300', '000001', 'AAPL'],
+                                                   {'000001': '华夏成长混合'})
+
+        fetcher.session.get.assert_called_once()
+        url = fetcher.session.get.call_args[0][0]
+        assert url == 'http://qt.gtimg.cn/q=sh600519,hk00700,sh510300'
+        assert results['600519']['price'] == 1500.0
+        assert results['600519']['source'] == 'tencent'
+        assert results['00700']['cny_price'] == 360.0
+        assert results['00700']['currency'] == 'HKD'
+        assert results['510300']['source'] == 'tencent_etf'
+        assert '000001' not in results and 'AAPL' not in results
+
+    def test_fetch_concurrent_falls_back_for_missing(self):
+        """测试批量未返回的代码逐个回退获取"""
+        fetcher = PriceFetcher()
+        batch = {'600519': {'code': '600519', 'price': 1500.0}}
+        with patch.object(fetcher.providers, 'fetch_many', return_value=batch), \
+                patch.object(fetcher, '_fetch_realtime',
+                             side_effect=lambda code, name: {'code': code, 'price': 1.0}) as realtime:
+            results = fetcher._fetch_concurrent(['600519', '000001'], {})
+
+        assert results['600519']['price'] == 1500.0
+        assert results['000001']['price'] == 1.0
+        realtime.assert_called_once_with('000001', '')
+
+    def test_max_staleness_overrides(self):
+        assert MarketTimeUtil.get_max_staleness('cn', {'cn': 120}) == 120
+        assert MarketTimeUtil.get_max_staleness('fund') == MarketTimeUtil.MAX_STALENESS_FUND
+
+    def test_quote_close_date(self):
+        """报价按自身交易日标注收盘日期：盘中不标注，基金按净值日期"""
+        assert PriceFetcher._quote_trade_date({'time': '20250314150003'}) == date(2025, 3, 14)
+        assert PriceFetcher._quote_trade_date({'time': '2025/03/14 16:08:00'}) == date(2025, 3, 14)
+        assert PriceFetcher._quote_trade_date({'time': '16:08:00'}) is None
+        assert PriceFetcher._quote_trade_date({'nav_date': '2025-03-13'}) == date(2025, 3, 13)
+
+        sh = MarketTimeUtil.TZ_SHANGHAI
+        # 北京时间周六上午：美股周五收盘已结束；A股当日未开盘
+        saturday = sh.localize(datetime(2025, 3, 15, 10, 0))
+        assert MarketTimeUtil.is_session_closed('us', date(2025, 3, 14), saturday)
+        assert not MarketTimeUtil.is_session_closed('cn', date(2025, 3, 14), sh.localize(datetime(2025, 3, 14, 14, 0)))
+        assert MarketTimeUtil.is_session_closed('cn', date(2025, 3, 14), sh.localize(datetime(2025, 3, 14, 15, 5)))
+        # 北京时间白天取到的美股报价仍属于纽约上一交易日，且当日尚未收盘
+        assert not MarketTimeUtil.is_session_closed('us', date(2025, 3, 14), sh.localize(datetime(2025, 3, 14, 23, 0)))
+
+        fetcher = PriceFetcher()
+        quote = {'price': 1.2, 'nav_date': '2025-03-13', 'source': 'eastmoney'}
+        assert fetcher._build_price_cache('110022', quote).close_date == date(2025, 3, 13)
+        with patch.object(MarketTimeUtil, 'is_session_closed', return_value=False):
+            assert fetcher._build_price_cache('600519', {'price': 1500.0, 'time': '20250314140000'}).close_date is None
+
+    def test_parse_close_history(self):
+        """测试历史日线解析（腾讯日K线取收盘价，Yahoo 按交易所当地日期）"""
+        kline = {'data': {'sh600519': {'day': [['2025-01-02', '1524.00', '1488.00', '1524.49', '1480.00', '5'],
+                                               ['bad']]}}}
+        assert PriceFetcher._parse_tencent_kline(kline, 'sh600519') == [(date(2025, 1, 2), 1488.0)]
+
+        # 2025-01-02 09:30 America/New_York = 14:30 UTC
+        chart = {'chart': {'result': [{'meta': {'gmtoffset': -18000}, 'timestamp': [1735828200, 1735914600],
+                                       'indicators': {'quote': [{'close': [243.85, None]}]}}]}}
+        assert PriceFetcher._parse_yahoo_history(chart) == [(date(2025, 1, 2), 243.85)]
+
+    def test_backfill_closes_writes_timeseries(self, tmp_path):
+        pytest.importorskip("numpy")
+        from src.timeseries_store import TimeSeriesStore
+
+        store = TimeSeriesStore(tmp_path / 'ts')
+        fetcher = PriceFetcher()
+        history = {'600519': [(date(2024, 12, 31), 1500.0), (date(2025, 1, 2), 1488.0)],
+                   'AAPL': [(date(2025, 1, 2), 243.85)]}
+        with patch.object(fetcher, '_fetch_close_history', side_effect=lambda code, name, s, e: history[code]):
+            written = fetcher.backfill_closes(['600519', 'AAPL'], date(2025, 1, 1), date(2025, 1, 3), timeseries=store)
+
+        assert written == {'600519': 1, 'AAPL': 1}
+        closes = store.prices('600519')
+        assert closes['close'].tolist() == [1488.0] and closes['cny_close'].tolist() == [1488.0]
+        # 外币资产不写人民币收盘价（估值时按当日汇率折算）
+        assert math.isnan(store.prices('AAPL')['cny_close'][0])
+
+        with pytest.raises(RuntimeError):
+            PriceFetcher().backfill_closes(['600519'], date(2025, 1, 1))
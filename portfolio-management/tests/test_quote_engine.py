@@ -0,0 +1,149 @@
+"""测试 asyncio 行情引擎"""
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+from src.price_fetcher import PriceFetcher
+from src.quote_engine import AsyncQuoteEngine
+
+RATES = {'USDCNY': 7.2, 'HKDCNY': 0.9}
+
+
+def _tencent_line(query_code, name, price):
+    fields = [''] * 50
+    fields[1], fields[3], fields[4], fields[5] = name, str(price), str(price - 1), str(price)
+    fields[30], fields[31], fields[32] = '20250314150000', '1.0', '1.0'
+    fields[33], fields[34], fields[36] = str(price), str(price), '100'
+    return f'v_{query_code}="{"~".join(fields)}";'
+
+
+def _yahoo_chart(price):
+    return {'chart': {'error': None, 'result': [{
+        'meta': {'shortName': 'Apple', 'previousClose': price - 1, 'currency': 'USD'},
+        'timestamp': [1],
+        'indicators': {'quote': [{'close': [price], 'open': [price], 'high': [price],
+                                  'low': [price], 'volume': [100]}]},
+    }]}}
+
+
+class _FakeResponse:
+    def __init__(self, body: str, status=200, delay=0, encoding='utf-8'):
+        self.body = body.encode(encoding)
+        self.status = status
+        self.delay = delay
+
+    async def __aenter__(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def read(self):
+        return self.body
+
+
+class _FakeSession:
+    """按 URL 返回预设响应，记录请求"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+        self.closed = False
+
+    def get(self, url, params=None, headers=None):
+        self.calls.append(url)
+        for prefix, response in self.routes.items():
+            if url.startswith(prefix):
+                return response
+        return _FakeResponse('', status=404)
+
+    async def close(self):
+        self.closed = True
+
+
+def _fetcher():
+    fetcher = PriceFetcher()
+    fetcher._fetch_exchange_rates = Mock(return_value=RATES)
+    return fetcher
+
+
+class TestAsyncQuoteEngine:
+    """测试单事件循环批量查询"""
+
+    def test_fetch_many_mixed_markets(self):
+        """A股/港股一次腾讯请求，美股走 Yahoo 协程，场外基金走线程池"""
+        session = _FakeSession({
+            'http://qt.gtimg.cn/q=': _FakeResponse('\n'.join([
+                _tencent_line('sh600519', '贵州茅台', 1500.0),
+                _tencent_line('hk00700', '腾讯控股', 400.0),
+            ]), encoding='gb2312'),
+            'https://query1.finance.yahoo.com': _FakeResponse(json.dumps(_yahoo_chart(200.0))),
+        })
+        fetcher = _fetcher()
+        fetcher._fetch_fresh = Mock(return_value={'code': '000001', 'price': 1.5, 'source': 'akshare_info'})
+
+        async def run():
+            async with AsyncQuoteEngine(fetcher) as engine:
+                engine._get_session = AsyncMock(return_value=session)
+                return await engine.fetch_many(['600519', '00700', 'AAPL', '000001'],
+                                               {'000001': '华夏成长混合'})
+
+        results = asyncio.run(run())
+
+        assert results['600519']['price'] == 1500.0
+        assert results['00700']['cny_price'] == 360.0
+        assert results['AAPL']['source'] == 'yahoo_api'
+        assert results['AAPL']['cny_price'] == 1440.0
+        assert results['000001']['price'] == 1.5
+        tencent_calls = [u for u in session.calls if u.startswith('http://qt.gtimg.cn')]
+        assert tencent_calls == ['http://qt.gtimg.cn/q=sh600519,hk00700']
+        fetcher._fetch_fresh.assert_called_once_with('000001', '华夏成长混合')
+        fetcher._fetch_exchange_rates.assert_called_once()
+
+    def test_deadline_cancels_in_flight(self):
+        """超过截止时间取消在途请求，已完成的结果照常返回"""
+        session = _FakeSession({
+            'http://qt.gtimg.cn/q=': _FakeResponse(_tencent_line('sh600519', '贵州茅台', 1500.0)),
+            'https://query1.finance.yahoo.com': _FakeResponse(json.dumps(_yahoo_chart(200.0)), delay=5),
+        })
+        fetcher = _fetcher()
+
+        async def run():
+            async with AsyncQuoteEngine(fetcher) as engine:
+                engine._get_session = AsyncMock(return_value=session)
+                return await engine.fetch_many(['600519', 'AAPL'], deadline=0.3)
+
+        start = time.monotonic()
+        results = asyncio.run(run())
+
+        assert time.monotonic() - start < 2
+        assert set(results) == {'600519'}
+        # 被取消的请求不计入健康统计
+        assert fetcher.provider_health()['yahoo_api']['calls'] == 0
+
+    def test_fetch_batch_sync_wrapper(self):
+        """fetch_batch(async_io=True) 走行情引擎，缓存读写与同步路径一致"""
+        storage = Mock()
+        storage.get_prices.return_value = {
+            '600036': {'asset_id': '600036', 'asset_name': '招商银行', 'price': 40.0,
+                       'cny_price': 40.0, 'currency': 'CNY', 'data_source': 'tencent',
+                       'expires_at': '2000-01-01 00:00:00', 'expired': True},
+        }
+        fetcher = PriceFetcher(storage=storage)
+        fetcher._fetch_exchange_rates = Mock(return_value=RATES)
+        fetcher._fetch_fresh = Mock(return_value=None)
+        session = _FakeSession({
+            'http://qt.gtimg.cn/q=': _FakeResponse(_tencent_line('sh600519', '贵州茅台', 1500.0)),
+        })
+
+        with patch.object(AsyncQuoteEngine, '_get_session', AsyncMock(return_value=session)):
+            results = fetcher.fetch_batch(['600519', '600036'], async_io=True)
+
+        assert results['600519']['price'] == 1500.0
+        # 腾讯未返回的代码经同步路径也失败后，使用过期缓存
+        assert results['600036']['price'] == 40.0
+        saved = storage.save_prices.call_args[0][0]
+        assert [p.asset_id for p in saved] == ['600519']
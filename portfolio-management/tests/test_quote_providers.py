@@ -0,0 +1,109 @@
+"""测试行情源注册表"""
+from unittest.mock import Mock, patch
+
+from src import quote_providers
+from src.quote_providers import ProviderHealth, ProviderRegistry, QuoteProvider, get_health
+
+
+def _failing(code):
+    raise ConnectionError('rate limited')
+
+
+class TestProviderRegistry:
+    """测试路由、熔断与批量回退"""
+
+    def test_fallback_order_and_health(self):
+        primary = Mock(return_value=None)
+        backup = Mock(return_value={'code': 'AAPL', 'price': 1.0})
+        registry = ProviderRegistry()
+        registry.register(QuoteProvider('a', {'us': primary}, expected_latency=0.1))
+        registry.register(QuoteProvider('b', {'us': backup}, expected_latency=1.0))
+
+        assert registry.fetch('us', 'AAPL')['price'] == 1.0
+        primary.assert_called_once_with('AAPL')
+        backup.assert_called_once_with('AAPL')
+        # 返回 None 表示无数据，不计入错误
+        assert registry.health()['a']['error_rate'] == 0.0
+        assert registry.fetch('hk', '00700') is None
+
+    def test_routes_to_fastest_healthy_provider(self):
+        registry = ProviderRegistry()
+        slow = registry.register(QuoteProvider('slow', {'cn': Mock()}, expected_latency=0.1))
+        fast = registry.register(QuoteProvider('fast', {'cn': Mock()}, expected_latency=5.0))
+        assert [p.name for p in registry.route('cn')] == ['slow', 'fast']
+
+        for _ in range(5):
+            slow.health.record(True, 2.0)
+            fast.health.record(True, 0.2)
+        assert [p.name for p in registry.route('cn')] == ['fast', 'slow']
+
+    def test_circuit_breaker_persists_across_registries(self):
+        flaky = Mock(side_effect=_failing)
+        backup = Mock(return_value={'price': 2.0})
+
+        def build(*providers):
+            registry = ProviderRegistry()
+            for provider in providers:
+                registry.register(provider)
+            return registry
+
+        for _ in range(quote_providers.FAILURE_THRESHOLD):
+            assert build(QuoteProvider('flaky', {'us': flaky})).fetch('us', 'AAPL') is None
+        assert get_health('flaky').state == ProviderHealth.OPEN
+
+        # 新的注册表（新的 PriceFetcher）共享熔断状态，不再调用 flaky
+        flaky.reset_mock()
+        registry = build(QuoteProvider('flaky', {'us': flaky}, expected_latency=0.1),
+                         QuoteProvider('backup', {'us': backup}, expected_latency=10.0))
+        assert registry.fetch('us', 'TSLA')['price'] == 2.0
+        flaky.assert_not_called()
+        assert registry.health()['flaky']['state'] == ProviderHealth.OPEN
+
+    def test_half_open_probe(self):
+        health = ProviderHealth('p')
+        for _ in range(quote_providers.FAILURE_THRESHOLD):
+            health.record(False, 0.1)
+        assert not health.allow()
+
+        with patch.object(quote_providers.time, 'monotonic', return_value=health.opened_at + 61):
+            assert health.allow()
+            # 半开只放行一次试探
+            assert not health.allow()
+            health.record(False, 0.1)
+        assert health.state == ProviderHealth.OPEN
+        assert health.cooldown == quote_providers.COOLDOWN * 2
+
+        with patch.object(quote_providers.time, 'monotonic', return_value=health.opened_at + 121):
+            assert health.allow()
+            health.record(True, 0.1)
+        assert health.state == ProviderHealth.CLOSED
+        assert health.cooldown == quote_providers.COOLDOWN
+
+    def test_error_rate_opens_breaker(self):
+        health = ProviderHealth('p')
+        for i in range(quote_providers.MIN_SAMPLES):
+            health.record(i % 2 == 0, 0.1)
+        assert health.state == ProviderHealth.OPEN
+
+    def test_fetch_many_passes_remaining_codes(self):
+        first = Mock(return_value={'600519': {'price': 1500.0}})
+        second = Mock(return_value={'00700': {'price': 400.0}})
+        registry = ProviderRegistry()
+        registry.register(QuoteProvider('first', {'cn': Mock(), 'hk': Mock()}, fetch_batch=first,
+                                        expected_latency=0.1))
+        registry.register(QuoteProvider('single', {'cn': Mock()}, expected_latency=0.2))
+        registry.register(QuoteProvider('second', {'hk': Mock()}, fetch_batch=second,
+                                        expected_latency=1.0))
+
+        results = registry.fetch_many(['cn', 'hk'], ['600519', '00700', 'AAPL'], {'x': 'y'})
+
+        assert set(results) == {'600519', '00700'}
+        first.assert_called_once_with(['600519', '00700', 'AAPL'], {'x': 'y'})
+        second.assert_called_once_with(['00700', 'AAPL'], {'x': 'y'})
+
+    def test_rate_limited_provider_uses_shared_bucket(self):
+        provider = QuoteProvider('limited', {'us': Mock(return_value=None)}, rate=5, burst=2)
+        with patch.object(provider.bucket, 'acquire') as acquire:
+            provider.call(provider.fetchers['us'], 'AAPL')
+        acquire.assert_called_once()
+        assert QuoteProvider('limited', {'us': Mock()}, rate=5).bucket is provider.bucket
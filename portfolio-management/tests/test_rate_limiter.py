@@ -0,0 +1,92 @@
+"""测试令牌桶限流器"""
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+
+from src.rate_limiter import TokenBucket, get_bucket
+
+
+class TestTokenBucket:
+    """测试令牌桶"""
+
+    @patch('src.rate_limiter.time.monotonic', return_value=1000.0)
+    def test_burst_then_wait(self, _):
+        """测试突发额度用完后按速率排队"""
+        bucket = TokenBucket(rate=10, burst=3)
+        waits = [bucket.reserve() for _ in range(5)]
+        assert waits[:3] == [0, 0, 0]
+        assert waits[3] == pytest.approx(0.1)
+        assert waits[4] == pytest.approx(0.2)
+
+    def test_refill(self):
+        """测试令牌随时间补充且不超过容量"""
+        with patch('src.rate_limiter.time.monotonic', return_value=1000.0):
+            bucket = TokenBucket(rate=10, burst=2)
+            bucket.reserve()
+            bucket.reserve()
+        with patch('src.rate_limiter.time.monotonic', return_value=1010.0):
+            assert bucket.reserve() == 0
+            assert bucket.reserve() == 0
+            assert bucket.reserve() > 0
+
+    @patch('src.rate_limiter.time.sleep')
+    @patch('src.rate_limiter.time.monotonic', return_value=1000.0)
+    def test_concurrent_threads_get_distinct_slots(self, _, mock_sleep):
+        """测试并发线程各自预约不同时间片"""
+        bucket = TokenBucket(rate=20, burst=1)
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        waits = sorted(round(c.args[0], 2) for c in mock_sleep.call_args_list)
+        assert waits == [0.05, 0.1, 0.15, 0.2]
+
+    def test_acquire_async(self):
+        """测试协程获取令牌（等待不阻塞事件循环）"""
+        bucket = TokenBucket(rate=50, burst=1)
+        ticks = []
+
+        async def ticker():
+            for _ in range(3):
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def run():
+            await asyncio.gather(bucket.acquire_async(), bucket.acquire_async(), ticker())
+
+        asyncio.run(run())
+        assert len(ticks) == 3
+
+    @patch('src.rate_limiter.time.monotonic', return_value=1000.0)
+    def test_aimd(self, _):
+        """测试 429 速率减半、成功后线性回升"""
+        bucket = TokenBucket(rate=16, burst=4)
+        bucket.on_throttled()
+        assert bucket.rate == 8
+        assert bucket.reserve() > 0  # 突发额度已清空
+
+        bucket.on_throttled()
+        bucket.on_throttled()
+        bucket.on_throttled()
+        assert bucket.rate == bucket.min_rate == 2
+
+        for _ in range(100):
+            bucket.on_success()
+        assert bucket.rate == 16
+
+    def test_invalid_rate(self):
+        """测试非法速率"""
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestBucketRegistry:
+    """测试进程级令牌桶注册表"""
+
+    def test_same_key_shared(self):
+        """测试相同 key 返回同一个令牌桶"""
+        assert get_bucket('k', 10) is get_bucket('k', 20)
+        assert get_bucket('k', 10) is not get_bucket('other', 10)
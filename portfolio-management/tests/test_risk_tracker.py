@@ -0,0 +1,97 @@
+"""测试增量风险指标"""
+import statistics
+from datetime import date, timedelta
+
+import pytest
+
+from src.models import NAVHistory
+from src.risk_tracker import RISK_STATE_DIR, RiskTracker
+
+
+def _navs(values, start=date(2025, 1, 1)):
+    return [NAVHistory(date=start + timedelta(days=i), account='lx',
+                       total_value=v * 100000, nav=v)
+            for i, v in enumerate(values)]
+
+
+class TestRiskTracker:
+    """测试增量更新与持久化"""
+
+    VALUES = [1.0, 1.02, 0.99, 1.05, 1.01, 0.97, 1.06, 1.08]
+
+    def test_matches_full_history(self, tmp_path):
+        """测试增量结果与全量计算一致"""
+        tracker = RiskTracker('lx', tmp_path / 'lx.json')
+        assert tracker.sync(_navs(self.VALUES)) == len(self.VALUES)
+
+        returns = [self.VALUES[i] / self.VALUES[i - 1] - 1 for i in range(1, len(self.VALUES))]
+        assert tracker.volatility() == pytest.approx(statistics.stdev(returns) * 252 ** 0.5)
+        assert tracker.max_drawdown == pytest.approx((1.05 - 0.97) / 1.05)
+        assert tracker.drawdown() == 0
+        # 1/4 峰值 1.05，1/7 收复
+        assert tracker.max_drawdown_days == 3
+        assert tracker.var(0.8) == pytest.approx(-sorted(returns)[1])
+        assert tracker.cvar(0.8) == pytest.approx(-(sorted(returns)[0] + sorted(returns)[1]) / 2)
+
+    def test_rolling_window(self, tmp_path):
+        """测试滚动窗口只保留最近 20 个收益率"""
+        values = [1.0 + 0.01 * ((i * 7) % 5) for i in range(40)]
+        tracker = RiskTracker('lx', tmp_path / 'lx.json')
+        tracker.sync(_navs(values))
+        returns = [values[i] / values[i - 1] - 1 for i in range(1, len(values))]
+        assert tracker.volatility(20) == pytest.approx(statistics.stdev(returns[-20:]) * 252 ** 0.5)
+        assert tracker.volatility(60) is None
+
+    def test_incremental_sync_and_persist(self, tmp_path):
+        """测试保存后只同步新增净值"""
+        state = tmp_path / 'lx.json'
+        navs = _navs(self.VALUES)
+        RiskTracker.refresh('lx', navs[:5], state)
+
+        tracker = RiskTracker.load('lx', state)
+        assert tracker.last_date == navs[4].date
+        assert tracker.sync(navs) == 3
+
+        full = RiskTracker('lx', tmp_path / 'full.json')
+        full.sync(navs)
+        assert tracker.snapshot() == full.snapshot()
+
+    def test_rewritten_history_rebuilds(self, tmp_path):
+        """测试最后同步日净值被改写时全量重建"""
+        tracker = RiskTracker('lx', tmp_path / 'lx.json')
+        navs = _navs(self.VALUES)
+        tracker.sync(navs)
+        navs[-1] = navs[-1].model_copy(update={'nav': 0.9})
+        assert tracker.sync(navs) == len(self.VALUES)
+        assert tracker.drawdown() == pytest.approx((1.06 - 0.9) / 1.06)
+
+    def test_rewritten_earlier_history_rebuilds(self, tmp_path):
+        """测试最后同步日之前的净值被改写或删除时也全量重建"""
+        state = tmp_path / 'lx.json'
+        navs = _navs(self.VALUES)
+        RiskTracker.refresh('lx', navs[:5], state)
+
+        rewritten = list(navs)
+        rewritten[1] = rewritten[1].model_copy(update={'nav': 1.2})
+        tracker = RiskTracker.load('lx', state)
+        assert tracker.sync(rewritten) == len(self.VALUES)
+        full = RiskTracker('lx', tmp_path / 'full.json')
+        full.sync(rewritten)
+        assert tracker.snapshot() == full.snapshot()
+
+        tracker = RiskTracker.load('lx', state)
+        assert tracker.sync(navs[:2] + navs[3:]) == len(self.VALUES) - 1
+
+    def test_state_file_name_sanitized(self):
+        tracker = RiskTracker('../a/b')
+        assert tracker.state_file.parent == RISK_STATE_DIR
+        assert tracker.state_file.name == '.._a_b.json'
+
+    def test_snapshot_and_corrupt_state(self, tmp_path):
+        state = tmp_path / 'lx.json'
+        state.write_text('{broken', encoding='utf-8')
+        tracker = RiskTracker.load('lx', state)
+        snapshot = tracker.snapshot()
+        assert snapshot['as_of'] is None
+        assert snapshot['volatility_20d'] is None
+        assert snapshot['max_drawdown'] == 0
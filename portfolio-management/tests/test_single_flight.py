@@ -0,0 +1,160 @@
+"""测试请求合并"""
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from src.price_fetcher import PriceFetcher
+from src.single_flight import SingleFlight
+
+
+def _run_threads(n, target):
+    results = [None] * n
+    errors = [None] * n
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    return results, errors
+
+
+class TestSingleFlight:
+    """测试按 key 合并在途请求"""
+
+    def test_concurrent_calls_share_one_request(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow(code):
+            calls.append(code)
+            time.sleep(0.2)
+            return {'code': code, 'price': 1.0}
+
+        results, errors = _run_threads(5, lambda: flight.do('AAPL', slow, 'AAPL'))
+
+        assert calls == ['AAPL']
+        assert errors == [None] * 5
+        assert all(value['price'] == 1.0 for value, _ in results)
+        assert sorted(shared for _, shared in results) == [False] + [True] * 4
+        assert flight.shared == 4
+        assert flight.in_flight() == 0
+
+    def test_error_propagates_to_waiters(self):
+        flight = SingleFlight()
+
+        def failing():
+            time.sleep(0.2)
+            raise ConnectionError('down')
+
+        _, errors = _run_threads(3, lambda: flight.do('USDCNY', failing))
+
+        assert all(isinstance(e, ConnectionError) for e in errors)
+        # 请求结束后不保留结果，下一次重新请求
+        assert flight.do('USDCNY', lambda: 7.2) == (7.2, False)
+
+    def test_do_many_waits_on_in_flight_keys(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def slow_single():
+            started.set()
+            time.sleep(0.2)
+            return {'price': 1500.0}
+
+        leader = threading.Thread(target=flight.do, args=('600519', slow_single))
+        leader.start()
+        started.wait(timeout=5)
+
+        batch = Mock(return_value={'00700': {'price': 400.0}})
+        results = flight.do_many(['600519', '00700', '00700'], batch)
+        leader.join(timeout=5)
+
+        batch.assert_called_once_with(['00700'])
+        assert results == {'600519': {'price': 1500.0}, '00700': {'price': 400.0}}
+
+    def test_partial_batch_result_retried_by_waiter(self):
+        """批量调用未返回的 key，等待方自行重新请求"""
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def batch(keys):
+            started.set()
+            time.sleep(0.2)
+            return {}
+
+        leader = threading.Thread(target=flight.do_many, args=(['000001'], batch))
+        leader.start()
+        started.wait(timeout=5)
+
+        single = Mock(return_value={'price': 1.5})
+        value, shared = flight.do('000001', single)
+        leader.join(timeout=5)
+
+        assert value == {'price': 1.5}
+        assert not shared
+        single.assert_called_once_with()
+
+    def test_do_many_error_raised_for_own_keys(self):
+        flight = SingleFlight()
+        with pytest.raises(RuntimeError):
+            flight.do_many(['a'], Mock(side_effect=RuntimeError('boom')))
+        assert flight.in_flight() == 0
+
+
+class TestPriceFetcherSingleFlight:
+    """测试 PriceFetcher 的并发查询合并"""
+
+    def test_concurrent_fetch_same_code(self):
+        storage = Mock()
+        storage.get_price.return_value = None
+        fetcher = PriceFetcher(storage=storage)
+
+        def slow(code, name):
+            time.sleep(0.2)
+            return {'code': code, 'price': 10.0, 'cny_price': 10.0, 'currency': 'CNY', 'source': 'tencent'}
+
+        fetcher._fetch_realtime = Mock(side_effect=slow)
+        results, _ = _run_threads(4, lambda: fetcher.fetch('600519'))
+
+        fetcher._fetch_realtime.assert_called_once()
+        assert all(r['price'] == 10.0 for r in results)
+        # 只有发起请求的调用方写缓存
+        storage.save_price.assert_called_once()
+
+    def test_exchange_rates_coalesced_by_pair(self):
+        """两个 PriceFetcher 同时刷新汇率，每个货币对只请求一次"""
+        def slow_get(url, timeout=None):
+            time.sleep(0.2)
+            response = Mock()
+            response.json.return_value = {'rates': {'CNY': 7.2}}
+            return response
+
+        get = Mock(side_effect=slow_get)
+        fetchers = [PriceFetcher(), PriceFetcher()]
+        for fetcher in fetchers:
+            fetcher.session.get = get
+            fetcher._load_rate_cache_from_file = Mock(return_value=None)
+            fetcher._save_rate_cache_to_file = Mock()
+
+        results = [None, None]
+
+        def refresh(i):
+            results[i] = fetchers[i]._fetch_exchange_rates()
+
+        threads = [threading.Thread(target=refresh, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+        assert results[0] == results[1] == {'USDCNY': 7.2, 'HKDCNY': 7.2}
+        assert get.call_count == 2
@@ -0,0 +1,84 @@
+"""测试本地时间序列存储"""
+from datetime import date, timedelta
+from unittest.mock import Mock, patch
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.feishu_storage import FeishuStorage
+from src.models import AssetType, NAVHistory, PriceCache
+from src.timeseries_store import HEADER_SIZE, TimeSeriesStore
+
+
+def _nav(d, nav):
+    return NAVHistory(date=d, account='lx', total_value=nav * 100000, shares=100000, nav=nav)
+
+
+class TestTimeSeriesStore:
+    """测试追加、切片与回填"""
+
+    def test_append_and_slice(self, tmp_path):
+        store = TimeSeriesStore(tmp_path)
+        start = date(2025, 1, 1)
+        rows = [(start + timedelta(days=i), 10.0 + i, None) for i in range(10)]
+        assert store.append_prices('600519', rows[:6]) == 6
+        assert store.append_prices('600519', rows[6:]) == 4
+
+        path = tmp_path / 'price' / '600519.bin'
+        assert path.stat().st_size == HEADER_SIZE + 10 * store.price_dtype.itemsize
+
+        window = store.prices('600519', date(2025, 1, 3), date(2025, 1, 5))
+        assert list(window['close']) == [12.0, 13.0, 14.0]
+        assert np.isnan(window['cny_close']).all()
+        # 切片为内存映射视图，不复制
+        assert np.shares_memory(window, store.prices('600519'))
+        assert store.last_date('price', '600519') == date(2025, 1, 10)
+
+    def test_same_day_overwrites_last(self, tmp_path):
+        store = TimeSeriesStore(tmp_path)
+        d = date(2025, 3, 14)
+        store.append_prices('00700.HK', [(d, 380.0, 350.0)])
+        store.append_prices('00700.HK', [(d, 382.5, 352.0)])
+        records = store.prices('00700.HK')
+        assert len(records) == 1
+        assert records['close'][0] == 382.5
+
+    def test_backfill_merges(self, tmp_path):
+        store = TimeSeriesStore(tmp_path)
+        store.append_navs('测试账户', [_nav(date(2025, 1, 10), 1.1), _nav(date(2025, 1, 12), 1.2)])
+        store.append_navs('测试账户', [_nav(date(2025, 1, 11), 1.15), _nav(date(2025, 1, 9), 1.0)])
+        records = store.navs('测试账户')
+        assert list(records['date'].astype(date)) == [date(2025, 1, 9), date(2025, 1, 10),
+                                                      date(2025, 1, 11), date(2025, 1, 12)]
+        assert list(records['nav']) == [1.0, 1.1, 1.15, 1.2]
+
+    def test_reopen_and_bad_header(self, tmp_path):
+        TimeSeriesStore(tmp_path).append_prices('AAPL', [(date(2025, 1, 2), 190.0, 1380.0)])
+        assert TimeSeriesStore(tmp_path).prices('AAPL')['cny_close'][0] == 1380.0
+
+        (tmp_path / 'price' / 'BAD.bin').write_bytes(b'x' * 64)
+        with pytest.raises(ValueError):
+            TimeSeriesStore(tmp_path).prices('BAD')
+
+
+class TestFeishuStorageTimeSeries:
+    """测试存储层写入本地序列"""
+
+    def test_save_price_and_nav_append(self, tmp_path):
+        client = Mock()
+        client.list_records.return_value = []
+        client.create_record.return_value = {'record_id': 'nav1'}
+        with patch('src.feishu_storage.config.is_timeseries_enabled', return_value=True):
+            storage = FeishuStorage(client=client)
+        storage.timeseries = TimeSeriesStore(tmp_path)
+        storage._local_price_cache = Mock()
+
+        storage.save_price(PriceCache(asset_id='600519', asset_type=AssetType.A_STOCK,
+                                      price=1500.0, currency='CNY', cny_price=1500.0,
+                                      close_date=date(2025, 3, 14)))
+        storage.save_nav(_nav(date(2025, 3, 14), 1.05))
+
+        assert storage.timeseries.prices('600519')['close'][0] == 1500.0
+        assert storage.timeseries.prices('600519')['date'][0] == date(2025, 3, 14)
+        assert storage.timeseries.navs('lx')['nav'][0] == 1.05